@@ -0,0 +1,39 @@
+-- This query will show the count of concurrent jobs broken down by minutes from the job_facts table
+-- (refresh it with job_facts.sql first)
+DECLARE interval_in_days INT64 DEFAULT 7;
+
+BEGIN
+WITH jobs AS
+(
+  SELECT
+    job_id AS jobId,
+    DATETIME_TRUNC(start_time, MINUTE) AS startTime,
+    DATETIME_TRUNC(end_time, MINUTE) AS endTime
+  FROM
+    `<project>.<dataset>.job_facts`
+  WHERE
+    event_type = 'QUERY'
+    AND principal_email IS NOT NULL
+    AND principal_email != ""
+    AND DATE(start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)
+    AND project_id IS NOT NULL
+    AND DATE(log_timestamp) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days DAY)
+),
+differences AS
+(
+  SELECT *,
+  generate_timestamp_array(startTime, endTime, INTERVAL 1 MINUTE) AS int
+  FROM jobs
+),
+byMinutes AS
+(
+  SELECT *
+  FROM differences,
+    UNNEST(int) AS minute
+)
+
+SELECT COUNT(*) AS jobCounter, minute
+FROM byMinutes
+GROUP BY minute
+ORDER BY minute ASC;
+END
@@ -0,0 +1,39 @@
+-- This query will show the count of concurrent jobs broken down by seconds from the job_facts table
+-- (refresh it with job_facts.sql first)
+DECLARE interval_in_days INT64 DEFAULT 7;
+
+BEGIN
+WITH jobs AS
+(
+  SELECT
+    job_id AS jobId,
+    DATETIME_TRUNC(start_time, SECOND) AS startTime,
+    DATETIME_TRUNC(end_time, SECOND) AS endTime
+  FROM
+    `<project>.<dataset>.job_facts`
+  WHERE
+    event_type = 'QUERY'
+    AND principal_email IS NOT NULL
+    AND principal_email != ""
+    AND DATE(start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)
+    AND project_id IS NOT NULL
+    AND DATE(log_timestamp) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days DAY)
+),
+differences AS
+(
+  SELECT *,
+  generate_timestamp_array(startTime, endTime, INTERVAL 1 SECOND) AS int
+  FROM jobs
+),
+bySeconds AS
+(
+  SELECT *
+  FROM differences,
+    UNNEST(int) AS second
+)
+
+SELECT COUNT(*) AS jobCounter, second
+FROM bySeconds
+GROUP BY second
+ORDER BY second ASC;
+END
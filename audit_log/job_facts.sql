@@ -0,0 +1,108 @@
+/*
+ *  This query creates and incrementally refreshes the job_facts table: one flattened row per completed
+ *  BigQuery job from the audit log sink, partitioned by job start date and clustered by project, job type
+ *  and principal.
+ *
+ *  The *_facts queries read this table instead of re-parsing and de-duplicating the nested audit log
+ *  records, which scans a small fraction of the bytes. Schedule this file (e.g. as a daily scheduled
+ *  query) and run it before the *_facts queries.
+ *
+ *  Each run re-reads the sink from the day before the newest loaded audit log entry (backfill_days on the
+ *  first run) and MERGEs on job_id, so re-running it never duplicates jobs.
+ */
+
+-- Change this value to change how many days the first run loads
+DECLARE backfill_days INT64 DEFAULT 30;
+-- Days of the audit log read by this run (set below from the newest loaded entry)
+DECLARE interval_in_days INT64;
+
+CREATE TABLE IF NOT EXISTS `<project>.<dataset>.job_facts` (
+  job_id STRING NOT NULL,
+  project_id STRING,
+  location STRING,
+  principal_email STRING,
+  event_type STRING,
+  start_time TIMESTAMP NOT NULL,
+  end_time TIMESTAMP,
+  log_timestamp TIMESTAMP,
+  total_slot_ms INT64,
+  total_billed_bytes INT64,
+  total_processed_bytes INT64,
+  reservation STRING,
+  query_hash STRING,
+  query STRING,
+  labels ARRAY<STRUCT<key STRING, value STRING>>
+)
+PARTITION BY DATE(start_time)
+CLUSTER BY project_id, event_type, principal_email;
+
+SET interval_in_days = (
+  SELECT
+    IFNULL(DATE_DIFF(CURRENT_DATE(), DATE(MAX(log_timestamp)), DAY) + 1, backfill_days)
+  FROM
+    `<project>.<dataset>.job_facts`
+  WHERE
+    DATE(start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL backfill_days DAY)
+);
+
+MERGE `<project>.<dataset>.job_facts` T
+USING (
+  SELECT
+    * EXCEPT(_rnk)
+  FROM (
+    SELECT
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId AS job_id,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.projectId AS project_id,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.location AS location,
+      protopayload_auditlog.authenticationInfo.principalEmail AS principal_email,
+      CASE protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.eventName
+          WHEN 'query_job_completed' THEN 'QUERY'
+          WHEN 'load_job_completed' THEN 'LOAD'
+          WHEN 'extract_job_completed' THEN 'EXTRACT'
+          WHEN 'table_copy_job_completed' THEN 'TABLE COPY'
+      END AS event_type,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.startTime AS start_time,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.endTime AS end_time,
+      timestamp AS log_timestamp,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.totalSlotMs AS total_slot_ms,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.totalBilledBytes AS total_billed_bytes,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.totalProcessedBytes AS total_processed_bytes,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.reservation,
+      TO_HEX(SHA256(protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobConfiguration.query.query)) AS query_hash,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobConfiguration.query.query,
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobConfiguration.labels,
+      ROW_NUMBER() OVER(PARTITION BY protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId ORDER BY timestamp DESC) AS _rnk
+    FROM
+      `<project>.<dataset>.cloudaudit_googleapis_com_data_access`
+    WHERE
+      protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId IS NOT NULL
+      AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId NOT LIKE 'script_job_%' -- filter BQ script child jobs
+      AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.eventName LIKE '%_job_completed'
+      AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobConfiguration.dryRun IS NULL
+      AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.startTime IS NOT NULL
+      AND DATE(timestamp) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days DAY)
+  )
+  WHERE
+    _rnk = 1
+) S
+ON T.job_id = S.job_id
+  -- Jobs logged in the re-read days started at most 6 hours before them: prune target partitions
+  AND DATE(T.start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days + 1 DAY)
+WHEN MATCHED THEN
+  UPDATE SET
+    project_id = S.project_id,
+    location = S.location,
+    principal_email = S.principal_email,
+    event_type = S.event_type,
+    start_time = S.start_time,
+    end_time = S.end_time,
+    log_timestamp = S.log_timestamp,
+    total_slot_ms = S.total_slot_ms,
+    total_billed_bytes = S.total_billed_bytes,
+    total_processed_bytes = S.total_processed_bytes,
+    reservation = S.reservation,
+    query_hash = S.query_hash,
+    query = S.query,
+    labels = S.labels
+WHEN NOT MATCHED THEN
+  INSERT ROW;
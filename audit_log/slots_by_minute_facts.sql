@@ -0,0 +1,43 @@
+-- This query returns how many slots were used on a per minute basis from the job_facts table
+-- (refresh it with job_facts.sql first)
+
+-- Change this value to change how far in the past the query will search
+DECLARE interval_in_days INT64 DEFAULT 7;
+
+WITH jobs AS (
+  SELECT
+    event_type AS eventType,
+    start_time AS startTime,
+    end_time AS endTime,
+    SAFE_DIVIDE(total_slot_ms, TIMESTAMP_DIFF(end_time, start_time, MILLISECOND)) AS slotCount
+  FROM
+    `<project>.<dataset>.job_facts`
+  WHERE
+    principal_email IS NOT NULL
+    AND principal_email != ""
+    AND DATE(start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)
+    AND project_id IS NOT NULL
+    AND project_id = '<project-name>'
+    AND DATE(log_timestamp) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days DAY)
+),
+differences AS (
+  SELECT
+    *,
+    GENERATE_TIMESTAMP_ARRAY(startTime, endTime, INTERVAL 1 MINUTE) AS int
+  FROM
+    jobs),
+byMinutes AS (
+  SELECT
+    * EXCEPT(int)
+  FROM
+    differences,
+    UNNEST(int) AS minute)
+
+SELECT
+  minute,
+  eventType,
+  SUM(slotCount) AS slotCount
+FROM byMinutes
+WHERE slotCount IS NOT NULL
+GROUP BY minute, eventType
+ORDER BY minute ASC
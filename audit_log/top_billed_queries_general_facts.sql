@@ -0,0 +1,35 @@
+-- This query returns the top billed queries over the specified timeframe from the job_facts table
+-- (refresh it with job_facts.sql first)
+
+-- Change this value to change how far in the past the query will search
+DECLARE interval_in_days INT64 DEFAULT 7;
+
+SELECT
+    principal_email AS user,
+    log_timestamp AS timestamp,
+    job_id AS jobId,
+    location,
+    project_id AS billingProjectId,
+    start_time AS startTime,
+    end_time AS endTime,
+    ROUND(SAFE_DIVIDE(COALESCE(total_billed_bytes, 0), POW(1024, 4)) * 5, 2) AS onDemandCost,
+    ROUND(COALESCE(total_billed_bytes, 0), 2) AS totalBytesBilled,
+    ROUND(COALESCE(total_billed_bytes, 0) / POW(1024, 2), 2) AS totalMegabytesBilled,
+    ROUND(COALESCE(total_billed_bytes, 0) / POW(1024, 3), 2) AS totalGigabytesBilled,
+    ROUND(COALESCE(total_billed_bytes, 0) / POW(1024, 4), 2) AS totalTerabytesBilled,
+    total_billed_bytes AS totalBilledBytes,
+    query
+FROM
+    `<project>.<dataset>.job_facts`
+WHERE
+    event_type = 'QUERY'
+    AND query IS NOT NULL
+    AND total_billed_bytes IS NOT NULL
+    AND principal_email IS NOT NULL
+    AND principal_email != ""
+    AND project_id IS NOT NULL
+    -- start_time prunes partitions; jobs logged in the window started at most 6 hours earlier
+    AND DATE(start_time) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days + 1 DAY)
+    AND DATE(log_timestamp) >= DATE_SUB(CURRENT_DATE(), INTERVAL interval_in_days DAY)
+ORDER BY
+    total_billed_bytes DESC
@@ -1,20 +1,53 @@
 import argparse
+import csv
+import hashlib
+import os
 import os.path
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 audit_log_directory = 'audit_log'
 information_schema_directory = 'information_schema'
 directories = [audit_log_directory, information_schema_directory]
 
+# <project> is the project holding the audit log sink dataset (left as-is unless --sink-project is given)
+placeholders = ['<project-name>', '<project>', '<dataset-region>', '<dataset>']
+placeholder_pattern = re.compile('|'.join(re.escape(p) for p in placeholders))
+
+# Templates compiled once per process (set directly or by the pool initializer)
+compiled_templates = []
+
+# Audit log sink layouts: date-sharded tables (<table>_YYYYMMDD), tables partitioned on
+# the timestamp column (Cloud Logging's partitioned tables), or ingestion-time partitions
+sink_table = 'cloudaudit_googleapis_com_data_access'
+sink_layouts = ['as-is', 'auto', 'sharded', 'partitioned', 'ingestion-time']
+
+# Time predicates used by the audit_log queries, and the date expression of their lower bound
+time_predicates = [
+    (re.compile(r'DATE\(timestamp\)\s*>=\s*(DATE_SUB\(CURRENT_DATE\(\),\s*INTERVAL\s+\w+\s+DAY\))'), '{0}'),
+    (re.compile(r'\(timestamp\)\s+BETWEEN\s+(TIMESTAMP_SUB\(CURRENT_TIMESTAMP\(\),\s*INTERVAL\s+\w+\s+DAY\))'
+                r'\s+AND\s+CURRENT_TIMESTAMP\(\)'), 'DATE({0})'),
+]
+
+# Predicate added next to the original one so the sink only reads the days in range
+pruning_predicates = {
+    'sharded': "_TABLE_SUFFIX BETWEEN FORMAT_DATE('%Y%m%d', {0}) AND FORMAT_DATE('%Y%m%d', CURRENT_DATE())",
+    'partitioned': 'timestamp >= TIMESTAMP({0})',
+    'ingestion-time': '_PARTITIONTIME >= TIMESTAMP({0})',
+}
+
 def init_argparse() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
-        usage="%(prog)s [--location <dataset-location>] <project> <output-directory>",
+        usage="%(prog)s [--location <dataset-location>] [--targets <targets-file>] [<project>] <output-directory>",
         description="Generate SQL files for specific projects and/or datasets into output directory."
     )
     parser.add_argument(
         'project',
         metavar='project',
         type=str,
-        help='Project name'
+        nargs='?',
+        help='Project name (omit when using --targets)'
     )
     parser.add_argument(
         '--location',
@@ -30,6 +63,39 @@ def init_argparse() -> argparse.ArgumentParser:
         help='Dataset name for audit logs',
         default='doitintl-cmp-bq'
     )
+    parser.add_argument(
+        '--targets',
+        metavar='targets',
+        type=str,
+        help='File with one "project[,location[,dataset]]" target per line; '
+             'each target is generated into <output-directory>/<project>'
+    )
+    parser.add_argument(
+        '--sink-project',
+        metavar='sink_project',
+        type=str,
+        help='Project of the audit log sink dataset (replaces <project>)'
+    )
+    parser.add_argument(
+        '--sink-layout',
+        metavar='sink_layout',
+        choices=sink_layouts,
+        help='Audit log sink layout used to rewrite time predicates for pruning: '
+             + ', '.join(sink_layouts) + ' (auto needs --sink-project and google-cloud-bigquery)',
+        default='as-is'
+    )
+    parser.add_argument(
+        '--report-savings',
+        action='store_true',
+        help='Dry-run each audit_log query before and after the rewrite and report bytes saved'
+    )
+    parser.add_argument(
+        '--workers',
+        metavar='workers',
+        type=int,
+        help='Worker processes for multiple targets',
+        default=os.cpu_count()
+    )
     parser.add_argument(
         'output',
         metavar='output',
@@ -39,45 +105,221 @@ def init_argparse() -> argparse.ArgumentParser:
 
     return parser
 
+def compile_template(contents: str) -> list:
+    # Split into alternating literal text and placeholder names, so rendering is
+    # a single join instead of one full-text replace pass per placeholder
+    parts = []
+    position = 0
+    for match in placeholder_pattern.finditer(contents):
+        parts.append(contents[position:match.start()])
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(contents[position:])
+    return parts
+
+def render_template(parts: list, values: dict) -> str:
+    # Even indexes are literal text, odd indexes are placeholders
+    return ''.join(part if i % 2 == 0 else values[part] for i, part in enumerate(parts))
+
+def rewrite_time_predicates(contents: str, layout: str) -> tuple:
+    # Add a pruning predicate after each recognised time predicate on the sink table
+    if layout == 'as-is' or sink_table not in contents:
+        return contents, 0
+
+    rewrites = 0
+    for pattern, lower_bound in time_predicates:
+        contents, count = pattern.subn(
+            lambda match: match.group(0) + ' AND '
+            + pruning_predicates[layout].format(lower_bound.format(match.group(1))),
+            contents
+        )
+        rewrites += count
+
+    # Sharded sinks have no base table: query the day tables through a wildcard
+    if layout == 'sharded':
+        contents = contents.replace(sink_table + '`', sink_table + '_*`')
+    return contents, rewrites
+
+def detect_sink_layout(project: str, dataset: str) -> str:
+    try:
+        from google.cloud import bigquery
+        from google.api_core.exceptions import NotFound
+    except ImportError:
+        raise SystemExit('--sink-layout auto needs google-cloud-bigquery (pip install google-cloud-bigquery)')
+
+    client = bigquery.Client(project=project)
+    try:
+        table = client.get_table(f'{project}.{dataset}.{sink_table}')
+    except NotFound:
+        for table_item in client.list_tables(f'{project}.{dataset}'):
+            if re.fullmatch(sink_table + r'_\d{8}', table_item.table_id):
+                return 'sharded'
+        raise SystemExit(f'No {sink_table} table or day shards found in {project}.{dataset}')
+
+    if table.time_partitioning is None:
+        # Unpartitioned: every query scans the whole table whatever the predicate
+        return 'as-is'
+    if table.time_partitioning.field is None:
+        return 'ingestion-time'
+    if table.time_partitioning.field == 'timestamp':
+        return 'partitioned'
+    return 'as-is'
+
+def load_templates(sink_layout: str = 'as-is') -> list:
+    templates = []
+    unrewritten = []
+    for current_directory in directories:
+        # Cycle over each file in the directories
+        for filename in sorted(os.scandir(current_directory), key=lambda f: f.name):
+            # Only grab SQL files
+            if filename.is_file() and filename.name.endswith('.sql'):
+                with open(filename.path) as file:
+                    contents, rewrites = rewrite_time_predicates(file.read(), sink_layout)
+                if sink_layout != 'as-is' and sink_table in contents and rewrites == 0:
+                    unrewritten.append(filename.path)
+                templates.append((current_directory, filename.name, compile_template(contents)))
+
+    if unrewritten:
+        print(f"Warning: no time predicate rewritten for {sink_layout} layout in: {', '.join(unrewritten)}")
+    return templates
+
+def report_savings(original_templates: list, rewritten_templates: list, values: dict) -> None:
+    try:
+        from google.cloud import bigquery
+    except ImportError:
+        raise SystemExit('--report-savings needs google-cloud-bigquery (pip install google-cloud-bigquery)')
+
+    client = bigquery.Client(project=values['<project>'])
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+
+    def dry_run_bytes(parts: list):
+        try:
+            return client.query(render_template(parts, values), job_config=job_config).total_bytes_processed, ''
+        except Exception as e:
+            return None, str(e).splitlines()[0]
+
+    print(f"\n{'Query':<50} {'Before GB':>12} {'After GB':>12} {'Saved GB':>12} {'Saved':>7}")
+    total_before = 0
+    total_after = 0
+    for (current_directory, name, original), (_, _, rewritten) in zip(original_templates, rewritten_templates):
+        if current_directory != audit_log_directory or original == rewritten:
+            continue
+        before, error = dry_run_bytes(original)
+        after, rewritten_error = dry_run_bytes(rewritten)
+        if before is None or after is None:
+            print(f"{name:<50} dry run failed: {error or rewritten_error}")
+            continue
+        total_before += before
+        total_after += after
+        saved_share = (before - after) / before if before else 0
+        print(f"{name:<50} {before / 1024**3:>12,.2f} {after / 1024**3:>12,.2f} "
+              f"{(before - after) / 1024**3:>12,.2f} {saved_share:>7.1%}")
+    print(f"{'TOTAL':<50} {total_before / 1024**3:>12,.2f} {total_after / 1024**3:>12,.2f} "
+          f"{(total_before - total_after) / 1024**3:>12,.2f}")
+
+def load_targets(targets_file: str, default_location: str, default_dataset: str) -> list:
+    targets = []
+    with open(targets_file, newline='') as file:
+        for row in csv.reader(file):
+            row = [value.strip() for value in row]
+            # Skip blank lines and comments
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            location = row[1] if len(row) > 1 and row[1] else default_location
+            dataset = row[2] if len(row) > 2 and row[2] else default_dataset
+            targets.append((row[0], location, dataset))
+    return targets
+
+def init_worker(templates: list) -> None:
+    global compiled_templates
+    compiled_templates = templates
+
+def write_if_changed(path: str, contents: str) -> bool:
+    # Compare content hashes so unchanged outputs keep their mtime and are not rewritten
+    data = contents.encode('utf-8')
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as existing:
+            if hashlib.sha256(existing.read()).digest() == hashlib.sha256(data).digest():
+                return False
+    with open(path, 'wb') as output_file:
+        output_file.write(data)
+    return True
+
+def target_values(project_name: str, region: str, dataset: str, sink_project: str) -> dict:
+    return {
+        '<project-name>': project_name,
+        '<project>': sink_project or '<project>',
+        '<dataset-region>': region,
+        '<dataset>': dataset,
+    }
+
+def generate_target(target: tuple) -> tuple:
+    project_name, region, dataset, sink_project, output_directory = target
+    values = target_values(project_name, region, dataset, sink_project)
+
+    written = 0
+    unchanged = 0
+    for current_directory, name, parts in compiled_templates:
+        # Check if output directory exists, if not create it
+        output_base_path = os.path.join(output_directory, current_directory)
+        os.makedirs(output_base_path, exist_ok=True)
+
+        # Write the output file out
+        if write_if_changed(os.path.join(output_base_path, name), render_template(parts, values)):
+            written += 1
+        else:
+            unchanged += 1
+    return written, unchanged
+
 def main() -> None:
     parser = init_argparse()
     args = parser.parse_args()
 
-    project_name = args.project
-    region = args.location
-    dataset = args.dataset
     output_directory = args.output
 
-    # If output directory doesn't exist create it
-    if not os.path.exists(output_directory):
-        os.mkdir(output_directory)
+    if args.targets:
+        if args.project:
+            parser.error('pass either a project or --targets, not both')
+        targets = load_targets(args.targets, args.location, args.dataset)
+        seen = set()
+        duplicates = sorted({project for project, _, _ in targets if project in seen or seen.add(project)})
+        if duplicates:
+            parser.error(f"duplicate projects in {args.targets}: {', '.join(duplicates)}")
+        jobs = [(project, location, dataset, args.sink_project, os.path.join(output_directory, project))
+                for project, location, dataset in targets]
+    elif args.project:
+        jobs = [(args.project, args.location, args.dataset, args.sink_project, output_directory)]
+    else:
+        parser.error('a project or --targets is required')
 
-    for current_directory in directories:
-        # Cycle over each file in the directories
-        for filename in os.scandir(current_directory):
-            # Only grab SQL files
-            if filename.is_file() and '.sql' in filename.path:
-                file = open(filename.path)
-                contents = file.read()
-                file.close()
-
-                # Perform a replace on the contents
-                contents = contents.replace('<project-name>', project_name)
-                contents = contents.replace('<dataset-region>', region)
-                contents = contents.replace('<dataset>', dataset)
-
-                # Check if output directory exists, if not create it
-                output_base_path = output_directory + '/' + current_directory
-                if not os.path.exists(output_directory):
-                    os.mkdir(output_directory)
-                if not os.path.exists(output_base_path):
-                    os.mkdir(output_base_path)
-
-                # Write the output file out
-                output_filename = output_base_path +  '/' + filename.name
-                output_file = open(output_filename, "w")
-                output_file.write(contents)
-                output_file.close()
+    sink_layout = args.sink_layout
+    if (sink_layout == 'auto' or args.report_savings) and not args.sink_project:
+        parser.error('--sink-layout auto and --report-savings need --sink-project')
+    if sink_layout == 'auto':
+        sink_layout = detect_sink_layout(args.sink_project, args.dataset)
+        print(f"Detected {sink_layout} layout for {args.sink_project}.{args.dataset}.{sink_table}")
+
+    start_time = time.time()
+    templates = load_templates(sink_layout)
+
+    if len(jobs) == 1 or args.workers <= 1:
+        init_worker(templates)
+        results = [generate_target(job) for job in jobs]
+    else:
+        # Templates are shipped to each worker once, not with every target
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(templates,)) as executor:
+            results = list(executor.map(generate_target, jobs,
+                                        chunksize=max(1, len(jobs) // (args.workers * 4))))
+
+    written = sum(result[0] for result in results)
+    unchanged = sum(result[1] for result in results)
+    print(f"Generated {len(templates)} files for {len(jobs)} target(s) in {time.time() - start_time:.1f}s: "
+          f"{written} written, {unchanged} unchanged")
+
+    # Bytes saved are measured on the first target; the rewrite does not depend on the target
+    if args.report_savings:
+        report_savings(load_templates(), templates, target_values(*jobs[0][:4]))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -8,13 +8,16 @@
 --          - Resource consumption differences
 --          - Growth trends year-over-year
 --
--- Method: Uses pre-classified traffic_classification table (Phase 1 output)
---         Hourly granularity for overall patterns (Track 1)
+-- Method: Uses the hourly roll-up of the pre-classified traffic_classification
+--         table (traffic_classification_hourly_cube, maintained by
+--         scripts/refresh_traffic_cube.py). Hourly granularity for overall
+--         patterns (Track 1). Distinct counts come from HLL sketches and
+--         percentiles from KLL sketches, both merged per hour.
 --
 -- Covers: 9 periods (Sep 2022 - Oct 2025), 21 months
 --
--- Cost estimate: ~1-5GB (queries classified table, not raw audit logs!)
--- Runtime estimate: 2-5 minutes (much faster than inline classification)
+-- Cost estimate: MBs (queries the hourly cube, not the job-level table)
+-- Runtime estimate: seconds
 -- ============================================================================
 
 -- ============================================================================
@@ -37,58 +40,55 @@ period_classification AS (
     CASE 
       WHEN analysis_period_label LIKE 'Peak%' THEN 'PEAK'
       ELSE 'NON_PEAK'
-    END AS period_type,
-    analysis_start_date,
-    analysis_end_date,
-    DATE_DIFF(analysis_end_date, analysis_start_date, DAY) AS period_days
-  FROM `narvar-data-lake.query_opt.traffic_classification`
+    END AS period_type
+  FROM `narvar-data-lake.query_opt.traffic_classification_hourly_cube`
   WHERE (analyze_periods IS NULL OR analysis_period_label IN UNNEST(analyze_periods))
 ),
 
 -- Hourly aggregation (Track 1: Overall patterns)
 hourly_patterns AS (
   SELECT
-    t.analysis_period_label,
+    c.analysis_period_label,
     pc.period_type,
-    DATE(t.start_time) AS date,
-    EXTRACT(HOUR FROM t.start_time) AS hour_of_day,
-    EXTRACT(DAYOFWEEK FROM t.start_time) AS day_of_week,
-    FORMAT_TIMESTAMP('%A', t.start_time) AS day_name,
+    DATE(c.hour) AS date,
+    EXTRACT(HOUR FROM c.hour) AS hour_of_day,
+    EXTRACT(DAYOFWEEK FROM c.hour) AS day_of_week,
+    FORMAT_TIMESTAMP('%A', c.hour) AS day_name,
     
     -- Consumer category breakdown
-    t.consumer_category,
-    t.consumer_subcategory,
+    c.consumer_category,
+    c.consumer_subcategory,
     
-    -- Volume metrics
-    COUNT(*) AS jobs,
-    COUNT(DISTINCT t.principal_email) AS unique_principals,
-    COUNT(DISTINCT t.project_id) AS unique_projects,
-    COUNT(DISTINCT t.retailer_moniker) AS unique_retailers,
+    -- Volume metrics (distinct principals/projects merged from HLL sketches)
+    SUM(c.jobs) AS jobs,
+    HLL_COUNT.MERGE(c.principals_sketch) AS unique_principals,
+    HLL_COUNT.MERGE(c.projects_sketch) AS unique_projects,
+    COUNT(DISTINCT c.retailer_moniker) AS unique_retailers,
     
-    -- Execution time metrics
-    ROUND(AVG(t.execution_time_seconds), 2) AS avg_exec_seconds,
-    ROUND(APPROX_QUANTILES(t.execution_time_seconds, 100)[OFFSET(50)], 2) AS p50_exec_seconds,
-    ROUND(APPROX_QUANTILES(t.execution_time_seconds, 100)[OFFSET(95)], 2) AS p95_exec_seconds,
-    ROUND(APPROX_QUANTILES(t.execution_time_seconds, 100)[OFFSET(99)], 2) AS p99_exec_seconds,
+    -- Execution time metrics (percentiles merged from KLL sketches)
+    ROUND(SUM(c.execution_seconds_sum) / NULLIF(SUM(c.jobs_with_execution_time), 0), 2) AS avg_exec_seconds,
+    ROUND(KLL_QUANTILES.MERGE_POINT_FLOAT64(c.execution_seconds_sketch, 0.50), 2) AS p50_exec_seconds,
+    ROUND(KLL_QUANTILES.MERGE_POINT_FLOAT64(c.execution_seconds_sketch, 0.95), 2) AS p95_exec_seconds,
+    ROUND(KLL_QUANTILES.MERGE_POINT_FLOAT64(c.execution_seconds_sketch, 0.99), 2) AS p99_exec_seconds,
     
     -- Slot consumption
-    ROUND(SUM(t.slot_hours), 2) AS total_slot_hours,
-    ROUND(AVG(t.slot_hours), 4) AS avg_slot_hours_per_job,
-    ROUND(AVG(t.approximate_slot_count), 2) AS avg_concurrent_slots,
+    ROUND(SUM(c.slot_hours), 2) AS total_slot_hours,
+    ROUND(SUM(c.slot_hours) / NULLIF(SUM(c.jobs_with_slot_hours), 0), 4) AS avg_slot_hours_per_job,
+    ROUND(SUM(c.approximate_slot_count_sum) / NULLIF(SUM(c.jobs_with_slot_count), 0), 2) AS avg_concurrent_slots,
     
     -- Cost
-    ROUND(SUM(t.estimated_slot_cost_usd), 2) AS total_cost_usd,
+    ROUND(SUM(c.estimated_slot_cost_usd), 2) AS total_cost_usd,
     
     -- QoS metrics
-    COUNTIF(t.is_qos_violation) AS qos_violations,
-    ROUND(COUNTIF(t.is_qos_violation) / NULLIF(COUNTIF(t.qos_status IN ('QoS_MET', 'QoS_VIOLATION')), 0) * 100, 2) AS qos_violation_pct
+    SUM(c.qos_violations) AS qos_violations,
+    ROUND(SUM(c.qos_violations) / NULLIF(SUM(c.qos_evaluated_jobs), 0) * 100, 2) AS qos_violation_pct
     
-  FROM `narvar-data-lake.query_opt.traffic_classification` t
+  FROM `narvar-data-lake.query_opt.traffic_classification_hourly_cube` c
   INNER JOIN period_classification pc USING (analysis_period_label)
-  WHERE (analyze_periods IS NULL OR t.analysis_period_label IN UNNEST(analyze_periods))
+  WHERE (analyze_periods IS NULL OR c.analysis_period_label IN UNNEST(analyze_periods))
   GROUP BY 
-    t.analysis_period_label, pc.period_type, date, hour_of_day, 
-    day_of_week, day_name, t.consumer_category, t.consumer_subcategory
+    c.analysis_period_label, pc.period_type, date, hour_of_day, 
+    day_of_week, day_name, c.consumer_category, c.consumer_subcategory
 )
 SELECT * FROM hourly_patterns;
 
@@ -252,7 +252,8 @@ ORDER BY MAX(CASE WHEN year = 2024 THEN total_slot_hours END) DESC;
 -- ============================================================================
 --
 -- This query provides OVERALL TRENDS (Track 1) for capacity planning.
--- Uses pre-classified traffic_classification table (much faster than inline classification).
+-- Uses the hourly cube over traffic_classification (refresh it after classification runs:
+-- python refresh_traffic_cube.py, or run_classification_all_periods.py --refresh-cube).
 --
 -- OUTPUT MODES (uncomment desired section):
 -- 1. Summary by category: Peak vs non-peak comparison (default)
@@ -262,8 +263,8 @@ ORDER BY MAX(CASE WHEN year = 2024 THEN total_slot_hours END) DESC;
 -- 5. Year-over-year growth: Historical growth trends
 --
 -- PERFORMANCE:
--- - ~2-5 minutes (vs 30-60 minutes for old inline classification approach)
--- - Queries only classified table (~20GB) vs raw audit logs (~200GB+)
+-- - Seconds (vs 2-5 minutes on traffic_classification, 30-60 minutes inline)
+-- - Queries only the hourly cube (MBs) vs classified table (~20GB) vs raw audit logs (~200GB+)
 --
 -- COMPLEMENTS:
 -- - identify_capacity_stress_periods.sql: Stress detection (Track 2)
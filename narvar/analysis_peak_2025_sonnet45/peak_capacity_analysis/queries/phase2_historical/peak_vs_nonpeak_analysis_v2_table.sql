@@ -1,6 +1,8 @@
 -- ============================================================================
 -- PEAK VS NON-PEAK TRAFFIC ANALYSIS - TABLE CREATION
 -- ============================================================================
+-- Reads the hourly cube (traffic_classification_hourly_cube), refreshed by
+-- scripts/refresh_traffic_cube.py
 
 DECLARE analyze_periods ARRAY<STRING> DEFAULT NULL;  -- NULL = all periods
 
@@ -17,51 +19,48 @@ period_classification AS (
     CASE 
       WHEN analysis_period_label LIKE 'Peak%' THEN 'PEAK'
       ELSE 'NON_PEAK'
-    END AS period_type,
-    analysis_start_date,
-    analysis_end_date,
-    DATE_DIFF(analysis_end_date, analysis_start_date, DAY) AS period_days
-  FROM `narvar-data-lake.query_opt.traffic_classification`
+    END AS period_type
+  FROM `narvar-data-lake.query_opt.traffic_classification_hourly_cube`
   WHERE (analyze_periods IS NULL OR analysis_period_label IN UNNEST(analyze_periods))
 ),
 
 hourly_patterns AS (
   SELECT
-    t.analysis_period_label,
+    c.analysis_period_label,
     pc.period_type,
-    DATE(t.start_time) AS date,
-    EXTRACT(HOUR FROM t.start_time) AS hour_of_day,
-    EXTRACT(DAYOFWEEK FROM t.start_time) AS day_of_week,
-    FORMAT_TIMESTAMP('%A', t.start_time) AS day_name,
+    DATE(c.hour) AS date,
+    EXTRACT(HOUR FROM c.hour) AS hour_of_day,
+    EXTRACT(DAYOFWEEK FROM c.hour) AS day_of_week,
+    FORMAT_TIMESTAMP('%A', c.hour) AS day_name,
     
-    t.consumer_category,
-    t.consumer_subcategory,
+    c.consumer_category,
+    c.consumer_subcategory,
     
-    COUNT(*) AS jobs,
-    COUNT(DISTINCT t.principal_email) AS unique_principals,
-    COUNT(DISTINCT t.project_id) AS unique_projects,
-    COUNT(DISTINCT t.retailer_moniker) AS unique_retailers,
+    SUM(c.jobs) AS jobs,
+    HLL_COUNT.MERGE(c.principals_sketch) AS unique_principals,
+    HLL_COUNT.MERGE(c.projects_sketch) AS unique_projects,
+    COUNT(DISTINCT c.retailer_moniker) AS unique_retailers,
     
-    ROUND(AVG(t.execution_time_seconds), 2) AS avg_exec_seconds,
-    ROUND(APPROX_QUANTILES(t.execution_time_seconds, 100)[OFFSET(50)], 2) AS p50_exec_seconds,
-    ROUND(APPROX_QUANTILES(t.execution_time_seconds, 100)[OFFSET(95)], 2) AS p95_exec_seconds,
-    ROUND(APPROX_QUANTILES(t.execution_time_seconds, 100)[OFFSET(99)], 2) AS p99_exec_seconds,
+    ROUND(SUM(c.execution_seconds_sum) / NULLIF(SUM(c.jobs_with_execution_time), 0), 2) AS avg_exec_seconds,
+    ROUND(KLL_QUANTILES.MERGE_POINT_FLOAT64(c.execution_seconds_sketch, 0.50), 2) AS p50_exec_seconds,
+    ROUND(KLL_QUANTILES.MERGE_POINT_FLOAT64(c.execution_seconds_sketch, 0.95), 2) AS p95_exec_seconds,
+    ROUND(KLL_QUANTILES.MERGE_POINT_FLOAT64(c.execution_seconds_sketch, 0.99), 2) AS p99_exec_seconds,
     
-    ROUND(SUM(t.slot_hours), 2) AS total_slot_hours,
-    ROUND(AVG(t.slot_hours), 4) AS avg_slot_hours_per_job,
-    ROUND(AVG(t.approximate_slot_count), 2) AS avg_concurrent_slots,
+    ROUND(SUM(c.slot_hours), 2) AS total_slot_hours,
+    ROUND(SUM(c.slot_hours) / NULLIF(SUM(c.jobs_with_slot_hours), 0), 4) AS avg_slot_hours_per_job,
+    ROUND(SUM(c.approximate_slot_count_sum) / NULLIF(SUM(c.jobs_with_slot_count), 0), 2) AS avg_concurrent_slots,
     
-    ROUND(SUM(t.estimated_slot_cost_usd), 2) AS total_cost_usd,
+    ROUND(SUM(c.estimated_slot_cost_usd), 2) AS total_cost_usd,
     
-    COUNTIF(t.is_qos_violation) AS qos_violations,
-    ROUND(COUNTIF(t.is_qos_violation) / NULLIF(COUNTIF(t.qos_status IN ('QoS_MET', 'QoS_VIOLATION')), 0) * 100, 2) AS qos_violation_pct
+    SUM(c.qos_violations) AS qos_violations,
+    ROUND(SUM(c.qos_violations) / NULLIF(SUM(c.qos_evaluated_jobs), 0) * 100, 2) AS qos_violation_pct
     
-  FROM `narvar-data-lake.query_opt.traffic_classification` t
+  FROM `narvar-data-lake.query_opt.traffic_classification_hourly_cube` c
   INNER JOIN period_classification pc USING (analysis_period_label)
-  WHERE (analyze_periods IS NULL OR t.analysis_period_label IN UNNEST(analyze_periods))
+  WHERE (analyze_periods IS NULL OR c.analysis_period_label IN UNNEST(analyze_periods))
   GROUP BY 
-    t.analysis_period_label, pc.period_type, date, hour_of_day, 
-    day_of_week, day_name, t.consumer_category, t.consumer_subcategory
+    c.analysis_period_label, pc.period_type, date, hour_of_day, 
+    day_of_week, day_name, c.consumer_category, c.consumer_subcategory
 ),
 
 peak_by_year AS (
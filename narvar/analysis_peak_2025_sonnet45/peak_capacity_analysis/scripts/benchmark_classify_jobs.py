@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Benchmark + parity check for classification_vectorized.classify_jobs
+
+Purpose: 1. Prove classify_jobs matches the v1.4 SQL semantics on a synthetic
+            fixture, against a row-by-row port of the original v1.4 CASE blocks
+            (kept verbatim here as a frozen reference - do not "update" it)
+         2. Time classify_jobs on a large fixture (default 10M rows)
+
+Usage:
+    python benchmark_classify_jobs.py                      # 200K parity rows, 10M timed rows
+    python benchmark_classify_jobs.py --rows 1000000 --parity-rows 50000
+"""
+
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from classification_vectorized import classify_jobs
+
+
+# ============================================================================
+# FROZEN v1.4 REFERENCE (row-by-row port of SQL_TEMPLATE, 2025-11-06)
+# ============================================================================
+
+V14_MONITOR_BASE_PROJECTS = ('monitor-base-us-prod', 'monitor-base-us-qa', 'monitor-base-us-stg')
+V14_SERVICE_ACCOUNT_EXCLUDE = (r'(airflow|composer|gke|compute|cdp|dataflow|etl|eddmodel|analytics-api|messaging|'
+                               r'shopify|ipaas|growthbook|metric-layer|retool|doit-cmp|bigquerydatatransfer|aiplatform|'
+                               r'looker|metabase|n8n|noflake|salesforce|fivetran|data-ml-jobs|rudderstack|vertex|'
+                               r'dev-testing|appspot|churnzero|promise-ai|carriers-ml)')
+
+V14_CATEGORY = [
+    (r'looker.*@.*\.iam\.gserviceaccount\.com', 'EXTERNAL'),
+    (r'(airflow|composer)', 'AUTOMATED'),
+    (r'gke-prod|gke-[a-z0-9]+-sumatra', 'AUTOMATED'),
+    (r'\d+-compute@developer\.gserviceaccount\.com', 'AUTOMATED'),
+    (r'(cdp|customer-data)', 'AUTOMATED'),
+    (r'(dataflow|etl)', 'AUTOMATED'),
+    (r'(eddmodel|ai-platform)', 'AUTOMATED'),
+    (r'analytics-api-bigquery-access', 'AUTOMATED'),
+    (r'^messaging@', 'AUTOMATED'),
+    (r'shopify.*runner', 'AUTOMATED'),
+    (r'ipaas-integration', 'AUTOMATED'),
+    (r'growthbook', 'AUTOMATED'),
+    (r'metric-layer', 'AUTOMATED'),
+    (r'retool', 'AUTOMATED'),
+    (r'(nub-tenant|carrierstest|service-samoa)@', 'AUTOMATED'),
+    (r'doit-cmp', 'AUTOMATED'),
+    (r'gcp-sa-bigquerydatatransfer', 'AUTOMATED'),
+    (r'gcp-sa-aiplatform', 'AUTOMATED'),
+    (r'qa-automation-bigquery', 'AUTOMATED'),
+    (r'noflake-', 'AUTOMATED'),
+    (r'salesforce-bq-access', 'AUTOMATED'),
+    (r'fivetran-production', 'AUTOMATED'),
+    (r'data-ml-jobs', 'AUTOMATED'),
+    (r'rudderstackbqwriter', 'AUTOMATED'),
+    (r'gcp-ship-vertex-ai', 'AUTOMATED'),
+    (r'dev-testing@narvar-ml', 'AUTOMATED'),
+    (r'narvar-ml-prod@appspot', 'AUTOMATED'),
+    (r'vertex-pipeline-sa', 'AUTOMATED'),
+    (r'churnzero-bq-access', 'AUTOMATED'),
+    (r'promise-ai@', 'AUTOMATED'),
+    (r'carriers-ml-service', 'AUTOMATED'),
+    (r'@narvar\.com$', 'INTERNAL'),
+    (r'metabase.*@.*\.iam\.gserviceaccount\.com', 'INTERNAL'),
+    (r'n8n', 'INTERNAL'),
+]
+
+V14_SUBCATEGORY = [
+    (r'looker.*@.*\.iam\.gserviceaccount\.com', 'HUB'),
+    (r'(airflow|composer)', 'AIRFLOW_COMPOSER'),
+    (r'gke-prod|gke-[a-z0-9]+-sumatra', 'GKE_WORKLOAD'),
+    (r'\d+-compute@developer\.gserviceaccount\.com', 'COMPUTE_ENGINE'),
+    (r'(cdp|customer-data)', 'CDP'),
+    (r'(dataflow|etl)', 'ETL_DATAFLOW'),
+    (r'(eddmodel|ai-platform)', 'ML_INFERENCE'),
+    (r'analytics-api-bigquery-access', 'ANALYTICS_API'),
+    (r'^messaging@', 'MESSAGING'),
+    (r'shopify.*runner', 'SHOPIFY_INTEGRATION'),
+    (r'ipaas-integration', 'IPAAS_INTEGRATION'),
+    (r'growthbook', 'GROWTHBOOK'),
+    (r'metric-layer', 'METRIC_LAYER'),
+    (r'retool', 'RETOOL'),
+    (r'doit-cmp', 'DOIT_CMP'),
+    (r'gcp-sa-bigquerydatatransfer', 'BQ_DATA_TRANSFER'),
+    (r'gcp-sa-aiplatform', 'AI_PLATFORM'),
+    (r'(nub-tenant|carrierstest|service-samoa)@', 'DOMAIN_SERVICE'),
+    (r'qa-automation-bigquery', 'QA_AUTOMATION'),
+    (r'noflake-', 'NOFLAKE_RETIRED'),
+    (r'salesforce-bq-access', 'SALESFORCE_INTEGRATION'),
+    (r'fivetran-production', 'FIVETRAN_ETL'),
+    (r'data-ml-jobs', 'ML_JOBS'),
+    (r'rudderstackbqwriter', 'RUDDERSTACK_ETL'),
+    (r'gcp-ship-vertex-ai', 'VERTEX_AI'),
+    (r'dev-testing@narvar-ml', 'ML_DEV_TESTING'),
+    (r'narvar-ml-prod@appspot', 'ML_APPSPOT'),
+    (r'vertex-pipeline-sa', 'VERTEX_PIPELINE'),
+    (r'churnzero-bq-access', 'CHURNZERO_INTEGRATION'),
+    (r'promise-ai@', 'PROMISE_AI'),
+    (r'carriers-ml-service', 'CARRIERS_ML'),
+]
+
+
+def _contains(pattern: str, value) -> bool:
+    """REGEXP_CONTAINS(LOWER(value), pattern); NULL never matches."""
+    return isinstance(value, str) and re.search(pattern, value.lower()) is not None
+
+
+def reference_classify_row(project_id, principal_email, user_agent, execution_time_seconds, retailer_moniker):
+    """One job through the v1.4 CASE blocks, in their original order."""
+    is_monitor = isinstance(project_id, str) and project_id.lower().startswith('monitor-')
+    is_monitor_base = project_id in V14_MONITOR_BASE_PROJECTS
+    is_looker = _contains(r'looker.*@.*\.iam\.gserviceaccount\.com', principal_email)
+
+    # consumer_category
+    category = None
+    if is_monitor_base:
+        category = 'AUTOMATED'
+    elif is_monitor:
+        category = 'EXTERNAL'
+    else:
+        for pattern, value in V14_CATEGORY:
+            if _contains(pattern, principal_email):
+                category = value
+                break
+        if category is None:
+            category = 'INTERNAL' if _contains(r'(tableau|powerbi)', user_agent) else 'UNCLASSIFIED'
+
+    # consumer_subcategory
+    subcategory = None
+    if is_monitor and isinstance(retailer_moniker, str):
+        subcategory = 'MONITOR'
+    elif is_monitor_base:
+        subcategory = 'MONITOR_BASE'
+    elif is_monitor:
+        subcategory = 'MONITOR_UNMATCHED'
+    else:
+        for pattern, value in V14_SUBCATEGORY:
+            if _contains(pattern, principal_email):
+                subcategory = value
+                break
+    if subcategory is None:
+        if (_contains(r'iam\.gserviceaccount\.com$', principal_email)
+                and not _contains(V14_SERVICE_ACCOUNT_EXCLUDE, principal_email)):
+            subcategory = 'SERVICE_ACCOUNT_OTHER'
+        elif _contains(r'metabase.*@.*\.iam\.gserviceaccount\.com', principal_email):
+            subcategory = 'METABASE'
+        elif _contains(r'n8n', principal_email):
+            subcategory = 'N8N_WORKFLOW'
+        elif _contains(r'@narvar\.com$', principal_email):
+            subcategory = 'ADHOC_USER'
+        elif _contains(r'(tableau|powerbi)', user_agent):
+            subcategory = 'OTHER_BI_TOOL'
+        elif _contains(r'iam\.gserviceaccount\.com$', principal_email):
+            subcategory = 'INTERNAL_SERVICE_ACCOUNT'
+        else:
+            subcategory = 'UNCLASSIFIED'
+
+    # qos_status (NULL > threshold is not TRUE -> QoS_MET)
+    seconds = execution_time_seconds
+    if is_monitor or is_looker:
+        qos_status = 'QoS_VIOLATION' if seconds is not None and seconds > 30 else 'QoS_MET'
+    elif _contains(r'(metabase|@narvar\.com$)', principal_email):
+        qos_status = 'QoS_VIOLATION' if seconds is not None and seconds > 480 else 'QoS_MET'
+    else:
+        qos_status = 'QoS_REQUIRES_SCHEDULE_DATA'
+
+    # priority_level
+    if is_monitor or is_looker:
+        priority = 1
+    elif _contains(r'(airflow|composer|gke|compute|cdp|dataflow|etl|eddmodel|analytics-api|messaging|shopify|'
+                   r'ipaas|growthbook|metric-layer|retool)', principal_email):
+        priority = 2
+    elif _contains(r'(metabase|@narvar\.com$|n8n)', principal_email):
+        priority = 3
+    else:
+        priority = 4
+
+    return category, subcategory, qos_status, priority
+
+
+# ============================================================================
+# FIXTURE
+# ============================================================================
+
+# Fragments that hit every rule, overlaps between rules and the exclusion list
+PRINCIPAL_FRAGMENTS = [
+    'looker', 'airflow', 'composer', 'gke-prod', 'gke-a1b2-sumatra', 'gke', '123-compute@developer.gserviceaccount.com',
+    'compute', 'cdp', 'customer-data', 'dataflow', 'etl', 'eddmodel', 'ai-platform', 'analytics-api-bigquery-access',
+    'analytics-api', 'messaging@', 'shopify-sync-runner', 'shopify', 'ipaas-integration', 'ipaas', 'growthbook',
+    'metric-layer', 'retool', 'doit-cmp', 'gcp-sa-bigquerydatatransfer', 'gcp-sa-aiplatform', 'nub-tenant@',
+    'carrierstest@', 'service-samoa@', 'qa-automation-bigquery', 'noflake-', 'salesforce-bq-access',
+    'fivetran-production', 'data-ml-jobs', 'rudderstackbqwriter', 'gcp-ship-vertex-ai', 'dev-testing@narvar-ml',
+    'narvar-ml-prod@appspot', 'vertex-pipeline-sa', 'churnzero-bq-access', 'promise-ai@', 'carriers-ml-service',
+    'metabase', 'MetaBase', 'n8n', 'jane.doe', 'svc', 'report', 'x',
+]
+PRINCIPAL_DOMAINS = ['@narvar.com', '@NARVAR.com', '@proj.iam.gserviceaccount.com', '@gmail.com',
+                     '@developer.gserviceaccount.com', '']
+USER_AGENTS = [None, 'Tableau 2023.3', 'PowerBI/2.1', 'python-bigquery/3.10', 'Looker', 'google-api-go-client']
+PROJECTS = ['narvar-data-lake', 'narvar-ml-prod', 'monitor-base-us-prod', 'monitor-base-us-qa',
+            'monitor-5c646e5-us-prod', 'monitor-f333b31-us-qa', 'monitor-0000000-us-stg', 'Monitor-ABC-us-prod', None]
+
+
+def build_principal_pool(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Distinct-ish principals built from rule fragments (a few with NULL)."""
+    pool = []
+    for _ in range(size):
+        parts = rng.choice(PRINCIPAL_FRAGMENTS, size=rng.integers(1, 4), replace=False)
+        pool.append('-'.join(parts) + rng.choice(PRINCIPAL_DOMAINS))
+    pool[:3] = [None, '', 'messaging@narvar.com']
+    return np.array(pool, dtype=object)
+
+
+def build_fixture(rows: int, seed: int = 7, pool_size: int = 5000) -> pd.DataFrame:
+    """Synthetic jobs frame with the columns classify_jobs reads."""
+    rng = np.random.default_rng(seed)
+    principals = build_principal_pool(pool_size, rng)
+    projects = np.array(PROJECTS, dtype=object)
+    agents = np.array(USER_AGENTS, dtype=object)
+
+    project_ids = projects[rng.integers(0, len(projects), rows)]
+    is_matched_monitor = np.isin(project_ids, ['monitor-5c646e5-us-prod', 'monitor-f333b31-us-qa'])
+    seconds = rng.exponential(120, rows).round().astype(float)
+    seconds[rng.random(rows) < 0.01] = np.nan
+
+    return pd.DataFrame({
+        'project_id': project_ids,
+        'principal_email': principals[rng.integers(0, len(principals), rows)],
+        'user_agent': agents[rng.integers(0, len(agents), rows)],
+        'execution_time_seconds': seconds,
+        'retailer_moniker': np.where(is_matched_monitor, 'some-retailer', None),
+    })
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def check_parity(rows: int) -> int:
+    """Compare classify_jobs with the frozen v1.4 reference; return mismatch count."""
+    fixture = build_fixture(rows)
+    print(f"🔍 Parity: {len(fixture):,} rows, {fixture['principal_email'].nunique(dropna=False):,} principals")
+
+    start_time = time.time()
+    expected = [
+        reference_classify_row(p, e, ua, None if pd.isna(s) else s, r)
+        for p, e, ua, s, r in zip(fixture['project_id'], fixture['principal_email'], fixture['user_agent'],
+                                  fixture['execution_time_seconds'], fixture['retailer_moniker'])
+    ]
+    print(f"   Reference (row by row): {time.time() - start_time:.1f}s")
+    expected = pd.DataFrame(expected, columns=['consumer_category', 'consumer_subcategory', 'qos_status', 'priority_level'])
+
+    actual = classify_jobs(fixture)
+    mismatches = 0
+    for column in expected.columns:
+        diff = actual[column].astype(object).to_numpy() != expected[column].to_numpy()
+        mismatches += int(diff.sum())
+        status = "✅" if not diff.any() else "❌"
+        print(f"   {status} {column:<22} {int(diff.sum()):,} mismatches")
+        if diff.any():
+            sample = fixture[diff].assign(expected=expected[column][diff], actual=actual[column][diff]).head(5)
+            print(sample.to_string())
+    return mismatches
+
+
+def run_benchmark(rows: int):
+    """Time classify_jobs on a large fixture."""
+    print(f"\n⏱️  Timing: building {rows:,} row fixture...")
+    fixture = build_fixture(rows, seed=11)
+    start_time = time.time()
+    classified = classify_jobs(fixture)
+    elapsed = time.time() - start_time
+    print(f"   classify_jobs: {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(classified['consumer_category'].value_counts().to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parity check and benchmark for classify_jobs')
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Rows for the timing run (0 to skip)')
+    parser.add_argument('--parity-rows', type=int, default=200_000, help='Rows for the parity check')
+    args = parser.parse_args()
+
+    mismatches = check_parity(args.parity_rows)
+    if args.rows:
+        run_benchmark(args.rows)
+
+    if mismatches:
+        print(f"\n❌ classify_jobs differs from v1.4 on {mismatches:,} values")
+        sys.exit(1)
+    print("\n✅ classify_jobs matches the v1.4 SQL semantics on the fixture")
+
+
+if __name__ == "__main__":
+    main()
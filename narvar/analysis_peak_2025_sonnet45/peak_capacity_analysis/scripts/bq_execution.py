@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+BigQuery Execution Layer - shared client, pricing and query metadata
+
+Purpose: One place for the plumbing every runner script needs:
+         - a pooled BigQuery (and Storage Read API) client per project/location,
+           so auth and connection setup happen once per process
+         - a single pricing table for on-demand bytes and reservation slot-hours
+         - SQL/results paths resolved from this directory, not the working directory
+         - a dry-run budget gate on every submission (per-query and per-session
+           byte budgets) with an estimated-vs-actual calibration log
+         - job labels, timing and a structured result dict
+
+Requirements:
+- google-cloud-bigquery
+- google-cloud-bigquery-storage (only for get_bqstorage_client)
+
+Usage (from a runner script):
+    from bq_execution import execute_query, read_sql, print_job_summary
+
+    result = execute_query(read_sql('phase2_consumer_analysis/looker_qos_deep_dive.sql'),
+                           script='looker_qos_deep_dive', max_gb=200)
+    if result['status'] == 'success':
+        print_job_summary(result)
+        df = result['df']
+
+    # Runners expose the budget flags via add_budget_arguments()/configure_budget()
+    python run_looker_full_analysis.py --max-gb 300 --session-max-gb 1000
+    python run_looker_full_analysis.py --override-budget
+
+    # Standalone: dry-run SQL files and print bytes/cost
+    python bq_execution.py ../queries/phase2_consumer_analysis/*.sql
+
+    # Estimated vs actual bytes per script, from the calibration log
+    python bq_execution.py --calibration
+
+Budgets can also be set per environment with BQ_QUERY_BUDGET_GB,
+BQ_SESSION_BUDGET_GB and BQ_BUDGET_OVERRIDE=1.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import google.auth
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from classification_rules import SLOT_COST_PER_HOUR
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+DEFAULT_PROJECT_ID = "narvar-data-lake"
+DEFAULT_LOCATION = "US"
+CREDENTIAL_SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ANALYSIS_DIR = SCRIPT_DIR.parent
+QUERIES_DIR = ANALYSIS_DIR / 'queries'
+RESULTS_DIR = ANALYSIS_DIR / 'results'
+
+# Single pricing table for every cost printed by the scripts.
+# On-demand analysis is billed per TiB (2**40 bytes) of bytes billed; the $5/TB
+# used by older scripts was the pre-2023 list price.
+PRICING = {
+    'on_demand_usd_per_tib': 6.25,
+    'slot_hour_usd': SLOT_COST_PER_HOUR,  # Reservation rate used in traffic_classification
+}
+
+# Dry-run budget gate: every submission is dry-run first and refused when the
+# estimate exceeds the per-query budget, or would push the process past the
+# per-session budget, unless the budget is overridden.
+DEFAULT_QUERY_BUDGET_GB = float(os.environ.get('BQ_QUERY_BUDGET_GB', 500))
+DEFAULT_SESSION_BUDGET_GB = float(os.environ.get('BQ_SESSION_BUDGET_GB', 2000))
+CALIBRATION_LOG = ANALYSIS_DIR / 'logs' / 'bq_cost_calibration.jsonl'
+
+# Labels attached to every job (visible in INFORMATION_SCHEMA.JOBS and billing export)
+DEFAULT_JOB_LABELS = {
+    'analysis': 'peak_capacity',
+}
+
+
+# ============================================================================
+# CLIENT POOL
+# ============================================================================
+
+_client_pool: Dict[Tuple[str, str], bigquery.Client] = {}
+_bqstorage_pool: Dict[Tuple[str, str], object] = {}
+_pool_lock = threading.Lock()
+_credentials = None
+_credentials_lock = threading.Lock()
+
+_budget = {
+    'query_gb': DEFAULT_QUERY_BUDGET_GB,
+    'session_gb': DEFAULT_SESSION_BUDGET_GB,
+    'override': os.environ.get('BQ_BUDGET_OVERRIDE') == '1',
+}
+_session = {'queries': 0, 'estimated_bytes': 0, 'actual_bytes': 0}
+_session_lock = threading.Lock()
+
+
+def get_credentials():
+    """Return the process-wide Application Default Credentials, resolving them once."""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials, _ = google.auth.default(scopes=CREDENTIAL_SCOPES)
+        return _credentials
+
+
+def get_client(project: Optional[str] = None, location: Optional[str] = None) -> bigquery.Client:
+    """Return the process-wide BigQuery client for a project/location, creating it once."""
+    key = (project or DEFAULT_PROJECT_ID, location or DEFAULT_LOCATION)
+    with _pool_lock:
+        if key not in _client_pool:
+            _client_pool[key] = bigquery.Client(project=key[0], location=key[1], credentials=get_credentials())
+        return _client_pool[key]
+
+
+def get_bqstorage_client(client: Optional[bigquery.Client] = None):
+    """Return the Storage Read API client for a pooled client's project/location."""
+    from google.cloud import bigquery_storage
+
+    client = client or get_client()
+    key = (client.project, client.location)
+    with _pool_lock:
+        if key not in _bqstorage_pool:
+            _bqstorage_pool[key] = bigquery_storage.BigQueryReadClient(credentials=get_credentials())
+        return _bqstorage_pool[key]
+
+
+# ============================================================================
+# PATHS, PRICING AND LABELS
+# ============================================================================
+
+def resolve_query_path(query_file) -> Path:
+    """Resolve a SQL path: absolute, relative to the working directory, or under queries/."""
+    path = Path(query_file)
+    if path.is_absolute() or path.exists():
+        return path
+    return QUERIES_DIR / path
+
+
+def read_sql(query_file) -> str:
+    """Read a SQL file (see resolve_query_path for lookup order)."""
+    with open(resolve_query_path(query_file), 'r') as f:
+        return f.read()
+
+
+def results_path(file_name: str) -> Path:
+    """Return a path under results/, creating the parent directory."""
+    path = RESULTS_DIR / file_name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def estimate_cost_usd(bytes_billed: Optional[int]) -> float:
+    """On-demand cost of the given bytes billed."""
+    return (bytes_billed or 0) / 1024**4 * PRICING['on_demand_usd_per_tib']
+
+
+def slot_cost_usd(slot_ms: Optional[int]) -> float:
+    """Reservation cost of the given slot-milliseconds."""
+    return (slot_ms or 0) / 3_600_000 * PRICING['slot_hour_usd']
+
+
+def job_labels(script: Optional[str] = None, **extra) -> Dict[str, str]:
+    """Build job labels; values are lowercased and cut to BigQuery's label charset."""
+    labels = dict(DEFAULT_JOB_LABELS)
+    if script:
+        labels['script'] = script
+    labels.update({k: str(v) for k, v in extra.items() if v is not None})
+    return {
+        key: re.sub(r'[^a-z0-9_-]', '_', value.lower())[:63]
+        for key, value in labels.items()
+    }
+
+
+def build_job_config(job_config: Optional[bigquery.QueryJobConfig] = None,
+                     script: Optional[str] = None,
+                     labels: Optional[Dict[str, str]] = None) -> bigquery.QueryJobConfig:
+    """Return a job config carrying the standard labels (existing labels win)."""
+    job_config = job_config or bigquery.QueryJobConfig()
+    job_config.labels = {**job_labels(script, **(labels or {})), **(job_config.labels or {})}
+    return job_config
+
+
+# ============================================================================
+# BUDGET GATE
+# ============================================================================
+
+def configure_budget(query_gb: Optional[float] = None, session_gb: Optional[float] = None,
+                     override: Optional[bool] = None):
+    """Set the process-wide byte budgets (None keeps the current value)."""
+    if query_gb is not None:
+        _budget['query_gb'] = query_gb
+    if session_gb is not None:
+        _budget['session_gb'] = session_gb
+    if override is not None:
+        _budget['override'] = _budget['override'] or override
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser):
+    """Add --max-gb, --session-max-gb and --override-budget to a runner's parser."""
+    parser.add_argument('--max-gb', type=float,
+                        help=f'Per-query scan budget in GB (default: {DEFAULT_QUERY_BUDGET_GB:.0f})')
+    parser.add_argument('--session-max-gb', type=float,
+                        help=f'Scan budget for all queries of this run in GB (default: {DEFAULT_SESSION_BUDGET_GB:.0f})')
+    parser.add_argument('--override-budget', action='store_true',
+                        help='Submit queries even when the dry run exceeds the budget')
+
+
+def configure_budget_from_args(args: argparse.Namespace):
+    """Apply the flags added by add_budget_arguments()."""
+    configure_budget(args.max_gb, args.session_max_gb, args.override_budget)
+
+
+def check_budget(estimated_bytes: int, max_gb: Optional[float] = None,
+                 override: Optional[bool] = None) -> Optional[str]:
+    """Reserve the estimate against the session budget; return a refusal reason or None."""
+    query_gb = max_gb if max_gb is not None else _budget['query_gb']
+    override = _budget['override'] if override is None else override
+    estimated_gb = estimated_bytes / 1024**3
+
+    with _session_lock:
+        session_gb = (_session['estimated_bytes'] + estimated_bytes) / 1024**3
+        if not override:
+            if estimated_gb > query_gb:
+                return f"Estimated scan {estimated_gb:,.2f} GB exceeds the per-query budget of {query_gb:,.2f} GB"
+            if session_gb > _budget['session_gb']:
+                return (f"Estimated scan {estimated_gb:,.2f} GB would bring this session to "
+                        f"{session_gb:,.2f} GB, over the session budget of {_budget['session_gb']:,.2f} GB")
+        _session['queries'] += 1
+        _session['estimated_bytes'] += estimated_bytes
+    return None
+
+
+def record_calibration(submitted: Dict, query_job) -> Dict:
+    """Append estimated vs actual bytes of a finished job to CALIBRATION_LOG."""
+    estimated = submitted['estimate']['bytes_processed']
+    actual = query_job.total_bytes_processed or 0
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'script': submitted.get('script'),
+        'job_id': query_job.job_id,
+        'query_hash': submitted['query_hash'],
+        'estimated_bytes': estimated,
+        'actual_bytes_processed': actual,
+        'actual_bytes_billed': query_job.total_bytes_billed or 0,
+        'cache_hit': bool(query_job.cache_hit),
+        'actual_to_estimate': round(actual / estimated, 4) if estimated else None,
+    }
+    with _session_lock:
+        _session['actual_bytes'] += actual
+        CALIBRATION_LOG.parent.mkdir(parents=True, exist_ok=True)
+        with open(CALIBRATION_LOG, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    return entry
+
+
+def session_summary() -> Dict:
+    """Queries, estimated and actual bytes submitted by this process so far."""
+    with _session_lock:
+        return {**_session, 'budget': dict(_budget)}
+
+
+def load_calibration_log() -> List[Dict]:
+    """Read every entry of the calibration log."""
+    if not CALIBRATION_LOG.exists():
+        return []
+    with open(CALIBRATION_LOG, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_calibration_report():
+    """Print the actual/estimated byte ratio per script (BigQuery cache hits excluded)."""
+    entries = [e for e in load_calibration_log() if not e['cache_hit'] and e['estimated_bytes']]
+    if not entries:
+        print(f"No calibration entries in {CALIBRATION_LOG}")
+        return
+
+    by_script: Dict[str, List[Dict]] = {}
+    for entry in entries:
+        by_script.setdefault(entry['script'] or '(none)', []).append(entry)
+
+    print(f"\n{'Script':<40} {'Jobs':>6} {'Estimated GB':>14} {'Actual GB':>12} {'Actual/Est':>11}")
+    print("-" * 87)
+    for script, rows in sorted(by_script.items()):
+        estimated = sum(r['estimated_bytes'] for r in rows)
+        actual = sum(r['actual_bytes_processed'] for r in rows)
+        print(f"{script:<40} {len(rows):>6} {estimated / 1024**3:>14,.2f} {actual / 1024**3:>12,.2f} "
+              f"{actual / estimated:>11.2f}")
+
+
+# ============================================================================
+# EXECUTION
+# ============================================================================
+
+def dry_run_query(query: str, client: Optional[bigquery.Client] = None,
+                  job_config: Optional[bigquery.QueryJobConfig] = None) -> Dict:
+    """
+    Dry-run a query.
+
+    Returns:
+        Dict with status, bytes_processed, estimated_cost_usd and referenced_tables;
+        on failure, error and not_found (a referenced table or dataset is missing)
+    """
+    client = client or get_client()
+    config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    if job_config is not None:
+        config.query_parameters = job_config.query_parameters
+        config.default_dataset = job_config.default_dataset
+        config.labels = job_config.labels
+
+    try:
+        query_job = client.query(query, job_config=config)
+    except Exception as e:
+        return {'status': 'failed', 'error': str(e), 'not_found': isinstance(e, NotFound)}
+
+    bytes_processed = query_job.total_bytes_processed or 0
+    return {
+        'status': 'success',
+        'bytes_processed': bytes_processed,
+        'gb_processed': bytes_processed / 1024**3,
+        'estimated_cost_usd': estimate_cost_usd(bytes_processed),
+        'referenced_tables': [
+            f"{t.project}.{t.dataset_id}.{t.table_id}" for t in (query_job.referenced_tables or [])
+        ],
+    }
+
+
+def submit_query(
+    query: str,
+    client: Optional[bigquery.Client] = None,
+    script: Optional[str] = None,
+    labels: Optional[Dict[str, str]] = None,
+    job_config: Optional[bigquery.QueryJobConfig] = None,
+    max_gb: Optional[float] = None,
+    override_budget: Optional[bool] = None,
+) -> Dict:
+    """
+    Dry-run a query, check it against the byte budgets and submit it.
+
+    max_gb overrides the per-query budget for this call. Unless the budget is
+    overridden, maximum_bytes_billed is set to the per-query budget so
+    BigQuery enforces it as well. The job is not waited for; pass the result
+    to record_calibration() once it has finished.
+
+    Returns:
+        Dict with status 'running' (plus query_job), 'blocked' or 'failed'
+    """
+    client = client or get_client()
+    job_config = build_job_config(job_config, script, labels)
+    start_time = time.time()
+    query_hash = hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]
+
+    estimate = dry_run_query(query, client, job_config)
+    if estimate['status'] != 'success':
+        return {**estimate, 'script': script, 'duration_seconds': time.time() - start_time}
+
+    refusal = check_budget(estimate['bytes_processed'], max_gb, override_budget)
+    if refusal:
+        return {
+            'status': 'blocked',
+            'error': f"{refusal} (raise --max-gb/--session-max-gb or pass --override-budget)",
+            'script': script,
+            'estimate': estimate,
+            'duration_seconds': time.time() - start_time,
+        }
+    override = _budget['override'] if override_budget is None else override_budget
+    if not override and job_config.maximum_bytes_billed is None:
+        query_gb = max_gb if max_gb is not None else _budget['query_gb']
+        job_config.maximum_bytes_billed = int(query_gb * 1024**3)
+
+    try:
+        query_job = client.query(query, job_config=job_config)
+    except Exception as e:
+        return {'status': 'failed', 'error': str(e), 'not_found': isinstance(e, NotFound), 'script': script,
+                'estimate': estimate, 'duration_seconds': time.time() - start_time}
+
+    return {
+        'status': 'running',
+        'job_id': query_job.job_id,
+        'query_job': query_job,
+        'script': script,
+        'query_hash': query_hash,
+        'estimate': estimate,
+        'start_time': start_time,
+    }
+
+
+def execute_query(
+    query: str,
+    client: Optional[bigquery.Client] = None,
+    script: Optional[str] = None,
+    labels: Optional[Dict[str, str]] = None,
+    job_config: Optional[bigquery.QueryJobConfig] = None,
+    max_gb: Optional[float] = None,
+    override_budget: Optional[bool] = None,
+    to_dataframe: bool = True,
+) -> Dict:
+    """
+    Run a query on the pooled client through the budget gate and wait for it.
+
+    See submit_query() for the gate. With to_dataframe=False the RowIterator is
+    returned under 'row_iterator' for the caller to consume (e.g. result_sink.py).
+
+    Returns:
+        Dict with status, job_id, bytes_processed, bytes_billed,
+        estimated_cost_usd, slot_ms, cache_hit, estimate, timing and df/row_iterator
+    """
+    submitted = submit_query(query, client, script, labels, job_config, max_gb, override_budget)
+    if submitted['status'] != 'running':
+        return submitted
+
+    query_job = submitted['query_job']
+    start_time = submitted['start_time']
+    try:
+        rows = query_job.result()
+        query_seconds = time.time() - start_time
+        record_calibration(submitted, query_job)
+        df = rows.to_dataframe() if to_dataframe else None
+    except Exception as e:
+        return {
+            'status': 'failed',
+            'job_id': query_job.job_id,
+            'error': str(e),
+            'not_found': isinstance(e, NotFound),
+            'estimate': submitted['estimate'],
+            'duration_seconds': time.time() - start_time,
+        }
+
+    result = {
+        'status': 'success',
+        'job_id': query_job.job_id,
+        'query_job': query_job,
+        'total_rows': rows.total_rows,
+        'bytes_processed': query_job.total_bytes_processed or 0,
+        'bytes_billed': query_job.total_bytes_billed or 0,
+        'estimated_cost_usd': estimate_cost_usd(query_job.total_bytes_billed),
+        'slot_ms': query_job.slot_millis or 0,
+        'slot_cost_usd': slot_cost_usd(query_job.slot_millis),
+        'cache_hit': bool(query_job.cache_hit),
+        'estimate': submitted['estimate'],
+        'query_seconds': query_seconds,
+        'duration_seconds': time.time() - start_time,
+    }
+    if to_dataframe:
+        result['df'] = df
+    else:
+        result['row_iterator'] = rows
+    return result
+
+
+def print_job_summary(result: Dict, indent: str = ''):
+    """Print the timing, bytes and cost of an execute_query() result."""
+    cache_note = ' (cache hit)' if result['cache_hit'] else ''
+    print(f"{indent}✅ Query completed in {result['duration_seconds']:.1f}s{cache_note} - job {result['job_id']}")
+    print(f"{indent}📦 Bytes processed: {result['bytes_processed']:,} ({result['bytes_processed'] / 1024**3:.2f} GB)")
+    if result.get('estimate'):
+        print(f"{indent}🔍 Dry-run estimate: {result['estimate']['gb_processed']:,.2f} GB")
+    print(f"{indent}💰 Cost: ${result['estimated_cost_usd']:.4f} on-demand "
+          f"(${PRICING['on_demand_usd_per_tib']}/TiB), "
+          f"{result['slot_ms'] / 3_600_000:,.2f} slot-hours (${result['slot_cost_usd']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dry-run SQL files on the shared client')
+    parser.add_argument('query_files', nargs='*', help='SQL files (absolute, relative or under queries/)')
+    parser.add_argument('--project', help=f'GCP project (default: {DEFAULT_PROJECT_ID})')
+    parser.add_argument('--calibration', action='store_true',
+                        help='Print estimated vs actual bytes from the calibration log')
+    args = parser.parse_args()
+
+    if args.calibration:
+        print_calibration_report()
+        return
+    if not args.query_files:
+        parser.error('give SQL files to dry-run, or --calibration')
+
+    client = get_client(args.project)
+    failed = 0
+    for query_file in args.query_files:
+        estimate = dry_run_query(read_sql(query_file), client)
+        if estimate['status'] != 'success':
+            failed += 1
+            print(f"❌ {query_file}: {estimate['error']}")
+            continue
+        print(f"✅ {query_file}: {estimate['gb_processed']:,.2f} GB, ${estimate['estimated_cost_usd']:.4f}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,270 @@
 #!/usr/bin/env python3
 """
 Check estimated BigQuery query cost via dry run.
-Usage: python check_query_cost.py <query_file.sql>
+
+A single file prints the detailed estimate. Several files, directories or glob
+patterns are dry-run concurrently and summarized in one table sorted by bytes,
+with referenced tables and failure reasons; --csv/--json write the same rows.
+
+Templates from the SQL library (generate_sql_files.py placeholders
+<project-name>, <dataset-region>, <dataset>, <project>) are rendered with
+--project, --location, --dataset and --sink-project before the dry run
+(sql_templates.py), so the generated library can be cost-audited without
+generating it first. --param overrides a DECLAREd variable such as
+interval_in_days as a query parameter.
+
+Usage:
+    python check_query_cost.py <query_file.sql>
+    python check_query_cost.py ../queries/phase2_consumer_analysis/ --csv costs.csv
+    python check_query_cost.py '../../../../information_schema/*.sql' --project my-customer-project \\
+        --location region-eu --json information_schema_costs.json --param interval_in_days=7
+    python check_query_cost.py ../../.. --workers 16    # every .sql under narvar/
+    python check_query_cost.py '../../../../audit_log/slots_by_minute*.sql' --project my-project \
+        --sink-project my-sink-project    # raw audit log vs. job_facts variant
 """
 
+import argparse
+import csv
+import glob
+import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
 from google.cloud import bigquery
 
+from bq_execution import PRICING, DEFAULT_QUERY_BUDGET_GB, dry_run_query, get_client, read_sql
+from sql_templates import render_library_sql
+
+# generate_sql_files.py defaults
+DEFAULT_LOCATION = 'region-us'
+DEFAULT_DATASET = 'doitintl-cmp-bq'
+DEFAULT_WORKERS = 8
+
 def check_query_cost(query_file_path):
     """Perform dry run to estimate query cost."""
-    
-    # Read query from file
-    with open(query_file_path, 'r') as f:
-        query = f.read()
-    
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Configure dry run
-    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
-    
+
+    # Read query from file (relative to the working directory or queries/)
+    query = read_sql(query_file_path)
+
     # Run dry run
     print(f"\n🔍 Checking query cost for: {query_file_path}\n")
     print("Running dry run...")
-    
+
     try:
-        query_job = client.query(query, job_config=job_config)
-        
+        estimate = dry_run_query(query)
+        if estimate['status'] != 'success':
+            raise RuntimeError(estimate['error'])
+
         # Get bytes processed
-        bytes_processed = query_job.total_bytes_processed
+        bytes_processed = estimate['bytes_processed']
         gb_processed = bytes_processed / (1024**3)
         tb_processed = bytes_processed / (1024**4)
-        
-        # Estimate cost (BigQuery on-demand: $5 per TB for analysis queries)
-        estimated_cost = tb_processed * 5.0
-        
+
+        # Estimate cost (BigQuery on-demand, shared pricing table)
+        estimated_cost = estimate['estimated_cost_usd']
+
         # Display results
         print(f"✅ Dry run successful!\n")
         print(f"📊 Estimated scan:")
         print(f"   - Bytes:      {bytes_processed:,}")
         print(f"   - Gigabytes:  {gb_processed:,.2f} GB")
-        print(f"   - Terabytes:  {tb_processed:,.4f} TB")
+        print(f"   - Tebibytes:  {tb_processed:,.4f} TiB")
         print(f"\n💰 Estimated cost:")
-        print(f"   - ${estimated_cost:.4f} (on-demand pricing: $5/TB)")
-        
+        print(f"   - ${estimated_cost:.4f} (on-demand pricing: ${PRICING['on_demand_usd_per_tib']}/TiB)")
+
         # Warning if over 10GB
         if gb_processed > 10:
             print(f"\n⚠️  WARNING: Query will scan {gb_processed:.2f} GB (>10GB threshold)")
         else:
             print(f"\n✅ Query scans {gb_processed:.2f} GB (within acceptable range)")
-        
+
+        # Runners refuse queries over the per-query budget unless overridden
+        if gb_processed > DEFAULT_QUERY_BUDGET_GB:
+            print(f"🚫 Over the per-query budget of {DEFAULT_QUERY_BUDGET_GB:.0f} GB: runners need --max-gb or --override-budget")
+
         return bytes_processed, estimated_cost
-        
+
     except Exception as e:
         print(f"❌ Dry run failed: {str(e)}")
         return None, None
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python check_query_cost.py <query_file.sql>")
+# ============================================================================
+# BATCH MODE
+# ============================================================================
+
+def expand_sql_paths(patterns: List[str]) -> List[Path]:
+    """Expand files, directories (recursively) and glob patterns to .sql files."""
+    paths = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            paths.extend(sorted(path.rglob('*.sql')))
+        elif path.is_file():
+            paths.append(path)
+        else:
+            paths.extend(sorted(Path(p) for p in glob.glob(pattern, recursive=True) if p.endswith('.sql')))
+    # De-duplicate while keeping order
+    return list(dict.fromkeys(p.resolve() for p in paths))
+
+
+def parse_param(text: str):
+    """Parse --param name=value; integers and floats are typed, the rest stay strings."""
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected name=value, got '{text}'")
+    for convert in (int, float):
+        try:
+            return name, convert(value)
+        except ValueError:
+            pass
+    return name, value
+
+
+def estimate_file(path: Path, client, values: Dict) -> Dict:
+    """Dry-run one SQL file and return a flat result row."""
+    row = {
+        'file': str(path),
+        'status': 'failed',
+        'bytes_processed': None,
+        'gb_processed': None,
+        'estimated_cost_usd': None,
+        'referenced_tables': '',
+        'error': '',
+    }
+    try:
+        query = path.read_text()
+    except (OSError, UnicodeDecodeError) as e:
+        row['error'] = f"Could not read file: {e}"
+        return row
+    if not query.strip():
+        row['error'] = 'Empty file'
+        return row
+
+    try:
+        # Fails on unrendered placeholders and on --param names the file does not declare
+        query, query_parameters = render_library_sql(query, **values)
+    except (ValueError, TypeError) as e:
+        row['error'] = str(e)
+        return row
+
+    estimate = dry_run_query(query, client, bigquery.QueryJobConfig(query_parameters=query_parameters))
+    if estimate['status'] != 'success':
+        # BigQuery errors carry the request URL and job location after the first line
+        row['error'] = estimate['error'].splitlines()[0][:500]
+        return row
+
+    row.update({
+        'status': 'success',
+        'bytes_processed': estimate['bytes_processed'],
+        'gb_processed': round(estimate['gb_processed'], 3),
+        'estimated_cost_usd': round(estimate['estimated_cost_usd'], 4),
+        'referenced_tables': ';'.join(sorted(set(estimate['referenced_tables']))),
+    })
+    return row
+
+
+def estimate_files(paths: List[Path], client, values: Dict,
+                   workers: int = DEFAULT_WORKERS) -> List[Dict]:
+    """Dry-run files concurrently; successes sorted by bytes (desc), then failures."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(lambda p: estimate_file(p, client, values), paths))
+    return sorted(rows, key=lambda r: (r['status'] != 'success', -(r['bytes_processed'] or 0), r['file']))
+
+
+def print_cost_table(rows: List[Dict], base_dir: Path):
+    """Print the batch results as a table, followed by failure reasons."""
+    def short(path: str) -> str:
+        try:
+            return str(Path(path).relative_to(base_dir))
+        except ValueError:
+            return path
+
+    successful = [r for r in rows if r['status'] == 'success']
+    failed = [r for r in rows if r['status'] != 'success']
+    width = max([len(short(r['file'])) for r in rows] + [4])
+
+    print(f"\n{'File':<{width}} {'GB':>12} {'Cost':>10}  Referenced tables")
+    print("-" * (width + 60))
+    for r in successful:
+        tables = r['referenced_tables'].split(';') if r['referenced_tables'] else []
+        table_note = tables[0] + (f" (+{len(tables) - 1})" if len(tables) > 1 else '') if tables else '-'
+        print(f"{short(r['file']):<{width}} {r['gb_processed']:>12,.2f} ${r['estimated_cost_usd']:>9,.4f}  {table_note}")
+    print("-" * (width + 60))
+
+    total_gb = sum(r['gb_processed'] for r in successful)
+    total_cost = sum(r['estimated_cost_usd'] for r in successful)
+    print(f"{'TOTAL (' + str(len(successful)) + ' queries)':<{width}} {total_gb:>12,.2f} ${total_cost:>9,.4f}")
+    print(f"💰 On-demand pricing: ${PRICING['on_demand_usd_per_tib']}/TiB")
+
+    over_budget = [r for r in successful if r['gb_processed'] > DEFAULT_QUERY_BUDGET_GB]
+    if over_budget:
+        print(f"🚫 {len(over_budget)} queries over the per-query budget of {DEFAULT_QUERY_BUDGET_GB:.0f} GB")
+
+    if failed:
+        print(f"\n❌ Failed dry runs: {len(failed)}")
+        for r in failed:
+            print(f"   {short(r['file'])}: {r['error']}")
+
+
+def write_results(rows: List[Dict], csv_path: Optional[str] = None, json_path: Optional[str] = None):
+    """Write batch results to CSV and/or JSON."""
+    if csv_path:
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 CSV written to: {csv_path}")
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"💾 JSON written to: {json_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate BigQuery query cost via dry run')
+    parser.add_argument('paths', nargs='+', help='SQL files, directories or glob patterns')
+    parser.add_argument('--project', help='Value for <project-name> in SQL library templates')
+    parser.add_argument('--location', default=DEFAULT_LOCATION,
+                        help='Value for <dataset-region> (default: %(default)s)')
+    parser.add_argument('--dataset', default=DEFAULT_DATASET,
+                        help='Value for <dataset> (default: %(default)s)')
+    parser.add_argument('--param', type=parse_param, action='append', default=[],
+                        help='Override a DECLAREd variable, e.g. interval_in_days=7 (repeatable)')
+    parser.add_argument('--sink-project', help='Value for <project> (audit log sink project) in SQL library templates')
+    parser.add_argument('--billing-project', help='Project the dry-run jobs run in (default: shared client project)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Concurrent dry runs (default: %(default)s)')
+    parser.add_argument('--csv', help='Write batch results to this CSV file')
+    parser.add_argument('--json', help='Write batch results to this JSON file')
+    args = parser.parse_args()
+
+    # One plain file keeps the detailed single-query report
+    single_file = len(args.paths) == 1 and Path(args.paths[0]).suffix == '.sql' and not any(
+        c in args.paths[0] for c in '*?[')
+    if single_file and not (args.project or args.sink_project or args.param or args.csv or args.json):
+        bytes_processed, _ = check_query_cost(args.paths[0])
+        sys.exit(0 if bytes_processed is not None else 1)
+
+    paths = expand_sql_paths(args.paths)
+    if not paths:
+        print(f"❌ No .sql files matched: {' '.join(args.paths)}")
         sys.exit(1)
-    
-    query_file = sys.argv[1]
-    check_query_cost(query_file)
 
+    values = {
+        'project': args.project,
+        'location': args.location,
+        'dataset': args.dataset,
+        'sink_project': args.sink_project,
+        'parameters': dict(args.param),
+    }
+    print(f"\n🔍 Dry-running {len(paths)} SQL files with {args.workers} workers...")
+    rows = estimate_files(paths, get_client(args.billing_project), values, args.workers)
+
+    print_cost_table(rows, Path.cwd())
+    write_results(rows, args.csv, args.json)
+    sys.exit(1 if any(r['status'] != 'success' for r in rows) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Traffic Classification Rules - single source of truth (v1.4)
+
+Purpose: Declarative principal-email rules behind consumer_category,
+         consumer_subcategory and priority_level in traffic_classification
+Used by: run_classification_all_periods.py (generated SQL) and local Python
+         classification (combined, precompiled regex)
+
+Rule semantics (identical to the v1.4 CASE blocks they replace):
+- Rules are evaluated in order against LOWER(principal_email); the first
+  matching rule sets consumer_subcategory (its name).
+- consumer_category comes from the matched rule; rules with category None
+  fall through to the BI-tool user-agent check (INTERNAL) or UNCLASSIFIED.
+- Rules with after_user_agent=True only apply when the user agent is not a BI
+  tool (OTHER_BI_TOOL wins over them).
+- priority_level comes from the rule when set, otherwise from PRIORITY_TIERS
+  (the v1.4 priority checks use broader substrings than the category rules, so
+  a rule only carries a priority when its pattern implies that tier).
+- Project-based rules (monitor-*, monitor-base) are applied by the callers
+  before any of these and always win.
+
+SQL is generated for BigQuery (default) or DuckDB (local replay); both use RE2.
+
+Usage:
+    python classification_rules.py                      # Print generated SQL
+    python classification_rules.py someone@narvar.com   # Classify principals locally
+"""
+
+import re
+import sys
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+
+# ============================================================================
+# RULE TABLE
+# ============================================================================
+
+# Subcategory names double as rule ids (principal_rule in the generated SQL)
+PRINCIPAL_RULES = [
+    # EXTERNAL
+    {"subcategory": "HUB", "pattern": r'looker.*@.*\.iam\.gserviceaccount\.com',
+     "category": "EXTERNAL", "priority": 1, "qos": "EXTERNAL"},
+
+    # AUTOMATED
+    {"subcategory": "AIRFLOW_COMPOSER", "pattern": r'(airflow|composer)', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "GKE_WORKLOAD", "pattern": r'gke-prod|gke-[a-z0-9]+-sumatra', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "COMPUTE_ENGINE", "pattern": r'\d+-compute@developer\.gserviceaccount\.com', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "CDP", "pattern": r'(cdp|customer-data)', "category": "AUTOMATED"},
+    {"subcategory": "ETL_DATAFLOW", "pattern": r'(dataflow|etl)', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "ML_INFERENCE", "pattern": r'(eddmodel|ai-platform)', "category": "AUTOMATED"},
+    {"subcategory": "ANALYTICS_API", "pattern": r'analytics-api-bigquery-access', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "MESSAGING", "pattern": r'^messaging@', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "SHOPIFY_INTEGRATION", "pattern": r'shopify.*runner', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "IPAAS_INTEGRATION", "pattern": r'ipaas-integration', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "GROWTHBOOK", "pattern": r'growthbook', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "METRIC_LAYER", "pattern": r'metric-layer', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "RETOOL", "pattern": r'retool', "category": "AUTOMATED", "priority": 2},
+    {"subcategory": "DOIT_CMP", "pattern": r'doit-cmp', "category": "AUTOMATED"},
+    {"subcategory": "BQ_DATA_TRANSFER", "pattern": r'gcp-sa-bigquerydatatransfer', "category": "AUTOMATED"},
+    {"subcategory": "AI_PLATFORM", "pattern": r'gcp-sa-aiplatform', "category": "AUTOMATED"},
+    {"subcategory": "DOMAIN_SERVICE", "pattern": r'(nub-tenant|carrierstest|service-samoa)@', "category": "AUTOMATED"},
+    {"subcategory": "QA_AUTOMATION", "pattern": r'qa-automation-bigquery', "category": "AUTOMATED"},
+    {"subcategory": "NOFLAKE_RETIRED", "pattern": r'noflake-', "category": "AUTOMATED"},
+    {"subcategory": "SALESFORCE_INTEGRATION", "pattern": r'salesforce-bq-access', "category": "AUTOMATED"},
+    {"subcategory": "FIVETRAN_ETL", "pattern": r'fivetran-production', "category": "AUTOMATED"},
+    {"subcategory": "ML_JOBS", "pattern": r'data-ml-jobs', "category": "AUTOMATED"},
+    {"subcategory": "RUDDERSTACK_ETL", "pattern": r'rudderstackbqwriter', "category": "AUTOMATED"},
+    {"subcategory": "VERTEX_AI", "pattern": r'gcp-ship-vertex-ai', "category": "AUTOMATED"},
+    {"subcategory": "ML_DEV_TESTING", "pattern": r'dev-testing@narvar-ml', "category": "AUTOMATED"},
+    {"subcategory": "ML_APPSPOT", "pattern": r'narvar-ml-prod@appspot', "category": "AUTOMATED"},
+    {"subcategory": "VERTEX_PIPELINE", "pattern": r'vertex-pipeline-sa', "category": "AUTOMATED"},
+    {"subcategory": "CHURNZERO_INTEGRATION", "pattern": r'churnzero-bq-access', "category": "AUTOMATED"},
+    {"subcategory": "PROMISE_AI", "pattern": r'promise-ai@', "category": "AUTOMATED"},
+    {"subcategory": "CARRIERS_ML", "pattern": r'carriers-ml-service', "category": "AUTOMATED"},
+
+    # Unknown service accounts. The exclusion list covers everything that could
+    # still set a category, so the category only depends on the user agent.
+    {"subcategory": "SERVICE_ACCOUNT_OTHER", "pattern": r'iam\.gserviceaccount\.com$', "category": None,
+     "exclude": r'(airflow|composer|gke|compute|cdp|dataflow|etl|eddmodel|analytics-api|messaging|shopify|ipaas|'
+                r'growthbook|metric-layer|retool|doit-cmp|bigquerydatatransfer|aiplatform|looker|metabase|n8n|'
+                r'noflake|salesforce|fivetran|data-ml-jobs|rudderstack|vertex|dev-testing|appspot|churnzero|'
+                r'promise-ai|carriers-ml)'},
+
+    # INTERNAL
+    {"subcategory": "METABASE", "pattern": r'metabase.*@.*\.iam\.gserviceaccount\.com', "category": "INTERNAL"},
+    {"subcategory": "N8N_WORKFLOW", "pattern": r'n8n', "category": "INTERNAL"},
+    {"subcategory": "ADHOC_USER", "pattern": r'@narvar\.com$', "category": "INTERNAL"},
+
+    # Remaining service accounts (only if the user agent is not a BI tool)
+    {"subcategory": "INTERNAL_SERVICE_ACCOUNT", "pattern": r'iam\.gserviceaccount\.com$', "category": None,
+     "after_user_agent": True},
+]
+
+# Matched against LOWER(user_agent) when no principal rule sets a category
+BI_TOOL_USER_AGENT_PATTERN = r'(tableau|powerbi)'
+BI_TOOL_CATEGORY = "INTERNAL"
+BI_TOOL_SUBCATEGORY = "OTHER_BI_TOOL"
+
+# priority_level for principals whose rule has no priority (checked in order)
+PRIORITY_TIERS = [
+    (2, r'(airflow|composer|gke|compute|cdp|dataflow|etl|eddmodel|analytics-api|messaging|shopify|ipaas|'
+        r'growthbook|metric-layer|retool)'),
+    (3, r'(metabase|@narvar\.com$|n8n)'),
+]
+DEFAULT_PRIORITY = 4
+
+# Internal QoS threshold applies to these principals (external QoS: rules with qos=EXTERNAL)
+INTERNAL_QOS_PATTERN = r'(metabase|@narvar\.com$)'
+
+# Project-based rules applied before the principal rules
+MONITOR_PROJECT_PREFIX = 'monitor-'
+MONITOR_BASE_PROJECTS = ('monitor-base-us-prod', 'monitor-base-us-qa', 'monitor-base-us-stg')
+
+UNCLASSIFIED = "UNCLASSIFIED"
+
+# QoS thresholds (seconds) and slot pricing used by the classification query
+EXTERNAL_QOS_THRESHOLD_SECONDS = 30  # Updated 2025-11-06 from 60s to 30s
+INTERNAL_QOS_THRESHOLD_SECONDS = 480
+AUTOMATED_QOS_THRESHOLD_SECONDS = 1800
+SLOT_COST_PER_HOUR = 0.0494
+
+SQL_DIALECTS = ('bigquery', 'duckdb')
+
+
+# ============================================================================
+# SQL GENERATION
+# ============================================================================
+
+def _sql_regex_contains(expr: str, pattern: str, dialect: str = 'bigquery') -> str:
+    """Render `expr` contains `pattern` (RE2 partial match) for a SQL dialect."""
+    if "'" in pattern:
+        raise ValueError(f"Pattern contains a quote and cannot be rendered as a SQL literal: {pattern}")
+    if dialect == 'bigquery':
+        return f"REGEXP_CONTAINS({expr}, r'{pattern}')"
+    if dialect == 'duckdb':
+        # DuckDB string literals do not process backslash escapes
+        return f"regexp_matches({expr}, '{pattern}')"
+    raise ValueError(f"Unknown SQL dialect: {dialect} (expected one of {SQL_DIALECTS})")
+
+
+def _sql_in_list(values: List[str]) -> str:
+    return ', '.join(f"'{v}'" for v in values)
+
+
+def sql_principal_rule(email_lc: str = 'principal_email_lc', dialect: str = 'bigquery') -> str:
+    """CASE expression returning the first matching rule id (NULL if none).
+
+    Each pattern is evaluated at most once per row, against the already
+    lower-cased email.
+    """
+    lines = ['CASE']
+    for rule in PRINCIPAL_RULES:
+        condition = _sql_regex_contains(email_lc, rule['pattern'], dialect)
+        if rule.get('exclude'):
+            condition += f"\n        AND NOT {_sql_regex_contains(email_lc, rule['exclude'], dialect)}"
+        lines.append(f"      WHEN {condition} THEN '{rule['subcategory']}'")
+    lines.append('    END')
+    return '\n'.join(lines)
+
+
+def sql_is_bi_tool_agent(user_agent: str = 'a.user_agent', dialect: str = 'bigquery') -> str:
+    """Boolean expression: user agent is a BI tool (NULL-safe)."""
+    return f"COALESCE({_sql_regex_contains(f'LOWER({user_agent})', BI_TOOL_USER_AGENT_PATTERN, dialect)}, FALSE)"
+
+
+def sql_principal_category(rule: str = 'principal_rule', is_bi_tool: str = 'is_bi_tool_agent') -> str:
+    """consumer_category for non-monitor projects, from the matched rule id."""
+    by_category: Dict[str, List[str]] = {}
+    for r in PRINCIPAL_RULES:
+        if r['category']:
+            by_category.setdefault(r['category'], []).append(r['subcategory'])
+    lines = ['CASE']
+    for category, rule_ids in by_category.items():
+        lines.append(f"        WHEN {rule} IN ({_sql_in_list(rule_ids)}) THEN '{category}'")
+    lines.append(f"        WHEN {is_bi_tool} THEN '{BI_TOOL_CATEGORY}'")
+    lines.append(f"        ELSE '{UNCLASSIFIED}'")
+    lines.append('      END')
+    return '\n'.join(lines)
+
+
+def sql_principal_subcategory(rule: str = 'principal_rule', is_bi_tool: str = 'is_bi_tool_agent') -> str:
+    """consumer_subcategory for non-monitor projects, from the matched rule id."""
+    late_rules = [r['subcategory'] for r in PRINCIPAL_RULES if r.get('after_user_agent')]
+    return (f"CASE\n"
+            f"        WHEN {rule} IS NOT NULL AND {rule} NOT IN ({_sql_in_list(late_rules)}) THEN {rule}\n"
+            f"        WHEN {is_bi_tool} THEN '{BI_TOOL_SUBCATEGORY}'\n"
+            f"        ELSE COALESCE({rule}, '{UNCLASSIFIED}')\n"
+            f"      END")
+
+
+def sql_principal_priority(rule: str = 'principal_rule', email_lc: str = 'principal_email_lc',
+                           dialect: str = 'bigquery') -> str:
+    """priority_level for non-monitor projects: rule priority, else PRIORITY_TIERS."""
+    by_priority: Dict[int, List[str]] = {}
+    for r in PRINCIPAL_RULES:
+        if r.get('priority'):
+            by_priority.setdefault(r['priority'], []).append(r['subcategory'])
+    lines = ['CASE']
+    for priority, rule_ids in sorted(by_priority.items()):
+        lines.append(f"        WHEN {rule} IN ({_sql_in_list(rule_ids)}) THEN {priority}")
+    for priority, pattern in PRIORITY_TIERS:
+        lines.append(f"        WHEN {_sql_regex_contains(email_lc, pattern, dialect)} THEN {priority}")
+    lines.append(f"        ELSE {DEFAULT_PRIORITY}")
+    lines.append('      END')
+    return '\n'.join(lines)
+
+
+def sql_principal_qos_class(rule: str = 'principal_rule', email_lc: str = 'principal_email_lc',
+                            dialect: str = 'bigquery') -> str:
+    """'EXTERNAL' / 'INTERNAL' / NULL QoS class for non-monitor projects."""
+    external = [r['subcategory'] for r in PRINCIPAL_RULES if r.get('qos') == 'EXTERNAL']
+    return (f"CASE\n"
+            f"      WHEN {rule} IN ({_sql_in_list(external)}) THEN 'EXTERNAL'\n"
+            f"      WHEN {_sql_regex_contains(email_lc, INTERNAL_QOS_PATTERN, dialect)} THEN 'INTERNAL'\n"
+            f"    END")
+
+
+def render_sql_expressions(dialect: str = 'bigquery') -> Dict:
+    """All generated expressions, keyed by their SQL template placeholder."""
+    return {
+        'monitor_base_projects': _sql_in_list(list(MONITOR_BASE_PROJECTS)),
+        'monitor_project_prefix': MONITOR_PROJECT_PREFIX,
+        'principal_rule_sql': sql_principal_rule(dialect=dialect),
+        'is_bi_tool_agent_sql': sql_is_bi_tool_agent(dialect=dialect),
+        'principal_category_sql': sql_principal_category(),
+        'principal_subcategory_sql': sql_principal_subcategory(),
+        'principal_priority_sql': sql_principal_priority(dialect=dialect),
+        'principal_qos_class_sql': sql_principal_qos_class(dialect=dialect),
+        'external_qos_threshold_seconds': EXTERNAL_QOS_THRESHOLD_SECONDS,
+        'internal_qos_threshold_seconds': INTERNAL_QOS_THRESHOLD_SECONDS,
+        'automated_qos_threshold_seconds': AUTOMATED_QOS_THRESHOLD_SECONDS,
+        'slot_cost_per_hour': SLOT_COST_PER_HOUR,
+    }
+
+
+# ============================================================================
+# PYTHON MATCHER
+# ============================================================================
+
+def _build_combined_regex() -> re.Pattern:
+    """Compile all rules into one anchored regex with ordered alternatives.
+
+    Every alternative is a zero-width lookahead tried at position 0, so the
+    regex engine tries the rules in table order and the first one that matches
+    anywhere in the string wins - the same first-match semantics as the SQL
+    CASE (a plain `a|b` search would prefer the leftmost match instead).
+    """
+    alternatives = []
+    for i, rule in enumerate(PRINCIPAL_RULES):
+        alt = f"(?=.*?(?:{rule['pattern']}))"
+        if rule.get('exclude'):
+            alt += f"(?!.*?(?:{rule['exclude']}))"
+        alternatives.append(f"(?P<r{i}>{alt})")
+    return re.compile('^(?:' + '|'.join(alternatives) + ')')
+
+
+COMBINED_RULE_REGEX = _build_combined_regex()
+BI_TOOL_USER_AGENT_REGEX = re.compile(BI_TOOL_USER_AGENT_PATTERN)
+PRIORITY_TIER_REGEXES = [(priority, re.compile(pattern)) for priority, pattern in PRIORITY_TIERS]
+INTERNAL_QOS_REGEX = re.compile(INTERNAL_QOS_PATTERN)
+
+
+@lru_cache(maxsize=None)
+def match_principal_rule(principal_email_lc: Optional[str]) -> Optional[Dict]:
+    """Return the first rule matching a lower-cased principal email, or None."""
+    if not principal_email_lc:
+        return None
+    match = COMBINED_RULE_REGEX.match(principal_email_lc)
+    if match is None:
+        return None
+    return PRINCIPAL_RULES[int(match.lastgroup[1:])]
+
+
+@lru_cache(maxsize=None)
+def classify_principal(principal_email: Optional[str], user_agent: Optional[str] = None) -> Dict:
+    """Classify a (principal_email, user_agent) pair for a non-monitor project.
+
+    Returns consumer_category, consumer_subcategory, priority_level and
+    qos_class ('EXTERNAL', 'INTERNAL' or None), matching the generated SQL.
+    """
+    # Non-strings (None, NaN from DataFrames) behave like SQL NULL
+    email_lc = principal_email.lower() if isinstance(principal_email, str) else None
+    is_bi_tool = isinstance(user_agent, str) and BI_TOOL_USER_AGENT_REGEX.search(user_agent.lower()) is not None
+    rule = match_principal_rule(email_lc)
+
+    if rule and rule['category']:
+        category = rule['category']
+    else:
+        category = BI_TOOL_CATEGORY if is_bi_tool else UNCLASSIFIED
+
+    if rule and not rule.get('after_user_agent'):
+        subcategory = rule['subcategory']
+    elif is_bi_tool:
+        subcategory = BI_TOOL_SUBCATEGORY
+    else:
+        subcategory = rule['subcategory'] if rule else UNCLASSIFIED
+
+    priority = rule.get('priority') if rule else None
+    if priority is None:
+        priority = DEFAULT_PRIORITY
+        if email_lc:
+            for tier_priority, regex in PRIORITY_TIER_REGEXES:
+                if regex.search(email_lc):
+                    priority = tier_priority
+                    break
+
+    if rule and rule.get('qos') == 'EXTERNAL':
+        qos_class = 'EXTERNAL'
+    elif email_lc and INTERNAL_QOS_REGEX.search(email_lc):
+        qos_class = 'INTERNAL'
+    else:
+        qos_class = None
+
+    return {
+        'consumer_category': category,
+        'consumer_subcategory': subcategory,
+        'priority_level': priority,
+        'qos_class': qos_class,
+    }
+
+
+def main():
+    if len(sys.argv) == 1:
+        for placeholder, sql in render_sql_expressions().items():
+            print(f"-- {placeholder}\n{sql}\n")
+        return
+
+    for principal in sys.argv[1:]:
+        result = classify_principal(principal)
+        print(f"{principal:<60} {result['consumer_category']:<13} {result['consumer_subcategory']:<25} "
+              f"P{result['priority_level']}  QoS: {result['qos_class'] or '-'}")
+
+
+if __name__ == "__main__":
+    main()
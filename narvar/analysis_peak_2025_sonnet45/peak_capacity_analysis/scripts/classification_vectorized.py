@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Traffic Classification - Vectorized pandas classifier
+
+Purpose: Apply the traffic_classification logic (consumer_category,
+         consumer_subcategory, priority_level, qos_status) to a DataFrame of jobs,
+         e.g. a CSV export, without a round trip through BigQuery
+Rules:   classification_rules.py (same table the SQL is generated from)
+
+How it stays fast: regexes run once per distinct principal / user agent / project
+(pd.factorize + one combined str.extract pattern), then per-row results are plain
+integer gathers and np.select - no per-row apply.
+
+Usage:
+    python classification_vectorized.py jobs.csv jobs_classified.csv
+    python classification_vectorized.py jobs.csv out.csv --retailer-mapping ../results/retailer_project_mapping.csv
+
+    from classification_vectorized import classify_jobs
+    df = classify_jobs(df)   # needs project_id, principal_email; optional user_agent,
+                             # execution_time_seconds, retailer_moniker
+"""
+
+import argparse
+import hashlib
+import sys
+import time
+import warnings
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from classification_rules import (
+    PRINCIPAL_RULES, COMBINED_RULE_REGEX, BI_TOOL_USER_AGENT_PATTERN, BI_TOOL_CATEGORY,
+    BI_TOOL_SUBCATEGORY, PRIORITY_TIERS, DEFAULT_PRIORITY, INTERNAL_QOS_PATTERN,
+    MONITOR_PROJECT_PREFIX, MONITOR_BASE_PROJECTS, UNCLASSIFIED,
+    EXTERNAL_QOS_THRESHOLD_SECONDS, INTERNAL_QOS_THRESHOLD_SECONDS,
+)
+
+
+# ============================================================================
+# OUTPUT VOCABULARY
+# ============================================================================
+
+CATEGORIES = ['EXTERNAL', 'AUTOMATED', 'INTERNAL', UNCLASSIFIED]
+SUBCATEGORIES = (['MONITOR', 'MONITOR_BASE', 'MONITOR_UNMATCHED']
+                 + [r['subcategory'] for r in PRINCIPAL_RULES]
+                 + [BI_TOOL_SUBCATEGORY, UNCLASSIFIED])
+QOS_STATUSES = ['QoS_VIOLATION', 'QoS_MET', 'QoS_REQUIRES_SCHEDULE_DATA']
+
+_CATEGORY_CODE = {name: i for i, name in enumerate(CATEGORIES)}
+_SUBCATEGORY_CODE = {name: i for i, name in enumerate(SUBCATEGORIES)}
+
+# Per-rule lookup arrays. One extra trailing entry serves "no rule" (index -1).
+_RULE_CATEGORY = np.array([_CATEGORY_CODE[r['category']] if r['category'] else -1
+                           for r in PRINCIPAL_RULES] + [-1])
+_RULE_SUBCATEGORY = np.array([_SUBCATEGORY_CODE[r['subcategory']] for r in PRINCIPAL_RULES] + [-1])
+_RULE_PRIORITY = np.array([r.get('priority') or 0 for r in PRINCIPAL_RULES] + [0])
+_RULE_AFTER_USER_AGENT = np.array([bool(r.get('after_user_agent')) for r in PRINCIPAL_RULES] + [False])
+_RULE_EXTERNAL_QOS = np.array([r.get('qos') == 'EXTERNAL' for r in PRINCIPAL_RULES] + [False])
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def _factorize(values: pd.Series):
+    """Integer codes (-1 for NULL) and the distinct non-NULL values as a string Series."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    return codes, pd.Series(np.asarray(uniques, dtype=object), dtype=object).astype(str)
+
+
+def _with_null_slot(per_unique: np.ndarray, null_value) -> np.ndarray:
+    """Append the value used for NULL inputs so that code -1 gathers it."""
+    return np.append(per_unique, np.array([null_value], dtype=per_unique.dtype))
+
+
+def _contains(values: pd.Series, pattern: str) -> np.ndarray:
+    """Vectorized REGEXP_CONTAINS over distinct values."""
+    with warnings.catch_warnings():
+        # Rule patterns use (a|b) groups; only the match flag is needed here
+        warnings.simplefilter('ignore', UserWarning)
+        return values.str.contains(pattern, regex=True).to_numpy(bool)
+
+
+def match_rules(emails_lc: pd.Series) -> np.ndarray:
+    """First matching PRINCIPAL_RULES index per email (-1 if none), one regex pass."""
+    if emails_lc.empty:
+        return np.empty(0, dtype=np.int64)
+    extracted = emails_lc.str.extract(COMBINED_RULE_REGEX.pattern, expand=True)
+    # Only the named r<i> groups identify rules (rule patterns have their own groups)
+    groups = extracted[[f'r{i}' for i in range(len(PRINCIPAL_RULES))]].notna().to_numpy()
+    return np.where(groups.any(axis=1), groups.argmax(axis=1), -1)
+
+
+def load_retailer_project_mapping(path: Path) -> Dict[str, str]:
+    """project_id -> retailer_moniker for monitor projects, from a CSV of monikers.
+
+    Mirrors query_opt.retailer_project_mapping:
+    monitor-{MD5(moniker)[:7]}-us-{prod|qa|stg}.
+    """
+    monikers = pd.read_csv(path, usecols=['retailer_moniker'])['retailer_moniker'].dropna().unique()
+    mapping = {}
+    for moniker in sorted(monikers):
+        digest = hashlib.md5(str(moniker).encode('utf-8')).hexdigest()[:7]
+        for environment in ('prod', 'qa', 'stg'):
+            # The SQL keeps every moniker on a hash collision; a dict keeps the first
+            mapping.setdefault(f"monitor-{digest}-us-{environment}", moniker)
+    return mapping
+
+
+# ============================================================================
+# CLASSIFIER
+# ============================================================================
+
+def classify_jobs(df, retailer_projects: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Classify jobs with the traffic_classification rules, fully vectorized.
+
+    Args:
+        df: pandas DataFrame (or pyarrow Table) with project_id and principal_email;
+            user_agent, execution_time_seconds and retailer_moniker are optional.
+        retailer_projects: project_id -> retailer_moniker, used to fill
+            retailer_moniker when the frame has no such column.
+
+    Returns a copy with consumer_category, consumer_subcategory and priority_level
+    (plus qos_status, qos_violation_seconds and is_qos_violation when
+    execution_time_seconds is present). Text outputs are pandas Categoricals.
+    """
+    if hasattr(df, 'to_pandas'):
+        df = df.to_pandas()
+    out = df.copy()
+    n = len(out)
+
+    # Projects: one pass over distinct project ids
+    project_codes, projects = _factorize(out['project_id'])
+    is_monitor = _with_null_slot(
+        projects.str.lower().str.startswith(MONITOR_PROJECT_PREFIX).to_numpy(bool), False
+    )[project_codes]
+    is_monitor_base = _with_null_slot(projects.isin(MONITOR_BASE_PROJECTS).to_numpy(bool), False)[project_codes]
+
+    if 'retailer_moniker' not in out.columns and retailer_projects is not None:
+        out['retailer_moniker'] = out['project_id'].map(retailer_projects)
+    if 'retailer_moniker' in out.columns:
+        has_retailer = out['retailer_moniker'].notna().to_numpy()
+    else:
+        has_retailer = np.zeros(n, dtype=bool)
+
+    # Principals: combined rule regex, priority tiers and QoS class per distinct email
+    email_codes, emails = _factorize(out['principal_email'].str.lower())
+    rule_idx = _with_null_slot(match_rules(emails), -1)[email_codes]
+    tier_priority_u = np.full(len(emails), DEFAULT_PRIORITY)
+    for priority, pattern in reversed(PRIORITY_TIERS):
+        tier_priority_u[_contains(emails, pattern)] = priority
+    tier_priority = _with_null_slot(tier_priority_u, DEFAULT_PRIORITY)[email_codes]
+    internal_qos = _with_null_slot(_contains(emails, INTERNAL_QOS_PATTERN), False)[email_codes]
+
+    # User agents: BI-tool check per distinct agent
+    if 'user_agent' in out.columns:
+        agent_codes, agents = _factorize(out['user_agent'])
+        is_bi_tool = _with_null_slot(_contains(agents.str.lower(), BI_TOOL_USER_AGENT_PATTERN), False)[agent_codes]
+    else:
+        is_bi_tool = np.zeros(n, dtype=bool)
+
+    has_rule = rule_idx >= 0
+    rule_category = _RULE_CATEGORY[rule_idx]
+    rule_subcategory = _RULE_SUBCATEGORY[rule_idx]
+    rule_priority = _RULE_PRIORITY[rule_idx]
+    rule_after_user_agent = _RULE_AFTER_USER_AGENT[rule_idx]
+
+    category_codes = np.select(
+        [is_monitor_base, is_monitor, rule_category >= 0, is_bi_tool],
+        [_CATEGORY_CODE['AUTOMATED'], _CATEGORY_CODE['EXTERNAL'], rule_category, _CATEGORY_CODE[BI_TOOL_CATEGORY]],
+        default=_CATEGORY_CODE[UNCLASSIFIED]
+    )
+    subcategory_codes = np.select(
+        [is_monitor & has_retailer, is_monitor_base, is_monitor & ~has_retailer,
+         has_rule & ~rule_after_user_agent, is_bi_tool, has_rule],
+        [_SUBCATEGORY_CODE['MONITOR'], _SUBCATEGORY_CODE['MONITOR_BASE'], _SUBCATEGORY_CODE['MONITOR_UNMATCHED'],
+         rule_subcategory, _SUBCATEGORY_CODE[BI_TOOL_SUBCATEGORY], rule_subcategory],
+        default=_SUBCATEGORY_CODE[UNCLASSIFIED]
+    )
+    out['consumer_category'] = pd.Categorical.from_codes(category_codes, CATEGORIES)
+    out['consumer_subcategory'] = pd.Categorical.from_codes(subcategory_codes, SUBCATEGORIES)
+    out['priority_level'] = np.select([is_monitor, rule_priority > 0], [1, rule_priority], default=tier_priority)
+
+    if 'execution_time_seconds' in out.columns:
+        seconds = pd.to_numeric(out['execution_time_seconds'], errors='coerce').to_numpy(float)
+        external_qos = is_monitor | _RULE_EXTERNAL_QOS[rule_idx]
+        # NaN > threshold is False, like NULL > threshold falling to ELSE 'QoS_MET' in SQL
+        over_external = seconds > EXTERNAL_QOS_THRESHOLD_SECONDS
+        over_internal = seconds > INTERNAL_QOS_THRESHOLD_SECONDS
+        violation, met, unknown = range(len(QOS_STATUSES))
+        qos_codes = np.select(
+            [external_qos, internal_qos],
+            [np.where(over_external, violation, met), np.where(over_internal, violation, met)],
+            default=unknown
+        )
+        out['qos_status'] = pd.Categorical.from_codes(qos_codes, QOS_STATUSES)
+        out['qos_violation_seconds'] = np.select(
+            [external_qos & over_external, ~external_qos & internal_qos & over_internal],
+            [seconds - EXTERNAL_QOS_THRESHOLD_SECONDS, seconds - INTERNAL_QOS_THRESHOLD_SECONDS],
+            default=0
+        )
+        is_violation = pd.array(qos_codes == violation, dtype='boolean')
+        is_violation[qos_codes == unknown] = pd.NA
+        out['is_qos_violation'] = is_violation
+
+    return out
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Reclassify a CSV export of jobs locally')
+    parser.add_argument('input', type=Path, help='CSV with project_id, principal_email (+ user_agent, execution_time_seconds)')
+    parser.add_argument('output', type=Path, help='Output CSV')
+    parser.add_argument('--retailer-mapping', type=Path,
+                        help='CSV with retailer_moniker, used when the input has no retailer_moniker column')
+    args = parser.parse_args()
+
+    if not args.input.exists():
+        print(f"❌ Input not found: {args.input}")
+        sys.exit(1)
+
+    print(f"📂 Loading {args.input}...")
+    df = pd.read_csv(args.input)
+    retailer_projects = load_retailer_project_mapping(args.retailer_mapping) if args.retailer_mapping else None
+
+    start_time = time.time()
+    classified = classify_jobs(df, retailer_projects=retailer_projects)
+    elapsed = time.time() - start_time
+    print(f"✅ Classified {len(classified):,} jobs in {elapsed:.2f}s")
+
+    summary = classified['consumer_category'].value_counts()
+    for category, jobs in summary.items():
+        print(f"   {category:<15} {jobs:>12,} ({jobs / max(len(classified), 1) * 100:.1f}%)")
+
+    classified.to_csv(args.output, index=False)
+    print(f"💾 Saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
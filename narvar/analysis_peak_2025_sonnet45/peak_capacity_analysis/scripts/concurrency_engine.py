@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Concurrency Engine - Exact job concurrency curves from one row per job
+
+Purpose: Replace concurrent_queries_by_second/_millisecond.sql and
+         queued_queries_by_second.sql, which explode JOBS_TIMELINE into one row
+         per job per period and COUNT them in BigQuery. Here only
+         (job_id, reservation, creation_time, start_time, end_time) is pulled
+         per job (JOBS_BY_PROJECT, or a local export) and concurrency is
+         computed locally with a sorted-event sweep: +1 at each start, -1 at
+         each end, np.lexsort + np.cumsum.
+Output:  Per-second / per-minute series (jobs overlapping each bucket, as the
+         SQL counts them, plus the instantaneous peak inside the bucket), the
+         exact millisecond step function (one row per change point instead of
+         one per millisecond), peak concurrency and time-weighted percentiles.
+
+Intervals are half-open [start, end): a job ending at the instant another
+starts is not counted as concurrent with it. With --queued the interval is
+[creation_time, start_time), i.e. time spent pending.
+
+Cost: the BigQuery side reads one row per job, independent of granularity, so
+millisecond concurrency over a month costs the same as per-minute. The pulled
+jobs are kept in the local result cache (the default window ends at midnight
+UTC, so reruns the same day are free).
+
+Usage:
+    python concurrency_engine.py --days 30
+    python concurrency_engine.py --days 7 --queued --by-reservation
+    python concurrency_engine.py --input ../results/jobs.parquet --resolutions ms second minute
+
+    from concurrency_engine import concurrency_steps, binned_concurrency
+    times, levels = concurrency_steps(start_ms, end_ms)
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bq_execution import (DEFAULT_PROJECT_ID, RESULTS_DIR, add_budget_arguments, configure_budget_from_args,
+                          get_client)
+from result_cache import cached_query_dataframe, print_cache_status
+from sql_templates import render_sql
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+RESOLUTIONS_MS = {
+    'ms': 1,
+    'second': 1000,
+    'minute': 60 * 1000,
+}
+DEFAULT_RESOLUTIONS = ['second', 'minute']
+DEFAULT_REGION = 'region-us'
+DEFAULT_DAYS = 7
+PERCENTILES = [50, 90, 95, 99]
+
+# Dense series are materialized per bucket; past this many buckets only the
+# step function is written (a month at 1 ms is 2.6 billion buckets)
+MAX_DENSE_BUCKETS = 50_000_000
+
+JOBS_SQL = """
+SELECT
+  job_id,
+  IFNULL(reservation_id, 'ON_DEMAND') AS reservation,
+  creation_time,
+  start_time,
+  end_time
+FROM `{project}`.`{region}`.INFORMATION_SCHEMA.JOBS_BY_PROJECT
+WHERE creation_time BETWEEN @window_start AND @window_end
+  AND job_type = @job_type
+  AND parent_job_id IS NULL  -- script child jobs are covered by their parent
+"""
+
+
+# ============================================================================
+# SWEEP
+# ============================================================================
+
+def to_epoch_ms(values) -> np.ndarray:
+    """Convert timestamps (strings, datetimes, tz-aware or not) to int64 epoch milliseconds."""
+    stamps = pd.to_datetime(values, utc=True)
+    if isinstance(stamps, pd.Series):
+        stamps = stamps.dt.tz_localize(None)
+    else:
+        stamps = stamps.tz_localize(None)
+    return np.asarray(stamps, dtype='datetime64[ms]').astype(np.int64)
+
+
+def concurrency_steps(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact concurrency step function of half-open intervals [start, end).
+
+    Returns:
+        (times, levels): levels[i] jobs run during [times[i], times[i+1]); the
+        last level is always 0
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts  # zero-length jobs never overlap anything
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)])
+    # Sort by time, ends (-1) before starts (+1) at equal times: half-open intervals
+    order = np.lexsort((deltas, times))
+    times = times[order]
+    levels = np.cumsum(deltas[order])
+
+    # Several events at one instant: the level after the last one holds
+    last_at_time = np.append(times[1:] != times[:-1], True)
+    return times[last_at_time], levels[last_at_time]
+
+
+def binned_concurrency(starts: np.ndarray, ends: np.ndarray, resolution_ms: int,
+                       origin_ms: Optional[int] = None) -> pd.DataFrame:
+    """
+    Per-bucket concurrency at a fixed resolution.
+
+    jobs: jobs whose interval overlaps the bucket (what the SQL's COUNT per
+    TIMESTAMP_TRUNC(period_start) measures); peak: highest instantaneous
+    concurrency inside the bucket.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return pd.DataFrame({'bucket_start': pd.Series(dtype='datetime64[ms]'),
+                             'jobs': pd.Series(dtype=np.int64), 'peak': pd.Series(dtype=np.int64)})
+
+    if origin_ms is None:
+        origin_ms = int(starts.min()) // resolution_ms * resolution_ms
+    first = (starts - origin_ms) // resolution_ms
+    last = (ends - 1 - origin_ms) // resolution_ms  # bucket holding the last running millisecond
+    n_buckets = int(last.max()) + 1
+    if n_buckets > MAX_DENSE_BUCKETS:
+        raise ValueError(f"{n_buckets:,} buckets at {resolution_ms} ms exceeds MAX_DENSE_BUCKETS; "
+                         f"use concurrency_steps() for this resolution")
+
+    # Difference array over buckets: +1 at the first bucket, -1 after the last
+    diff = np.bincount(first, minlength=n_buckets + 1) - np.bincount(last + 1, minlength=n_buckets + 1)
+    jobs = np.cumsum(diff[:n_buckets])
+
+    # Peak inside a bucket: the level at its start, or any change point within it
+    times, levels = concurrency_steps(starts, ends)
+    bucket_starts = origin_ms + np.arange(n_buckets, dtype=np.int64) * resolution_ms
+    level_at_start = np.concatenate([[0], levels])[np.searchsorted(times, bucket_starts, side='right')]
+    peak = level_at_start.copy()
+    change_bucket = (times - origin_ms) // resolution_ms
+    inside = change_bucket < n_buckets  # the final drop to 0 can land just past the last bucket
+    np.maximum.at(peak, change_bucket[inside], levels[inside])
+
+    return pd.DataFrame({
+        'bucket_start': bucket_starts.astype('datetime64[ms]'),
+        'jobs': jobs,
+        'peak': peak,
+    })
+
+
+def time_weighted_percentiles(times: np.ndarray, levels: np.ndarray,
+                              percentiles: List[int] = PERCENTILES) -> Dict[str, float]:
+    """Percentiles of instantaneous concurrency, weighted by how long each level lasted."""
+    if len(times) < 2:
+        return {f'p{p}': 0.0 for p in percentiles}
+    durations = np.diff(times)
+    held = levels[:-1]
+    order = np.argsort(held, kind='stable')
+    cumulative = np.cumsum(durations[order])
+    total = cumulative[-1]
+    return {f'p{p}': float(held[order][np.searchsorted(cumulative, total * p / 100.0)])
+            for p in percentiles}
+
+
+def summarize_concurrency(starts: np.ndarray, ends: np.ndarray) -> Dict:
+    """Peak concurrency (and when), time-weighted percentiles and active time."""
+    times, levels = concurrency_steps(starts, ends)
+    if len(times) == 0:
+        return {'jobs': 0, 'peak_concurrency': 0, 'peak_time': None,
+                **{f'p{p}': 0.0 for p in PERCENTILES}, 'busy_fraction': 0.0}
+    peak_index = int(np.argmax(levels))
+    durations = np.diff(times)
+    return {
+        'jobs': int(np.sum(np.asarray(ends) > np.asarray(starts))),
+        'peak_concurrency': int(levels[peak_index]),
+        'peak_time': pd.Timestamp(int(times[peak_index]), unit='ms', tz='UTC'),
+        **time_weighted_percentiles(times, levels),
+        'busy_fraction': float(durations[levels[:-1] > 0].sum() / max(times[-1] - times[0], 1)),
+    }
+
+
+# ============================================================================
+# DATA
+# ============================================================================
+
+def job_intervals(df: pd.DataFrame, queued: bool = False,
+                  window_end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (start_ms, end_ms) per job: running time, or pending time with queued=True."""
+    if queued:
+        begin, finish = df['creation_time'], df['start_time']
+    else:
+        begin, finish = df['start_time'], df['end_time']
+    begin = pd.to_datetime(begin, utc=True)
+    finish = pd.to_datetime(finish, utc=True)
+    # Jobs still running (or still pending) are cut at the window end, or at
+    # the last observed timestamp for a local export
+    fill = pd.Timestamp(window_end) if window_end else max(begin.max(), finish.max())
+    finish = finish.fillna(fill)
+    valid = begin.notna().to_numpy()
+    return to_epoch_ms(begin[valid]), to_epoch_ms(finish[valid])
+
+
+def fetch_jobs(project: str, region: str, window_start: datetime, window_end: datetime,
+               job_type: str = 'QUERY', refresh: bool = False, max_gb: Optional[float] = None) -> pd.DataFrame:
+    """Pull one row per job for the window (via the local result cache)."""
+    sql, query_parameters = render_sql(
+        JOBS_SQL,
+        identifiers={'project': project, 'region': region},
+        parameters={'window_start': window_start, 'window_end': window_end, 'job_type': job_type},
+    )
+    from google.cloud import bigquery
+    result = cached_query_dataframe(
+        sql,
+        client=get_client(project),
+        script='concurrency_engine',
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+        source_tables=[],  # INFORMATION_SCHEMA has no version; the window is absolute
+        refresh=refresh,
+        max_gb=max_gb,
+    )
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    print_cache_status(result)
+    return result['df']
+
+
+def load_jobs(path: Path) -> pd.DataFrame:
+    """Load a local job export (Parquet or CSV)."""
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def write_series(df: pd.DataFrame, output_dir: Path, name: str):
+    path = output_dir / f"{name}.parquet"
+    df.to_parquet(path, index=False)
+    print(f"   💾 {path} ({len(df):,} rows)")
+
+
+def analyze(df: pd.DataFrame, label: str, resolutions: List[str], queued: bool,
+            window_end: Optional[datetime], output_dir: Path) -> Dict:
+    """Compute and write the series for one set of jobs; return its summary."""
+    starts, ends = job_intervals(df, queued=queued, window_end=window_end)
+    summary = summarize_concurrency(starts, ends)
+    print(f"\n📊 {label}: {summary['jobs']:,} jobs, peak {summary['peak_concurrency']:,} at {summary['peak_time']}")
+    print("   Time-weighted concurrency: " + ", ".join(f"p{p} {summary[f'p{p}']:.0f}" for p in PERCENTILES)
+          + f" (busy {summary['busy_fraction']:.1%} of the time)")
+
+    for resolution in resolutions:
+        resolution_ms = RESOLUTIONS_MS[resolution]
+        try:
+            series = binned_concurrency(starts, ends, resolution_ms)
+        except ValueError:
+            # Too fine for a dense series: write the exact change points instead
+            times, levels = concurrency_steps(starts, ends)
+            series = pd.DataFrame({'time': times.astype('datetime64[ms]'), 'concurrency': levels})
+            write_series(series, output_dir, f"{label}_steps")
+            continue
+        if resolution != 'ms' and len(series):
+            busiest = series.loc[series['jobs'].idxmax()]
+            print(f"   Per {resolution}: max {busiest['jobs']:,} overlapping jobs at {busiest['bucket_start']}")
+        write_series(series, output_dir, f"{label}_by_{resolution}")
+    return {'label': label, **summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exact job concurrency curves from one row per job')
+    parser.add_argument('--input', type=Path, help='Local Parquet/CSV with start_time, end_time (+ creation_time, '
+                                                   'reservation) instead of querying')
+    parser.add_argument('--project', default=DEFAULT_PROJECT_ID, help='Project whose jobs are analyzed')
+    parser.add_argument('--region', default=DEFAULT_REGION, help='INFORMATION_SCHEMA region qualifier')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='Days before --end-date')
+    parser.add_argument('--end-date', type=date.fromisoformat,
+                        help='Window end (exclusive, UTC midnight; default: today)')
+    parser.add_argument('--job-type', default='QUERY', help='JOBS_BY_PROJECT job_type')
+    parser.add_argument('--queued', action='store_true', help='Concurrency of pending time instead of running time')
+    parser.add_argument('--by-reservation', action='store_true', help='Also compute each reservation separately')
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS_MS), default=DEFAULT_RESOLUTIONS)
+    parser.add_argument('--output-dir', type=Path, default=RESULTS_DIR / 'concurrency')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
+
+    end_date = args.end_date or datetime.now(timezone.utc).date()
+    window_end = datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc)
+    window_start = window_end - timedelta(days=args.days)
+
+    if args.input:
+        if not args.input.exists():
+            print(f"❌ Input not found: {args.input}")
+            sys.exit(1)
+        print(f"📂 Loading {args.input}...")
+        jobs = load_jobs(args.input)
+        window_end = None
+    else:
+        print(f"🔍 Pulling {args.job_type} jobs for {args.project} ({window_start:%Y-%m-%d} to {window_end:%Y-%m-%d})")
+        try:
+            jobs = fetch_jobs(args.project, args.region, window_start, window_end,
+                              job_type=args.job_type, refresh=args.refresh, max_gb=args.max_gb)
+        except Exception as e:
+            print(f"❌ Query failed: {e}")
+            sys.exit(1)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    kind = 'queued' if args.queued else 'concurrent'
+    start_time = time.time()
+
+    summaries = [analyze(jobs, kind, args.resolutions, args.queued, window_end, args.output_dir)]
+    if args.by_reservation and 'reservation' in jobs.columns:
+        for reservation, group in jobs.groupby(jobs['reservation'].fillna('ON_DEMAND')):
+            label = f"{kind}_{str(reservation).split('.')[-1]}"
+            summaries.append(analyze(group, label, args.resolutions, args.queued, window_end, args.output_dir))
+
+    summary_file = args.output_dir / f"{kind}_summary.csv"
+    pd.DataFrame(summaries).to_csv(summary_file, index=False)
+    print(f"\n✅ Computed in {time.time() - start_time:.1f}s")
+    print(f"💾 Summary saved to: {summary_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ Usage:
 import argparse
 from google.cloud import bigquery
 
+from bq_execution import add_budget_arguments, configure_budget_from_args, execute_query, get_client
+
 
 PROJECT_ID = "narvar-data-lake"
 DATASET_ID = "query_opt"
@@ -117,13 +119,20 @@ DROP TABLE `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}_deduped`;
 # EXECUTION FUNCTIONS
 # ============================================================================
 
+def run_query(client: bigquery.Client, query: str):
+    """Run a statement through the budget gate and return its rows."""
+    result = execute_query(query, client=client, script='deduplicate_classification_table', to_dataframe=False)
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    return result['row_iterator']
+
+
 def print_stats(client: bigquery.Client, query: str, title: str):
     """Print statistics table."""
     print(f"\n{title}")
     print("=" * 100)
     
-    result = client.query(query).result()
-    row = next(result)
+    row = next(run_query(client, query))
     
     print(f"Total rows:       {row['total_rows']:>12,}")
     print(f"Unique jobs:      {row['unique_jobs']:>12,}")
@@ -140,7 +149,7 @@ def print_version_breakdown(client: bigquery.Client):
     print(f"{'Period':<25} {'Version':<10} {'Rows':>12} {'Unique Jobs':>12} {'Slot Hours':>15}")
     print("-" * 120)
     
-    result = client.query(VERSION_SUMMARY_QUERY).result()
+    result = run_query(client, VERSION_SUMMARY_QUERY)
     
     for row in result:
         print(f"{row['analysis_period_label']:<25} {row['classification_version']:<10} "
@@ -184,7 +193,7 @@ def deduplicate_table(client: bigquery.Client, dry_run: bool = True):
     # Step 1: Create backup
     print("\n1️⃣  Creating backup table...")
     try:
-        client.query(BACKUP_QUERY).result()
+        run_query(client, BACKUP_QUERY)
         print(f"   ✅ Backup created: {BACKUP_TABLE_ID}")
     except Exception as e:
         print(f"   ❌ Backup failed: {e}")
@@ -194,10 +203,12 @@ def deduplicate_table(client: bigquery.Client, dry_run: bool = True):
     # Step 2: Create deduplicated version
     print("\n2️⃣  Creating deduplicated table...")
     try:
-        job = client.query(DEDUP_QUERY)
-        result = job.result()
+        result = execute_query(DEDUP_QUERY, client=client, script='deduplicate_classification_table',
+                               to_dataframe=False)
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
         print(f"   ✅ Deduplicated table created: {TABLE_ID}_deduped")
-        print(f"   📊 Bytes processed: {job.total_bytes_processed / 1e9:.2f} GB")
+        print(f"   📊 Bytes processed: {result['bytes_processed'] / 1e9:.2f} GB")
     except Exception as e:
         print(f"   ❌ Deduplication failed: {e}")
         print("   Original table is safe (no changes made)")
@@ -225,7 +236,7 @@ def deduplicate_table(client: bigquery.Client, dry_run: bool = True):
     # Step 5: Replace original table
     print("\n3️⃣  Replacing original table with deduplicated version...")
     try:
-        client.query(REPLACE_QUERY).result()
+        run_query(client, REPLACE_QUERY)
         print(f"   ✅ Table replaced successfully!")
         print(f"   ✅ Backup available at: {BACKUP_TABLE_ID}")
     except Exception as e:
@@ -261,7 +272,9 @@ def main():
     parser.add_argument('--dry-run', action='store_true', help='Dry run mode (same as --mode dry-run)')
     parser.add_argument('--execute', action='store_true', help='Execute mode (same as --mode execute)')
     
+    add_budget_arguments(parser)
     args = parser.parse_args()
+    configure_budget_from_args(args)
     
     # Determine mode
     if args.execute:
@@ -275,7 +288,7 @@ def main():
     
     # Initialize client
     try:
-        client = bigquery.Client(project=PROJECT_ID)
+        client = get_client(PROJECT_ID)
         print(f"\n✅ Connected to BigQuery project: {PROJECT_ID}")
     except Exception as e:
         print(f"\n❌ Failed to connect: {e}")
@@ -4,11 +4,32 @@ Generate Phase 2 Analysis Jupyter Notebook
 
 This script creates a comprehensive Jupyter notebook for Phase 2 historical
 capacity analysis with extensive markdown documentation and visualization code.
+
+Data is loaded with table_snapshots.load_snapshot(): each section selects only
+the columns and periods it uses, and results are kept as local Parquet
+snapshots (categorical string columns) until the source table changes, so
+re-running the notebook does not re-query BigQuery.
+
+The notebook metadata and cell tags drive notebook_executor.py: the stress
+timeline cells are tagged 'per-period' and run once per TIMELINE_PERIODS entry
+(SELECTED_PERIOD is set in the 'parameters' cell); the main notebook run leaves
+them to those period runs.
 """
 
 import json
 from pathlib import Path
 
+# Phase 2 result tables read by the notebook (cell cache keys include their versions)
+SOURCE_TABLES = [
+    'narvar-data-lake.query_opt.phase2_stress_periods',
+    'narvar-data-lake.query_opt.phase2_external_qos',
+    'narvar-data-lake.query_opt.phase2_monitor_base',
+    'narvar-data-lake.query_opt.phase2_peak_patterns',
+]
+
+# Periods the executor renders the per-period stress timeline for
+TIMELINE_PERIODS = ['Peak_2024_2025', 'Peak_2023_2024', 'Peak_2022_2023']
+
 def create_notebook():
     """Create complete Phase 2 analysis notebook structure"""
     
@@ -19,16 +40,16 @@ def create_notebook():
         cells.append({
             "cell_type": "markdown",
             "metadata": {},
-            "source": content.split('\n')
+            "source": content.splitlines(keepends=True)
         })
     
-    def add_code(content):
+    def add_code(content, tags=None):
         cells.append({
             "cell_type": "code",
             "execution_count": None,
-            "metadata": {},
+            "metadata": {"tags": tags} if tags else {},
             "outputs": [],
-            "source": content.split('\n')
+            "source": content.splitlines(keepends=True)
         })
     
     # Title and Executive Summary
@@ -38,34 +59,45 @@ def create_notebook():
 
 ## 📋 Executive Summary
 
+**Classification Version**: v1.4 (Updated 2025-11-06)  
+**Key Changes**:
+- ✅ monitor-base reclassified: EXTERNAL → AUTOMATED
+- ✅ EXTERNAL QoS threshold updated: 60s → 30s
+- ✅ Data deduplicated: 43.8M unique jobs retained
+
 **Objective**: Analyze 3 years of BigQuery capacity patterns to inform Nov 2025-Jan 2026 peak slot allocation decisions.
 
 **Analysis Period**: Sep 2022 - Oct 2025 (43.8M jobs, 9 periods, 21 months)
 
 **Key Questions**:
 1. How often does capacity stress (WARNING/CRITICAL) occur?
-2. What happens to EXTERNAL customer QoS during stress?
-3. Does monitor-base (85% of external capacity) CAUSE customer stress?
-4. How much additional capacity is needed to prevent stress?
-5. What are reliable growth trends for 2025-2026 projection?
+2. What happens to EXTERNAL customer QoS during stress? (MONITOR vs HUB)
+3. Does monitor-base causation exist? (Now classified as AUTOMATED)
+4. Which monitor retailers drive most traffic?
+5. Why is WARNING stress 0%?
 
 **Data Sources**:
-- Phase 1 Classifications: `narvar-data-lake.query_opt.traffic_classification`
+- Phase 1 Classifications: `narvar-data-lake.query_opt.traffic_classification` (v1.4)
 - Phase 2 Analysis Results:
   - `phase2_stress_periods` - Stress state timeline (10-min windows)
-  - `phase2_external_qos` - Customer QoS degradation analysis
-  - `phase2_monitor_base` - Infrastructure QoS + causation test
-  - `phase2_peak_patterns` - Overall traffic patterns (5 outputs)
+  - `phase2_external_qos` - Customer QoS degradation analysis (30s threshold)
+  - `phase2_monitor_base` - Infrastructure QoS (now AUTOMATED category)
 
 ---""")
     
+    add_code("""# Phase 2 queries have been executed with v1.4 classification
+# Updated: 2025-11-06 (monitor-base -> AUTOMATED, QoS threshold 60s -> 30s)
+print("✅ v1.4 data loaded - monitor-base reclassified, 30s QoS threshold")""")
+    
     # Section 1: Setup
     add_markdown("""# 1. Setup & Configuration
 
 ---
 
 ## 1.1 Import Libraries""")
-    
+
+    add_code("""! pip install plotly""")
+
     add_code("""# Data manipulation
 import pandas as pd
 import numpy as np
@@ -85,8 +117,13 @@ from plotly.subplots import make_subplots
 # Utilities
 import warnings
 import os
+import sys
 from pathlib import Path
 
+# Snapshot loader (column projection, filters, local Parquet cache)
+sys.path.insert(0, str(Path('../scripts').resolve()))
+from table_snapshots import load_snapshot, STRESS_STATES
+
 warnings.filterwarnings('ignore')
 
 print("✅ Libraries imported successfully")
@@ -102,6 +139,9 @@ LOCATION = 'us'
 # Initialize BigQuery client
 client = bigquery.Client(project=PROJECT_ID, location=LOCATION)
 
+# Periods to load (None = all); sections only fetch the periods they use
+ANALYZE_PERIODS = None  # e.g. ['Peak_2024_2025', 'Baseline_2025_Sep_Oct']
+
 # Phase 2 result tables
 TABLES = {
     'stress_periods': f'{PROJECT_ID}.{DATASET_ID}.phase2_stress_periods',
@@ -152,7 +192,9 @@ print("✅ Visualization settings configured")""")
 
 # 2. Data Import
 
-Load Phase 2 query results from BigQuery tables.
+Load Phase 2 query results from BigQuery tables. Each load selects only the
+columns the analysis uses and is cached as a local Parquet snapshot until the
+table changes (pass `refresh=True` to `load_snapshot` to force a re-query).
 
 ---
 
@@ -160,52 +202,45 @@ Load Phase 2 query results from BigQuery tables.
 
 **Source**: `phase2_stress_periods`
 
-**Contains**: 10-minute window timeline with stress state classifications.""")
+**Contains**: 10-minute window timeline with stress state classifications, plus
+hourly aggregates (`is_hourly_aggregate`) for % of time metrics.""")
     
-    add_code("""# Load stress period data
+    add_code("""# Load ALL stress period data (both 10-min windows and hourly aggregates)
 print("Loading stress period data...")
 
-query = f\"\"\"
-SELECT *
-FROM `{TABLES['stress_periods']}`
-ORDER BY analysis_period_label, window_start
-\"\"\"
-
-df_stress = client.query(query).to_dataframe()
-
-# Convert timestamps
-df_stress['window_start'] = pd.to_datetime(df_stress['window_start'])
-df_stress['window_end'] = pd.to_datetime(df_stress['window_end'])
-
-# Categorical ordering
-df_stress['stress_state'] = pd.Categorical(
-    df_stress['stress_state'],
-    categories=['NORMAL', 'INFO', 'WARNING', 'CRITICAL'],
-    ordered=True
+# Distribution only needs period + state (the timeline loads its own period below)
+df_stress_all = load_snapshot(
+    TABLES['stress_periods'],
+    columns=['analysis_period_label', 'window_start', 'stress_state', 'is_hourly_aggregate'],
+    filters={'analysis_period_label': ANALYZE_PERIODS},
+    order_by=['analysis_period_label', 'window_start'],
+    ordered_categories={'stress_state': STRESS_STATES},
+    client=client
 )
 
-print(f"✅ Loaded {len(df_stress):,} stress period records")
-print(f"   Date range: {df_stress['window_start'].min()} to {df_stress['window_start'].max()}")
-df_stress.head()""")
+# Create separate dataframes for different analyses
+df_stress_hourly = df_stress_all[df_stress_all['is_hourly_aggregate'] == True].copy()
+df_stress_windows = df_stress_all[df_stress_all['is_hourly_aggregate'] == False].copy()
+
+print(f"✅ Loaded {len(df_stress_all):,} total stress period records")
+print(f"   Hourly aggregates: {len(df_stress_hourly):,} (for % of time metrics)")
+print(f"   10-minute windows: {len(df_stress_windows):,} (for stress event severity)")
+print(f"   Date range: {df_stress_all['window_start'].min()} to {df_stress_all['window_start'].max()}")
+df_stress_hourly.head()""")
     
     add_markdown("""## 2.2 Load External Customer QoS Data""")
     
     add_code("""# Load external customer QoS data
 print("Loading external customer QoS data...")
 
-query = f\"\"\"
-SELECT *
-FROM `{TABLES['external_qos']}`
-ORDER BY analysis_period_label, stress_state
-\"\"\"
-
-df_external_qos = client.query(query).to_dataframe()
-
-# Categorical ordering
-df_external_qos['stress_state'] = pd.Categorical(
-    df_external_qos['stress_state'],
-    categories=['NORMAL', 'INFO', 'WARNING', 'CRITICAL'],
-    ordered=True
+df_external_qos = load_snapshot(
+    TABLES['external_qos'],
+    columns=['analysis_period_label', 'stress_state', 'total_jobs', 'qos_violations',
+             'qos_violation_pct', 'p95_execution_seconds', 'p99_execution_seconds'],
+    filters={'analysis_period_label': ANALYZE_PERIODS},
+    order_by=['analysis_period_label', 'stress_state'],
+    ordered_categories={'stress_state': STRESS_STATES},
+    client=client
 )
 
 print(f"✅ Loaded {len(df_external_qos):,} external QoS records")
@@ -217,24 +252,28 @@ df_external_qos.head()""")
     add_code("""# Load monitor-base analysis data
 print("Loading monitor-base analysis data...")
 
-query = f\"\"\"
-SELECT *
-FROM `{TABLES['monitor_base']}`
-ORDER BY analysis_section, analysis_period_label
-\"\"\"
-
-df_monitor_base = client.query(query).to_dataframe()
-
-# Split into Part A (QoS) and Part B (Causation)
-df_monitor_base_qos = df_monitor_base[
-    df_monitor_base['analysis_section'] == 'PART A: MONITOR_BASE QoS PERFORMANCE'
-].copy()
+# Part A (QoS) and Part B (Causation) are separate sections with different columns
+df_monitor_base_qos = load_snapshot(
+    TABLES['monitor_base'],
+    columns=['analysis_period_label', 'total_jobs', 'total_slot_hours',
+             'qos_violation_pct', 'p95_exec_seconds'],
+    filters={'analysis_section': 'PART A: MONITOR_BASE QoS PERFORMANCE',
+             'analysis_period_label': ANALYZE_PERIODS},
+    order_by=['analysis_period_label'],
+    client=client
+)
 
-df_monitor_base_causation = df_monitor_base[
-    df_monitor_base['analysis_section'] == 'PART B: CAUSATION - Customer QoS vs monitor-base Activity'
-].copy()
+df_monitor_base_causation = load_snapshot(
+    TABLES['monitor_base'],
+    columns=['analysis_period_label', 'monitor_base_intensity', 'monitor_base_concurrent_slot_hours',
+             'customer_concurrent_jobs', 'customer_concurrent_violation_pct'],
+    filters={'analysis_section': 'PART B: CAUSATION - Customer QoS vs monitor-base Activity',
+             'analysis_period_label': ANALYZE_PERIODS},
+    order_by=['analysis_period_label'],
+    client=client
+)
 
-print(f"✅ Loaded {len(df_monitor_base):,} monitor-base records")
+print(f"✅ Loaded {len(df_monitor_base_qos) + len(df_monitor_base_causation):,} monitor-base records")
 print(f"   Part A (QoS): {len(df_monitor_base_qos)} records")
 print(f"   Part B (Causation): {len(df_monitor_base_causation)} records")""")
     
@@ -254,26 +293,59 @@ Analyze when and how often BigQuery capacity was under stress.
 
 ## 3.1 Stress State Distribution""")
     
-    add_code("""# Calculate stress state distribution
-stress_distribution = df_stress.groupby(
-    ['analysis_period_label', 'stress_state']
-).size().reset_index(name='window_count')
+    add_code("""# Calculate BOTH views of stress distribution
+
+# VIEW 1: % of Total Hours (using hourly aggregates - shows % of time in stress)
+print("VIEW 1: STRESS STATE DISTRIBUTION (% of Total Hours)")
+print("="*80)
+
+stress_hourly_dist = df_stress_hourly.groupby(
+    ['analysis_period_label', 'stress_state'], observed=False
+).size().reset_index(name='hour_count')
 
-total_windows = stress_distribution.groupby('analysis_period_label')['window_count'].transform('sum')
-stress_distribution['pct_of_time'] = (stress_distribution['window_count'] / total_windows * 100).round(2)
+total_hours = stress_hourly_dist.groupby('analysis_period_label')['hour_count'].transform('sum')
+stress_hourly_dist['pct_of_time'] = (stress_hourly_dist['hour_count'] / total_hours * 100).round(2)
 
-# Pivot for better readability
-stress_summary = stress_distribution.pivot(
+stress_summary = stress_hourly_dist.pivot(
     index='analysis_period_label',
     columns='stress_state',
     values='pct_of_time'
 ).fillna(0)
 
-print("STRESS STATE DISTRIBUTION (% of time)")
-print("="*80)
 print(stress_summary)
-print(f"\\nAverage time in WARNING: {stress_summary['WARNING'].mean():.1f}%")
-print(f"Average time in CRITICAL: {stress_summary['CRITICAL'].mean():.1f}%")""")
+print(f"\\nAverage time in WARNING: {stress_summary['WARNING'].mean():.2f}%")
+print(f"Average time in CRITICAL: {stress_summary['CRITICAL'].mean():.2f}%")
+print(f"Total stress time: {(stress_summary['WARNING'].mean() + stress_summary['CRITICAL'].mean()):.2f}%")
+
+# VIEW 2: Stress Event Severity (10-minute windows - when stress occurs, how severe?)
+print("\\n\\nVIEW 2: STRESS EVENT SEVERITY (When stress occurs, how severe?)")
+print("="*80)
+
+stress_windows_dist = df_stress_windows.groupby(
+    ['analysis_period_label', 'stress_state'], observed=False
+).size().reset_index(name='window_count')
+
+total_stress_windows = stress_windows_dist.groupby('analysis_period_label')['window_count'].transform('sum')
+stress_windows_dist['pct_of_stress'] = (stress_windows_dist['window_count'] / total_stress_windows * 100).round(2)
+
+stress_severity = stress_windows_dist.pivot(
+    index='analysis_period_label',
+    columns='stress_state',
+    values='pct_of_stress'
+).fillna(0)
+
+print(stress_severity)
+print(f"\\nWhen stress occurs:")
+print(f"  {stress_severity['CRITICAL'].mean():.1f}% of stress events are CRITICAL")
+print(f"  {stress_severity['INFO'].mean():.1f}% of stress events are INFO")
+print(f"  {stress_severity['WARNING'].mean():.1f}% of stress events are WARNING")
+
+# Summary
+print("\\n" + "="*80)
+print("📊 KEY INSIGHT:")
+print(f"Stress is RARE: {stress_summary['CRITICAL'].mean():.2f}% of total hours in CRITICAL")
+print(f"But SEVERE: {stress_severity['CRITICAL'].mean():.1f}% of stress events are CRITICAL (not just INFO)")
+print("="*80)""")
     
     add_code("""# Visualization: Stress state distribution
 fig, ax = plt.subplots(figsize=FIGSIZE_WIDE)
@@ -300,17 +372,27 @@ print("✅ Visualization saved: stress_state_distribution.png")""")
     
     add_markdown("""## 3.2 Stress Timeline Visualization""")
     
-    add_code("""# Select a period for timeline
+    add_code("""# Select a period (and the states to plot) for the timeline
 SELECTED_PERIOD = 'Peak_2024_2025'
-
-df_timeline = df_stress[df_stress['analysis_period_label'] == SELECTED_PERIOD].copy()
+TIMELINE_STATES = STRESS_STATES  # e.g. ['WARNING', 'CRITICAL'] to plot stress windows only""",
+             tags=['parameters'])
+    
+    add_code("""# Load the selected period's timeline: hourly aggregates (for NORMAL) and 10-min windows (for stress)
+df_timeline = load_snapshot(
+    TABLES['stress_periods'],
+    columns=['window_start', 'stress_state', 'concurrent_jobs'],
+    filters={'analysis_period_label': SELECTED_PERIOD, 'stress_state': list(TIMELINE_STATES)},
+    order_by=['window_start'],
+    ordered_categories={'stress_state': STRESS_STATES},
+    client=client
+)
 stress_level_map = {'NORMAL': 0, 'INFO': 1, 'WARNING': 2, 'CRITICAL': 3}
-df_timeline['stress_level'] = df_timeline['stress_state'].map(stress_level_map)
+df_timeline['stress_level'] = df_timeline['stress_state'].map(stress_level_map).astype(int)
 
 # Interactive timeline with Plotly
 fig = go.Figure()
 
-for state in ['NORMAL', 'INFO', 'WARNING', 'CRITICAL']:
+for state in TIMELINE_STATES:
     df_state = df_timeline[df_timeline['stress_state'] == state]
     
     fig.add_trace(go.Scatter(
@@ -345,7 +427,7 @@ fig.update_layout(
 fig.write_html(IMAGES_DIR / f'stress_timeline_{SELECTED_PERIOD}.html')
 fig.show()
 
-print(f"✅ Interactive timeline saved: stress_timeline_{SELECTED_PERIOD}.html")""")
+print(f"✅ Interactive timeline saved: stress_timeline_{SELECTED_PERIOD}.html")""", tags=['per-period'])
     
     # Section 4: Customer QoS Impact
     add_markdown("""---
@@ -354,15 +436,17 @@ print(f"✅ Interactive timeline saved: stress_timeline_{SELECTED_PERIOD}.html")
 
 Analyze how EXTERNAL customer-facing QoS degrades during capacity stress.
 
-**Scope**: MONITOR (retailer queries), HUB (Looker dashboards)
-**QoS Threshold**: < 60 seconds
+**Scope**: MONITOR (retailer queries), HUB (Looker dashboards)  
+**QoS Threshold**: < 30 seconds (Updated 2025-11-06 from 60s)
+
+**⚠️ KEY FINDING**: HUB users show severe QoS degradation during Peak_2024_2025 CRITICAL stress periods
 
 ---
 
 ## 4.1 QoS Violation Rates by Stress State""")
     
     add_code("""# QoS violation summary
-qos_summary = df_external_qos.groupby('stress_state').agg({
+qos_summary = df_external_qos.groupby('stress_state', observed=True).agg({
     'total_jobs': 'sum',
     'qos_violations': 'sum',
     'qos_violation_pct': 'mean',
@@ -461,7 +545,7 @@ print(f"{'✅ MEETING 30-min SLA' if avg_p95 < 1800 else '⚠️  EXCEEDING 30-m
     
     add_code("""# Causation analysis
 if not df_monitor_base_causation.empty:
-    causation_summary = df_monitor_base_causation.groupby('monitor_base_intensity').agg({
+    causation_summary = df_monitor_base_causation.groupby('monitor_base_intensity', observed=True).agg({
         'monitor_base_concurrent_slot_hours': 'mean',
         'customer_concurrent_jobs': 'mean',
         'customer_concurrent_violation_pct': 'mean'
@@ -652,6 +736,12 @@ print(f"\\n📁 All exports saved to: {OUTPUT_DIR.absolute()}")""")
     notebook = {
         "cells": cells,
         "metadata": {
+            "analysis": {
+                "source_tables": SOURCE_TABLES,
+                "artifact_dirs": ["../images", "../results"],
+                "period_parameter": "SELECTED_PERIOD",
+                "periods": TIMELINE_PERIODS
+            },
             "kernelspec": {
                 "display_name": "Python 3",
                 "language": "python",
@@ -688,7 +778,8 @@ def main():
     
     print(f"✅ Notebook generated successfully: {output_path}")
     print(f"   Total cells: {len(notebook['cells'])}")
-    print(f"   Ready to run in Jupyter!")
+    print(f"   Ready to run in Jupyter, or headless with cached cells:")
+    print(f"   python notebook_executor.py {output_path}")
 
 if __name__ == '__main__':
     main()
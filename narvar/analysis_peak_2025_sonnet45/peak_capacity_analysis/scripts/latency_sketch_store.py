@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Latency Sketch Store - Execution-time percentiles for any slice without rescanning
+
+Purpose: P95/P99 execution times are recomputed from raw traffic_classification
+         rows by every report (APPROX_QUANTILES in the phase2 SQL, pandas
+         quantile() in the runners), and some reports average per-period
+         percentiles, which is not a percentile of anything. This store keeps
+         one mergeable sketch (quantile_sketch.py, 1% relative accuracy) per
+         (analysis_period_label, hour, consumer_subcategory, reservation,
+         retailer_moniker); any roll-up merges the matching sketches, so
+         percentiles for any slice and time range come back in milliseconds.
+
+Build: the sketch bin of each job is computed in BigQuery and only
+(key, bin, count) rows are downloaded, one query per period (cached locally).
+Rebuilding a period replaces its rows in the store.
+
+Usage:
+    python latency_sketch_store.py --build --periods Peak_2024_2025 Peak_2023_2024
+    python latency_sketch_store.py --build --input ../results/classified_jobs.parquet
+
+    python latency_sketch_store.py --by analysis_period_label consumer_subcategory
+    python latency_sketch_store.py --where consumer_subcategory=HUB,ANALYTICS_API --from 2024-11-20 --to 2024-12-03
+
+    from latency_sketch_store import load_sketch_store, latency_percentiles
+    latency_percentiles(load_sketch_store(), by=['reservation'], where={'consumer_subcategory': ['HUB']})
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bq_execution import RESULTS_DIR, add_budget_arguments, configure_budget_from_args, get_client
+from quantile_sketch import BIN_VALUES, LOG_GAMMA, MIN_INDEX, NUM_BINS, SKETCH_MIN_VALUE, sketch_bins
+from result_cache import cached_query_dataframe, print_cache_status
+from run_classification_all_periods import DATASET_ID, PERIODS, PROJECT_ID, TABLE_ID
+from sql_templates import render_sql
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SKETCH_KEYS = ['analysis_period_label', 'hour', 'consumer_subcategory', 'reservation', 'retailer_moniker']
+SKETCH_STORE_FILE = RESULTS_DIR / 'latency_sketches.parquet'
+DEFAULT_QUANTILES = [0.50, 0.95, 0.99]
+
+# Same bin as quantile_sketch.sketch_bins(), computed where the rows are
+SKETCH_BINS_SQL = """
+SELECT
+  analysis_period_label,
+  TIMESTAMP_TRUNC(start_time, HOUR) AS hour,
+  IFNULL(consumer_subcategory, 'UNKNOWN') AS consumer_subcategory,
+  IFNULL(reservation_name, 'UNKNOWN') AS reservation,
+  IFNULL(retailer_moniker, 'NONE') AS retailer_moniker,
+  IF(execution_time_seconds <= @min_value, 0,
+     LEAST(CAST(CEIL(LN(execution_time_seconds) / @log_gamma) AS INT64) - @min_index, @max_bin)) AS bin,
+  COUNT(*) AS jobs,
+  SUM(execution_time_seconds) AS total_seconds
+FROM `{project_id}.{dataset_id}.{table_id}`
+WHERE analysis_period_label = @period_label
+  AND start_time IS NOT NULL
+  AND execution_time_seconds IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+def fetch_sketch_bins(period_label: str, refresh: bool = False, max_gb: Optional[float] = None) -> pd.DataFrame:
+    """(key, bin, jobs, total_seconds) rows for one period (via the local result cache)."""
+    sql, query_parameters = render_sql(
+        SKETCH_BINS_SQL,
+        identifiers={'project_id': PROJECT_ID, 'dataset_id': DATASET_ID, 'table_id': TABLE_ID},
+        parameters={
+            'period_label': period_label,
+            'min_value': SKETCH_MIN_VALUE,
+            'log_gamma': LOG_GAMMA,
+            'min_index': MIN_INDEX,
+            'max_bin': NUM_BINS - 1,
+        },
+    )
+    from google.cloud import bigquery
+    result = cached_query_dataframe(
+        sql,
+        client=get_client(PROJECT_ID),
+        script='latency_sketch_store',
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+        refresh=refresh,
+        max_gb=max_gb,
+    )
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    print_cache_status(result)
+    return result['df']
+
+
+def sketch_bins_from_jobs(jobs: pd.DataFrame) -> pd.DataFrame:
+    """The same (key, bin, jobs, total_seconds) rows from a local export of classified jobs."""
+    jobs = jobs.dropna(subset=['start_time', 'execution_time_seconds'])
+    keyed = pd.DataFrame({
+        'analysis_period_label': jobs['analysis_period_label'],
+        'hour': pd.to_datetime(jobs['start_time'], utc=True).dt.floor('h'),
+        'consumer_subcategory': jobs['consumer_subcategory'].fillna('UNKNOWN'),
+        'reservation': jobs['reservation_name'].fillna('UNKNOWN'),
+        'retailer_moniker': jobs['retailer_moniker'].fillna('NONE'),
+        'bin': sketch_bins(jobs['execution_time_seconds'].to_numpy(dtype=np.float64)),
+        'execution_time_seconds': jobs['execution_time_seconds'],
+    })
+    return (keyed.groupby(SKETCH_KEYS + ['bin'], observed=True)['execution_time_seconds']
+            .agg(jobs='count', total_seconds='sum').reset_index())
+
+
+def pack_sketches(binned: pd.DataFrame) -> pd.DataFrame:
+    """One row per key: job count, total seconds and the sparse sketch (bins, counts lists)."""
+    binned = binned.sort_values(SKETCH_KEYS + ['bin']).reset_index(drop=True)
+    grouped = binned.groupby(SKETCH_KEYS, sort=False, dropna=False)
+    store = grouped.agg(jobs=('jobs', 'sum'), total_seconds=('total_seconds', 'sum')).reset_index()
+    # Rows are sorted by key, so each sketch is a contiguous run of (bin, count) rows
+    boundaries = np.cumsum(grouped.size().to_numpy())[:-1]
+    store['bins'] = np.split(binned['bin'].to_numpy(dtype=np.int32), boundaries)
+    store['counts'] = np.split(binned['jobs'].to_numpy(dtype=np.int64), boundaries)
+    store['hour'] = pd.to_datetime(store['hour'], utc=True)
+    return store
+
+
+def update_store(new_rows: pd.DataFrame, path: Path = SKETCH_STORE_FILE) -> pd.DataFrame:
+    """Replace the periods in new_rows and write the store."""
+    if path.exists():
+        existing = load_sketch_store(path)
+        existing = existing[~existing['analysis_period_label'].isin(new_rows['analysis_period_label'].unique())]
+        new_rows = pd.concat([existing, new_rows], ignore_index=True)
+    new_rows = new_rows.sort_values(['analysis_period_label', 'hour']).reset_index(drop=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    new_rows.to_parquet(path, index=False, compression='zstd')
+    return new_rows
+
+
+def load_sketch_store(path: Path = SKETCH_STORE_FILE) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+
+# ============================================================================
+# QUERY
+# ============================================================================
+
+def latency_percentiles(
+    store: pd.DataFrame,
+    by: Optional[List[str]] = None,
+    where: Optional[Dict[str, List]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    quantiles: List[float] = DEFAULT_QUANTILES,
+) -> pd.DataFrame:
+    """
+    Merge the sketches of a slice and return job count, average and quantiles
+    of execution seconds per group.
+
+    where: {column: allowed values}; start/end bound the hour (end exclusive).
+    """
+    by = by or []
+    mask = pd.Series(True, index=store.index)
+    for column, values in (where or {}).items():
+        mask &= store[column].isin(values)
+    if start:
+        mask &= store['hour'] >= pd.Timestamp(start, tz='UTC')
+    if end:
+        mask &= store['hour'] < pd.Timestamp(end, tz='UTC')
+    rows = store[mask]
+    quantile_columns = [f'p{round(q * 100):g}_execution_seconds' for q in quantiles]
+    if rows.empty:
+        return pd.DataFrame(columns=by + ['jobs', 'avg_execution_seconds'] + quantile_columns)
+
+    if by:
+        grouped = rows.groupby(by, observed=True)
+        codes = grouped.ngroup().to_numpy()
+        groups = grouped.size().index.to_frame(index=False)
+    else:
+        codes, groups = np.zeros(len(rows), dtype=np.int64), pd.DataFrame(index=[0])
+    n_groups = len(groups)
+
+    # Merge: one bincount over (group, bin) for every stored (bin, count) pair
+    lengths = rows['bins'].map(len).to_numpy()
+    bins = np.concatenate(rows['bins'].to_numpy()).astype(np.int64)
+    counts = np.concatenate(rows['counts'].to_numpy())
+    group_of_pair = np.repeat(codes, lengths)
+    sketches = np.bincount(group_of_pair * NUM_BINS + bins, weights=counts,
+                           minlength=n_groups * NUM_BINS).reshape(n_groups, NUM_BINS)
+
+    cumulative = np.cumsum(sketches, axis=1)
+    totals = cumulative[:, -1]
+    result = groups.copy()
+    result['jobs'] = np.bincount(codes, weights=rows['jobs'].to_numpy(), minlength=n_groups).astype(np.int64)
+    result['avg_execution_seconds'] = (np.bincount(codes, weights=rows['total_seconds'].to_numpy(),
+                                                   minlength=n_groups) / result['jobs']).round(2)
+    for q, column in zip(quantiles, quantile_columns):
+        ranks = np.clip(np.ceil(q * totals), 1, None)
+        index = (cumulative < ranks[:, None]).sum(axis=1)  # first bin reaching the rank
+        result[column] = BIN_VALUES[np.minimum(index, NUM_BINS - 1)].round(2)
+    return result.sort_values('jobs', ascending=False).reset_index(drop=True)
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def parse_where(text: str):
+    """Parse --where column=value1,value2."""
+    column, sep, values = text.partition('=')
+    if not sep or column not in SKETCH_KEYS:
+        raise argparse.ArgumentTypeError(f"expected <{'|'.join(SKETCH_KEYS)}>=v1,v2, got '{text}'")
+    return column, values.split(',')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the latency sketch store')
+    parser.add_argument('--build', action='store_true', help='(Re)build the sketches of --periods or --input')
+    parser.add_argument('--periods', nargs='+', default=[p['label'] for p in PERIODS if not p.get('skip')],
+                        help='analysis_period_label values to build')
+    parser.add_argument('--input', type=Path, help='Local Parquet/CSV of classified jobs to build from')
+    parser.add_argument('--store', type=Path, default=SKETCH_STORE_FILE)
+    parser.add_argument('--by', nargs='*', default=['analysis_period_label'], choices=SKETCH_KEYS,
+                        help='Roll-up grouping (default: %(default)s)')
+    parser.add_argument('--where', type=parse_where, action='append', default=[],
+                        help='Slice filter column=v1,v2 (repeatable)')
+    parser.add_argument('--from', dest='start', help='First hour (inclusive, e.g. 2024-11-20)')
+    parser.add_argument('--to', dest='end', help='Last hour (exclusive)')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
+
+    if args.build:
+        if args.input:
+            jobs = pd.read_parquet(args.input) if args.input.suffix == '.parquet' else pd.read_csv(args.input)
+            binned = [sketch_bins_from_jobs(jobs)]
+        else:
+            binned = []
+            for period in args.periods:
+                print(f"🔍 Sketching {period}...")
+                try:
+                    binned.append(fetch_sketch_bins(period, refresh=args.refresh, max_gb=args.max_gb))
+                except Exception as e:
+                    print(f"❌ Query failed for {period}: {e}")
+                    sys.exit(1)
+        store = update_store(pack_sketches(pd.concat(binned, ignore_index=True)), args.store)
+        print(f"💾 Sketch store: {args.store} ({len(store):,} sketches, {store['jobs'].sum():,} jobs, "
+              f"{args.store.stat().st_size / 1024**2:,.1f} MB)")
+
+    if not args.store.exists():
+        print(f"❌ No sketch store at {args.store} (run with --build first)")
+        sys.exit(1)
+
+    store = load_sketch_store(args.store)
+    start_time = time.time()
+    result = latency_percentiles(store, args.by, dict(args.where), args.start, args.end)
+    print(f"\n📊 Execution time percentiles ({(time.time() - start_time) * 1000:.0f} ms from "
+          f"{len(store):,} sketches):")
+    print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
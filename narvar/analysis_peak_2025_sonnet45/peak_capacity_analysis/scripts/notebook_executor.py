@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+"""
+Notebook Executor - Headless, cell-memoized execution of analysis notebooks
+
+Purpose: Re-running a generated notebook (generate_phase2_notebook.py) after
+         editing one chart should not re-render every 300-DPI figure or
+         reload every table. This executor:
+         - fingerprints each code cell by its source, the fingerprints of the
+           cells that define the names it uses (def/use analysis of the cell
+           ASTs) and, for cells that load data, the last-modified time of the
+           notebook's source tables
+         - reuses the cached outputs of unchanged cells, and restores the
+           files they wrote (images, CSVs) from a content-addressed store
+         - executes only changed cells plus the upstream cells needed to
+           rebuild their kernel state
+         - runs the cells tagged 'per-period' once per period in parallel
+           worker kernels, with the period injected after the 'parameters'
+           cell (one executed notebook per period); when periods are given
+           the main notebook leaves those cells unexecuted, so no period is
+           rendered twice at once into the same files
+
+Notebook metadata (written by generate_phase2_notebook.py):
+    "analysis": {
+        "source_tables": ["narvar-data-lake.query_opt.phase2_stress_periods", ...],
+        "artifact_dirs": ["../images", "../results"],   # relative to the notebook
+        "period_parameter": "SELECTED_PERIOD",
+        "periods": ["Peak_2024_2025", ...]
+    }
+
+Cache: results/.notebook_cache/cells/<key>.json (outputs) and
+       results/.notebook_cache/artifacts/<sha256><suffix> (files written by cells).
+       Files written by cells running at the same time in different worker
+       kernels can be attributed to either cell; restoring them is still exact.
+       Dot-directories under the artifact dirs (results/.query_cache, this
+       cache) are never treated as cell output. Least-recently-used cells, and
+       the artifacts only they reference, are evicted once the cache exceeds
+       MAX_CACHE_BYTES.
+
+Requirements:
+- nbclient, nbformat, ipykernel (kernel for the notebook)
+- google-cloud-bigquery (only when the notebook lists source_tables)
+
+Usage:
+    python notebook_executor.py ../notebooks/phase2_analysis.ipynb
+    python notebook_executor.py ../notebooks/phase2_analysis.ipynb --plan      # Show what would run
+    python notebook_executor.py ../notebooks/phase2_analysis.ipynb --periods Peak_2024_2025 Peak_2023_2024
+    python notebook_executor.py ../notebooks/phase2_analysis.ipynb --no-periods --output /tmp/out.ipynb
+    python notebook_executor.py ../notebooks/phase2_analysis.ipynb --refresh   # Ignore cached cells
+    python notebook_executor.py --evict --max-gb 1
+    python notebook_executor.py --clear-cache
+"""
+
+import argparse
+import ast
+import copy
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import nbformat
+from nbclient import NotebookClient
+from nbclient.exceptions import CellExecutionError
+
+from bq_execution import RESULTS_DIR
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+CACHE_DIR = RESULTS_DIR / '.notebook_cache'
+CELL_CACHE_DIR = CACHE_DIR / 'cells'
+ARTIFACT_CACHE_DIR = CACHE_DIR / 'artifacts'
+MAX_CACHE_BYTES = 2 * 1024**3  # LRU eviction threshold (cell outputs + artifacts)
+CACHE_KEY_VERSION = 2  # Bump to invalidate every cached cell after a key/format change
+
+DEFAULT_KERNEL = 'python3'
+DEFAULT_CELL_TIMEOUT_SECONDS = 1800
+DEFAULT_MAX_WORKERS = 4
+
+PARAMETERS_TAG = 'parameters'
+PER_PERIOD_TAG = 'per-period'
+
+# A cell containing any of these reads the notebook's source tables, so its key
+# includes their last-modified times
+DATA_LOAD_MARKERS = ('load_snapshot(', 'client.query(', 'read_gbq(')
+
+
+# ============================================================================
+# CELL DEPENDENCIES
+# ============================================================================
+
+def python_source(source: str) -> str:
+    """Cell source with IPython magics and shell escapes blanked out."""
+    return '\n'.join('' if line.lstrip().startswith(('%', '!')) else line
+                     for line in source.split('\n'))
+
+
+def node_names(node):
+    """(stored, loaded) names of an expression or simple statement, without comprehension variables."""
+    stored, loaded, scoped = set(), set(), set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            (stored if isinstance(child.ctx, (ast.Store, ast.Del)) else loaded).add(child.id)
+        elif isinstance(child, ast.comprehension):
+            scoped |= {n.id for n in ast.walk(child.target) if isinstance(n, ast.Name)}
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            for alias in child.names:
+                stored.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            stored.add(child.name)
+        elif isinstance(child, (ast.Subscript, ast.Attribute)) and isinstance(child.ctx, ast.Store):
+            base = child.value
+            while isinstance(base, (ast.Subscript, ast.Attribute)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                stored.add(base.id)
+                loaded.add(base.id)
+        elif isinstance(child, ast.Constant) and isinstance(child.value, str) and child.value.isidentifier():
+            loaded.add(child.value)
+    return stored - scoped, loaded - scoped
+
+
+def cell_names(source: str) -> Dict[str, Set[str]]:
+    """
+    Names a cell defines, and names it uses from earlier cells. Statements are followed in order, so a name assigned
+    earlier in the same cell (fig = plt.figure() ... fig.savefig(), or a for
+    loop variable inside its body) is not an upstream use.
+
+    Mutating a name (df['x'] = ..., df.x = ...) both uses and redefines it.
+    String constants count as uses, which covers checks like 'ratio' in locals().
+
+    Raises:
+        SyntaxError if the cell does not parse
+    """
+    tree = ast.parse(python_source(source))
+
+    defined, used = set(), set()
+
+    def load(node):
+        stored, loaded = node_names(node)
+        used.update(loaded - defined)
+        defined.update(stored)
+
+    def visit(statements):
+        for statement in statements:
+            if isinstance(statement, (ast.For, ast.AsyncFor)):
+                load(statement.iter)
+                load(statement.target)
+                visit(statement.body + statement.orelse)
+            elif isinstance(statement, (ast.With, ast.AsyncWith)):
+                for item in statement.items:
+                    load(item.context_expr)
+                    if item.optional_vars is not None:
+                        load(item.optional_vars)
+                visit(statement.body)
+            elif isinstance(statement, (ast.If, ast.While)):
+                load(statement.test)
+                visit(statement.body + statement.orelse)
+            elif isinstance(statement, ast.Try):
+                visit(statement.body)
+                for handler in statement.handlers:
+                    if handler.type is not None:
+                        load(handler.type)
+                    if handler.name:
+                        defined.add(handler.name)
+                    visit(handler.body)
+                visit(statement.orelse + statement.finalbody)
+            else:
+                load(statement)
+
+    visit(tree.body)
+    return {'defined': defined, 'used': used}
+
+
+def cell_dependencies(sources: List[str]) -> List[Set[int]]:
+    """
+    For each cell, the earlier cells its kernel state depends on: the last
+    definer of every name it uses.
+
+    Raises:
+        ValueError naming the code cell that does not parse; a broken cell
+        would otherwise be cached as a dependency-free no-op or fail mid-run
+    """
+    last_definer: Dict[str, int] = {}
+    dependencies = []
+    for index, source in enumerate(sources):
+        try:
+            names = cell_names(source)
+        except SyntaxError as e:
+            raise ValueError(f"Code cell {index} does not parse (line {e.lineno}: {e.msg}): "
+                             f"{source.strip().splitlines()[0][:80] if source.strip() else '<empty>'}") from e
+        dependencies.append({last_definer[n] for n in names['used'] if n in last_definer})
+        for name in names['defined']:
+            last_definer[name] = index
+    return dependencies
+
+
+def upstream_closure(cells: Set[int], dependencies: List[Set[int]]) -> Set[int]:
+    """The given cells plus everything they transitively depend on."""
+    closure, pending = set(), list(cells)
+    while pending:
+        index = pending.pop()
+        if index not in closure:
+            closure.add(index)
+            pending.extend(dependencies[index])
+    return closure
+
+
+def cell_keys(sources: List[str], dependencies: List[Set[int]], kernel_name: str,
+              data_versions: Dict[str, str]) -> List[str]:
+    """SHA-256 per cell over its source, its dependencies' keys and (for data loads) table versions."""
+    keys = []
+    for index, source in enumerate(sources):
+        payload = {
+            'version': CACHE_KEY_VERSION,
+            'kernel': kernel_name,
+            'source': source,
+            'upstream': sorted(keys[d] for d in dependencies[index]),
+            'data': data_versions if any(m in source for m in DATA_LOAD_MARKERS) else {},
+        }
+        keys.append(hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest())
+    return keys
+
+
+# ============================================================================
+# CELL CACHE
+# ============================================================================
+
+def _entry_path(key: str) -> Path:
+    return CELL_CACHE_DIR / f"{key}.json"
+
+
+def load_cell_entry(key: str) -> Optional[Dict]:
+    path = _entry_path(key)
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        entry = json.load(f)
+    os.utime(path)  # Mark as recently used for LRU eviction
+    return entry
+
+
+def save_cell_entry(key: str, entry: Dict):
+    CELL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = _entry_path(key).with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(entry, f)
+    os.replace(temp_path, _entry_path(key))  # Atomic: worker kernels may share keys
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_state(artifact_dirs: List[Path]) -> Dict[Path, tuple]:
+    """
+    {file: (mtime_ns, size)} for every file under the artifact directories.
+
+    Dot-directories are skipped: they hold caches (result_cache's Parquet
+    snapshots, this executor's store) that manage their own files, and
+    snapshotting them would hash every query result on every run.
+    """
+    state = {}
+    for directory in artifact_dirs:
+        for root, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                path = Path(root) / filename
+                stat = path.stat()
+                state[path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def store_artifacts(before: Dict[Path, tuple], after: Dict[Path, tuple], notebook_dir: Path) -> List[Dict]:
+    """Copy files written between two artifact_state() calls into the artifact store."""
+    ARTIFACT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    artifacts = []
+    for path, state in sorted(after.items()):
+        if before.get(path) == state:
+            continue
+        sha = file_sha256(path)
+        stored = ARTIFACT_CACHE_DIR / f"{sha}{path.suffix}"
+        if not stored.exists():
+            shutil.copyfile(path, stored)
+        artifacts.append({'path': os.path.relpath(path, notebook_dir), 'sha256': sha})
+    return artifacts
+
+
+def restore_artifacts(artifacts: List[Dict], notebook_dir: Path) -> int:
+    """Put back the files a cached cell wrote, where missing or changed."""
+    restored = 0
+    for artifact in artifacts:
+        target = notebook_dir / artifact['path']
+        stored = ARTIFACT_CACHE_DIR / f"{artifact['sha256']}{target.suffix}"
+        if not stored.exists():
+            continue
+        if not target.exists() or file_sha256(target) != artifact['sha256']:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(stored, target)
+            restored += 1
+    return restored
+
+
+def list_cell_entries() -> List[Dict]:
+    """Cached cells with their size and referenced artifacts, oldest access first."""
+    if not CELL_CACHE_DIR.exists():
+        return []
+    entries = []
+    for path in CELL_CACHE_DIR.glob('*.json'):
+        with open(path, 'r') as f:
+            artifacts = json.load(f).get('artifacts', [])
+        entries.append({
+            'key': path.stem,
+            'bytes': path.stat().st_size,
+            'last_used': path.stat().st_mtime,
+            'artifacts': {f"{a['sha256']}{Path(a['path']).suffix}" for a in artifacts},
+        })
+    return sorted(entries, key=lambda e: e['last_used'])
+
+
+def evict(max_bytes: int = MAX_CACHE_BYTES, keep: Optional[Set[str]] = None) -> int:
+    """
+    Delete least-recently-used cells, and artifacts no remaining cell
+    references, until the cache fits in max_bytes. Cells in `keep` (the ones
+    the current run used) are never deleted.
+    """
+    entries = list_cell_entries()
+    keep = keep or set()
+    artifact_sizes = {p.name: p.stat().st_size for p in ARTIFACT_CACHE_DIR.glob('*')} \
+        if ARTIFACT_CACHE_DIR.exists() else {}
+    references = {}
+    for entry in entries:
+        for name in entry['artifacts']:
+            references[name] = references.get(name, 0) + 1
+
+    # Artifacts no cell references (their cells were deleted) go first
+    total = sum(e['bytes'] for e in entries)
+    for name, size in artifact_sizes.items():
+        if references.get(name):
+            total += size
+        else:
+            (ARTIFACT_CACHE_DIR / name).unlink()
+
+    evicted = 0
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        if entry['key'] in keep:
+            continue
+        _entry_path(entry['key']).unlink()
+        total -= entry['bytes']
+        for name in entry['artifacts']:
+            references[name] -= 1
+            if references[name] == 0 and name in artifact_sizes:
+                (ARTIFACT_CACHE_DIR / name).unlink()
+                total -= artifact_sizes[name]
+        evicted += 1
+    return evicted
+
+
+def clear_cache() -> int:
+    entries = len(list(CELL_CACHE_DIR.glob('*.json'))) if CELL_CACHE_DIR.exists() else 0
+    if CACHE_DIR.exists():
+        shutil.rmtree(CACHE_DIR)
+    return entries
+
+
+# ============================================================================
+# EXECUTION
+# ============================================================================
+
+def tagged_cells(nb, tag: str) -> Set[int]:
+    """Positions (among code cells) of the cells carrying a tag."""
+    code_cells = [cell for cell in nb.cells if cell.cell_type == 'code']
+    return {p for p, cell in enumerate(code_cells) if tag in cell.metadata.get('tags', [])}
+
+
+def plan_cells(nb, kernel_name: str, data_versions: Dict[str, str], refresh: bool = False,
+               skip: Optional[Set[int]] = None) -> Dict:
+    """
+    Decide which code cells of a notebook must run. Cells in `skip` (code cell
+    positions) are neither run nor restored.
+
+    Returns:
+        Dict with code cell indexes, keys, cached entries, skipped cells, stale
+        cells (no cached output) and run cells (stale cells plus their upstream state)
+    """
+    skip = skip or set()
+    code_cells = [i for i, cell in enumerate(nb.cells) if cell.cell_type == 'code']
+    sources = [nb.cells[i].source for i in code_cells]
+    dependencies = cell_dependencies(sources)
+    keys = cell_keys(sources, dependencies, kernel_name, data_versions)
+    entries = [None if refresh or i in skip else load_cell_entry(key) for i, key in enumerate(keys)]
+    stale = {i for i, entry in enumerate(entries) if entry is None} - skip
+    return {
+        'code_cells': code_cells,
+        'keys': keys,
+        'entries': entries,
+        'skip': skip,
+        'stale': stale,
+        'run': upstream_closure(stale, dependencies) - skip,
+    }
+
+
+def execute_notebook(nb, notebook_dir: Path, label: str, kernel_name: str = DEFAULT_KERNEL,
+                     data_versions: Optional[Dict[str, str]] = None, artifact_dirs: Optional[List[Path]] = None,
+                     timeout: int = DEFAULT_CELL_TIMEOUT_SECONDS, refresh: bool = False,
+                     skip: Optional[Set[int]] = None) -> Dict:
+    """
+    Execute a notebook in place, reusing cached outputs of unchanged cells.
+    Cells in `skip` (code cell positions) are left without outputs.
+
+    Returns:
+        Dict with status, label, ran/reused/restored counts, duration and error
+    """
+    start_time = time.time()
+    plan = plan_cells(nb, kernel_name, data_versions or {}, refresh, skip)
+    artifact_dirs = artifact_dirs or []
+    ran, restored = 0, 0
+
+    # Unchanged cells that do not have to run: cached outputs and files
+    for position, index in enumerate(plan['code_cells']):
+        entry = plan['entries'][position]
+        if position in plan['skip']:
+            nb.cells[index].outputs, nb.cells[index].execution_count = [], None
+        elif position not in plan['run'] and entry is not None:
+            nb.cells[index].outputs = [nbformat.from_dict(o) for o in entry['outputs']]
+            nb.cells[index].execution_count = entry['execution_count']
+            restored += restore_artifacts(entry['artifacts'], notebook_dir)
+
+    result = {'label': label, 'status': 'success', 'keys': plan['keys'], 'cells': len(plan['code_cells']),
+              'ran': len(plan['run']),
+              'reused': len(plan['code_cells']) - len(plan['run']) - len(plan['skip']),
+              'restored_files': restored}
+    if not plan['run']:
+        result['duration_seconds'] = time.time() - start_time
+        return result
+
+    client = NotebookClient(nb, timeout=timeout, kernel_name=kernel_name,
+                            resources={'metadata': {'path': str(notebook_dir)}})
+    try:
+        with client.setup_kernel():
+            for position, index in enumerate(plan['code_cells']):
+                if position not in plan['run']:
+                    continue
+                cell = nb.cells[index]
+                before = artifact_state(artifact_dirs)
+                cell_start = time.time()
+                client.execute_cell(cell, index)
+                cell_seconds = time.time() - cell_start
+                ran += 1
+                save_cell_entry(plan['keys'][position], {
+                    'outputs': cell.outputs,
+                    'execution_count': cell.execution_count,
+                    'artifacts': store_artifacts(before, artifact_state(artifact_dirs), notebook_dir),
+                    'executed_at': datetime.now().isoformat(),
+                    'seconds': round(cell_seconds, 3),
+                })
+                if position in plan['stale']:
+                    print(f"   ▶️  [{label}] cell {index}: {cell_seconds:.1f}s")
+    except CellExecutionError as e:
+        result.update({'status': 'failed', 'error': str(e).strip().split('\n')[-1]})
+    except Exception as e:
+        result.update({'status': 'failed', 'error': str(e)})
+
+    result.update({'ran': ran, 'duration_seconds': time.time() - start_time})
+    return result
+
+
+def period_notebook(nb, period: str, parameter: str):
+    """
+    A notebook with only the per-period cells, their upstream cells and the
+    period assigned right after the parameters cell.
+    """
+    code_cells = [i for i, cell in enumerate(nb.cells) if cell.cell_type == 'code']
+    section = tagged_cells(nb, PER_PERIOD_TAG)
+    parameters_cells = tagged_cells(nb, PARAMETERS_TAG)
+    dependencies = cell_dependencies([nb.cells[i].source for i in code_cells])
+    keep = upstream_closure(section | parameters_cells, dependencies)
+
+    period_nb = copy.deepcopy(nb)
+    cells = []
+    for position, index in enumerate(code_cells):
+        if position not in keep:
+            continue
+        cell = copy.deepcopy(nb.cells[index])
+        cell.outputs, cell.execution_count = [], None
+        cells.append(cell)
+        if position in parameters_cells:
+            injected = nbformat.v4.new_code_cell(f"{parameter} = {period!r}")
+            injected.metadata['tags'] = ['injected-parameters']
+            cells.append(injected)
+    period_nb.cells = cells
+    return period_nb
+
+
+def notebook_data_versions(tables: List[str]) -> Dict[str, str]:
+    """Last-modified time of each source table (metadata call, no scan)."""
+    if not tables:
+        return {}
+    from bq_execution import get_client  # BigQuery is only needed for notebooks with source tables
+    from result_cache import source_table_versions
+    return source_table_versions(get_client(), tables)
+
+
+def run_notebook(notebook_path: Path, output_path: Optional[Path] = None, periods: Optional[List[str]] = None,
+                 period_output_dir: Optional[Path] = None, kernel_name: str = DEFAULT_KERNEL,
+                 max_workers: int = DEFAULT_MAX_WORKERS, timeout: int = DEFAULT_CELL_TIMEOUT_SECONDS,
+                 refresh: bool = False) -> List[Dict]:
+    """
+    Execute a notebook and, when periods are given, its per-period section once
+    per period, all in parallel kernels. Returns one result per notebook run.
+
+    With periods, the main run skips the per-period cells: its default period
+    may be one of the periods, and two kernels rendering the same period would
+    write the same files (and cache each other's writes) at the same time.
+    """
+    notebook_path = notebook_path.resolve()
+    notebook_dir = notebook_path.parent
+    output_path = (output_path or notebook_path).resolve()
+    period_output_dir = (period_output_dir or output_path.parent).resolve()
+
+    nb = nbformat.read(notebook_path, as_version=4)
+    analysis = nb.metadata.get('analysis', {})
+    data_versions = notebook_data_versions(analysis.get('source_tables', []))
+    artifact_dirs = [(notebook_dir / d).resolve() for d in analysis.get('artifact_dirs', [])]
+    parameter = analysis.get('period_parameter')
+    if periods and not parameter:
+        raise ValueError("Notebook metadata has no analysis.period_parameter; cannot run per-period sections")
+
+    runs = [{'label': 'main', 'nb': nb, 'output': output_path,
+             'skip': tagged_cells(nb, PER_PERIOD_TAG) if periods else set()}]
+    for period in periods or []:
+        runs.append({
+            'label': period,
+            'nb': period_notebook(nb, period, parameter),
+            'output': period_output_dir / f"{output_path.stem}.{period}.ipynb",
+            'skip': set(),
+        })
+
+    def run(unit):
+        result = execute_notebook(unit['nb'], notebook_dir, unit['label'], kernel_name,
+                                  data_versions, artifact_dirs, timeout, refresh, unit['skip'])
+        unit['output'].parent.mkdir(parents=True, exist_ok=True)
+        nbformat.write(unit['nb'], unit['output'])
+        return {**result, 'output': str(unit['output'])}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(runs)))) as pool:
+        results = list(pool.map(run, runs))
+    evict(keep={key for r in results for key in r.pop('keys', [])})
+    return results
+
+
+def print_plan(notebook_path: Path, kernel_name: str = DEFAULT_KERNEL, refresh: bool = False):
+    """Print which cells would run and why, without starting a kernel."""
+    nb = nbformat.read(notebook_path, as_version=4)
+    data_versions = notebook_data_versions(nb.metadata.get('analysis', {}).get('source_tables', []))
+    plan = plan_cells(nb, kernel_name, data_versions, refresh)
+    print(f"\n📋 Execution plan: {notebook_path}")
+    for position, index in enumerate(plan['code_cells']):
+        first_line = next((l for l in nb.cells[index].source.split('\n') if l.strip()), '')[:60]
+        if position in plan['stale']:
+            status = 'RUN (changed)'
+        elif position in plan['run']:
+            status = 'RUN (upstream state)'
+        else:
+            entry = plan['entries'][position]
+            status = f"cached ({entry['seconds']:.1f}s saved)"
+        print(f"   cell {index:>3}  {status:<22} {first_line}")
+    print(f"\n   {len(plan['run'])} of {len(plan['code_cells'])} code cells would run")
+
+
+def print_run_summary(results: List[Dict]):
+    print(f"\n{'='*80}")
+    print(f"📊 NOTEBOOK EXECUTION SUMMARY")
+    print(f"{'='*80}")
+    for r in results:
+        icon = '✅' if r['status'] == 'success' else '❌'
+        print(f"{icon} {r['label']:<24} ran {r['ran']:>3} / reused {r['reused']:>3} cells, "
+              f"{r['restored_files']} file(s) restored, {r['duration_seconds']:.1f}s -> {r['output']}")
+        if r['status'] != 'success':
+            print(f"   Error: {r['error']}")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Execute an analysis notebook headlessly, reusing unchanged cells')
+    parser.add_argument('notebook', type=Path, nargs='?', help='Notebook to execute')
+    parser.add_argument('--output', type=Path, help='Executed notebook path (default: overwrite the input)')
+    parser.add_argument('--periods', nargs='+',
+                        help='Periods for the per-period section (default: analysis.periods from the notebook)')
+    parser.add_argument('--no-periods', action='store_true', help='Only execute the main notebook')
+    parser.add_argument('--period-output-dir', type=Path,
+                        help='Directory for per-period notebooks (default: next to --output)')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f'Kernels running at once (default: {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--kernel', default=DEFAULT_KERNEL, help=f'Kernel name (default: {DEFAULT_KERNEL})')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_CELL_TIMEOUT_SECONDS,
+                        help=f'Per-cell timeout in seconds (default: {DEFAULT_CELL_TIMEOUT_SECONDS})')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached cells and execute everything')
+    parser.add_argument('--plan', action='store_true', help='Show which cells would run, without executing')
+    parser.add_argument('--evict', action='store_true', help='Evict LRU cached cells down to --max-gb')
+    parser.add_argument('--max-gb', type=float, default=MAX_CACHE_BYTES / 1024**3,
+                        help=f'Size limit for --evict (default: {MAX_CACHE_BYTES / 1024**3:.0f})')
+    parser.add_argument('--clear-cache', action='store_true', help='Delete every cached cell and artifact')
+    args = parser.parse_args()
+
+    if args.clear_cache:
+        print(f"🗑️  Removed {clear_cache()} cached cells from {CACHE_DIR}")
+        return
+    if args.evict:
+        print(f"🗑️  Evicted {evict(int(args.max_gb * 1024**3))} cached cells from {CACHE_DIR}")
+        return
+    if args.notebook is None:
+        parser.error('notebook is required')
+    if args.plan:
+        print_plan(args.notebook, args.kernel, args.refresh)
+        return
+
+    periods = None
+    if not args.no_periods:
+        periods = args.periods or nbformat.read(args.notebook, as_version=4).metadata.get(
+            'analysis', {}).get('periods')
+
+    print(f"\n🚀 Executing {args.notebook}" + (f" (+ {len(periods)} period section(s))" if periods else ''))
+    results = run_notebook(args.notebook, args.output, periods, args.period_output_dir, args.kernel,
+                           args.max_workers, args.timeout, args.refresh)
+    print_run_summary(results)
+    if any(r['status'] != 'success' for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Quantile Sketch - Fixed-bin, mergeable latency sketches
+
+Purpose: Approximate quantiles of execution times that can be combined and
+         updated without keeping the values. A sketch is a NumPy count array
+         over logarithmic bins (the DDSketch layout): every value v lands in
+         bin ceil(log_gamma(v)), so any quantile is returned within
+         SKETCH_RELATIVE_ACCURACY of the true value.
+         - merge: add the count arrays (sketches from different hours,
+           reservations or processes combine exactly)
+         - delete: subtract counts, which is what sliding windows need
+           (stress_detector.py adds jobs entering a window and removes jobs
+           leaving it)
+         - serialize: only non-empty bins are kept (sketch_to_sparse), a few
+           dozen (bin, count) pairs for a typical hour of jobs
+
+Values at or below SKETCH_MIN_VALUE (including 0) share the first bin and are
+reported as 0; values above SKETCH_MAX_VALUE are clamped to the last bin.
+
+Usage:
+    from quantile_sketch import sketch_from_values, merge_sketches, sketch_quantiles
+
+    hourly = [sketch_from_values(df['execution_time_seconds']) for _, df in jobs.groupby('hour')]
+    p50, p95, p99 = sketch_quantiles(merge_sketches(hourly), [0.50, 0.95, 0.99])
+"""
+
+import math
+from typing import Iterable, List
+
+import numpy as np
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MIN_VALUE = 1e-3   # seconds; job timings are millisecond precision
+SKETCH_MAX_VALUE = 1e6    # seconds (11.6 days), longer than any BigQuery job
+
+GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_INDEX = math.ceil(math.log(SKETCH_MIN_VALUE) / LOG_GAMMA)
+NUM_BINS = math.ceil(math.log(SKETCH_MAX_VALUE) / LOG_GAMMA) - MIN_INDEX + 2  # bin 0: <= min value
+
+# Representative value per bin: the point within SKETCH_RELATIVE_ACCURACY of
+# every value in the bin
+BIN_VALUES = np.concatenate([
+    [0.0],
+    2 * GAMMA ** np.arange(MIN_INDEX + 1, MIN_INDEX + NUM_BINS) / (GAMMA + 1),
+])
+
+
+# ============================================================================
+# SKETCHES
+# ============================================================================
+
+def new_sketch() -> np.ndarray:
+    return np.zeros(NUM_BINS, dtype=np.int64)
+
+
+def sketch_bins(values) -> np.ndarray:
+    """Bin index of each value."""
+    values = np.asarray(values, dtype=np.float64)
+    safe = np.maximum(np.nan_to_num(values, nan=0.0), SKETCH_MIN_VALUE)
+    index = np.ceil(np.log(safe) / LOG_GAMMA).astype(np.int64) - MIN_INDEX
+    index[values <= SKETCH_MIN_VALUE] = 0
+    return np.clip(index, 0, NUM_BINS - 1)
+
+
+def sketch_from_values(values) -> np.ndarray:
+    """Sketch of the non-null values."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.bincount(sketch_bins(values[~np.isnan(values)]), minlength=NUM_BINS)
+
+
+def merge_sketches(sketches: Iterable[np.ndarray]) -> np.ndarray:
+    """Sketch of the union of the values behind the given sketches."""
+    merged = new_sketch()
+    for sketch in sketches:
+        merged += sketch
+    return merged
+
+
+def sketch_to_sparse(sketch: np.ndarray):
+    """(bins, counts) of the non-empty bins, the serialized form of a sketch."""
+    bins = np.flatnonzero(sketch)
+    return bins.astype(np.int32), sketch[bins]
+
+
+def sketch_from_sparse(bins, counts) -> np.ndarray:
+    sketch = new_sketch()
+    np.add.at(sketch, np.asarray(bins, dtype=np.int64), np.asarray(counts, dtype=np.int64))
+    return sketch
+
+
+def sketch_count(sketch: np.ndarray) -> int:
+    return int(sketch.sum())
+
+
+def sketch_quantiles(sketch: np.ndarray, quantiles: List[float]) -> List[float]:
+    """Quantiles (0-1) of the sketched values; NaN for an empty sketch."""
+    cumulative = np.cumsum(sketch)
+    total = cumulative[-1]
+    if total <= 0:
+        return [float('nan')] * len(quantiles)
+    # Nearest rank, like APPROX_QUANTILES
+    ranks = np.ceil(np.asarray(quantiles) * total).clip(1, total)
+    return BIN_VALUES[np.searchsorted(cumulative, ranks, side='left')].tolist()
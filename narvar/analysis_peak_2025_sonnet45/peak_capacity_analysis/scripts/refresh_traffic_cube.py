@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Traffic Cube - Hourly roll-up of traffic_classification
+
+Purpose: Most Phase 2 reports group traffic_classification by hour, day or
+         period and a handful of dimensions, yet each run re-scans the job-level
+         table (tens of GB). This script maintains an hourly OLAP cube keyed by
+
+             analysis_period_label x classification_version x hour x
+             consumer_category x consumer_subcategory x retailer_moniker x
+             reservation_name x job_type
+
+         holding only measures that roll up exactly:
+         - sums and counts (jobs, slot-hours, cost, bytes, QoS counts)
+         - maxima (execution time, approximate slot count)
+         - mergeable sketches for the non-additive metrics: HLL_COUNT for
+           distinct principals/projects and KLL_QUANTILES for execution-time
+           percentiles (merged with HLL_COUNT.MERGE / KLL_QUANTILES.MERGE_POINT_*)
+         Reports that read the cube scan MB instead of GB
+         (queries/phase2_historical/peak_vs_nonpeak_analysis_v2*.sql).
+
+Refresh: incremental per day. A cube watermark table records, for every day
+         it rebuilt, two signals that cost no table scan:
+         - the classifier's latest processed_at for the day
+           (traffic_classification_watermarks, written by --incremental runs)
+         - the last_modified_time of the day's DATE(start_time) partition
+           (INFORMATION_SCHEMA.PARTITIONS), which also moves on out-of-band
+           DML such as deduplicate_classification_table.py
+         Days whose signals changed since the last refresh are rebuilt in one
+         DELETE + INSERT transaction per consecutive day range. Unchanged days
+         are never re-aggregated.
+
+         --verify additionally compares a per-day fingerprint (rows, slot-ms,
+         latest classification_date and an order-independent hash of every
+         column the cube reads) against the one stored at refresh time. It
+         scans the period's columns, so it is an occasional audit, not part of
+         the routine refresh.
+
+Output: narvar-data-lake.query_opt.traffic_classification_hourly_cube
+        narvar-data-lake.query_opt.traffic_classification_cube_watermarks
+
+Requirements:
+- google-cloud-bigquery
+- Proper GCP credentials configured
+
+Usage:
+    python refresh_traffic_cube.py                       # Changed days, all periods
+    python refresh_traffic_cube.py --periods Peak_2024_2025 Baseline_2025_Sep_Oct
+    python refresh_traffic_cube.py --full                # Rebuild every classified day
+    python refresh_traffic_cube.py --verify              # Also rebuild days whose content hash changed
+    python refresh_traffic_cube.py --dry-run             # Show changed days and cost
+    python run_classification_all_periods.py --mode all --incremental --refresh-cube
+"""
+
+import argparse
+import sys
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from bq_execution import (add_budget_arguments, configure_budget_from_args, dry_run_query, execute_query,
+                          get_client, print_job_summary)
+from run_classification_all_periods import (DATASET_ID, PERIODS, PROJECT_ID, TABLE_ID, WATERMARK_DDL_TEMPLATE,
+                                            WATERMARK_TABLE_ID, group_consecutive_days)
+from sql_templates import render_sql, substitute
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+CUBE_TABLE_ID = "traffic_classification_hourly_cube"
+CUBE_WATERMARK_TABLE_ID = "traffic_classification_cube_watermarks"
+
+CUBE_KEY_COLUMNS = [
+    'analysis_period_label', 'classification_version', 'hour', 'consumer_category',
+    'consumer_subcategory', 'retailer_moniker', 'reservation_name', 'job_type'
+]
+
+# Columns the cube reads. The per-day content hash (--verify) covers all of them,
+# so any reclassification that changes a cube row changes the day's fingerprint.
+SOURCE_HASH_COLUMNS = [
+    'job_id', 'project_id', 'principal_email', 'consumer_category', 'consumer_subcategory',
+    'retailer_moniker', 'reservation_name', 'job_type', 'start_time', 'execution_time_seconds',
+    'total_slot_ms', 'slot_hours', 'approximate_slot_count', 'total_billed_bytes',
+    'estimated_slot_cost_usd', 'qos_status', 'is_qos_violation', 'qos_violation_seconds'
+]
+# Order-independent: XOR of one 64-bit fingerprint per job row
+SOURCE_CONTENT_HASH_SQL = (f"BIT_XOR(FARM_FINGERPRINT(TO_JSON_STRING(STRUCT({', '.join(SOURCE_HASH_COLUMNS)}))))")
+
+# KLL sketch precision: rank error ~1/precision. 100 keeps hourly sketches small
+# (the cube stays MB-sized) with percentiles accurate to about +-1 rank point.
+KLL_PRECISION = 100
+
+SQL_IDENTIFIERS = {
+    'project_id': PROJECT_ID,
+    'dataset_id': DATASET_ID,
+    'table_id': TABLE_ID,
+    'watermark_table_id': WATERMARK_TABLE_ID,
+    'cube_table_id': CUBE_TABLE_ID,
+    'cube_watermark_table_id': CUBE_WATERMARK_TABLE_ID,
+}
+
+
+# ============================================================================
+# SQL
+# ============================================================================
+
+CUBE_DDL_TEMPLATE = """
+CREATE TABLE IF NOT EXISTS `{project_id}.{dataset_id}.{cube_table_id}` (
+  analysis_period_label STRING NOT NULL,
+  classification_version STRING,
+  hour TIMESTAMP NOT NULL,
+  consumer_category STRING,
+  consumer_subcategory STRING,
+  retailer_moniker STRING,
+  reservation_name STRING,
+  job_type STRING,
+
+  -- Additive measures
+  jobs INT64,
+  jobs_with_execution_time INT64,
+  jobs_with_slot_hours INT64,
+  jobs_with_slot_count INT64,
+  execution_seconds_sum FLOAT64,
+  total_slot_ms INT64,
+  slot_hours FLOAT64,
+  approximate_slot_count_sum FLOAT64,
+  total_billed_bytes INT64,
+  estimated_slot_cost_usd FLOAT64,
+  qos_evaluated_jobs INT64,
+  qos_violations INT64,
+  qos_violation_seconds_sum FLOAT64,
+
+  -- Maxima
+  execution_seconds_max FLOAT64,
+  approximate_slot_count_max FLOAT64,
+
+  -- Mergeable sketches
+  execution_seconds_sketch BYTES,  -- KLL_QUANTILES.MERGE_POINT_FLOAT64(sketch, phi)
+  principals_sketch BYTES,         -- HLL_COUNT.MERGE(sketch)
+  projects_sketch BYTES,           -- HLL_COUNT.MERGE(sketch)
+
+  refreshed_at TIMESTAMP
+)
+PARTITION BY DATE(hour)
+CLUSTER BY analysis_period_label, consumer_category, consumer_subcategory;
+
+CREATE TABLE IF NOT EXISTS `{project_id}.{dataset_id}.{cube_watermark_table_id}` (
+  analysis_period_label STRING NOT NULL,
+  classification_version STRING,
+  partition_date DATE NOT NULL,
+  source_rows INT64,
+  source_slot_ms INT64,
+  source_classified_on DATE,
+  source_content_hash INT64,
+  source_processed_at TIMESTAMP,
+  source_partition_modified TIMESTAMP,
+  refreshed_at TIMESTAMP NOT NULL,
+  script_job_id STRING
+)
+CLUSTER BY analysis_period_label;
+
+-- Added after the first release: watermarks without them rebuild once
+ALTER TABLE `{project_id}.{dataset_id}.{cube_watermark_table_id}`
+  ADD COLUMN IF NOT EXISTS source_content_hash INT64,
+  ADD COLUMN IF NOT EXISTS source_processed_at TIMESTAMP,
+  ADD COLUMN IF NOT EXISTS source_partition_modified TIMESTAMP;
+""" + WATERMARK_DDL_TEMPLATE  # Read by the change signals before any incremental run created it
+
+# Per-day change signals of a period, from metadata only: the classifier's
+# watermark and the partition's last-modified time (no traffic_classification scan)
+SOURCE_SIGNALS_SQL = """
+SELECT
+  partition_date,
+  MAX(processed_at) AS source_processed_at,
+  MAX(last_modified_time) AS source_partition_modified
+FROM (
+  SELECT partition_date, processed_at, CAST(NULL AS TIMESTAMP) AS last_modified_time
+  FROM `{project_id}.{dataset_id}.{watermark_table_id}`
+  WHERE analysis_period_label = @period_label
+    AND partition_date BETWEEN @period_start_date AND @period_end_date
+  UNION ALL
+  SELECT SAFE.PARSE_DATE('%Y%m%d', partition_id), NULL, last_modified_time
+  FROM `{project_id}.{dataset_id}.INFORMATION_SCHEMA.PARTITIONS`
+  WHERE table_name = @table_name
+    AND SAFE.PARSE_DATE('%Y%m%d', partition_id) BETWEEN @period_start_date AND @period_end_date
+)
+GROUP BY partition_date
+"""
+
+# Signals of every day of a period against those stored at its last refresh
+SOURCE_SIGNALS_CTE = """
+WITH
+source AS (
+{source_signals_sql}
+),
+refreshed AS (
+  SELECT partition_date, MAX(source_processed_at) AS source_processed_at,
+    MAX(source_partition_modified) AS source_partition_modified
+  FROM `{project_id}.{dataset_id}.{cube_watermark_table_id}`
+  WHERE analysis_period_label = @period_label
+  GROUP BY partition_date
+)
+"""
+
+CHANGED_DAYS_SQL = SOURCE_SIGNALS_CTE + """
+SELECT partition_date
+FROM source s
+FULL OUTER JOIN refreshed r USING (partition_date)
+WHERE s.source_processed_at IS DISTINCT FROM r.source_processed_at
+   OR s.source_partition_modified IS DISTINCT FROM r.source_partition_modified
+ORDER BY partition_date
+"""
+
+# Every day of a period: classified (one narrow start_time scan), signalled or refreshed
+ALL_DAYS_SQL = SOURCE_SIGNALS_CTE + """
+SELECT DISTINCT DATE(start_time) AS partition_date
+FROM `{project_id}.{dataset_id}.{table_id}`
+WHERE analysis_period_label = @period_label
+  AND start_time IS NOT NULL
+UNION DISTINCT
+SELECT partition_date FROM source
+UNION DISTINCT
+SELECT partition_date FROM refreshed
+ORDER BY partition_date
+"""
+
+# --verify: full-content fingerprint of every classified day, against the one
+# stored at refresh time. Reads the period's clustered blocks, but only the
+# columns the cube aggregates.
+SOURCE_FINGERPRINT_CTE = """
+WITH
+source AS (
+  SELECT
+    classification_version,
+    DATE(start_time) AS partition_date,
+    COUNT(*) AS source_rows,
+    SUM(total_slot_ms) AS source_slot_ms,
+    MAX(classification_date) AS source_classified_on,
+    {source_content_hash_sql} AS source_content_hash
+  FROM `{project_id}.{dataset_id}.{table_id}`
+  WHERE analysis_period_label = @period_label
+    AND start_time IS NOT NULL
+  GROUP BY classification_version, partition_date
+),
+refreshed AS (
+  SELECT classification_version, partition_date, source_rows, source_slot_ms, source_classified_on,
+    source_content_hash
+  FROM `{project_id}.{dataset_id}.{cube_watermark_table_id}`
+  WHERE analysis_period_label = @period_label
+)
+"""
+
+CONTENT_CHANGED_DAYS_SQL = SOURCE_FINGERPRINT_CTE + """
+SELECT DISTINCT partition_date
+FROM source s
+FULL OUTER JOIN refreshed r USING (classification_version, partition_date)
+WHERE s.source_rows IS DISTINCT FROM r.source_rows
+   OR s.source_slot_ms IS DISTINCT FROM r.source_slot_ms
+   OR s.source_classified_on IS DISTINCT FROM r.source_classified_on
+   OR s.source_content_hash IS DISTINCT FROM r.source_content_hash
+ORDER BY partition_date
+"""
+
+REFRESH_HEADER_TEMPLATE = """
+-- ============================================================================
+-- Traffic cube refresh
+-- ============================================================================
+
+DECLARE period_label STRING DEFAULT @period_label;
+DECLARE refresh_start_date DATE;
+DECLARE refresh_end_date DATE;
+
+-- Signals are captured before the rebuild reads the data: a change landing in
+-- between is recorded as not yet seen and rebuilt by the next refresh
+CREATE TEMP TABLE source_signals AS
+{source_signals_sql};
+{refresh_statements}
+"""
+
+REFRESH_RANGE_TEMPLATE = """
+-- ============================================================================
+-- Day range {range_index}
+-- ============================================================================
+
+SET refresh_start_date = @refresh_start_date_{range_index};
+SET refresh_end_date = @refresh_end_date_{range_index};
+
+BEGIN TRANSACTION;
+
+DELETE FROM `{project_id}.{dataset_id}.{cube_table_id}`
+WHERE analysis_period_label = period_label
+  AND DATE(hour) BETWEEN refresh_start_date AND refresh_end_date;
+
+INSERT INTO `{project_id}.{dataset_id}.{cube_table_id}`
+SELECT
+  analysis_period_label,
+  classification_version,
+  TIMESTAMP_TRUNC(start_time, HOUR) AS hour,
+  consumer_category,
+  consumer_subcategory,
+  retailer_moniker,
+  reservation_name,
+  job_type,
+
+  COUNT(*) AS jobs,
+  COUNT(execution_time_seconds) AS jobs_with_execution_time,
+  COUNT(slot_hours) AS jobs_with_slot_hours,
+  COUNT(approximate_slot_count) AS jobs_with_slot_count,
+  SUM(execution_time_seconds) AS execution_seconds_sum,
+  SUM(total_slot_ms) AS total_slot_ms,
+  SUM(slot_hours) AS slot_hours,
+  SUM(approximate_slot_count) AS approximate_slot_count_sum,
+  SUM(total_billed_bytes) AS total_billed_bytes,
+  SUM(estimated_slot_cost_usd) AS estimated_slot_cost_usd,
+  COUNTIF(qos_status IN ('QoS_MET', 'QoS_VIOLATION')) AS qos_evaluated_jobs,
+  COUNTIF(is_qos_violation) AS qos_violations,
+  SUM(qos_violation_seconds) AS qos_violation_seconds_sum,
+
+  MAX(execution_time_seconds) AS execution_seconds_max,
+  MAX(approximate_slot_count) AS approximate_slot_count_max,
+
+  KLL_QUANTILES.INIT_FLOAT64(CAST(execution_time_seconds AS FLOAT64), {kll_precision}) AS execution_seconds_sketch,
+  HLL_COUNT.INIT(principal_email) AS principals_sketch,
+  HLL_COUNT.INIT(project_id) AS projects_sketch,
+
+  CURRENT_TIMESTAMP() AS refreshed_at
+FROM `{project_id}.{dataset_id}.{table_id}`
+WHERE analysis_period_label = period_label
+  AND DATE(start_time) BETWEEN refresh_start_date AND refresh_end_date
+GROUP BY {cube_group_by};
+
+DELETE FROM `{project_id}.{dataset_id}.{cube_watermark_table_id}`
+WHERE analysis_period_label = period_label
+  AND partition_date BETWEEN refresh_start_date AND refresh_end_date;
+
+-- One row per (version, day) with data, and one per signalled day without data
+-- for this period, so neither is seen as changed again.
+-- Column list: on tables that predate a column, ALTER TABLE appended it last
+INSERT INTO `{project_id}.{dataset_id}.{cube_watermark_table_id}`
+  (analysis_period_label, classification_version, partition_date, source_rows, source_slot_ms,
+   source_classified_on, source_content_hash, source_processed_at, source_partition_modified,
+   refreshed_at, script_job_id)
+SELECT
+  period_label,
+  c.classification_version,
+  partition_date,
+  c.source_rows,
+  c.source_slot_ms,
+  c.source_classified_on,
+  c.source_content_hash,
+  s.source_processed_at,
+  s.source_partition_modified,
+  CURRENT_TIMESTAMP() AS refreshed_at,
+  @@script.job_id AS script_job_id
+FROM (
+  SELECT
+    classification_version,
+    DATE(start_time) AS partition_date,
+    COUNT(*) AS source_rows,
+    SUM(total_slot_ms) AS source_slot_ms,
+    MAX(classification_date) AS source_classified_on,
+    {source_content_hash_sql} AS source_content_hash
+  FROM `{project_id}.{dataset_id}.{table_id}`
+  WHERE analysis_period_label = period_label
+    AND DATE(start_time) BETWEEN refresh_start_date AND refresh_end_date
+  GROUP BY classification_version, partition_date
+) c
+FULL OUTER JOIN (
+  SELECT * FROM source_signals
+  WHERE partition_date BETWEEN refresh_start_date AND refresh_end_date
+) s USING (partition_date);
+
+COMMIT TRANSACTION;
+"""
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def ensure_cube_tables(client: bigquery.Client):
+    """Create the cube and the watermark tables if they do not exist (DDL, no scan)."""
+    result = execute_query(substitute(CUBE_DDL_TEMPLATE, SQL_IDENTIFIERS), client=client,
+                           script='refresh_traffic_cube', labels={'step': 'ddl'}, to_dataframe=False)
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+
+
+def signal_parameters(period_label: str) -> Dict:
+    """Query parameters of SOURCE_SIGNALS_SQL for a period."""
+    period = next((p for p in PERIODS if p['label'] == period_label), None)
+    if period is None:
+        raise ValueError(f"Unknown period: {period_label}")
+    return {
+        'period_label': period_label,
+        'period_start_date': date.fromisoformat(period['start_date']),
+        'period_end_date': date.fromisoformat(period['end_date']),
+        'table_name': TABLE_ID,
+    }
+
+
+def query_days(client: bigquery.Client, template: str, parameters: Dict, step: str) -> List[date]:
+    """Run one of the day-listing queries for a period."""
+    sql, query_parameters = render_sql(
+        template,
+        identifiers=SQL_IDENTIFIERS,
+        fragments={'source_signals_sql': substitute(SOURCE_SIGNALS_SQL, SQL_IDENTIFIERS),
+                   'source_content_hash_sql': SOURCE_CONTENT_HASH_SQL},
+        parameters=parameters,
+    )
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    result = execute_query(sql, client=client, script='refresh_traffic_cube',
+                           labels={'step': step}, job_config=job_config)
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    return [d.date() if hasattr(d, 'date') else d for d in result['df']['partition_date']]
+
+
+def get_refresh_days(client: bigquery.Client, period_label: str, full: bool = False,
+                     verify: bool = False) -> List[date]:
+    """Days of a period whose classification changed since the last cube refresh.
+
+    Changes are detected from metadata (classifier watermark, partition
+    last-modified time). With verify=True, days whose content fingerprint
+    differs from the one stored at refresh time are added (scans the period).
+    With full=True every classified, signalled or previously refreshed day is
+    returned. Days that disappeared from traffic_classification are included,
+    so their cube rows are deleted.
+    """
+    if full:
+        return query_days(client, ALL_DAYS_SQL, signal_parameters(period_label), 'all_days')
+    days = set(query_days(client, CHANGED_DAYS_SQL, signal_parameters(period_label), 'signals'))
+    if verify:
+        content_days = set(query_days(client, CONTENT_CHANGED_DAYS_SQL, {'period_label': period_label},
+                                      'fingerprint'))
+        if content_days - days:
+            print(f"   🔍 {period_label}: {len(content_days - days)} day(s) changed without a signal")
+        days |= content_days
+    return sorted(days)
+
+
+def render_refresh_sql(period_label: str,
+                       day_ranges: List[Tuple[date, date]]) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """Render the DELETE + INSERT script rebuilding the given day ranges of a period.
+
+    Range boundaries are parameters, so the text only depends on the number of ranges.
+    """
+    parameters = signal_parameters(period_label)
+    refresh_statements = []
+    for range_index, (first, last) in enumerate(day_ranges):
+        refresh_statements.append(substitute(
+            REFRESH_RANGE_TEMPLATE,
+            identifiers={**SQL_IDENTIFIERS, 'range_index': range_index},
+            fragments={'cube_group_by': ', '.join(CUBE_KEY_COLUMNS),
+                       'kll_precision': str(KLL_PRECISION),  # Sketch precision must be a literal
+                       'source_content_hash_sql': SOURCE_CONTENT_HASH_SQL},
+        ))
+        parameters[f'refresh_start_date_{range_index}'] = first
+        parameters[f'refresh_end_date_{range_index}'] = last
+
+    return render_sql(
+        REFRESH_HEADER_TEMPLATE,
+        fragments={'source_signals_sql': substitute(SOURCE_SIGNALS_SQL, SQL_IDENTIFIERS),
+                   'refresh_statements': ''.join(refresh_statements)},
+        parameters=parameters,
+    )
+
+
+def refresh_period(client: bigquery.Client, period_label: str, full: bool = False,
+                   dry_run: bool = False, verify: bool = False) -> Dict:
+    """Rebuild the cube days of one period whose classification changed."""
+    days = get_refresh_days(client, period_label, full, verify)
+    day_ranges = group_consecutive_days(days)
+    if not day_ranges:
+        print(f"   ✅ {period_label}: cube up to date")
+        return {'period': period_label, 'status': 'up_to_date', 'days': 0}
+
+    print(f"   🔄 {period_label}: {len(days)} day(s) in {len(day_ranges)} range(s) "
+          f"({day_ranges[0][0]} to {day_ranges[-1][1]})")
+    sql, query_parameters = render_refresh_sql(period_label, day_ranges)
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+
+    if dry_run:
+        estimate = dry_run_query(sql, client, job_config)
+        if estimate['status'] != 'success':
+            return {'period': period_label, 'status': 'failed', 'error': estimate['error'], 'days': len(days)}
+        print(f"      💰 Estimated: {estimate['gb_processed']:.2f} GB (${estimate['estimated_cost_usd']:.4f})")
+        return {'period': period_label, 'status': 'dry_run', 'days': len(days),
+                'bytes_processed': estimate['bytes_processed']}
+
+    result = execute_query(sql, client=client, script='refresh_traffic_cube',
+                           labels={'step': 'refresh'}, job_config=job_config, to_dataframe=False)
+    if result['status'] != 'success':
+        print(f"      ❌ Refresh failed: {result['error']}")
+        return {'period': period_label, 'status': 'failed', 'error': result['error'], 'days': len(days)}
+    print_job_summary(result, indent='      ')
+    return {'period': period_label, 'status': 'success', 'days': len(days),
+            'bytes_processed': result['bytes_processed']}
+
+
+def refresh_cube(client: bigquery.Client, period_labels: Optional[List[str]] = None,
+                 full: bool = False, dry_run: bool = False, verify: bool = False) -> List[Dict]:
+    """Refresh the cube for the given periods (default: every non-skipped period)."""
+    if period_labels is None:
+        period_labels = [p['label'] for p in PERIODS if not p.get('skip', False)]
+
+    ensure_cube_tables(client)  # Also on dry runs: the change queries read the watermark tables
+    print(f"\n🧊 Refreshing `{PROJECT_ID}.{DATASET_ID}.{CUBE_TABLE_ID}` "
+          f"({'full rebuild' if full else 'changed days only' + (', content verified' if verify else '')})")
+
+    results = []
+    for period_label in period_labels:
+        try:
+            results.append(refresh_period(client, period_label, full, dry_run, verify))
+        except Exception as e:
+            print(f"   ❌ {period_label}: {e}")
+            results.append({'period': period_label, 'status': 'failed', 'error': str(e), 'days': 0})
+    return results
+
+
+def print_refresh_summary(results: List[Dict]):
+    refreshed = [r for r in results if r['status'] in ('success', 'dry_run')]
+    failed = [r for r in results if r['status'] == 'failed']
+    total_bytes = sum(r.get('bytes_processed', 0) for r in refreshed)
+    print(f"\n{'='*80}")
+    print(f"📊 CUBE REFRESH SUMMARY")
+    print(f"{'='*80}")
+    print(f"   Periods refreshed: {len(refreshed)} "
+          f"({sum(r['days'] for r in refreshed)} day(s)), up to date: "
+          f"{sum(r['status'] == 'up_to_date' for r in results)}, failed: {len(failed)}")
+    print(f"   Bytes processed: {total_bytes / 1024**3:,.2f} GB")
+    for r in failed:
+        print(f"   ❌ {r['period']}: {r['error']}")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the hourly traffic_classification cube')
+    parser.add_argument('--periods', nargs='+',
+                        help='Period labels to refresh (default: every non-skipped period)')
+    parser.add_argument('--full', action='store_true',
+                        help='Rebuild every classified day instead of only the changed ones')
+    parser.add_argument('--verify', action='store_true',
+                        help='Also rebuild days whose content hash changed without a change signal '
+                             '(scans the period)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Show the days to refresh and the estimated scan without executing')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
+
+    client = get_client(PROJECT_ID)
+    results = refresh_cube(client, args.periods, full=args.full, dry_run=args.dry_run, verify=args.verify)
+    print_refresh_summary(results)
+    if any(r['status'] == 'failed' for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Traffic Classification - Local Replay (DuckDB)
+
+Purpose: Replay the traffic_classification query locally over an exported slice of
+         the audit log, so classification rule changes can be tested without
+         spending BigQuery slot-hours
+Input:   Parquet or JSONL export of the audit-log fields used by audit_data
+         (print the export statement with --print-export-sql)
+Output:  Parquet or CSV with the same columns as query_opt.traffic_classification
+
+The principal rules come from classification_rules.py (DuckDB dialect), so an edit
+there is picked up by both this replay and run_classification_all_periods.py.
+
+Requirements:
+- duckdb
+- google-cloud-bigquery (only imported for the shared period/column definitions)
+
+Usage:
+    # 1. Export the audit-log fields for a period once (runs in BigQuery)
+    python replay_classification_local.py --period Baseline_2025_Sep_Oct \\
+        --print-export-sql --gcs-uri 'gs://my-bucket/audit_2025_sep_oct/*.parquet'
+
+    # 2. Replay locally as often as needed
+    python replay_classification_local.py --period Baseline_2025_Sep_Oct \\
+        --input 'exports/audit_2025_sep_oct/*.parquet' --output ../results/local_classification.parquet
+
+    python replay_classification_local.py --start-date 2025-10-01 --end-date 2025-10-07 \\
+        --input audit_oct.jsonl --output local_oct.csv
+"""
+
+import argparse
+import sys
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional
+
+import duckdb
+
+from classification_rules import render_sql_expressions
+from run_classification_all_periods import CLASSIFICATION_VERSION, OUTPUT_COLUMNS, PERIODS
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_RETAILER_MAPPING = SCRIPT_DIR.parent / 'results' / 'retailer_project_mapping.csv'
+LOCAL_PERIOD_LABEL = "Local_Replay"
+
+# Columns expected in the export (one row per audit-log entry). JSONL exports omit
+# NULL fields and quote INT64/TIMESTAMP values, so JSON input is read with this
+# explicit schema and cast in the query.
+EXPORT_COLUMN_TYPES = {
+    'timestamp': 'VARCHAR',
+    'principal_email': 'VARCHAR',
+    'job_id': 'VARCHAR',
+    'project_id': 'VARCHAR',
+    'location': 'VARCHAR',
+    'event_name': 'VARCHAR',
+    'start_time': 'VARCHAR',
+    'end_time': 'VARCHAR',
+    'total_slot_ms': 'VARCHAR',
+    'total_billed_bytes': 'VARCHAR',
+    'query_text': 'VARCHAR',
+    'reservation_name': 'VARCHAR',
+    'user_agent': 'VARCHAR',
+    'dry_run': 'BOOLEAN',
+}
+
+
+# ============================================================================
+# SQL TEMPLATES
+# ============================================================================
+
+# BigQuery: flatten the audit-log fields read by audit_data into a Parquet export
+EXPORT_SQL_TEMPLATE = """
+EXPORT DATA OPTIONS (
+  uri = '{gcs_uri}',
+  format = 'PARQUET',
+  overwrite = true
+) AS
+SELECT
+  timestamp,
+  protopayload_auditlog.authenticationInfo.principalEmail AS principal_email,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId AS job_id,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.projectId AS project_id,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.location AS location,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.eventName AS event_name,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.startTime AS start_time,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.endTime AS end_time,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.totalSlotMs AS total_slot_ms,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.totalBilledBytes AS total_billed_bytes,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobConfiguration.query.query AS query_text,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobStatistics.reservation AS reservation_name,
+  protopayload_auditlog.requestMetadata.callerSuppliedUserAgent AS user_agent,
+  protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobConfiguration.dryRun AS dry_run
+FROM `narvar-data-lake.doitintl_cmp_bq.cloudaudit_googleapis_com_data_access`
+WHERE DATE(timestamp) BETWEEN '{start_date}' AND '{end_date}'
+  AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.eventName LIKE '%_job_completed'
+"""
+
+# DuckDB port of run_classification_all_periods.CLASSIFICATION_SELECT.
+# Differences are dialect only: epoch arithmetic for TIMESTAMP_DIFF (truncating),
+# NULLIF around regexp_extract (DuckDB returns '' on no match) and the retailer
+# mapping built from a moniker list instead of query_opt.retailer_project_mapping.
+LOCAL_CLASSIFICATION_SQL_TEMPLATE = """
+WITH
+retailer_mappings AS (
+  SELECT DISTINCT
+    'monitor-' || SUBSTR(md5(retailer_moniker), 1, 7) || '-us-' || environment AS project_id,
+    retailer_moniker
+  FROM read_csv_auto('{retailer_mapping_path}', header = true)
+  CROSS JOIN (VALUES ('prod'), ('qa'), ('stg')) AS env(environment)
+  WHERE retailer_moniker IS NOT NULL
+),
+
+audit_data AS (
+  SELECT
+    principal_email,
+    job_id,
+    project_id,
+    location,
+    CASE event_name
+      WHEN 'query_job_completed' THEN 'QUERY'
+      WHEN 'load_job_completed' THEN 'LOAD'
+      WHEN 'extract_job_completed' THEN 'EXTRACT'
+      WHEN 'table_copy_job_completed' THEN 'TABLE_COPY'
+    END AS job_type,
+    start_time,
+    end_time,
+    (epoch_us(end_time) - epoch_us(start_time)) // 1000000 AS execution_time_seconds,
+    total_slot_ms,
+    total_billed_bytes,
+    total_slot_ms / NULLIF((epoch_us(end_time) - epoch_us(start_time)) // 1000, 0) AS approximate_slot_count,
+    query_text,
+    reservation_name,
+    user_agent
+  FROM (
+    SELECT
+      * REPLACE (
+        CAST("timestamp" AS TIMESTAMPTZ) AS "timestamp",
+        CAST(start_time AS TIMESTAMPTZ) AS start_time,
+        CAST(end_time AS TIMESTAMPTZ) AS end_time,
+        CAST(total_slot_ms AS BIGINT) AS total_slot_ms,
+        CAST(total_billed_bytes AS BIGINT) AS total_billed_bytes
+      )
+    FROM {source}
+  )
+  -- DATE(timestamp) BETWEEN scan_start_date AND scan_end_date, as a UTC range
+  WHERE "timestamp" >= TIMESTAMPTZ '{scan_start_date} 00:00:00+00'
+    AND "timestamp" < TIMESTAMPTZ '{scan_end_date} 00:00:00+00' + INTERVAL 1 DAY
+    AND job_id IS NOT NULL
+    AND job_id NOT LIKE 'script_job_%'
+    AND event_name LIKE '%_job_completed'
+    AND dry_run IS NULL
+    AND total_slot_ms IS NOT NULL
+  -- Latest log entry per job (BigQuery version: ROW_NUMBER ... row_num = 1)
+  QUALIFY ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY "timestamp" DESC) = 1
+),
+
+audit_deduplicated AS (
+  SELECT
+    *,
+    IFNULL(LOWER(principal_email), '') AS principal_email_lc,
+    IFNULL(user_agent, '') AS user_agent_key,
+    project_id IN ({monitor_base_projects}) AS is_monitor_base_project,
+    STARTS_WITH(LOWER(project_id), '{monitor_project_prefix}') AS is_monitor_project
+  FROM audit_data
+),
+
+-- Same shape as query_opt.traffic_classification_principals, built in memory
+principal_pairs AS (
+  SELECT DISTINCT principal_email_lc, user_agent_key AS user_agent
+  FROM audit_deduplicated
+),
+
+principal_rule_matched AS (
+  SELECT
+    a.*,
+    {principal_rule_sql} AS principal_rule,
+    {is_bi_tool_agent_sql} AS is_bi_tool_agent
+  FROM principal_pairs a
+),
+
+principal_lookup AS (
+  SELECT
+    principal_email_lc,
+    user_agent,
+    {principal_category_sql} AS consumer_category,
+    {principal_subcategory_sql} AS consumer_subcategory,
+    {principal_priority_sql} AS priority_level,
+    {principal_qos_class_sql} AS qos_class
+  FROM principal_rule_matched
+),
+
+principal_matched AS (
+  SELECT
+    a.*,
+    p.consumer_category AS principal_category,
+    p.consumer_subcategory AS principal_subcategory,
+    p.priority_level AS principal_priority,
+    CASE
+      WHEN a.is_monitor_project THEN 'EXTERNAL'
+      ELSE p.qos_class
+    END AS qos_class
+  FROM audit_deduplicated a
+  LEFT JOIN principal_lookup p
+    ON p.principal_email_lc = a.principal_email_lc
+    AND p.user_agent = a.user_agent_key
+),
+
+retailer_selected AS (
+  SELECT
+    a.job_id,
+    a.project_id,
+    rm.retailer_moniker
+  FROM audit_deduplicated a
+  INNER JOIN retailer_mappings rm
+    ON rm.project_id = a.project_id
+  WHERE a.is_monitor_project
+),
+
+traffic_classified AS (
+  SELECT
+    a.*,
+    rs.retailer_moniker,
+
+    COALESCE(
+      NULLIF(regexp_extract(a.query_text, '--\\s*Metabase::\\s*userID:\\s*(\\d+)', 1), ''),
+      NULLIF(regexp_extract(a.query_text, '/\\*\\s*Metabase\\s*userID:\\s*(\\d+)\\s*\\*/', 1), ''),
+      NULLIF(regexp_extract(a.query_text, '--\\s*metabase_user_id\\s*=\\s*(\\d+)', 1), '')
+    ) AS metabase_user_id,
+
+    CASE
+      WHEN a.is_monitor_base_project THEN 'AUTOMATED'
+      WHEN a.is_monitor_project THEN 'EXTERNAL'
+      ELSE a.principal_category
+    END AS consumer_category,
+
+    CASE
+      WHEN a.is_monitor_project AND rs.retailer_moniker IS NOT NULL THEN 'MONITOR'
+      WHEN a.is_monitor_base_project THEN 'MONITOR_BASE'
+      WHEN a.is_monitor_project AND rs.retailer_moniker IS NULL THEN 'MONITOR_UNMATCHED'
+      ELSE a.principal_subcategory
+    END AS consumer_subcategory,
+
+    ROUND(a.total_slot_ms / 3600000 * {slot_cost_per_hour}, 4) AS estimated_slot_cost_usd,
+
+    CASE
+      WHEN a.qos_class = 'EXTERNAL' THEN
+        CASE WHEN a.execution_time_seconds > {external_qos_threshold_seconds} THEN 'QoS_VIOLATION' ELSE 'QoS_MET' END
+      WHEN a.qos_class = 'INTERNAL' THEN
+        CASE WHEN a.execution_time_seconds > {internal_qos_threshold_seconds} THEN 'QoS_VIOLATION' ELSE 'QoS_MET' END
+      ELSE 'QoS_REQUIRES_SCHEDULE_DATA'
+    END AS qos_status,
+
+    CASE
+      WHEN a.qos_class = 'EXTERNAL' AND a.execution_time_seconds > {external_qos_threshold_seconds}
+        THEN a.execution_time_seconds - {external_qos_threshold_seconds}
+      WHEN a.qos_class = 'INTERNAL' AND a.execution_time_seconds > {internal_qos_threshold_seconds}
+        THEN a.execution_time_seconds - {internal_qos_threshold_seconds}
+      ELSE 0
+    END AS qos_violation_seconds,
+
+    CASE
+      WHEN a.is_monitor_project THEN 1
+      ELSE a.principal_priority
+    END AS priority_level
+
+  FROM principal_matched a
+  LEFT JOIN retailer_selected rs USING (job_id, project_id)
+)
+
+SELECT
+  CURRENT_DATE AS classification_date,
+  DATE '{start_date}' AS analysis_start_date,
+  DATE '{end_date}' AS analysis_end_date,
+  '{period_label}' AS analysis_period_label,
+  '{classification_version}' AS classification_version,
+
+  job_id,
+  project_id,
+  principal_email,
+  location,
+
+  consumer_category,
+  consumer_subcategory,
+  priority_level,
+
+  retailer_moniker,
+  metabase_user_id,
+
+  job_type,
+  start_time,
+  end_time,
+  execution_time_seconds,
+  ROUND(execution_time_seconds / 60.0, 2) AS execution_time_minutes,
+
+  total_slot_ms,
+  approximate_slot_count,
+  ROUND(total_slot_ms / 3600000, 2) AS slot_hours,
+  total_billed_bytes,
+  ROUND(total_billed_bytes / POW(1024, 3), 2) AS total_billed_gb,
+  estimated_slot_cost_usd,
+
+  qos_status,
+  qos_violation_seconds,
+  CASE
+    WHEN qos_status = 'QoS_VIOLATION' THEN TRUE
+    WHEN qos_status = 'QoS_MET' THEN FALSE
+    ELSE NULL
+  END AS is_qos_violation,
+
+  reservation_name,
+  user_agent,
+  SUBSTR(query_text, 1, 500) AS query_text_sample
+
+FROM traffic_classified
+"""
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def _sql_string(value: str) -> str:
+    """Escape a value for use inside a single-quoted DuckDB literal."""
+    return str(value).replace("'", "''")
+
+
+def source_relation(input_path: str) -> str:
+    """DuckDB table function reading a Parquet or JSONL export (globs allowed)."""
+    suffix = input_path.rstrip('*').lower()
+    path = _sql_string(input_path)
+    if suffix.endswith('.parquet') or suffix.endswith('.parq') or suffix.endswith('/'):
+        return f"read_parquet('{path}', union_by_name = true)"
+    if suffix.endswith(('.jsonl', '.json', '.ndjson')):
+        columns = ', '.join(f"'{name}': '{sql_type}'" for name, sql_type in EXPORT_COLUMN_TYPES.items())
+        return f"read_json('{path}', format = 'newline_delimited', columns = {{{columns}}})"
+    raise ValueError(f"Unsupported input format (expected .parquet or .jsonl): {input_path}")
+
+
+def resolve_period(args) -> Dict:
+    """Period label and dates from --period or --start-date/--end-date."""
+    if args.period:
+        matches = [p for p in PERIODS if p['label'] == args.period]
+        if not matches:
+            labels = ', '.join(p['label'] for p in PERIODS)
+            raise ValueError(f"Unknown period '{args.period}'. Known periods: {labels}")
+        period = dict(matches[0])
+    else:
+        if not (args.start_date and args.end_date):
+            raise ValueError("Provide --period or both --start-date and --end-date")
+        period = {'label': args.label or LOCAL_PERIOD_LABEL,
+                  'start_date': args.start_date, 'end_date': args.end_date}
+    # Validate dates (they are inlined into SQL)
+    date.fromisoformat(period['start_date'])
+    date.fromisoformat(period['end_date'])
+    return period
+
+
+def render_local_sql(period: Dict, input_path: str, retailer_mapping_path: Path) -> str:
+    """Render the DuckDB classification query for a period."""
+    return LOCAL_CLASSIFICATION_SQL_TEMPLATE.format(
+        source=source_relation(input_path),
+        retailer_mapping_path=_sql_string(retailer_mapping_path),
+        scan_start_date=period['start_date'],
+        scan_end_date=period['end_date'],
+        start_date=period['start_date'],
+        end_date=period['end_date'],
+        period_label=_sql_string(period['label']),
+        classification_version=CLASSIFICATION_VERSION,
+        **render_sql_expressions(dialect='duckdb')
+    )
+
+
+def render_export_sql(period: Dict, gcs_uri: str) -> str:
+    """Render the BigQuery EXPORT DATA statement producing the replay input."""
+    return EXPORT_SQL_TEMPLATE.format(
+        gcs_uri=gcs_uri,
+        start_date=period['start_date'],
+        end_date=period['end_date']
+    )
+
+
+def run_local_classification(period: Dict, input_path: str, output_path: Path,
+                             retailer_mapping_path: Path = DEFAULT_RETAILER_MAPPING,
+                             threads: Optional[int] = None) -> Dict:
+    """Classify an audit-log export locally and write the traffic_classification schema."""
+    if not retailer_mapping_path.exists():
+        return {'status': 'error', 'error': f"Retailer mapping not found: {retailer_mapping_path}"}
+
+    output_format = 'CSV' if output_path.suffix.lower() == '.csv' else 'PARQUET'
+    copy_options = "FORMAT CSV, HEADER" if output_format == 'CSV' else "FORMAT PARQUET"
+
+    con = duckdb.connect()
+    con.execute("SET TimeZone = 'UTC'")  # DATE(timestamp) in BigQuery is a UTC date
+    try:
+        # DuckDB 1.5 raises an internal cast error when this rewrite meets the
+        # per-job QUALIFY over cast columns; the plan is fine without it
+        con.execute("SET disabled_optimizers = 'top_n_window_elimination'")
+    except duckdb.Error:
+        pass  # Older DuckDB without this optimizer
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+
+    sql = render_local_sql(period, input_path, retailer_mapping_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    start_time = time.time()
+    try:
+        con.execute(f"COPY ({sql}) TO '{_sql_string(output_path)}' ({copy_options})")
+    except duckdb.Error as e:
+        return {'status': 'error', 'error': str(e)}
+    elapsed = time.time() - start_time
+
+    output_relation = (f"read_csv_auto('{_sql_string(output_path)}')" if output_format == 'CSV'
+                       else f"read_parquet('{_sql_string(output_path)}')")
+    columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {output_relation}").fetchall()]
+    if columns != OUTPUT_COLUMNS:
+        print(f"⚠️  Output columns differ from traffic_classification: {columns}")
+
+    breakdown = con.execute(f"""
+        SELECT consumer_category, COUNT(*) AS jobs, ROUND(SUM(slot_hours), 2) AS slot_hours
+        FROM {output_relation}
+        GROUP BY 1
+        ORDER BY jobs DESC
+    """).fetchall()
+    con.close()
+
+    return {
+        'status': 'success',
+        'rows': sum(row[1] for row in breakdown),
+        'breakdown': breakdown,
+        'runtime_seconds': elapsed,
+        'output': str(output_path),
+    }
+
+
+def print_breakdown(result: Dict):
+    """Print the per-category summary of a local run."""
+    total = result['rows'] or 1
+    print(f"\n{'Category':<15} {'Jobs':>12} {'%':>7} {'Slot hours':>14}")
+    print("-" * 52)
+    for category, jobs, slot_hours in result['breakdown']:
+        print(f"{str(category):<15} {jobs:>12,} {jobs / total * 100:>6.2f}% {slot_hours or 0:>14,.2f}")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay traffic classification locally with DuckDB over an audit-log export'
+    )
+    parser.add_argument('--period', help='Period label from run_classification_all_periods.PERIODS')
+    parser.add_argument('--start-date', help='Start date (YYYY-MM-DD) when not using --period')
+    parser.add_argument('--end-date', help='End date (YYYY-MM-DD) when not using --period')
+    parser.add_argument('--label', help=f'analysis_period_label for --start-date/--end-date runs '
+                                        f'(default: {LOCAL_PERIOD_LABEL})')
+    parser.add_argument('--input', help='Parquet or JSONL export (glob patterns allowed)')
+    parser.add_argument('--output', help='Output .parquet or .csv file')
+    parser.add_argument('--retailer-mapping', type=Path, default=DEFAULT_RETAILER_MAPPING,
+                        help='CSV with a retailer_moniker column (default: results/retailer_project_mapping.csv)')
+    parser.add_argument('--threads', type=int, help='DuckDB worker threads (default: all cores)')
+    parser.add_argument('--print-export-sql', action='store_true',
+                        help='Print the BigQuery EXPORT DATA statement for the period and exit')
+    parser.add_argument('--gcs-uri', default='gs://<bucket>/<prefix>/audit-*.parquet',
+                        help='Destination URI for --print-export-sql (must contain *)')
+
+    args = parser.parse_args()
+
+    try:
+        period = resolve_period(args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    if args.print_export_sql:
+        print(render_export_sql(period, args.gcs_uri))
+        return
+
+    if not (args.input and args.output):
+        parser.error('--input and --output are required (or use --print-export-sql)')
+
+    print("=" * 80)
+    print("💻 LOCAL CLASSIFICATION REPLAY (DuckDB)")
+    print("=" * 80)
+    print(f"Period: {period['label']} ({period['start_date']} to {period['end_date']})")
+    print(f"Version: {CLASSIFICATION_VERSION}")
+    print(f"Input: {args.input}")
+    print(f"Output: {args.output}")
+
+    result = run_local_classification(period, args.input, Path(args.output),
+                                      retailer_mapping_path=args.retailer_mapping,
+                                      threads=args.threads)
+    if result['status'] != 'success':
+        print(f"\n❌ Local replay failed: {result['error']}")
+        sys.exit(1)
+
+    print(f"\n✅ Classified {result['rows']:,} jobs in {result['runtime_seconds']:.1f}s")
+    print_breakdown(result)
+    print(f"\n💾 Saved to: {result['output']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Reservation Simulator - Size a reservation by replaying historical job traces
+
+Purpose: Replace guesswork like adhoc_analysis/.../calculate_capacity.py (one
+         slot-hour total and assumed 1.5x/2x peak multipliers) with a replay of
+         real jobs (start, end, total_slot_ms) from traffic_classification or a
+         local export against candidate reservation configurations:
+         baseline slots, autoscale max and borrowable idle slots.
+Output:  Per configuration: cost, queueing delay distribution, and QoS
+         violations per QoS class against the classification thresholds
+         (EXTERNAL 30s, INTERNAL 480s; jobs the classification leaves at
+         QoS_REQUIRES_SCHEDULE_DATA have none), as CSV plus a summary of the
+         cheapest configuration meeting --max-violation-pct. The target applies
+         to violations the configuration adds on top of the historical ones, so
+         classes that already violated often as the trace ran do not rule out
+         every configuration.
+
+Model (fluid, 1-second resolution, fully vectorized):
+  - demand[t]: slots jobs used in second t, each job's total_slot_ms spread
+    evenly over its runtime (slot_usage_engine.spread_per_second)
+  - capacity[t] = baseline + idle slots + autoscale[t]; autoscale covers the
+    demand above baseline + idle in AUTOSCALE_INCREMENT steps up to the max,
+    and does not scale down for AUTOSCALE_MIN_SECONDS
+  - backlog (slot-seconds) follows the Lindley recursion
+    B[t] = max(0, B[t-1] + demand[t] - capacity[t]), solved with cumsum and
+    a running minimum instead of a loop
+  - a job ending in second t completes once later capacity has drained B[t]
+    (FIFO); that delay is added to its historical execution time
+  Each configuration is O(seconds), so a 92-day peak (7.9M seconds) takes
+  about a second and hundreds of configurations run in minutes with --workers.
+
+Caveats: traces already include the contention of the reservation they ran
+on, so demand is spread over the observed (possibly stretched) runtimes; the
+autoscaler reacts to trace demand, not to backlog. Idle slots are free;
+baseline is billed around the clock and autoscale per allocated slot-second,
+both at PRICING['slot_hour_usd'].
+
+Usage:
+    python reservation_simulator.py --period Peak_2024_2025 --reservation bq-narvar-admin:US.default
+    python reservation_simulator.py --period Peak_2024_2025 --subcategory MESSAGING \\
+        --baseline 0 50 100 200 --autoscale-max 0 100 200 --idle-slots 0 50 --workers 8
+    python reservation_simulator.py --input ../results/messaging_jobs.parquet --baseline 30 50 100
+"""
+
+import argparse
+import itertools
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bq_execution import PRICING, RESULTS_DIR, add_budget_arguments, configure_budget_from_args, get_client
+from classification_rules import (EXTERNAL_QOS_THRESHOLD_SECONDS, INTERNAL_QOS_PATTERN,
+                                  INTERNAL_QOS_THRESHOLD_SECONDS, MONITOR_PROJECT_PREFIX)
+from concurrency_engine import to_epoch_ms
+from result_cache import cached_query_dataframe, print_cache_status
+from run_classification_all_periods import DATASET_ID, PERIODS, PRINCIPAL_LOOKUP_TABLE_ID, PROJECT_ID, TABLE_ID
+from slot_usage_engine import spread_per_second
+from sql_templates import render_sql
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# By qos_class, as in the classification query's qos_status (no class: no QoS)
+QOS_THRESHOLDS = {
+    'EXTERNAL': EXTERNAL_QOS_THRESHOLD_SECONDS,
+    'INTERNAL': INTERNAL_QOS_THRESHOLD_SECONDS,
+}
+
+# BigQuery editions autoscaling: slots are added in steps of 50 and kept for
+# at least 60 seconds once allocated
+AUTOSCALE_INCREMENT = 50
+AUTOSCALE_MIN_SECONDS = 60
+
+DEFAULT_PERIOD = 'Peak_2024_2025'
+DEFAULT_BASELINE_STEPS = 20
+DEFAULT_MAX_VIOLATION_PCT = 1.0
+DELAY_PERCENTILES = [50, 95, 99]
+
+# traffic_classification keeps qos_status but not the QoS class behind it, so the
+# class is recovered the way the classification assigned it: monitor projects are
+# EXTERNAL, other jobs take the principal lookup's qos_class. Versions classified
+# before the lookup existed fall back to INTERNAL_QOS_PATTERN (else an EXTERNAL rule).
+TRACE_SQL = """
+SELECT
+  t.job_id,
+  t.consumer_category,
+  t.consumer_subcategory,
+  t.reservation_name,
+  t.start_time,
+  t.end_time,
+  t.execution_time_seconds,
+  t.total_slot_ms,
+  CASE
+    WHEN t.is_qos_violation IS NULL THEN NULL  -- QoS_REQUIRES_SCHEDULE_DATA
+    WHEN STARTS_WITH(LOWER(t.project_id), @monitor_project_prefix) THEN 'EXTERNAL'
+    ELSE COALESCE(
+      p.qos_class,
+      IF(REGEXP_CONTAINS(LOWER(t.principal_email), @internal_qos_pattern), 'INTERNAL', 'EXTERNAL'))
+  END AS qos_class
+FROM `{project_id}.{dataset_id}.{table_id}` t
+LEFT JOIN (
+  SELECT classification_version, principal_email_lc, user_agent, qos_class
+  FROM `{project_id}.{dataset_id}.{principal_lookup_table_id}`
+  QUALIFY ROW_NUMBER() OVER(
+    PARTITION BY classification_version, principal_email_lc, user_agent ORDER BY created_at) = 1
+) p
+  ON p.classification_version = t.classification_version
+  AND p.principal_email_lc = IFNULL(LOWER(t.principal_email), '')
+  AND p.user_agent = IFNULL(t.user_agent, '')
+WHERE t.analysis_period_label = @period_label
+  AND t.start_time IS NOT NULL
+  AND t.end_time IS NOT NULL
+  AND t.total_slot_ms > 0
+"""
+
+
+# ============================================================================
+# TRACES
+# ============================================================================
+
+def fetch_trace(period_label: str, refresh: bool = False, max_gb: Optional[float] = None) -> pd.DataFrame:
+    """Pull one row per classified job for a period (via the local result cache)."""
+    sql, query_parameters = render_sql(
+        TRACE_SQL,
+        identifiers={'project_id': PROJECT_ID, 'dataset_id': DATASET_ID, 'table_id': TABLE_ID,
+                     'principal_lookup_table_id': PRINCIPAL_LOOKUP_TABLE_ID},
+        parameters={
+            'period_label': period_label,
+            'monitor_project_prefix': MONITOR_PROJECT_PREFIX,
+            'internal_qos_pattern': INTERNAL_QOS_PATTERN,
+        },
+    )
+    from google.cloud import bigquery
+    result = cached_query_dataframe(
+        sql,
+        client=get_client(PROJECT_ID),
+        script='reservation_simulator',
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+        refresh=refresh,
+        max_gb=max_gb,
+    )
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    print_cache_status(result)
+    return result['df']
+
+
+def load_trace(path: Path) -> pd.DataFrame:
+    """Load a local trace export (Parquet or CSV) with the TRACE_SQL columns."""
+    trace = pd.read_parquet(path) if path.suffix == '.parquet' else pd.read_csv(path)
+    if 'qos_class' not in trace.columns:
+        raise ValueError(f"{path} has no qos_class column (export it with TRACE_SQL)")
+    return trace
+
+
+def filter_trace(trace: pd.DataFrame, reservations: Optional[List[str]] = None,
+                 categories: Optional[List[str]] = None, subcategories: Optional[List[str]] = None) -> pd.DataFrame:
+    """Keep the jobs the candidate reservation would run."""
+    mask = pd.Series(True, index=trace.index)
+    if reservations:
+        mask &= trace['reservation_name'].isin(reservations)
+    if categories:
+        mask &= trace['consumer_category'].isin(categories)
+    if subcategories:
+        mask &= trace['consumer_subcategory'].isin(subcategories)
+    return trace[mask]
+
+
+def prepare_trace(trace: pd.DataFrame, window_start: int, window_end: int) -> Dict:
+    """Demand curve plus the per-job arrays the simulation needs."""
+    starts = to_epoch_ms(trace['start_time'])
+    ends = to_epoch_ms(trace['end_time'])
+    slot_ms = trace['total_slot_ms'].to_numpy(dtype=np.float64)
+    demand = spread_per_second(starts, ends, slot_ms, window_start, window_end) / 1000  # slots
+
+    if 'execution_time_seconds' in trace.columns:
+        execution = trace['execution_time_seconds'].to_numpy(dtype=np.float64)
+    else:
+        execution = (ends - starts) / 1000
+    thresholds = trace['qos_class'].map(QOS_THRESHOLDS).to_numpy(dtype=np.float64)  # NaN: no QoS
+    return {
+        'demand': demand,
+        'end_second': np.clip(ends // 1000 - window_start, 0, len(demand) - 1),
+        'execution': execution,
+        'qos_class': trace['qos_class'].fillna('NONE').to_numpy(),
+        'threshold': thresholds,
+        'hours': (window_end - window_start) / 3600,
+    }
+
+
+# ============================================================================
+# SIMULATION
+# ============================================================================
+
+def autoscale_slots(demand: np.ndarray, floor: float, autoscale_max: int) -> np.ndarray:
+    """Autoscaled slots per second: demand above floor, stepped, capped and held."""
+    if autoscale_max <= 0:
+        return np.zeros(len(demand))
+    need = np.ceil(np.maximum(demand - floor, 0) / AUTOSCALE_INCREMENT) * AUTOSCALE_INCREMENT
+    need = np.minimum(need, autoscale_max)
+    # No scale-down until AUTOSCALE_MIN_SECONDS have passed: trailing window max
+    return pd.Series(need).rolling(AUTOSCALE_MIN_SECONDS, min_periods=1).max().to_numpy()
+
+
+def queue_delays(demand: np.ndarray, capacity: np.ndarray, at_seconds: np.ndarray) -> np.ndarray:
+    """FIFO fluid queueing delay (seconds) of work finishing at the given seconds."""
+    net = np.cumsum(demand - capacity)
+    backlog = net - np.minimum(np.minimum.accumulate(net), 0)  # Lindley: max(0, B[t-1] + x[t])
+
+    delays = np.zeros(len(at_seconds))
+    waiting = backlog[at_seconds] > 1e-9
+    if waiting.any():
+        delivered = np.cumsum(capacity)
+        t = at_seconds[waiting]
+        drained = np.searchsorted(delivered, delivered[t] + backlog[t], side='left')
+        delays[waiting] = drained - t  # past the window end: lower bound
+    return delays
+
+
+def simulate(trace: Dict, baseline: int, autoscale_max: int = 0, idle_slots: int = 0) -> Dict:
+    """Replay a prepared trace against one reservation configuration."""
+    demand = trace['demand']
+    autoscale = autoscale_slots(demand, baseline + idle_slots, autoscale_max)
+    capacity = baseline + idle_slots + autoscale
+    delays = queue_delays(demand, capacity, trace['end_second'])
+
+    simulated = trace['execution'] + delays
+    has_qos = ~np.isnan(trace['threshold'])
+    violated = has_qos & (simulated > trace['threshold'])
+    added = violated & ~(trace['execution'] > trace['threshold'])  # Met as it ran, violated here
+    delayed = delays[delays > 0]
+
+    baseline_cost = baseline * trace['hours'] * PRICING['slot_hour_usd']
+    autoscale_cost = autoscale.sum() / 3600 * PRICING['slot_hour_usd']
+    row = {
+        'baseline_slots': baseline,
+        'autoscale_max_slots': autoscale_max,
+        'idle_slots': idle_slots,
+        'total_cost_usd': round(baseline_cost + autoscale_cost, 2),
+        'baseline_cost_usd': round(baseline_cost, 2),
+        'autoscale_cost_usd': round(autoscale_cost, 2),
+        'autoscale_slot_hours': round(autoscale.sum() / 3600, 1),
+        'jobs_delayed': int(len(delayed)),
+        'jobs_delayed_pct': round(100 * len(delayed) / max(len(delays), 1), 3),
+        **{f'delay_p{p}_s': float(np.percentile(delays, p)) for p in DELAY_PERCENTILES},
+        'delay_max_s': float(delays.max()) if len(delays) else 0.0,
+        'qos_violations': int(violated.sum()),
+        'added_qos_violations': int(added.sum()),
+    }
+    for qos_class in QOS_THRESHOLDS:
+        in_class = trace['qos_class'] == qos_class
+        jobs = max(in_class.sum(), 1)
+        row[f'{qos_class.lower()}_violations'] = int(violated[in_class].sum())
+        row[f'{qos_class.lower()}_violation_pct'] = round(100 * violated[in_class].sum() / jobs, 3)
+        row[f'{qos_class.lower()}_added_violations'] = int(added[in_class].sum())
+        row[f'{qos_class.lower()}_added_violation_pct'] = round(100 * added[in_class].sum() / jobs, 3)
+    return row
+
+
+def historical_violations(trace: Dict) -> Dict[str, int]:
+    """QoS violations of the trace as it actually ran."""
+    violated = trace['execution'] > trace['threshold']  # NaN thresholds compare False
+    return {qos_class: int(violated[trace['qos_class'] == qos_class].sum()) for qos_class in QOS_THRESHOLDS}
+
+
+# ============================================================================
+# SWEEP
+# ============================================================================
+
+_worker_trace = None
+
+
+def init_worker(trace: Dict):
+    global _worker_trace
+    _worker_trace = trace
+
+
+def simulate_config(config: tuple) -> Dict:
+    return simulate(_worker_trace, *config)
+
+
+def sweep(trace: Dict, configs: List[tuple], workers: int = 1) -> pd.DataFrame:
+    """Simulate every (baseline, autoscale_max, idle_slots) configuration."""
+    if workers > 1 and len(configs) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(trace,)) as executor:
+            rows = list(executor.map(simulate_config, configs, chunksize=max(1, len(configs) // (workers * 4))))
+    else:
+        rows = [simulate(trace, *config) for config in configs]
+    return pd.DataFrame(rows).sort_values(['total_cost_usd', 'qos_violations']).reset_index(drop=True)
+
+
+def default_baselines(demand: np.ndarray, steps: int = DEFAULT_BASELINE_STEPS) -> List[int]:
+    """Evenly spaced baselines (multiples of AUTOSCALE_INCREMENT) from 0 to peak demand."""
+    peak = int(np.ceil(demand.max() / AUTOSCALE_INCREMENT) * AUTOSCALE_INCREMENT) if len(demand) else 0
+    step = max(AUTOSCALE_INCREMENT, int(np.ceil(peak / steps / AUTOSCALE_INCREMENT) * AUTOSCALE_INCREMENT))
+    return list(range(0, peak + step, step))
+
+
+def print_recommendation(results: pd.DataFrame, max_violation_pct: float, historical: Dict[str, int]):
+    """Print the cheapest configurations and the cheapest one meeting the QoS target.
+
+    The target is on added violations (jobs that met QoS as they ran but miss it
+    under the configuration), as a percentage of each class's jobs.
+    """
+    columns = ['baseline_slots', 'autoscale_max_slots', 'idle_slots', 'total_cost_usd', 'delay_p99_s',
+               'external_violations', 'external_added_violations', 'internal_violations', 'internal_added_violations']
+    print(f"\n📜 Historical QoS violations: " + ", ".join(f"{k} {v:,}" for k, v in historical.items()))
+
+    added_pct = [f'{c.lower()}_added_violation_pct' for c in QOS_THRESHOLDS]
+    meets = results[(results[added_pct] <= max_violation_pct).all(axis=1)]
+    if meets.empty:
+        print(f"\n⚠️  No configuration adds at most {max_violation_pct}% violations to every QoS class")
+        print(results.sort_values('added_qos_violations')[columns].head(10).to_string(index=False))
+        return
+    print(f"\n💡 Configurations adding at most {max_violation_pct}% violations to every QoS class (cheapest first):")
+    print(meets[columns].head(10).to_string(index=False))
+    best = meets.iloc[0]
+    print(f"\n✅ Cheapest: baseline {best['baseline_slots']:.0f}, autoscale max {best['autoscale_max_slots']:.0f}, "
+          f"idle {best['idle_slots']:.0f} -> ${best['total_cost_usd']:,.2f} for the period, "
+          f"p99 delay {best['delay_p99_s']:.0f}s")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Size a reservation by replaying historical job traces')
+    parser.add_argument('--period', default=DEFAULT_PERIOD, help='analysis_period_label to replay')
+    parser.add_argument('--input', type=Path, help='Local trace (Parquet/CSV) instead of traffic_classification')
+    parser.add_argument('--reservation', nargs='+', help='Only jobs that ran on these reservation_name values')
+    parser.add_argument('--category', nargs='+', help='Only these consumer_category values')
+    parser.add_argument('--subcategory', nargs='+', help='Only these consumer_subcategory values')
+    parser.add_argument('--baseline', type=int, nargs='+', help='Baseline slots to try (default: 0 to peak)')
+    parser.add_argument('--autoscale-max', type=int, nargs='+', default=[0], help='Autoscale max slots to try')
+    parser.add_argument('--idle-slots', type=int, nargs='+', default=[0], help='Borrowable idle slots to try')
+    parser.add_argument('--max-violation-pct', type=float, default=DEFAULT_MAX_VIOLATION_PCT,
+                        help='Most violations a configuration may add per QoS class, as %% of the class\'s jobs, '
+                             'for the recommendation (default: %(default)s%%)')
+    parser.add_argument('--workers', type=int, default=1, help='Parallel simulation processes')
+    parser.add_argument('--output', type=Path, help='Results CSV (default: results/reservation_sizing_<period>.csv)')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
+
+    if args.input:
+        if not args.input.exists():
+            print(f"❌ Trace not found: {args.input}")
+            sys.exit(1)
+        print(f"📂 Loading {args.input}...")
+        try:
+            trace = load_trace(args.input)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        label = args.input.stem
+    else:
+        period = next((p for p in PERIODS if p['label'] == args.period), None)
+        if period is None:
+            print(f"❌ Unknown period: {args.period}")
+            sys.exit(1)
+        print(f"🔍 Fetching job trace for {args.period}...")
+        try:
+            trace = fetch_trace(args.period, refresh=args.refresh, max_gb=args.max_gb)
+        except Exception as e:
+            print(f"❌ Query failed: {e}")
+            sys.exit(1)
+        label = args.period
+
+    trace = filter_trace(trace, args.reservation, args.category, args.subcategory)
+    if trace.empty:
+        print("❌ No jobs left after filtering")
+        sys.exit(1)
+
+    if args.input:
+        window_start = int(to_epoch_ms(trace['start_time']).min() // 1000)
+        window_end = int(to_epoch_ms(trace['end_time']).max() // 1000) + 1
+    else:
+        start = date.fromisoformat(period['start_date'])
+        end = date.fromisoformat(period.get('end_date', start.isoformat())) + timedelta(days=1)
+        window_start = int(pd.Timestamp(start, tz='UTC').timestamp())
+        window_end = max(int(pd.Timestamp(end, tz='UTC').timestamp()),
+                         int(to_epoch_ms(trace['end_time']).max() // 1000) + 1)
+
+    start_time = time.time()
+    prepared = prepare_trace(trace, window_start, window_end)
+    demand = prepared['demand']
+    print(f"📊 {len(trace):,} jobs over {prepared['hours'] / 24:.1f} days: "
+          f"average {demand.mean():,.1f} slots, p99 {np.percentile(demand, 99):,.1f}, peak {demand.max():,.1f}")
+
+    baselines = args.baseline or default_baselines(demand)
+    configs = list(itertools.product(baselines, args.autoscale_max, args.idle_slots))
+    print(f"🔁 Simulating {len(configs)} configurations with {args.workers} worker(s)...")
+    results = sweep(prepared, configs, args.workers)
+    print(f"   Done in {time.time() - start_time:.1f}s")
+
+    output = args.output or RESULTS_DIR / f"reservation_sizing_{label}.csv"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(output, index=False)
+    print_recommendation(results, args.max_violation_pct, historical_violations(prepared))
+    print(f"\n💾 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Result Cache - Content-addressed local Parquet cache for query results
+
+Purpose: Re-running a report to tweak its printed summary should not re-execute
+         the same SQL against BigQuery. Results are cached as Parquet, keyed by
+         a hash of the SQL text, its query parameters and the last-modified time
+         of every source table, so any change to the query or to the data
+         (e.g. a new traffic_classification load) is a cache miss.
+Storage: results/.query_cache/<key>.parquet plus a <key>.json sidecar with the
+         original job's metadata. Least-recently-used entries are evicted once
+         the cache exceeds MAX_CACHE_BYTES.
+
+Source tables are taken from a (free) dry run unless passed explicitly. Tables
+that are written continuously, such as the audit-log sink, change on every
+lookup, so queries over them effectively bypass the cache.
+
+Requirements:
+- google-cloud-bigquery
+- pyarrow
+
+Usage (from a runner script):
+    from result_cache import cached_query_dataframe, cached_query_to_file
+
+    result = cached_query_dataframe(query, script='run_hub_analytics_api_analysis',
+                                    refresh=args.refresh)
+    df = result['df']
+
+    # Inspect / maintain the cache
+    python result_cache.py --stats
+    python result_cache.py --evict --max-gb 1
+    python result_cache.py --clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from google.api_core.exceptions import GoogleAPIError
+from google.cloud import bigquery
+
+from bq_execution import RESULTS_DIR, dry_run_query, get_client
+from result_sink import infer_output_format, stream_query_to_file
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+CACHE_DIR = RESULTS_DIR / '.query_cache'
+MAX_CACHE_BYTES = 2 * 1024**3  # LRU eviction threshold (Parquet + sidecars)
+CACHE_KEY_VERSION = 1  # Bump to invalidate every entry after a key/format change
+
+
+# ============================================================================
+# CACHE KEYS
+# ============================================================================
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace so formatting-only edits keep the same key."""
+    return ' '.join(query.split())
+
+
+def source_table_versions(client: bigquery.Client, tables: List[str]) -> Dict[str, str]:
+    """Return {table: last-modified ISO timestamp} for the given table ids."""
+    versions = {}
+    for table_id in sorted(set(tables)):
+        table = client.get_table(table_id)
+        versions[table_id] = table.modified.isoformat() if table.modified else ''
+    return versions
+
+
+def cache_key(query: str, job_config: Optional[bigquery.QueryJobConfig],
+              source_versions: Dict[str, str]) -> str:
+    """SHA-256 over the normalized SQL, its parameters and source table versions."""
+    parameters = [p.to_api_repr() for p in (job_config.query_parameters if job_config else [])]
+    payload = json.dumps({
+        'version': CACHE_KEY_VERSION,
+        'sql': normalize_sql(query),
+        'parameters': parameters,
+        'sources': source_versions,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _entry_paths(key: str):
+    return CACHE_DIR / f"{key}.parquet", CACHE_DIR / f"{key}.json"
+
+
+# ============================================================================
+# CACHE MAINTENANCE
+# ============================================================================
+
+def list_entries() -> List[Dict]:
+    """Return cache entries with size and last access time, oldest access first."""
+    if not CACHE_DIR.exists():
+        return []
+    entries = []
+    for data_file in CACHE_DIR.glob('*.parquet'):
+        meta_file = data_file.with_suffix('.json')
+        size = data_file.stat().st_size + (meta_file.stat().st_size if meta_file.exists() else 0)
+        entries.append({
+            'key': data_file.stem,
+            'bytes': size,
+            'last_used': data_file.stat().st_mtime,
+        })
+    return sorted(entries, key=lambda e: e['last_used'])
+
+
+def evict(max_bytes: int = MAX_CACHE_BYTES, keep: Optional[str] = None) -> int:
+    """Delete least-recently-used entries until the cache fits in max_bytes.
+
+    The entry `keep` (the one just written) is never deleted, even if it alone
+    is larger than max_bytes.
+    """
+    entries = list_entries()
+    total = sum(e['bytes'] for e in entries)
+    evicted = 0
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        if entry['key'] == keep:
+            continue
+        for path in _entry_paths(entry['key']):
+            if path.exists():
+                path.unlink()
+        total -= entry['bytes']
+        evicted += 1
+    return evicted
+
+
+def clear_cache() -> int:
+    """Delete every cache entry."""
+    entries = list_entries()
+    if CACHE_DIR.exists():
+        shutil.rmtree(CACHE_DIR)
+    return len(entries)
+
+
+# ============================================================================
+# CACHED EXECUTION
+# ============================================================================
+
+def fetch_to_cache(
+    query: str,
+    client: Optional[bigquery.Client] = None,
+    script: Optional[str] = None,
+    job_config: Optional[bigquery.QueryJobConfig] = None,
+    source_tables: Optional[List[str]] = None,
+    refresh: bool = False,
+    max_gb: Optional[float] = None,
+) -> Dict:
+    """
+    Return a cache entry for the query, running it only on a miss or refresh.
+
+    Returns:
+        Result dict with status, cache_file, local_cache_hit and the original
+        job metadata (bytes/cost are zero on a hit: nothing was billed)
+    """
+    client = client or get_client()
+    start_time = time.time()
+
+    if source_tables is None:
+        estimate = dry_run_query(query, client, job_config)
+        if estimate['status'] != 'success':
+            return estimate
+        source_tables = estimate['referenced_tables']
+    try:
+        source_versions = source_table_versions(client, source_tables)
+    except GoogleAPIError as e:  # Missing, renamed or unreadable source table
+        return {'status': 'failed', 'error': f"Could not read source table metadata: {e}",
+                'duration_seconds': time.time() - start_time}
+    key = cache_key(query, job_config, source_versions)
+    data_file, meta_file = _entry_paths(key)
+
+    if not refresh and data_file.exists() and meta_file.exists():
+        os.utime(data_file)  # Mark as recently used for LRU eviction
+        with open(meta_file, 'r') as f:
+            metadata = json.load(f)
+        return {
+            **metadata,
+            'status': 'success',
+            'cache_file': str(data_file),
+            'local_cache_hit': True,
+            'cache_hit': True,
+            'bytes_processed': 0,
+            'bytes_billed': 0,
+            'estimated_cost_usd': 0.0,
+            'slot_ms': 0,
+            'slot_cost_usd': 0.0,
+            'duration_seconds': time.time() - start_time,
+        }
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    result = stream_query_to_file(query, data_file, client=client, script=script,
+                                  job_config=job_config, max_gb=max_gb)
+    if result['status'] != 'success':
+        return result
+
+    metadata = {
+        'key': key,
+        'job_id': result['job_id'],
+        'script': script,
+        'cached_at': datetime.now().isoformat(),
+        'source_tables': source_tables,
+        'rows': result['rows'],
+        'original_bytes_processed': result['bytes_processed'],
+        'original_cost_usd': result['estimated_cost_usd'],
+    }
+    with open(meta_file, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    evict(keep=key)
+
+    return {**result, 'cache_file': str(data_file), 'local_cache_hit': False,
+            'duration_seconds': time.time() - start_time}
+
+
+def cached_query_dataframe(query: str, **kwargs) -> Dict:
+    """fetch_to_cache() plus the cached result loaded under 'df'."""
+    result = fetch_to_cache(query, **kwargs)
+    if result['status'] == 'success':
+        result['df'] = pd.read_parquet(result['cache_file'])
+    return result
+
+
+def cached_query_to_file(query: str, output_file, output_format: Optional[str] = None, **kwargs) -> Dict:
+    """
+    fetch_to_cache() plus a copy of the result at output_file (Parquet or CSV).
+
+    CSV output is converted batch by batch, so memory stays bounded like a
+    direct result_sink download.
+    """
+    output_file = str(output_file)
+    output_format = infer_output_format(output_file, output_format)
+    result = fetch_to_cache(query, **kwargs)
+    if result['status'] != 'success':
+        return result
+
+    if output_format == 'parquet':
+        shutil.copyfile(result['cache_file'], output_file)
+    else:
+        parquet_file = pq.ParquetFile(result['cache_file'])
+        with pa_csv.CSVWriter(output_file, parquet_file.schema_arrow) as writer:
+            for batch in parquet_file.iter_batches():
+                writer.write_batch(batch)
+
+    result.update({'output_file': output_file, 'format': output_format})
+    return result
+
+
+def print_cache_status(result: Dict):
+    """Print where a cached result came from."""
+    if result.get('local_cache_hit'):
+        print(f"⚡ Local result cache hit ({result['rows']:,} rows from job {result['job_id']}, "
+              f"cached {result['cached_at']}) - no BigQuery cost")
+    else:
+        print(f"💾 Result cached for reruns: {result['cache_file']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or maintain the local query result cache')
+    parser.add_argument('--stats', action='store_true', help='Show cache size and entries')
+    parser.add_argument('--evict', action='store_true', help='Evict LRU entries down to --max-gb')
+    parser.add_argument('--max-gb', type=float, default=MAX_CACHE_BYTES / 1024**3,
+                        help=f'Size limit for --evict (default: {MAX_CACHE_BYTES / 1024**3:.0f})')
+    parser.add_argument('--clear', action='store_true', help='Delete every cache entry')
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"🗑️  Removed {clear_cache()} cache entries from {CACHE_DIR}")
+        return
+    if args.evict:
+        print(f"🗑️  Evicted {evict(int(args.max_gb * 1024**3))} entries")
+
+    entries = list_entries()
+    total_mb = sum(e['bytes'] for e in entries) / 1024**2
+    print(f"📁 Cache: {CACHE_DIR}")
+    print(f"📊 Entries: {len(entries)} ({total_mb:,.1f} MB of {MAX_CACHE_BYTES / 1024**2:,.0f} MB)")
+    if args.stats:
+        for entry in reversed(entries):
+            last_used = datetime.fromtimestamp(entry['last_used']).strftime('%Y-%m-%d %H:%M')
+            print(f"   {entry['key'][:16]}  {entry['bytes'] / 1024**2:8.1f} MB  last used {last_used}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Result Sink - Stream BigQuery query results to Parquet/CSV
+
+Purpose: Download query results as Arrow record batches over the BigQuery Storage
+         Read API and write them to disk batch by batch, instead of materializing
+         the whole result with to_dataframe() and then calling df.to_csv()
+Output:  Parquet or CSV file (format taken from the file extension by default)
+
+Memory stays bounded by the read-ahead queue of record batches, so full-year Hub
+and Looker pulls with large query_text columns no longer need the whole result in
+RAM. Summary statistics are computed afterwards with read_result_columns(), which
+loads only the columns a report actually uses.
+
+Requirements:
+- google-cloud-bigquery (client, labels and dry-run gate come from bq_execution.py)
+- google-cloud-bigquery-storage (Storage Read API; small results fall back to REST)
+- pyarrow
+
+Usage (from a runner script):
+    from bq_execution import results_path
+    from result_sink import stream_query_to_file, read_result_columns
+
+    result = stream_query_to_file(query, results_path('hub_analysis.parquet'), script='hub_analysis')
+    if result['status'] == 'success':
+        df = read_result_columns(result['output_file'], ['job_id', 'slot_hours'])
+
+    # Standalone: stream a SQL file to disk
+    python result_sink.py ../queries/phase2_consumer_analysis/monitor_retailer_performance_profile.sql \\
+        --output ../results/monitor_retailer_performance.parquet
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from bq_execution import execute_query, get_bqstorage_client, get_client, print_job_summary, read_sql
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+OUTPUT_FORMATS = ('parquet', 'csv')
+PARQUET_COMPRESSION = 'zstd'
+
+# Record batches buffered between the Storage Read API streams and the writer.
+# This (times the batch size) is the memory ceiling of a download.
+MAX_QUEUE_SIZE = 4
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def infer_output_format(output_file: str, output_format: Optional[str] = None) -> str:
+    """Return the output format, taken from the file extension if not given."""
+    if output_format is None:
+        output_format = Path(output_file).suffix.lstrip('.').lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unsupported output format '{output_format}' for {output_file} "
+            f"(expected one of {', '.join(OUTPUT_FORMATS)})"
+        )
+    return output_format
+
+
+def open_batch_writer(path: str, output_format: str, schema: pa.Schema):
+    """Open an incremental Parquet or CSV writer for record batches of one schema."""
+    if output_format == 'parquet':
+        return pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+    return pa_csv.CSVWriter(path, schema)
+
+
+# ============================================================================
+# MAIN FUNCTIONS
+# ============================================================================
+
+def stream_query_to_file(
+    query: str,
+    output_file,
+    output_format: Optional[str] = None,
+    client: Optional[bigquery.Client] = None,
+    script: Optional[str] = None,
+    job_config: Optional[bigquery.QueryJobConfig] = None,
+    max_gb: Optional[float] = None,
+    max_stream_count: Optional[int] = None,
+) -> Dict:
+    """
+    Run a query (via bq_execution.execute_query) and stream its result to a file.
+
+    The file is written to '<output_file>.partial' and renamed on success, so an
+    interrupted download never leaves a truncated result under the final name.
+
+    Returns:
+        execute_query() metadata plus output_file, format, rows, batches and
+        download timing
+    """
+    output_file = str(output_file)
+    output_format = infer_output_format(output_file, output_format)
+    partial_file = f"{output_file}.partial"
+    client = client or get_client()
+
+    result = execute_query(query, client=client, script=script, job_config=job_config,
+                           max_gb=max_gb, to_dataframe=False)
+    result.update({'output_file': output_file, 'format': output_format, 'rows': 0, 'batches': 0})
+    if result['status'] != 'success':
+        return result
+
+    download_start = time.time()
+    row_iterator = result.pop('row_iterator')
+    rows_written = 0
+    batches_written = 0
+    writer = None
+
+    try:
+        for batch in row_iterator.to_arrow_iterable(
+            bqstorage_client=get_bqstorage_client(client),
+            max_queue_size=MAX_QUEUE_SIZE,
+            max_stream_count=max_stream_count,
+        ):
+            if batch.num_rows == 0:
+                continue
+            if writer is None:
+                writer = open_batch_writer(partial_file, output_format, batch.schema)
+            writer.write_batch(batch)
+            rows_written += batch.num_rows
+            batches_written += 1
+
+        if writer is None:
+            # Empty result: still write the header/schema so readers find the columns
+            writer = open_batch_writer(partial_file, output_format, row_iterator.to_arrow().schema)
+        writer.close()
+        os.replace(partial_file, output_file)
+
+    except Exception as e:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        result.update({'status': 'failed', 'error': str(e), 'rows': rows_written})
+        return result
+
+    result.update({
+        'rows': rows_written,
+        'batches': batches_written,
+        'download_seconds': time.time() - download_start,
+        'duration_seconds': result['duration_seconds'] + time.time() - download_start,
+    })
+    return result
+
+
+def read_result_columns(output_file: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load a streamed result for summary statistics, reading only the given columns.
+
+    Columns that are not in the file are skipped, so optional report columns can
+    be listed without checking the query's output first.
+    """
+    output_format = infer_output_format(output_file)
+
+    if output_format == 'parquet':
+        if columns is not None:
+            available = set(pq.read_schema(output_file).names)
+            columns = [c for c in columns if c in available]
+        return pq.read_table(output_file, columns=columns).to_pandas()
+
+    usecols = None if columns is None else (lambda c: c in set(columns))
+    return pd.read_csv(output_file, usecols=usecols)
+
+
+def print_sink_summary(result: Dict):
+    """Print the row count and download timing of a streamed result."""
+    size_mb = os.path.getsize(result['output_file']) / 1024**2
+    print_job_summary(result)
+    print(f"📥 Downloaded in {result['download_seconds']:.1f}s")
+    print(f"📊 Rows: {result['rows']:,} ({result['batches']:,} batches, {size_mb:.1f} MB {result['format']})")
+    print(f"💾 Results saved to: {result['output_file']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Stream a BigQuery query result to Parquet or CSV'
+    )
+    parser.add_argument('query_file', help='SQL file to execute')
+    parser.add_argument('--output', required=True, help='Output file (.parquet or .csv)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, help='Override format from extension')
+    parser.add_argument('--project', help='GCP project for the query job')
+    parser.add_argument('--max-streams', type=int, help='Limit Storage Read API streams')
+    parser.add_argument('--max-gb', type=float, help='Dry-run first and refuse queries scanning more')
+    args = parser.parse_args()
+
+    print(f"🚀 Streaming {args.query_file} -> {args.output}")
+    result = stream_query_to_file(
+        read_sql(args.query_file), args.output,
+        output_format=args.format,
+        client=get_client(args.project),
+        script='result_sink',
+        max_gb=args.max_gb,
+        max_stream_count=args.max_streams,
+    )
+
+    if result['status'] != 'success':
+        print(f"❌ Query failed: {result['error']}")
+        sys.exit(1)
+    print_sink_summary(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,8 @@ Traffic Classification - Multi-Period Automation Script
 
 Purpose: Automatically classify BigQuery traffic for multiple peak and non-peak periods
 Output: Populates narvar-data-lake.query_opt.traffic_classification table
-Runtime: ~2-3 hours for all periods (can run overnight)
+Runtime: ~2-3 hours sequentially; with --max-concurrent N periods run side by side,
+         so a full run takes roughly as long as the slowest period
 
 Requirements:
 - google-cloud-bigquery
@@ -15,18 +16,31 @@ Usage:
     python run_classification_all_periods.py --mode all
     python run_classification_all_periods.py --mode peak-only
     python run_classification_all_periods.py --mode test  # Run one period only
+    python run_classification_all_periods.py --mode all --max-concurrent 4
+    python run_classification_all_periods.py --mode all --incremental  # Nightly: new days only
+    python run_classification_all_periods.py --mode all --chunk-size week  # Resumable, retried chunks
+    python run_classification_all_periods.py --mode all --incremental --refresh-cube  # + hourly cube
 """
 
 import argparse
+import json
+import os
 import sys
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+import math
 import time
 
 from google.cloud import bigquery
 from google.cloud.exceptions import GoogleCloudError
 
+from bq_execution import (add_budget_arguments, build_job_config, configure_budget_from_args, dry_run_query,
+                          estimate_cost_usd, execute_query, get_client, record_calibration, session_summary,
+                          submit_query)
+from classification_rules import render_sql_expressions
+from sql_templates import render_sql, substitute
+
 
 # ============================================================================
 # CONFIGURATION
@@ -35,8 +49,29 @@ from google.cloud.exceptions import GoogleCloudError
 PROJECT_ID = "narvar-data-lake"
 DATASET_ID = "query_opt"
 TABLE_ID = "traffic_classification"
+WATERMARK_TABLE_ID = "traffic_classification_watermarks"  # Per-day progress for --incremental
+PRINCIPAL_LOOKUP_TABLE_ID = "traffic_classification_principals"  # Per-version principal cache
+RETAILER_MAPPING_TABLE_ID = "retailer_project_mapping"  # Monitor project_id -> retailer_moniker
+RETAILER_MAPPING_WATERMARK_TABLE_ID = "retailer_project_mapping_watermarks"  # Days scanned for monikers
+RETAILER_MAPPING_HISTORY_START = "2022-01-01"  # First t_return_details day used for monikers
+RETAILER_MAPPING_LOOKBACK_DAYS = 7  # Re-scanned behind the watermark for late-arriving returns
 CLASSIFICATION_VERSION = "v1.4"  # 2025-11-06: monitor-base → AUTOMATED, QoS threshold 60s → 30s
 
+# Scheduler settings (periods are independent INSERTs, so they can run side by side)
+DEFAULT_MAX_CONCURRENT = 4
+# MERGE runs wrap each job in a multi-statement transaction on traffic_classification;
+# BigQuery aborts concurrent transactions that change the same table, so they run serially
+MERGE_MAX_CONCURRENT = 1
+DEFAULT_POLL_INTERVAL_SECONDS = 15
+
+# Chunked runs (--chunk-size day|week): failed chunks are retried with exponential
+# backoff and progress is checkpointed locally so a restart resumes where it stopped
+CHUNK_SIZE_DAYS = {'day': 1, 'week': 7}
+DEFAULT_MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 60
+RETRY_BACKOFF_MAX_SECONDS = 900
+DEFAULT_CHECKPOINT_FILE = Path(__file__).resolve().parent / 'classification_checkpoint.json'
+
 # Period definitions
 PERIODS = [
     # ====================
@@ -134,41 +169,174 @@ PERIODS = [
 # SQL TEMPLATE
 # ============================================================================
 
-SQL_TEMPLATE = """
+SQL_HEADER_TEMPLATE = """
 -- Auto-generated classification query
--- Period: {period_label}
--- Generated: {timestamp}
+-- Run values are query parameters, so the text is identical for every period
 
-DECLARE start_date DATE DEFAULT '{start_date}';
-DECLARE end_date DATE DEFAULT '{end_date}';
-DECLARE analysis_period_label STRING DEFAULT '{period_label}';
-DECLARE classification_version STRING DEFAULT '{classification_version}';
+DECLARE start_date DATE DEFAULT @start_date;
+DECLARE end_date DATE DEFAULT @end_date;
+-- Audit-log days actually scanned (the whole period unless running incrementally)
+DECLARE scan_start_date DATE DEFAULT @start_date;
+DECLARE scan_end_date DATE DEFAULT @end_date;
+DECLARE analysis_period_label STRING DEFAULT @period_label;
+DECLARE classification_version STRING DEFAULT @classification_version;
 
--- QoS thresholds
-DECLARE external_qos_threshold_seconds INT64 DEFAULT 30;  -- Updated 2025-11-06 from 60s to 30s
-DECLARE internal_qos_threshold_seconds INT64 DEFAULT 480;
-DECLARE automated_qos_threshold_seconds INT64 DEFAULT 1800;
+-- QoS thresholds (classification_rules.py)
+DECLARE external_qos_threshold_seconds INT64 DEFAULT @external_qos_threshold_seconds;
+DECLARE internal_qos_threshold_seconds INT64 DEFAULT @internal_qos_threshold_seconds;
+DECLARE automated_qos_threshold_seconds INT64 DEFAULT @automated_qos_threshold_seconds;
 
 -- Slot cost calculation
-DECLARE slot_cost_per_hour FLOAT64 DEFAULT 0.0494;
+DECLARE slot_cost_per_hour FLOAT64 DEFAULT @slot_cost_per_hour;
+"""
 
+# Lookup refresh, run once per run before any classification job is submitted.
+# Jobs read the lookups but never write them, so concurrent jobs cannot add the
+# same new principal or moniker twice. One principal refresh per audit-log day
+# range the jobs will scan.
+LOOKUP_REFRESH_TEMPLATE = """
+-- Auto-generated lookup refresh
+-- Run values are query parameters, so the text only depends on the number of ranges
+
+DECLARE scan_start_date DATE;
+DECLARE scan_end_date DATE;
+
+-- t_return_details days scanned for new retailer monikers
+DECLARE retailer_mapping_scan_start DATE;
+DECLARE retailer_mapping_scan_end DATE DEFAULT CURRENT_DATE();
+
+-- Retailer to monitor project mapping: monitor-{{MD5(moniker)[:7]}}-us-{{prod|qa|stg}}.
+-- Persisted so runs only hash monikers not seen before, and so the classification
+-- can join on project_id equality.
+CREATE TABLE IF NOT EXISTS `{project_id}.{dataset_id}.{retailer_mapping_table_id}` (
+  project_id STRING NOT NULL,
+  retailer_moniker STRING NOT NULL,
+  environment STRING NOT NULL,
+  created_at TIMESTAMP NOT NULL
+)
+CLUSTER BY project_id;
+
+-- Last t_return_details day scanned by each mapping refresh
+CREATE TABLE IF NOT EXISTS `{project_id}.{dataset_id}.{retailer_mapping_watermark_table_id}` (
+  scanned_through DATE NOT NULL,
+  refreshed_at TIMESTAMP NOT NULL,
+  script_job_id STRING
+);
+
+-- Re-scan a lookback window behind the last scanned day, so rows that land late are
+-- still picked up. Before the first watermark, continue from the newest mapping row
+-- (full history on the very first run).
+SET retailer_mapping_scan_start = COALESCE(
+  DATE_SUB(
+    (SELECT MAX(scanned_through) FROM `{project_id}.{dataset_id}.{retailer_mapping_watermark_table_id}`),
+    INTERVAL @retailer_mapping_lookback_days DAY),
+  DATE_SUB(
+    (SELECT DATE(MAX(created_at)) FROM `{project_id}.{dataset_id}.{retailer_mapping_table_id}`),
+    INTERVAL @retailer_mapping_lookback_days DAY),
+  @retailer_mapping_history_start
+);
+
+INSERT INTO `{project_id}.{dataset_id}.{retailer_mapping_table_id}`
+  (project_id, retailer_moniker, environment, created_at)
+WITH new_monikers AS (
+  SELECT DISTINCT retailer_moniker
+  FROM `narvar-data-lake.reporting.t_return_details`
+  WHERE DATE(return_created_date) BETWEEN retailer_mapping_scan_start AND retailer_mapping_scan_end
+    AND retailer_moniker IS NOT NULL
+    AND retailer_moniker NOT IN (
+      SELECT retailer_moniker FROM `{project_id}.{dataset_id}.{retailer_mapping_table_id}`
+    )
+)
+SELECT
+  CONCAT('monitor-', SUBSTR(TO_HEX(MD5(retailer_moniker)), 1, 7), '-us-', environment) AS project_id,
+  retailer_moniker,
+  environment,
+  CURRENT_TIMESTAMP()
+FROM new_monikers
+CROSS JOIN UNNEST(['prod', 'qa', 'stg']) AS environment;
+
+INSERT INTO `{project_id}.{dataset_id}.{retailer_mapping_watermark_table_id}`
+VALUES (retailer_mapping_scan_end, CURRENT_TIMESTAMP(), @@script.job_id);
+
+-- Distinct-principal classification cache (one row per version, principal, user agent)
+CREATE TABLE IF NOT EXISTS `{project_id}.{dataset_id}.{principal_lookup_table_id}` (
+  classification_version STRING NOT NULL,
+  principal_email_lc STRING NOT NULL,
+  user_agent STRING NOT NULL,
+  principal_rule STRING,
+  consumer_category STRING NOT NULL,
+  consumer_subcategory STRING NOT NULL,
+  priority_level INT64 NOT NULL,
+  qos_class STRING,
+  created_at TIMESTAMP NOT NULL
+)
+CLUSTER BY classification_version, principal_email_lc;
+{refresh_statements}
+"""
+
+LOOKUP_REFRESH_RANGE_TEMPLATE = """
 -- ============================================================================
--- Insert into physical table
+-- Day range {range_index}
 -- ============================================================================
 
-INSERT INTO `{project_id}.{dataset_id}.{table_id}`
+SET scan_start_date = @scan_start_date_{range_index};
+SET scan_end_date = @scan_end_date_{range_index};
+{principal_lookup_refresh}
+"""
 
+# Classify (principal, user agent) pairs in the scanned days that are not cached
+# yet for this version. Regex cost scales with new principals, not with jobs.
+PRINCIPAL_LOOKUP_REFRESH_TEMPLATE = """
+INSERT INTO `{project_id}.{dataset_id}.{principal_lookup_table_id}`
+  (classification_version, principal_email_lc, user_agent, principal_rule, consumer_category,
+   consumer_subcategory, priority_level, qos_class, created_at)
 WITH
--- Get retailer to monitor project mappings using MD5 hash
+scanned_principals AS (
+  SELECT DISTINCT
+    IFNULL(LOWER(protopayload_auditlog.authenticationInfo.principalEmail), '') AS principal_email_lc,
+    IFNULL(protopayload_auditlog.requestMetadata.callerSuppliedUserAgent, '') AS user_agent
+  FROM `narvar-data-lake.doitintl_cmp_bq.cloudaudit_googleapis_com_data_access`
+  WHERE DATE(timestamp) BETWEEN scan_start_date AND scan_end_date
+    AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.eventName LIKE '%_job_completed'
+),
+
+new_principals AS (
+  SELECT s.*
+  FROM scanned_principals s
+  LEFT JOIN `{project_id}.{dataset_id}.{principal_lookup_table_id}` p
+    ON p.classification_version = @classification_version
+    AND p.principal_email_lc = s.principal_email_lc
+    AND p.user_agent = s.user_agent
+  WHERE p.principal_email_lc IS NULL
+),
+
+principal_rule_matched AS (
+  SELECT
+    a.*,
+    {principal_rule_sql} AS principal_rule,
+    {is_bi_tool_agent_sql} AS is_bi_tool_agent
+  FROM new_principals a
+)
+
+SELECT
+  @classification_version,
+  principal_email_lc,
+  user_agent,
+  principal_rule,
+  {principal_category_sql},
+  {principal_subcategory_sql},
+  {principal_priority_sql},
+  {principal_qos_class_sql},
+  CURRENT_TIMESTAMP()
+FROM principal_rule_matched;
+"""
+
+CLASSIFICATION_SELECT_TEMPLATE = """
+WITH
+-- Retailer to monitor project mapping (one row per project_id; refreshed before the jobs run)
 retailer_mappings AS (
-  SELECT DISTINCT 
-    retailer_moniker,
-    CONCAT('monitor-', SUBSTR(TO_HEX(MD5(retailer_moniker)), 0, 7), '-us-prod') AS project_id_prod,
-    CONCAT('monitor-', SUBSTR(TO_HEX(MD5(retailer_moniker)), 0, 7), '-us-qa') AS project_id_qa,
-    CONCAT('monitor-', SUBSTR(TO_HEX(MD5(retailer_moniker)), 0, 7), '-us-stg') AS project_id_stg
-  FROM `narvar-data-lake.reporting.t_return_details`
-  WHERE DATE(return_created_date) >= '2022-01-01'
-    AND retailer_moniker IS NOT NULL
+  SELECT DISTINCT project_id, retailer_moniker
+  FROM `{project_id}.{dataset_id}.{retailer_mapping_table_id}`
 ),
 
 -- Extract and deduplicate audit log data
@@ -216,7 +384,7 @@ audit_data AS (
     ) AS row_num
     
   FROM `narvar-data-lake.doitintl_cmp_bq.cloudaudit_googleapis_com_data_access`
-  WHERE DATE(timestamp) BETWEEN start_date AND end_date
+  WHERE DATE(timestamp) BETWEEN scan_start_date AND scan_end_date
     AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId IS NOT NULL
     AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.job.jobName.jobId NOT LIKE 'script_job_%'
     AND protopayload_auditlog.servicedata_v1_bigquery.jobCompletedEvent.eventName LIKE '%_job_completed'
@@ -225,11 +393,43 @@ audit_data AS (
 ),
 
 audit_deduplicated AS (
-  SELECT * EXCEPT(row_num)
+  SELECT
+    * EXCEPT(row_num),
+    IFNULL(LOWER(principal_email), '') AS principal_email_lc,
+    IFNULL(user_agent, '') AS user_agent_key,
+    project_id IN ({monitor_base_projects}) AS is_monitor_base_project,
+    STARTS_WITH(LOWER(project_id), '{monitor_project_prefix}') AS is_monitor_project
   FROM audit_data
   WHERE row_num = 1
 ),
 
+-- Principal classification, computed once per distinct (principal, user agent)
+-- by the lookup refresh that runs once before the classification jobs
+principal_lookup AS (
+  SELECT *
+  FROM `{project_id}.{dataset_id}.{principal_lookup_table_id}`
+  -- The parameter, not the script variable: the lookup's own column would shadow it
+  WHERE classification_version = @classification_version
+  -- Concurrent jobs of older runs may have added the same pair twice: keep the first
+  QUALIFY ROW_NUMBER() OVER(PARTITION BY principal_email_lc, user_agent ORDER BY created_at) = 1
+),
+
+principal_matched AS (
+  SELECT
+    a.*,
+    p.consumer_category AS principal_category,
+    p.consumer_subcategory AS principal_subcategory,
+    p.priority_level AS principal_priority,
+    CASE
+      WHEN a.is_monitor_project THEN 'EXTERNAL'
+      ELSE p.qos_class
+    END AS qos_class
+  FROM audit_deduplicated a
+  LEFT JOIN principal_lookup p
+    ON p.principal_email_lc = a.principal_email_lc
+    AND p.user_agent = a.user_agent_key
+),
+
 retailer_selected AS (
   SELECT
     a.job_id,
@@ -237,8 +437,8 @@ retailer_selected AS (
     rm.retailer_moniker
   FROM audit_deduplicated a
   INNER JOIN retailer_mappings rm
-    ON a.project_id IN (rm.project_id_prod, rm.project_id_qa, rm.project_id_stg)
-  WHERE STARTS_WITH(LOWER(a.project_id), 'monitor-')
+    ON rm.project_id = a.project_id
+  WHERE a.is_monitor_project
 ),
 
 traffic_classified AS (
@@ -252,127 +452,46 @@ traffic_classified AS (
       REGEXP_EXTRACT(a.query_text, r'--\\s*metabase_user_id\\s*=\\s*(\\d+)')
     ) AS metabase_user_id,
     
-    -- PRIMARY CLASSIFICATION
+    -- PRIMARY CLASSIFICATION (principal rules: classification_rules.py, via principal_lookup)
     CASE
       -- Monitor-base infrastructure (AUTOMATED, not customer-facing) - Updated 2025-11-06
-      WHEN a.project_id IN ('monitor-base-us-prod', 'monitor-base-us-qa', 'monitor-base-us-stg') THEN 'AUTOMATED'
-      WHEN STARTS_WITH(LOWER(a.project_id), 'monitor-') THEN 'EXTERNAL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'looker.*@.*\\.iam\\.gserviceaccount\\.com') THEN 'EXTERNAL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(airflow|composer)') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gke-prod|gke-[a-z0-9]+-sumatra') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'\\d+-compute@developer\\.gserviceaccount\\.com') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(cdp|customer-data)') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(dataflow|etl)') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(eddmodel|ai-platform)') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'analytics-api-bigquery-access') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'^messaging@') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'shopify.*runner') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'ipaas-integration') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'growthbook') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'metric-layer') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'retool') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(nub-tenant|carrierstest|service-samoa)@') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'doit-cmp') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gcp-sa-bigquerydatatransfer') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gcp-sa-aiplatform') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'qa-automation-bigquery') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'noflake-') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'salesforce-bq-access') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'fivetran-production') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'data-ml-jobs') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'rudderstackbqwriter') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gcp-ship-vertex-ai') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'dev-testing@narvar-ml') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'narvar-ml-prod@appspot') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'vertex-pipeline-sa') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'churnzero-bq-access') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'promise-ai@') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'carriers-ml-service') THEN 'AUTOMATED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'@narvar\\.com$') THEN 'INTERNAL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'metabase.*@.*\\.iam\\.gserviceaccount\\.com') THEN 'INTERNAL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'n8n') THEN 'INTERNAL'
-      WHEN REGEXP_CONTAINS(LOWER(a.user_agent), r'(tableau|powerbi)') THEN 'INTERNAL'
-      ELSE 'UNCLASSIFIED'
+      WHEN a.is_monitor_base_project THEN 'AUTOMATED'
+      WHEN a.is_monitor_project THEN 'EXTERNAL'
+      ELSE a.principal_category
     END AS consumer_category,
     
     -- SECONDARY CLASSIFICATION
     CASE
-      WHEN STARTS_WITH(LOWER(a.project_id), 'monitor-') AND rs.retailer_moniker IS NOT NULL THEN 'MONITOR'
-      WHEN a.project_id IN ('monitor-base-us-prod', 'monitor-base-us-qa', 'monitor-base-us-stg') THEN 'MONITOR_BASE'
-      WHEN STARTS_WITH(LOWER(a.project_id), 'monitor-') AND rs.retailer_moniker IS NULL THEN 'MONITOR_UNMATCHED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'looker.*@.*\\.iam\\.gserviceaccount\\.com') THEN 'HUB'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(airflow|composer)') THEN 'AIRFLOW_COMPOSER'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gke-prod|gke-[a-z0-9]+-sumatra') THEN 'GKE_WORKLOAD'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'\\d+-compute@developer\\.gserviceaccount\\.com') THEN 'COMPUTE_ENGINE'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(cdp|customer-data)') THEN 'CDP'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(dataflow|etl)') THEN 'ETL_DATAFLOW'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(eddmodel|ai-platform)') THEN 'ML_INFERENCE'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'analytics-api-bigquery-access') THEN 'ANALYTICS_API'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'^messaging@') THEN 'MESSAGING'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'shopify.*runner') THEN 'SHOPIFY_INTEGRATION'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'ipaas-integration') THEN 'IPAAS_INTEGRATION'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'growthbook') THEN 'GROWTHBOOK'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'metric-layer') THEN 'METRIC_LAYER'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'retool') THEN 'RETOOL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'doit-cmp') THEN 'DOIT_CMP'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gcp-sa-bigquerydatatransfer') THEN 'BQ_DATA_TRANSFER'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gcp-sa-aiplatform') THEN 'AI_PLATFORM'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(nub-tenant|carrierstest|service-samoa)@') THEN 'DOMAIN_SERVICE'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'qa-automation-bigquery') THEN 'QA_AUTOMATION'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'noflake-') THEN 'NOFLAKE_RETIRED'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'salesforce-bq-access') THEN 'SALESFORCE_INTEGRATION'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'fivetran-production') THEN 'FIVETRAN_ETL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'data-ml-jobs') THEN 'ML_JOBS'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'rudderstackbqwriter') THEN 'RUDDERSTACK_ETL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'gcp-ship-vertex-ai') THEN 'VERTEX_AI'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'dev-testing@narvar-ml') THEN 'ML_DEV_TESTING'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'narvar-ml-prod@appspot') THEN 'ML_APPSPOT'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'vertex-pipeline-sa') THEN 'VERTEX_PIPELINE'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'churnzero-bq-access') THEN 'CHURNZERO_INTEGRATION'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'promise-ai@') THEN 'PROMISE_AI'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'carriers-ml-service') THEN 'CARRIERS_ML'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'iam\\.gserviceaccount\\.com$')
-        AND NOT REGEXP_CONTAINS(LOWER(a.principal_email), r'(airflow|composer|gke|compute|cdp|dataflow|etl|eddmodel|analytics-api|messaging|shopify|ipaas|growthbook|metric-layer|retool|doit-cmp|bigquerydatatransfer|aiplatform|looker|metabase|n8n|noflake|salesforce|fivetran|data-ml-jobs|rudderstack|vertex|dev-testing|appspot|churnzero|promise-ai|carriers-ml)')
-        THEN 'SERVICE_ACCOUNT_OTHER'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'metabase.*@.*\\.iam\\.gserviceaccount\\.com') THEN 'METABASE'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'n8n') THEN 'N8N_WORKFLOW'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'@narvar\\.com$') THEN 'ADHOC_USER'
-      WHEN REGEXP_CONTAINS(LOWER(a.user_agent), r'(tableau|powerbi)') THEN 'OTHER_BI_TOOL'
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'iam\\.gserviceaccount\\.com$') THEN 'INTERNAL_SERVICE_ACCOUNT'
-      ELSE 'UNCLASSIFIED'
+      WHEN a.is_monitor_project AND rs.retailer_moniker IS NOT NULL THEN 'MONITOR'
+      WHEN a.is_monitor_base_project THEN 'MONITOR_BASE'
+      WHEN a.is_monitor_project AND rs.retailer_moniker IS NULL THEN 'MONITOR_UNMATCHED'
+      ELSE a.principal_subcategory
     END AS consumer_subcategory,
     
     ROUND(SAFE_DIVIDE(a.total_slot_ms, 3600000) * slot_cost_per_hour, 4) AS estimated_slot_cost_usd,
     
     CASE
-      WHEN STARTS_WITH(LOWER(a.project_id), 'monitor-') OR REGEXP_CONTAINS(LOWER(a.principal_email), r'looker.*@.*\\.iam\\.gserviceaccount\\.com') THEN
+      WHEN a.qos_class = 'EXTERNAL' THEN
         CASE WHEN a.execution_time_seconds > external_qos_threshold_seconds THEN 'QoS_VIOLATION' ELSE 'QoS_MET' END
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(metabase|@narvar\\.com$)') THEN
+      WHEN a.qos_class = 'INTERNAL' THEN
         CASE WHEN a.execution_time_seconds > internal_qos_threshold_seconds THEN 'QoS_VIOLATION' ELSE 'QoS_MET' END
       ELSE 'QoS_REQUIRES_SCHEDULE_DATA'
     END AS qos_status,
     
     CASE
-      WHEN (STARTS_WITH(LOWER(a.project_id), 'monitor-') OR REGEXP_CONTAINS(LOWER(a.principal_email), r'looker.*@.*\\.iam\\.gserviceaccount\\.com'))
-        AND a.execution_time_seconds > external_qos_threshold_seconds 
+      WHEN a.qos_class = 'EXTERNAL' AND a.execution_time_seconds > external_qos_threshold_seconds
         THEN a.execution_time_seconds - external_qos_threshold_seconds
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(metabase|@narvar\\.com$)')
-        AND a.execution_time_seconds > internal_qos_threshold_seconds 
+      WHEN a.qos_class = 'INTERNAL' AND a.execution_time_seconds > internal_qos_threshold_seconds
         THEN a.execution_time_seconds - internal_qos_threshold_seconds
       ELSE 0
     END AS qos_violation_seconds,
     
     CASE
-      WHEN STARTS_WITH(LOWER(a.project_id), 'monitor-') OR REGEXP_CONTAINS(LOWER(a.principal_email), r'looker.*@.*\\.iam\\.gserviceaccount\\.com') 
-        THEN 1
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(airflow|composer|gke|compute|cdp|dataflow|etl|eddmodel|analytics-api|messaging|shopify|ipaas|growthbook|metric-layer|retool)')
-        THEN 2
-      WHEN REGEXP_CONTAINS(LOWER(a.principal_email), r'(metabase|@narvar\\.com$|n8n)')
-        THEN 3
-      ELSE 4
+      WHEN a.is_monitor_project THEN 1
+      ELSE a.principal_priority
     END AS priority_level
     
-  FROM audit_deduplicated a
+  FROM principal_matched a
   LEFT JOIN retailer_selected rs USING (job_id, project_id)
 )
 
@@ -420,7 +539,103 @@ SELECT
   user_agent,
   SUBSTR(query_text, 1, 500) AS query_text_sample
 
-FROM traffic_classified;
+FROM traffic_classified
+"""
+
+# Principal-email rules are generated from classification_rules.PRINCIPAL_RULES.
+# Generated SQL is substituted as fragments; thresholds and slot cost are values
+# and are passed as query parameters (sql_templates.py).
+RULE_SQL = render_sql_expressions()
+RULE_PARAMETER_NAMES = ['external_qos_threshold_seconds', 'internal_qos_threshold_seconds',
+                        'automated_qos_threshold_seconds', 'slot_cost_per_hour']
+RULE_FRAGMENTS = {k: v for k, v in RULE_SQL.items() if k not in RULE_PARAMETER_NAMES}
+RULE_PARAMETERS = {k: RULE_SQL[k] for k in RULE_PARAMETER_NAMES}
+
+# Table names
+SQL_IDENTIFIERS = {
+    'project_id': PROJECT_ID,
+    'dataset_id': DATASET_ID,
+    'table_id': TABLE_ID,
+    'watermark_table_id': WATERMARK_TABLE_ID,
+    'principal_lookup_table_id': PRINCIPAL_LOOKUP_TABLE_ID,
+    'retailer_mapping_table_id': RETAILER_MAPPING_TABLE_ID,
+    'retailer_mapping_watermark_table_id': RETAILER_MAPPING_WATERMARK_TABLE_ID,
+}
+PRINCIPAL_LOOKUP_REFRESH = substitute(PRINCIPAL_LOOKUP_REFRESH_TEMPLATE, SQL_IDENTIFIERS, RULE_FRAGMENTS)
+CLASSIFICATION_SELECT = substitute(CLASSIFICATION_SELECT_TEMPLATE, SQL_IDENTIFIERS, RULE_FRAGMENTS)
+
+# Full-period run: append every job in the period
+SQL_TEMPLATE = SQL_HEADER_TEMPLATE + """
+-- ============================================================================
+-- Insert into physical table
+-- ============================================================================
+
+INSERT INTO `{project_id}.{dataset_id}.{table_id}`
+{classification_select};
+"""
+
+# Columns written by CLASSIFICATION_SELECT, in order (MERGE updates all but the key)
+OUTPUT_COLUMNS = [
+    'classification_date', 'analysis_start_date', 'analysis_end_date', 'analysis_period_label',
+    'classification_version', 'job_id', 'project_id', 'principal_email', 'location',
+    'consumer_category', 'consumer_subcategory', 'priority_level', 'retailer_moniker',
+    'metabase_user_id', 'job_type', 'start_time', 'end_time', 'execution_time_seconds',
+    'execution_time_minutes', 'total_slot_ms', 'approximate_slot_count', 'slot_hours',
+    'total_billed_bytes', 'total_billed_gb', 'estimated_slot_cost_usd', 'qos_status',
+    'qos_violation_seconds', 'is_qos_violation', 'reservation_name', 'user_agent',
+    'query_text_sample'
+]
+MERGE_KEY_COLUMNS = ['job_id', 'analysis_period_label']
+
+
+# Per-day classification progress (also read by refresh_traffic_cube.py)
+WATERMARK_DDL_TEMPLATE = """
+CREATE TABLE IF NOT EXISTS `{project_id}.{dataset_id}.{watermark_table_id}` (
+  analysis_period_label STRING NOT NULL,
+  classification_version STRING NOT NULL,
+  partition_date DATE NOT NULL,
+  processed_at TIMESTAMP NOT NULL,
+  script_job_id STRING
+)
+CLUSTER BY analysis_period_label, classification_version;
+"""
+
+# Incremental run: only the day partitions missing from the watermark table for
+# the current version. MERGE keeps re-runs idempotent (no duplicate job rows).
+INCREMENTAL_SQL_TEMPLATE = SQL_HEADER_TEMPLATE + WATERMARK_DDL_TEMPLATE + """{merge_statements}
+"""
+
+MERGE_STATEMENT_TEMPLATE = """
+-- ============================================================================
+-- Day range {range_index}
+-- ============================================================================
+
+SET scan_start_date = @scan_start_date_{range_index};
+SET scan_end_date = @scan_end_date_{range_index};
+
+BEGIN TRANSACTION;
+
+MERGE `{project_id}.{dataset_id}.{table_id}` T
+USING (
+  SELECT * FROM ({classification_select})
+  WHERE TRUE
+  -- A job must appear once in the source (guards against retailer hash collisions)
+  QUALIFY ROW_NUMBER() OVER(PARTITION BY job_id ORDER BY retailer_moniker) = 1
+) S
+ON T.job_id = S.job_id
+  AND T.analysis_period_label = S.analysis_period_label
+  -- Jobs logged on day D start on D or D-1 (6h max runtime): prune target partitions
+  AND DATE(T.start_time) BETWEEN DATE_SUB(scan_start_date, INTERVAL 1 DAY) AND scan_end_date
+WHEN MATCHED THEN
+  UPDATE SET {merge_update_set}
+WHEN NOT MATCHED THEN
+  INSERT ROW;
+
+INSERT INTO `{project_id}.{dataset_id}.{watermark_table_id}`
+SELECT analysis_period_label, classification_version, day, CURRENT_TIMESTAMP(), @@script.job_id
+FROM UNNEST(GENERATE_DATE_ARRAY(scan_start_date, scan_end_date)) AS day;
+
+COMMIT TRANSACTION;
 """
 
 
@@ -446,7 +661,7 @@ def get_periods_to_run(mode: str) -> List[Dict]:
 def create_bigquery_client() -> bigquery.Client:
     """Initialize BigQuery client."""
     try:
-        client = bigquery.Client(project=PROJECT_ID)
+        client = get_client(PROJECT_ID)
         print(f"✅ Connected to BigQuery project: {PROJECT_ID}")
         return client
     except Exception as e:
@@ -454,95 +669,586 @@ def create_bigquery_client() -> bigquery.Client:
         sys.exit(1)
 
 
-def run_classification(client: bigquery.Client, period: Dict, dry_run: bool = False) -> Dict:
-    """Execute classification query for a single period."""
+def period_parameters(period: Dict) -> Dict:
+    """Query parameter values shared by the full-period and incremental scripts."""
+    return {
+        'start_date': period['start_date'],
+        'end_date': period['end_date'],
+        'period_label': period['label'],
+        'classification_version': CLASSIFICATION_VERSION,
+        **RULE_PARAMETERS
+    }
+
+
+def render_classification_sql(period: Dict) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """Render the full-period classification script and its query parameters."""
+    return render_sql(
+        SQL_TEMPLATE,
+        identifiers=SQL_IDENTIFIERS,
+        fragments={'classification_select': CLASSIFICATION_SELECT},
+        parameters=period_parameters(period),
+    )
+
+
+def get_pending_days(client: bigquery.Client, period: Dict) -> List[date]:
+    """Return the period's days not yet classified with CLASSIFICATION_VERSION.
     
-    period_label = period['label']
-    start_date = period['start_date']
-    end_date = period['end_date']
-    description = period['description']
+    Today is never pending: its audit-log partition is still being written.
+    """
+    start = date.fromisoformat(period['start_date'])
+    end = min(date.fromisoformat(period['end_date']), date.today() - timedelta(days=1))
+    if end < start:
+        return []
+    
+    watermark_sql = f"""
+    SELECT DISTINCT partition_date
+    FROM `{PROJECT_ID}.{DATASET_ID}.{WATERMARK_TABLE_ID}`
+    WHERE analysis_period_label = @period_label
+      AND classification_version = @classification_version
+      AND partition_date BETWEEN @start_date AND @end_date
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter('period_label', 'STRING', period['label']),
+        bigquery.ScalarQueryParameter('classification_version', 'STRING', CLASSIFICATION_VERSION),
+        bigquery.ScalarQueryParameter('start_date', 'DATE', start),
+        bigquery.ScalarQueryParameter('end_date', 'DATE', end),
+    ])
+    result = execute_query(watermark_sql, client=client, script='run_classification_all_periods',
+                           labels={'step': 'pending_days'}, job_config=job_config, to_dataframe=False)
+    if result['status'] == 'success':
+        processed = {row['partition_date'] for row in result['row_iterator']}
+    elif result.get('not_found'):
+        processed = set()  # First incremental run: watermark table is created by the script
+    else:
+        raise RuntimeError(result['error'])
+    
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)
+            if start + timedelta(days=i) not in processed]
+
+
+def group_consecutive_days(days: List[date]) -> List[Tuple[date, date]]:
+    """Collapse sorted days into inclusive (first, last) ranges of consecutive days."""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def render_incremental_sql(period: Dict,
+                           day_ranges: List[Tuple[date, date]]) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """Render a MERGE script covering only the given day ranges of a period.
+
+    Range boundaries are parameters too, so the text only depends on how many
+    ranges there are (always one for --chunk-size runs).
+    """
+    merge_update_set = ',\n    '.join(
+        f'{col} = S.{col}' for col in OUTPUT_COLUMNS if col not in MERGE_KEY_COLUMNS
+    )
+    fragments = {
+        'classification_select': CLASSIFICATION_SELECT,
+        'merge_update_set': merge_update_set,
+    }
+    parameters = period_parameters(period)
+    merge_statements = []
+    for range_index, (first, last) in enumerate(day_ranges):
+        merge_statements.append(substitute(
+            MERGE_STATEMENT_TEMPLATE,
+            identifiers={**SQL_IDENTIFIERS, 'range_index': range_index},
+            fragments=fragments,
+        ))
+        parameters[f'scan_start_date_{range_index}'] = first
+        parameters[f'scan_end_date_{range_index}'] = last
+
+    return render_sql(
+        INCREMENTAL_SQL_TEMPLATE,
+        identifiers=SQL_IDENTIFIERS,
+        fragments={'merge_statements': ''.join(merge_statements)},
+        parameters=parameters,
+    )
+
+
+def render_lookup_refresh_sql(day_ranges: List[Tuple[date, date]]) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """Render the run-once lookup refresh script over the given audit-log day ranges."""
+    parameters = {
+        'classification_version': CLASSIFICATION_VERSION,
+        'retailer_mapping_history_start': date.fromisoformat(RETAILER_MAPPING_HISTORY_START),
+        'retailer_mapping_lookback_days': RETAILER_MAPPING_LOOKBACK_DAYS,
+    }
+    refresh_statements = []
+    for range_index, (first, last) in enumerate(day_ranges):
+        refresh_statements.append(substitute(
+            LOOKUP_REFRESH_RANGE_TEMPLATE,
+            identifiers={'range_index': range_index},
+            fragments={'principal_lookup_refresh': PRINCIPAL_LOOKUP_REFRESH},
+        ))
+        parameters[f'scan_start_date_{range_index}'] = first
+        parameters[f'scan_end_date_{range_index}'] = last
+
+    return render_sql(
+        LOOKUP_REFRESH_TEMPLATE,
+        identifiers=SQL_IDENTIFIERS,
+        fragments={'refresh_statements': ''.join(refresh_statements)},
+        parameters=parameters,
+    )
+
+
+def unit_scan_days(client: bigquery.Client, units: List[Dict], incremental: bool) -> List[date]:
+    """Audit-log days the given work units will scan, across all units.
+    
+    Incremental whole-period units scan their pending days; a period whose
+    watermarks cannot be read is left out (its own job reports the error).
+    """
+    days = set()
+    for unit in units:
+        period = unit['period']
+        if unit['day_range']:
+            first, last = unit['day_range']
+        elif incremental:
+            try:
+                days.update(get_pending_days(client, period))
+            except Exception as e:
+                print(f"   ⚠️  {period['label']}: could not read watermarks ({e})")
+            continue
+        else:
+            first, last = date.fromisoformat(period['start_date']), date.fromisoformat(period['end_date'])
+        days.update(first + timedelta(days=i) for i in range((last - first).days + 1))
+    return sorted(days)
+
+
+def refresh_lookup_tables(client: bigquery.Client, units: List[Dict], incremental: bool = False,
+                          dry_run: bool = False) -> Dict:
+    """Map new retailer monikers and classify new principals once for every day the units will scan.
+    
+    Runs before any classification job is submitted, so the jobs (which may
+    run side by side) only read the retailer mapping and principal lookup.
+    """
+    print(f"\n🔎 Refreshing lookups ({RETAILER_MAPPING_TABLE_ID}, {PRINCIPAL_LOOKUP_TABLE_ID} {CLASSIFICATION_VERSION})")
+    scan_days = unit_scan_days(client, units, incremental)
+    if not scan_days:
+        print("   ⏭️  No audit-log days to scan - nothing to do")
+        return {'status': 'skipped'}
+    day_ranges = group_consecutive_days(scan_days)
+    print(f"   📆 {len(scan_days)} day(s) in {len(day_ranges)} range(s) ({scan_days[0]} to {scan_days[-1]})")
+    
+    sql, query_parameters = render_lookup_refresh_sql(day_ranges)
+    job_config = build_job_config(script='run_classification_all_periods', labels={
+        'classification_version': CLASSIFICATION_VERSION,
+    })
+    job_config.query_parameters = query_parameters
+    if dry_run:
+        estimate = dry_run_query(sql, client, job_config)
+        if estimate['status'] != 'success':
+            print(f"   ❌ Dry run failed: {estimate['error']}")
+            return {'status': 'error', 'error': estimate['error']}
+        print(f"   💰 Estimated bytes processed: {estimate['bytes_processed']:,}")
+        return {'status': 'dry_run', 'bytes_processed': estimate['bytes_processed']}
     
+    result = execute_query(sql, client=client, script='run_classification_all_periods',
+                           job_config=job_config, to_dataframe=False)
+    if result['status'] != 'success':
+        print(f"   ❌ Lookup refresh failed: {result['error']}")
+        return {'status': 'error', 'error': result['error']}
+    print(f"   ✅ Done in {result['duration_seconds']:.0f}s, "
+          f"{result['bytes_processed'] / 1e9:.2f} GB processed")
+    return {'status': 'success', 'bytes_processed': result['bytes_processed']}
+
+
+def print_period_header(period: Dict, day_range: Optional[Tuple[date, date]] = None):
+    """Print the banner shown when a period (or one of its chunks) is picked up."""
     print(f"\n{'='*80}")
-    print(f"🔄 Processing: {period_label}")
-    print(f"   Description: {description}")
-    print(f"   Period: {start_date} to {end_date}")
+    print(f"🔄 Processing: {period['label']}")
+    print(f"   Description: {period['description']}")
+    print(f"   Period: {period['start_date']} to {period['end_date']}")
+    if day_range:
+        print(f"   Chunk: {day_range[0]} to {day_range[1]}")
     print(f"   Type: {period['type'].upper()}")
     print(f"{'='*80}")
+
+
+def submit_classification(client: bigquery.Client, period: Dict, dry_run: bool = False,
+                          incremental: bool = False,
+                          day_range: Optional[Tuple[date, date]] = None) -> Dict:
+    """Submit the classification query for a period without waiting for it.
+
+    With `day_range` only that chunk of the period is classified (MERGE, like
+    incremental mode). Returns a result dict for dry runs, up-to-date
+    incremental periods and submission failures, otherwise a 'running' entry
+    holding the query job so the caller can poll it.
+    """
+    period_label = period['label']
+    print_period_header(period, day_range)
     
-    # Generate SQL from template
-    sql = SQL_TEMPLATE.format(
-        period_label=period_label,
-        start_date=start_date,
-        end_date=end_date,
-        classification_version=CLASSIFICATION_VERSION,
-        project_id=PROJECT_ID,
-        dataset_id=DATASET_ID,
-        table_id=TABLE_ID,
-        timestamp=datetime.now().isoformat()
-    )
+    if day_range:
+        sql, query_parameters = render_incremental_sql(period, [day_range])
+    elif incremental:
+        try:
+            pending_days = get_pending_days(client, period)
+        except Exception as e:
+            print(f"   ❌ Could not read watermarks: {e}")
+            return {'status': 'error', 'period_label': period_label, 'error': str(e)}
+        if not pending_days:
+            print(f"   ⏭️  Already classified with {CLASSIFICATION_VERSION} - nothing to do")
+            return {'status': 'skipped', 'period_label': period_label}
+        day_ranges = group_consecutive_days(pending_days)
+        print(f"   📆 Pending days: {len(pending_days)} in {len(day_ranges)} range(s) "
+              f"({pending_days[0]} to {pending_days[-1]})")
+        sql, query_parameters = render_incremental_sql(period, day_ranges)
+    else:
+        sql, query_parameters = render_classification_sql(period)
     
     # Configure job
-    job_config = bigquery.QueryJobConfig()
-    if dry_run:
-        job_config.dry_run = True
-        job_config.use_query_cache = False
+    job_config = build_job_config(script='run_classification_all_periods', labels={
+        'period': period_label,
+        'classification_version': CLASSIFICATION_VERSION,
+    })
+    job_config.query_parameters = query_parameters
+    if not dry_run:
+        # Dry-run, budget check and submit (bq_execution budget gate)
+        submitted = submit_query(sql, client, script='run_classification_all_periods', job_config=job_config)
+        if submitted['status'] == 'blocked':
+            print(f"   🚫 Not submitted: {submitted['error']}")
+            return {'status': 'error', 'period_label': period_label, 'error': submitted['error'], 'blocked': True}
+        if submitted['status'] != 'running':
+            print(f"   ❌ Query failed: {submitted['error']}")
+            return {'status': 'error', 'period_label': period_label, 'error': submitted['error']}
+        
+        print(f"   🔍 Dry-run estimate: {submitted['estimate']['gb_processed']:,.2f} GB")
+        print(f"   ⏳ Query job started: {submitted['job_id']}")
+        return {
+            **submitted,
+            'period_label': period_label,
+            'incremental': incremental or day_range is not None
+        }
     
+    job_config.dry_run = True
+    job_config.use_query_cache = False
     try:
-        # Execute query
-        start_time = time.time()
         query_job = client.query(sql, job_config=job_config)
+    except GoogleCloudError as e:
+        print(f"   ❌ Query failed: {e}")
+        return {'status': 'error', 'period_label': period_label, 'error': str(e)}
+    except Exception as e:
+        print(f"   ❌ Unexpected error: {e}")
+        return {'status': 'error', 'period_label': period_label, 'error': str(e)}
+    
+    print(f"   💰 Estimated bytes processed: {query_job.total_bytes_processed:,}")
+    print(f"   💰 Estimated cost: ${estimate_cost_usd(query_job.total_bytes_processed):.2f}")
+    return {
+        'status': 'dry_run',
+        'bytes_processed': query_job.total_bytes_processed,
+        'period_label': period_label
+    }
+
+
+def finalize_classification(client: bigquery.Client, submitted: Dict, validate: bool = True) -> Dict:
+    """Collect the outcome of a submitted classification job and validate it."""
+    
+    period_label = submitted['period_label']
+    query_job = submitted['query_job']
+    
+    try:
+        query_job.result()  # Raises if the job failed
+    except GoogleCloudError as e:
+        print(f"   ❌ {period_label}: query failed: {e}")
+        return {'status': 'error', 'period_label': period_label, 'error': str(e)}
+    except Exception as e:
+        print(f"   ❌ {period_label}: unexpected error: {e}")
+        return {'status': 'error', 'period_label': period_label, 'error': str(e)}
+    
+    elapsed_time = time.time() - submitted['start_time']
+    record_calibration(submitted, query_job)
+    
+    print(f"   ✅ {period_label}: completed in {elapsed_time/60:.1f} minutes")
+    print(f"   📊 Bytes processed: {query_job.total_bytes_processed / 1e9:.2f} GB")
+    print(f"   📊 Slot milliseconds: {query_job.slot_millis:,}")
+    
+    result = {
+        'status': 'success',
+        'period_label': period_label,
+        'job_id': query_job.job_id,
+        'runtime_minutes': elapsed_time / 60,
+        'bytes_processed': query_job.total_bytes_processed,
+        'slot_ms': query_job.slot_millis
+    }
+    if validate:
+        result['validation'] = validate_period(client, period_label, incremental=submitted.get('incremental', False))
+    return result
+
+
+def run_classification(client: bigquery.Client, period: Dict, dry_run: bool = False,
+                       incremental: bool = False) -> Dict:
+    """Execute classification query for a single period and wait for it."""
+    
+    submitted = submit_classification(client, period, dry_run=dry_run, incremental=incremental)
+    if submitted['status'] != 'running':
+        return submitted
+    
+    print(f"   ⏳ Waiting for completion...", flush=True)
+    return finalize_classification(client, submitted)
+
+
+# ============================================================================
+# CHUNKING & CHECKPOINTS
+# ============================================================================
+
+def split_into_chunks(day_ranges: List[Tuple[date, date]], chunk_size: str) -> List[Tuple[date, date]]:
+    """Split inclusive day ranges into day- or week-sized (7-day) chunks."""
+    step = CHUNK_SIZE_DAYS[chunk_size]
+    chunks = []
+    for first, last in day_ranges:
+        chunk_start = first
+        while chunk_start <= last:
+            chunk_end = min(chunk_start + timedelta(days=step - 1), last)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def chunk_key(period_label: str, day_range: Tuple[date, date]) -> str:
+    """Checkpoint key for a chunk; includes the version so a version bump starts fresh."""
+    return f"{CLASSIFICATION_VERSION}|{period_label}|{day_range[0]}|{day_range[1]}"
+
+
+def load_checkpoint(path: Path) -> Dict:
+    """Load chunk state from the checkpoint file (empty state if it does not exist)."""
+    if not path.exists():
+        return {'chunks': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: Path, checkpoint: Dict):
+    """Write the checkpoint atomically so a crash never leaves a truncated file."""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def record_chunk_state(checkpoint: Optional[Dict], checkpoint_path: Optional[Path], key: str, **fields):
+    """Update one chunk's entry in the checkpoint and persist it immediately."""
+    if checkpoint is None:
+        return
+    entry = checkpoint['chunks'].setdefault(key, {})
+    entry.update(fields, updated_at=datetime.now().isoformat(timespec='seconds'))
+    save_checkpoint(checkpoint_path, checkpoint)
+
+
+def build_work_units(client: bigquery.Client, periods: List[Dict], chunk_size: str,
+                     incremental: bool, checkpoint: Optional[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Turn periods into schedulable units: whole periods, or day/week chunks.
+    
+    Chunks already marked 'done' in the checkpoint are skipped (resume); with
+    --incremental, chunks are only built over days missing from the watermarks.
+    Returns (units, failed): a period whose watermarks cannot be read gets an
+    error result in `failed` instead of stopping the whole run.
+    """
+    units = []
+    failed = []
+    for period in periods:
+        if chunk_size == 'period':
+            units.append({'key': period['label'], 'period': period, 'day_range': None})
+            continue
         
-        if dry_run:
-            print(f"   💰 Estimated bytes processed: {query_job.total_bytes_processed:,}")
-            print(f"   💰 Estimated cost: ${query_job.total_bytes_processed / 1e12 * 5:.2f}")
-            return {
-                'status': 'dry_run',
-                'bytes_processed': query_job.total_bytes_processed,
-                'period_label': period_label
-            }
+        if incremental:
+            try:
+                day_ranges = group_consecutive_days(get_pending_days(client, period))
+            except Exception as e:
+                print(f"   ❌ {period['label']}: could not read watermarks: {e}")
+                failed.append({'status': 'error', 'period_label': period['label'], 'error': str(e)})
+                continue
+        else:
+            day_ranges = [(date.fromisoformat(period['start_date']), date.fromisoformat(period['end_date']))]
         
-        # Wait for completion
-        print(f"   ⏳ Query job started: {query_job.job_id}")
-        print(f"   ⏳ Waiting for completion...", flush=True)
+        chunks = split_into_chunks(day_ranges, chunk_size)
+        resumed = 0
+        for day_range in chunks:
+            key = chunk_key(period['label'], day_range)
+            if checkpoint and checkpoint['chunks'].get(key, {}).get('status') == 'done':
+                resumed += 1
+                continue
+            units.append({'key': key, 'period': period, 'day_range': day_range})
+        print(f"   {period['label']:<30} {len(chunks)} {chunk_size} chunk(s), "
+              f"{resumed} already done (checkpoint), {len(chunks) - resumed} to run")
+    
+    for unit in units:
+        unit.update(attempts=0, not_before=0.0)
+    return units, failed
+
+
+def retry_delay_seconds(attempt: int) -> float:
+    """Exponential backoff for the given (1-based) failed attempt."""
+    return min(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1), RETRY_BACKOFF_MAX_SECONDS)
+
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+def run_units_concurrently(client: bigquery.Client, units: List[Dict], max_concurrent: int,
+                           poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                           dry_run: bool = False, incremental: bool = False,
+                           max_retries: int = 0, checkpoint: Optional[Dict] = None,
+                           checkpoint_path: Optional[Path] = None) -> List[Dict]:
+    """Run classification jobs with at most `max_concurrent` in flight.
+    
+    Units (whole periods or chunks from build_work_units) are submitted in the
+    order given, i.e. period priority order, and polled until done; whichever
+    job finishes first is reported first, and a freed slot is immediately
+    refilled. Failed units are retried up to `max_retries` times with
+    exponential backoff. Chunk state goes to the checkpoint as it changes.
+    Results are returned in submission order so print_summary() stays stable.
+    """
+    pending = list(units)
+    in_flight: List[Dict] = []
+    results: Dict[str, Dict] = {}
+    total = len(units)
+    submit_more = True
+    chunked = any(u['day_range'] for u in units)
+    
+    while (pending and submit_more) or in_flight:
+        # Fill free slots in priority order, skipping units still backing off
+        while submit_more and len(in_flight) < max_concurrent:
+            ready = [u for u in pending if u['not_before'] <= time.time()]
+            if not ready:
+                break
+            unit = ready[0]
+            pending.remove(unit)
+            unit['attempts'] += 1
+            print(f"\n\n{'#'*80}")
+            print(f"# SUBMIT {total - len(pending)}/{total} ({len(in_flight) + 1}/{max_concurrent} slots in use)"
+                  + (f" - attempt {unit['attempts']}/{max_retries + 1}" if unit['attempts'] > 1 else ""))
+            print(f"{'#'*80}")
+            
+            submitted = submit_classification(client, unit['period'], dry_run=dry_run,
+                                              incremental=incremental, day_range=unit['day_range'])
+            submitted['unit'] = unit
+            if submitted['status'] == 'running':
+                in_flight.append(submitted)
+                if unit['day_range']:
+                    record_chunk_state(checkpoint, checkpoint_path, unit['key'], status='running',
+                                       attempts=unit['attempts'], job_id=submitted['query_job'].job_id)
+            else:
+                finished_unit(submitted, unit, results, pending, max_retries, checkpoint, checkpoint_path)
         
-        result = query_job.result()  # Wait for job to complete
+        if not in_flight:
+            if pending and submit_more:
+                # Everything left is backing off - wait for the earliest retry
+                time.sleep(max(0.0, min(u['not_before'] for u in pending) - time.time()))
+            continue
         
-        elapsed_time = time.time() - start_time
+        time.sleep(poll_interval)
         
-        print(f"   ✅ Completed in {elapsed_time/60:.1f} minutes")
-        print(f"   📊 Bytes processed: {query_job.total_bytes_processed / 1e9:.2f} GB")
-        print(f"   📊 Slot milliseconds: {query_job.slot_millis:,}")
+        still_running = []
+        finished = []
+        for submitted in in_flight:
+            try:
+                done = submitted['query_job'].done()
+            except Exception as e:
+                print(f"   ⚠️  {submitted['period_label']}: status check failed ({e}), retrying")
+                done = False
+            (finished if done else still_running).append(submitted)
+        in_flight = still_running
         
-        # Validate results
-        validation_result = validate_period(client, period_label)
+        for submitted in finished:
+            unit = submitted['unit']
+            result = finalize_classification(client, submitted, validate=not chunked)
+            final = finished_unit(result, unit, results, pending, max_retries, checkpoint, checkpoint_path)
+            print(f"   📈 Progress: {len(results)}/{total} finished, {len(in_flight)} running, "
+                  f"{len(pending)} queued")
+            
+            if (final and result['status'] == 'error' and pending and submit_more
+                    and not incremental and not chunked):
+                response = input(f"\n⚠️  Classification failed. Continue submitting remaining periods? [y/N]: ")
+                submit_more = response.lower() == 'y'
+    
+    return [results[u['key']] for u in units if u['key'] in results]
+
+
+def finished_unit(result: Dict, unit: Dict, results: Dict[str, Dict], pending: List[Dict],
+                  max_retries: int, checkpoint: Optional[Dict], checkpoint_path: Optional[Path]) -> bool:
+    """Record a unit's outcome, or requeue it with backoff. Returns True if final."""
+    result['unit_key'] = unit['key']
+    result['day_range'] = unit['day_range']
+    
+    if result['status'] == 'error' and not result.get('blocked') and unit['attempts'] <= max_retries:
+        delay = retry_delay_seconds(unit['attempts'])
+        unit['not_before'] = time.time() + delay
+        pending.insert(0, unit)
+        print(f"   🔁 Retrying {unit['key']} in {delay:.0f}s (attempt {unit['attempts'] + 1}/{max_retries + 1})")
+        if unit['day_range']:
+            record_chunk_state(checkpoint, checkpoint_path, unit['key'], status='retrying',
+                               attempts=unit['attempts'], error=result.get('error'))
+        return False
+    
+    results[unit['key']] = result
+    if unit['day_range'] and result['status'] in ('success', 'error'):
+        if result['status'] == 'success':
+            record_chunk_state(checkpoint, checkpoint_path, unit['key'], status='done',
+                               attempts=unit['attempts'], job_id=result['job_id'], error=None,
+                               bytes_processed=result['bytes_processed'], slot_ms=result['slot_ms'],
+                               runtime_minutes=round(result['runtime_minutes'], 2))
+        else:
+            record_chunk_state(checkpoint, checkpoint_path, unit['key'], status='failed',
+                               attempts=unit['attempts'], error=result.get('error'))
+    return True
+
+
+def summarize_chunk_results(client: bigquery.Client, periods: List[Dict], unit_results: List[Dict],
+                            dry_run: bool = False) -> List[Dict]:
+    """Roll chunk results up to one result per period for print_summary().
+    
+    A period is validated once all of its chunks in this run succeeded.
+    """
+    period_results = []
+    for period in periods:
+        chunk_results = [r for r in unit_results if r['period_label'] == period['label']]
+        if not chunk_results:
+            period_results.append({'status': 'skipped', 'period_label': period['label']})
+            continue
+        if dry_run:
+            period_results.append({
+                'status': 'dry_run',
+                'period_label': period['label'],
+                'bytes_processed': sum(r.get('bytes_processed', 0) for r in chunk_results)
+            })
+            continue
         
-        return {
-            'status': 'success',
-            'period_label': period_label,
-            'runtime_minutes': elapsed_time / 60,
-            'bytes_processed': query_job.total_bytes_processed,
-            'slot_ms': query_job.slot_millis,
-            'validation': validation_result
-        }
+        failed = [r for r in chunk_results if r['status'] == 'error']
+        if failed:
+            failed_ranges = ', '.join(f"{r['day_range'][0]}..{r['day_range'][1]}" for r in failed)
+            period_results.append({
+                'status': 'error',
+                'period_label': period['label'],
+                'error': f"{len(failed)} chunk(s) failed ({failed_ranges}) - re-run to resume from checkpoint"
+            })
+            continue
         
-    except GoogleCloudError as e:
-        print(f"   ❌ Query failed: {e}")
-        return {
-            'status': 'error',
-            'period_label': period_label,
-            'error': str(e)
-        }
-    except Exception as e:
-        print(f"   ❌ Unexpected error: {e}")
-        return {
-            'status': 'error',
-            'period_label': period_label,
-            'error': str(e)
-        }
+        period_results.append({
+            'status': 'success',
+            'period_label': period['label'],
+            'runtime_minutes': sum(r['runtime_minutes'] for r in chunk_results),
+            'bytes_processed': sum(r['bytes_processed'] for r in chunk_results),
+            'slot_ms': sum(r['slot_ms'] or 0 for r in chunk_results),
+            'validation': validate_period(client, period['label'], incremental=True)
+        })
+    return period_results
 
 
-def validate_period(client: bigquery.Client, period_label: str) -> Dict:
-    """Validate classification results for a period."""
+def validate_period(client: bigquery.Client, period_label: str, incremental: bool = False) -> Dict:
+    """Validate classification results for a period.
+    
+    Full runs insert fresh rows stamped with today's date; incremental runs
+    only touch new days, so they validate every row of the current version.
+    """
+    
+    if incremental:
+        row_filter = f"classification_version = '{CLASSIFICATION_VERSION}'"
+    else:
+        row_filter = "classification_date = CURRENT_DATE()"
     
     validation_sql = f"""
     SELECT
@@ -556,12 +1262,15 @@ def validate_period(client: bigquery.Client, period_label: str) -> Dict:
       COUNT(DISTINCT retailer_moniker) AS unique_retailers
     FROM `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`
     WHERE analysis_period_label = '{period_label}'
-      AND classification_date = CURRENT_DATE();
+      AND {row_filter};
     """
     
     try:
-        result = client.query(validation_sql).result()
-        row = next(result)
+        result = execute_query(validation_sql, client=client, script='run_classification_all_periods',
+                               to_dataframe=False)
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
+        row = next(result['row_iterator'])
         
         validation = {
             'total_jobs': row['total_jobs'],
@@ -604,6 +1313,7 @@ def print_summary(results: List[Dict]):
     
     successful = [r for r in results if r['status'] == 'success']
     failed = [r for r in results if r['status'] == 'error']
+    skipped = [r for r in results if r['status'] == 'skipped']
     
     if successful:
         print(f"✅ Successful runs: {len(successful)}")
@@ -631,6 +1341,9 @@ def print_summary(results: List[Dict]):
         print(f"{'-'*100}")
         print(f"{'TOTAL':<30} {total_jobs:>11,} {'':>12} {'':>15} ${total_cost:>10,.0f} {total_runtime:>7.1f} min")
     
+    if skipped:
+        print(f"\n⏭️  Already up to date: {', '.join(r['period_label'] for r in skipped)}")
+    
     if failed:
         print(f"\n❌ Failed runs: {len(failed)}")
         for r in failed:
@@ -652,14 +1365,54 @@ def main():
     parser.add_argument('--dry-run', 
                         action='store_true',
                         help='Estimate cost without executing')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Only classify days missing from the watermark table for the current version (MERGE, no duplicates)')
+    parser.add_argument('--max-concurrent',
+                        type=int,
+                        default=DEFAULT_MAX_CONCURRENT,
+                        help=f'Maximum number of period jobs running at once (default: {DEFAULT_MAX_CONCURRENT}; '
+                             f'MERGE runs always use {MERGE_MAX_CONCURRENT})')
+    parser.add_argument('--poll-interval',
+                        type=float,
+                        default=DEFAULT_POLL_INTERVAL_SECONDS,
+                        help=f'Seconds between job status polls (default: {DEFAULT_POLL_INTERVAL_SECONDS})')
+    parser.add_argument('--chunk-size',
+                        choices=['period', 'day', 'week'],
+                        default='period',
+                        help='Split each period into day or week chunks (MERGE per chunk, checkpointed, resumable)')
+    parser.add_argument('--max-retries',
+                        type=int,
+                        default=DEFAULT_MAX_RETRIES,
+                        help=f'Retries per failed chunk/incremental job, with exponential backoff (default: {DEFAULT_MAX_RETRIES})')
+    parser.add_argument('--checkpoint-file',
+                        type=Path,
+                        default=DEFAULT_CHECKPOINT_FILE,
+                        help='Chunk checkpoint file used to resume interrupted chunked runs')
+    parser.add_argument('--refresh-cube',
+                        action='store_true',
+                        help='Afterwards, rebuild the changed days of the hourly cube (refresh_traffic_cube.py)')
+    add_budget_arguments(parser)
     
     args = parser.parse_args()
+    configure_budget_from_args(args)
+    if args.max_concurrent < 1:
+        parser.error('--max-concurrent must be at least 1')
+    
+    chunked = args.chunk_size != 'period'
+    # Incremental and chunked runs MERGE; chunks of one period all target the same table
+    merge_mode = args.incremental or chunked
+    max_concurrent = min(args.max_concurrent, MERGE_MAX_CONCURRENT) if merge_mode else args.max_concurrent
     
     print(f"\n{'='*80}")
     print(f"🚀 BigQuery Traffic Classification - Multi-Period Automation")
     print(f"{'='*80}")
     print(f"Mode: {args.mode}")
     print(f"Dry run: {args.dry_run}")
+    print(f"Incremental: {args.incremental}")
+    print(f"Max concurrent jobs: {max_concurrent}"
+          + (" (MERGE transactions on the same table run one at a time)" if max_concurrent < args.max_concurrent else ""))
+    print(f"Chunk size: {args.chunk_size}")
     print(f"Target table: {PROJECT_ID}.{DATASET_ID}.{TABLE_ID}")
     print(f"Classification version: {CLASSIFICATION_VERSION}")
     print(f"{'='*80}\n")
@@ -678,9 +1431,15 @@ def main():
     if args.dry_run:
         print(f"\n💰 Running in DRY-RUN mode (cost estimation only)")
     
+    # Full-period INSERTs are not idempotent, so only MERGE-based runs are retried
+    max_retries = args.max_retries if (chunked or args.incremental) else 0
+    
     # Confirm execution
-    if not args.dry_run and args.mode != 'test':
-        response = input(f"\n⚠️  Proceed with classification? This will take ~{len(periods_to_run) * 15} minutes. [y/N]: ")
+    # Incremental runs are meant for unattended nightly jobs, so they never prompt
+    if not args.dry_run and not args.incremental and args.mode != 'test':
+        # ~15 min per period job (the sequential estimate); concurrent jobs finish in waves
+        waves = math.ceil(len(periods_to_run) / max_concurrent)
+        response = input(f"\n⚠️  Proceed with classification? This will take ~{waves * 15} minutes. [y/N]: ")
         if response.lower() != 'y':
             print("Cancelled by user.")
             return
@@ -688,24 +1447,52 @@ def main():
     # Initialize BigQuery client
     client = create_bigquery_client()
     
+    # Resume chunked runs from the local checkpoint
+    checkpoint = None
+    if chunked and not args.dry_run:
+        checkpoint = load_checkpoint(args.checkpoint_file)
+        print(f"📌 Checkpoint: {args.checkpoint_file}")
+    
+    units, failed_periods = build_work_units(client, periods_to_run, args.chunk_size, args.incremental, checkpoint)
+    
+    # Map new monikers and classify new principals once, before jobs that read them run side by side
+    lookup_refresh = refresh_lookup_tables(client, units, incremental=args.incremental, dry_run=args.dry_run)
+    if lookup_refresh['status'] == 'error':
+        print("❌ Not submitting classification jobs: the lookup tables could not be refreshed")
+        sys.exit(1)
+    
     # Run classifications
-    results = []
-    for i, period in enumerate(periods_to_run, 1):
-        print(f"\n\n{'#'*80}")
-        print(f"# RUN {i}/{len(periods_to_run)}")
-        print(f"{'#'*80}")
-        
-        result = run_classification(client, period, dry_run=args.dry_run)
-        results.append(result)
-        
-        if result['status'] == 'error' and not args.dry_run:
-            response = input(f"\n⚠️  Classification failed. Continue with remaining periods? [y/N]: ")
-            if response.lower() != 'y':
-                break
+    run_started = time.time()
+    results = run_units_concurrently(
+        client,
+        units,
+        max_concurrent=max_concurrent,
+        poll_interval=args.poll_interval,
+        dry_run=args.dry_run,
+        incremental=args.incremental,
+        max_retries=max_retries,
+        checkpoint=checkpoint,
+        checkpoint_path=args.checkpoint_file
+    )
+    if chunked:
+        failed_labels = {r['period_label'] for r in failed_periods}
+        results = summarize_chunk_results(client, [p for p in periods_to_run if p['label'] not in failed_labels],
+                                          results, dry_run=args.dry_run)
+    results += failed_periods
+    wall_clock_minutes = (time.time() - run_started) / 60
     
     # Print summary
     if not args.dry_run:
         print_summary(results)
+        print(f"⏱️  Wall-clock time: {wall_clock_minutes:.1f} min (max {max_concurrent} concurrent jobs)")
+        session = session_summary()
+        print(f"📦 Scanned: {session['actual_bytes'] / 1024**3:,.1f} GB actual vs "
+              f"{session['estimated_bytes'] / 1024**3:,.1f} GB dry-run estimate "
+              f"(session budget {session['budget']['session_gb']:,.0f} GB)")
+        
+        if args.refresh_cube:
+            from refresh_traffic_cube import print_refresh_summary, refresh_cube  # Imports this module
+            print_refresh_summary(refresh_cube(client, [p['label'] for p in periods_to_run]))
         
         # Provide next steps
         print("\n🎯 Next Steps:")
@@ -715,9 +1502,9 @@ def main():
         print(f"   4. Query the table: `{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}`")
     else:
         print("\n💰 Dry run summary:")
-        total_bytes = sum(r.get('bytes_processed', 0) for r in results)
+        total_bytes = sum(r.get('bytes_processed', 0) for r in results) + lookup_refresh.get('bytes_processed', 0)
         print(f"   Total bytes to process: {total_bytes / 1e9:.2f} GB")
-        print(f"   Estimated cost: ${total_bytes / 1e12 * 5:.2f}")
+        print(f"   Estimated cost: ${estimate_cost_usd(total_bytes):.2f}")
 
 
 if __name__ == "__main__":
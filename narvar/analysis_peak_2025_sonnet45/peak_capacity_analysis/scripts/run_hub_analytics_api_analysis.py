@@ -3,43 +3,49 @@
 Run Hub Analytics API performance analysis.
 Analyzes REAL Hub analytics dashboards (analytics-api-bigquery-access service account).
 Cost: ~$0.018 (3.74 GB scan)
+Results are cached locally (result_cache.py) until traffic_classification changes;
+pass --refresh to re-run the query.
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 from datetime import datetime
 import pandas as pd
 
-def run_hub_analytics_analysis():
+from bq_execution import (add_budget_arguments, configure_budget_from_args, print_job_summary, read_sql,
+                          resolve_query_path, results_path)
+from latency_sketch_store import SKETCH_STORE_FILE, latency_percentiles, load_sketch_store
+from result_cache import cached_query_dataframe, print_cache_status
+
+# Tables the query reads (their last-modified time is part of the cache key)
+SOURCE_TABLES = ['narvar-data-lake.query_opt.traffic_classification']
+
+def run_hub_analytics_analysis(refresh=False):
     """Execute Hub Analytics API performance analysis."""
     
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Read query from file
-    query_file = 'queries/phase2_consumer_analysis/hub_analytics_api_performance.sql'
+    # Read query from queries/ (resolved from this script's location)
+    query_file = resolve_query_path('phase2_consumer_analysis/hub_analytics_api_performance.sql')
     print(f"\n📂 Reading query from: {query_file}")
-    
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     print(f"\n🚀 Executing Hub Analytics API analysis...")
-    print(f"💰 Estimated cost: ~$0.018 (3.74 GB scan)")
     print(f"📊 Analyzing ANALYTICS_API consumer subcategory (real Hub analytics)")
     print(f"⏱️  This should complete in 30-60 seconds...\n")
     
     # Run query
     try:
-        start_time = datetime.now()
-        df = client.query(query).to_dataframe()
-        duration = (datetime.now() - start_time).total_seconds()
-        
-        print(f"✅ Query completed successfully in {duration:.1f} seconds!")
+        result = cached_query_dataframe(query, script='run_hub_analytics_api_analysis',
+                                        source_tables=SOURCE_TABLES, refresh=refresh)
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
+        
+        df = result['df']
+        print_job_summary(result)
+        print_cache_status(result)
         print(f"📊 Results: {len(df)} period(s) analyzed\n")
         
         # Save to CSV
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'results/hub_analytics_api_performance_{timestamp}.csv'
+        output_file = results_path(f'hub_analytics_api_performance_{timestamp}.csv')
         
         df.to_csv(output_file, index=False)
         print(f"💾 Results saved to: {output_file}")
@@ -96,8 +102,19 @@ def run_hub_analytics_analysis():
         overall_violation_rate = total_violations / total_queries * 100
         print(f"   Total QoS Violations: {total_violations:,} ({overall_violation_rate:.2f}%)")
         print(f"   Avg Execution Time: {df['avg_execution_seconds'].mean():.2f}s")
-        print(f"   Avg P95 Execution: {df['p95_execution_seconds'].mean():.2f}s")
-        print(f"   Avg P99 Execution: {df['p99_execution_seconds'].mean():.2f}s")
+        # Percentiles cannot be averaged across periods: merge the periods' latency sketches instead
+        if SKETCH_STORE_FILE.exists():
+            latency = latency_percentiles(load_sketch_store(), where={
+                'consumer_subcategory': ['ANALYTICS_API'],
+                'analysis_period_label': df['analysis_period_label'].tolist(),
+            })
+            if not latency.empty:
+                print(f"   P95 Execution (all periods): {latency['p95_execution_seconds'].iloc[0]:.2f}s")
+                print(f"   P99 Execution (all periods): {latency['p99_execution_seconds'].iloc[0]:.2f}s")
+        else:
+            print(f"   P95 Execution by period: {df['p95_execution_seconds'].min():.2f}s - "
+                  f"{df['p95_execution_seconds'].max():.2f}s "
+                  f"(build latency_sketch_store.py for percentiles across periods)")
         
         # QoS by reservation
         if not df['violation_pct_reserved'].isna().all():
@@ -153,10 +170,13 @@ def run_hub_analytics_analysis():
         return None, None
 
 if __name__ == "__main__":
-    # Change to project directory
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Run Hub Analytics API performance analysis')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache and re-run the query')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
     
-    df, output_file = run_hub_analytics_analysis()
+    df, output_file = run_hub_analytics_analysis(refresh=args.refresh)
     
     if df is not None:
         print(f"\n✨ Analysis complete! Ready for comparison with Looker.")
@@ -2,45 +2,49 @@
 """
 Run full Hub Analytics API analysis with retailer attribution.
 Cost: ~$0.85 (173.92 GB scan)
+Results are streamed to disk (CSV or Parquet) via result_sink.py.
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 from datetime import datetime
 import pandas as pd
 
-def run_full_hub_analytics_analysis():
+from bq_execution import add_budget_arguments, configure_budget_from_args, read_sql, resolve_query_path, results_path
+from result_sink import stream_query_to_file, read_result_columns, print_sink_summary
+
+# Columns used by the summary below (query text columns are left on disk)
+SUMMARY_COLUMNS = [
+    'job_id', 'start_time', 'analysis_period_label', 'attribution_quality',
+    'extraction_method', 'retailer_attribution', 'is_qos_violation',
+    'execution_time_seconds', 'actual_cost_usd', 'slot_hours', 'gb_scanned',
+    'reservation_type', 'has_joins', 'has_group_by', 'has_cte',
+    'has_window_functions', 'query_length',
+]
+
+def run_full_hub_analytics_analysis(output_format='csv'):
     """Execute full Hub Analytics API analysis with retailer attribution."""
     
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Read query from file
-    query_file = 'queries/phase2_consumer_analysis/hub_analytics_api_full_analysis.sql'
+    # Read query from queries/ (resolved from this script's location)
+    query_file = resolve_query_path('phase2_consumer_analysis/hub_analytics_api_full_analysis.sql')
     print(f"\n📂 Reading query from: {query_file}")
-    
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     print(f"\n🚀 Executing full Hub Analytics API analysis with retailer attribution...")
-    print(f"⚠️  Estimated cost: ~$0.85 (173.92 GB scan)")
     print(f"⏱️  This may take 2-3 minutes...\n")
     
     # Run query
     try:
-        start_time = datetime.now()
-        df = client.query(query).to_dataframe()
-        duration = (datetime.now() - start_time).total_seconds()
-        
-        print(f"✅ Query completed successfully in {duration:.1f} seconds!")
-        print(f"📊 Results: {len(df)} Hub Analytics API queries analyzed\n")
-        
-        # Save to CSV
+        # Stream results to disk
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'results/hub_analytics_api_full_analysis_{timestamp}.csv'
+        output_file = results_path(f'hub_analytics_api_full_analysis_{timestamp}.{output_format}')
         
-        df.to_csv(output_file, index=False)
-        print(f"💾 Results saved to: {output_file}")
+        result = stream_query_to_file(query, output_file, script='run_hub_analytics_full_analysis')
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
+        
+        print_sink_summary(result)
+        df = read_result_columns(output_file, SUMMARY_COLUMNS)
+        print(f"📊 Results: {len(df)} Hub Analytics API queries analyzed\n")
         
         # Print comprehensive summary
         print(f"\n" + "="*80)
@@ -159,7 +163,7 @@ def run_full_hub_analytics_analysis():
                 'is_qos_violation_<lambda>': 'violation_rate_pct'
             }, inplace=True)
             
-            retailer_file = f'results/hub_analytics_api_retailer_summary_{timestamp}.csv'
+            retailer_file = results_path(f'hub_analytics_api_retailer_summary_{timestamp}.csv')
             retailer_summary.to_csv(retailer_file)
             print(f"💾 Retailer summary saved to: {retailer_file}")
         
@@ -177,10 +181,13 @@ def run_full_hub_analytics_analysis():
         return None, None
 
 if __name__ == "__main__":
-    # Change to project directory
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Run full Hub Analytics API analysis')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output file format')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
     
-    df, output_file = run_full_hub_analytics_analysis()
+    df, output_file = run_full_hub_analytics_analysis(args.format)
     
     if df is not None:
         print(f"\n✨ Analysis complete! Ready for report update.")
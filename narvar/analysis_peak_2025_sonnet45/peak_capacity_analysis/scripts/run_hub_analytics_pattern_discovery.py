@@ -4,38 +4,37 @@ Run Hub Analytics API pattern discovery to find retailer attribution patterns.
 Cost: ~$0.19 (38 GB scan)
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 from datetime import datetime
 import pandas as pd
 
+from bq_execution import (add_budget_arguments, configure_budget_from_args, execute_query, print_job_summary,
+                          read_sql, resolve_query_path, results_path)
+
 def run_pattern_discovery():
     """Execute Hub Analytics API pattern discovery query."""
     
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Read query from file
-    query_file = 'queries/phase2_consumer_analysis/hub_analytics_api_pattern_discovery.sql'
+    # Read query from queries/ (resolved from this script's location)
+    query_file = resolve_query_path('phase2_consumer_analysis/hub_analytics_api_pattern_discovery.sql')
     print(f"\n📂 Reading query from: {query_file}")
-    
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     print(f"\n🚀 Executing Hub Analytics API pattern discovery...")
-    print(f"⚠️  Estimated cost: ~$0.19 (38 GB scan)")
     print(f"⏱️  This may take 1-2 minutes...\n")
     
     # Run query
     try:
-        df = client.query(query).to_dataframe()
+        result = execute_query(query, script='run_hub_analytics_pattern_discovery')
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
         
-        print(f"✅ Query completed successfully!")
+        df = result['df']
+        print_job_summary(result)
         print(f"📊 Results: {len(df)} queries sampled\n")
         
         # Save to CSV
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'results/hub_analytics_api_pattern_discovery_{timestamp}.csv'
+        output_file = results_path(f'hub_analytics_api_pattern_discovery_{timestamp}.csv')
         
         df.to_csv(output_file, index=False)
         print(f"💾 Results saved to: {output_file}")
@@ -138,8 +137,9 @@ def run_pattern_discovery():
         return None, None
 
 if __name__ == "__main__":
-    # Change to project directory
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Run Hub Analytics API pattern discovery')
+    add_budget_arguments(parser)
+    configure_budget_from_args(parser.parse_args())
     
     df, output_file = run_pattern_discovery()
     
@@ -4,40 +4,37 @@ Run full 2025 Hub analysis with improved retailer extraction.
 Cost: ~$0.85 (173.75 GB scan)
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 from datetime import datetime
 import pandas as pd
 
+from bq_execution import (add_budget_arguments, configure_budget_from_args, execute_query, print_job_summary,
+                          read_sql, resolve_query_path, results_path)
+
 def run_full_hub_analysis():
     """Execute full Hub analysis and save results."""
     
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Read query from file
-    query_file = 'queries/phase2_consumer_analysis/hub_full_2025_analysis.sql'
+    # Read query from queries/ (resolved from this script's location)
+    query_file = resolve_query_path('phase2_consumer_analysis/looker_full_2025_analysis.sql')
     print(f"\n📂 Reading query from: {query_file}")
-    
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     print(f"\n🚀 Executing full 2025 Hub analysis...")
-    print(f"⚠️  Estimated cost: ~$0.85 (173.75 GB scan)")
     print(f"⏱️  This may take 2-3 minutes...\n")
     
     # Run query
     try:
-        start_time = datetime.now()
-        df = client.query(query).to_dataframe()
-        duration = (datetime.now() - start_time).total_seconds()
+        result = execute_query(query, script='run_looker_full_analysis')
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
         
-        print(f"✅ Query completed successfully in {duration:.1f} seconds!")
+        df = result['df']
+        print_job_summary(result)
         print(f"📊 Results: {len(df)} Hub queries analyzed\n")
         
         # Save to CSV
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'results/hub_full_2025_analysis_{timestamp}.csv'
+        output_file = results_path(f'hub_full_2025_analysis_{timestamp}.csv')
         
         df.to_csv(output_file, index=False)
         print(f"💾 Results saved to: {output_file}")
@@ -162,7 +159,7 @@ def run_full_hub_analysis():
             'is_qos_violation_<lambda>': 'violation_rate_pct'
         }, inplace=True)
         
-        retailer_file = f'results/hub_retailer_summary_{timestamp}.csv'
+        retailer_file = results_path(f'hub_retailer_summary_{timestamp}.csv')
         retailer_summary.to_csv(retailer_file)
         print(f"💾 Retailer summary saved to: {retailer_file}")
         
@@ -182,8 +179,9 @@ def run_full_hub_analysis():
         return None, None
 
 if __name__ == "__main__":
-    # Change to project directory
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Run full 2025 Looker/Hub analysis')
+    add_budget_arguments(parser)
+    configure_budget_from_args(parser.parse_args())
     
     df, output_file = run_full_hub_analysis()
     
@@ -2,43 +2,50 @@
 """
 Run Hub Pattern Discovery Query and save results to CSV.
 Extracts full query text from audit logs to identify retailer attribution patterns.
+Results are streamed to disk (CSV or Parquet) via result_sink.py, so the full query
+text never has to be held in memory at once.
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 from datetime import datetime
 import pandas as pd
 
-def run_pattern_discovery():
+from bq_execution import add_budget_arguments, configure_budget_from_args, read_sql, resolve_query_path, results_path
+from result_sink import stream_query_to_file, read_result_columns, print_sink_summary
+
+# Columns used by the summary below (query text columns are left on disk)
+SUMMARY_COLUMNS = [
+    'analysis_period_label', 'retailer_extraction_success',
+    'pattern_1_retailer_equals', 'pattern_2_retailer_in', 'pattern_3_join_retailer',
+    'has_joins', 'has_group_by', 'has_cte', 'has_window_functions',
+    'is_qos_violation', 'execution_time_seconds', 'slot_hours', 'estimated_slot_cost_usd',
+    'full_query_length', 'partial_query_length', 'pct_captured_in_sample',
+]
+
+def run_pattern_discovery(output_format='csv'):
     """Execute pattern discovery query and save results."""
     
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Read query from file
-    query_file = 'queries/phase2_consumer_analysis/hub_pattern_discovery_sample.sql'
+    # Read query from queries/ (resolved from this script's location)
+    query_file = resolve_query_path('phase2_consumer_analysis/looker_pattern_discovery_sample.sql')
     print(f"\n📂 Reading query from: {query_file}")
-    
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     print(f"\n🚀 Executing pattern discovery query...")
-    print(f"⚠️  Estimated cost: ~$0.19 (38 GB scan)")
     print(f"⏱️  This may take 1-2 minutes...\n")
     
     # Run query
     try:
-        df = client.query(query).to_dataframe()
-        
-        print(f"✅ Query completed successfully!")
-        print(f"📊 Results: {len(df)} queries sampled\n")
-        
-        # Save to CSV
+        # Stream results to disk
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'results/hub_pattern_discovery_{timestamp}.csv'
+        output_file = results_path(f'hub_pattern_discovery_{timestamp}.{output_format}')
         
-        df.to_csv(output_file, index=False)
-        print(f"💾 Results saved to: {output_file}")
+        result = stream_query_to_file(query, output_file, script='run_looker_pattern_discovery')
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
+        
+        print_sink_summary(result)
+        df = read_result_columns(output_file, SUMMARY_COLUMNS)
+        print(f"📊 Results: {len(df)} queries sampled\n")
         
         # Print summary statistics
         print(f"\n" + "="*80)
@@ -103,10 +110,13 @@ def run_pattern_discovery():
         return None, None
 
 if __name__ == "__main__":
-    # Change to project directory
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Run Hub pattern discovery query')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output file format')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
     
-    df, output_file = run_pattern_discovery()
+    df, output_file = run_pattern_discovery(args.format)
     
     if df is not None:
         print(f"\n✨ Success! Data ready for analysis.")
@@ -3,45 +3,48 @@
 Run Monitor retailer performance profile analysis.
 Analyzes direct retailer API queries (Monitor projects) by retailer for 2025 periods.
 Cost: ~$0.016 (3.20 GB scan)
+Results are streamed to disk (CSV or Parquet) via result_sink.py and cached locally
+(result_cache.py) until traffic_classification changes; pass --refresh to re-run.
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 from datetime import datetime
 import pandas as pd
 
-def run_monitor_analysis():
+from bq_execution import add_budget_arguments, configure_budget_from_args, read_sql, resolve_query_path, results_path
+from result_cache import cached_query_to_file, print_cache_status
+from result_sink import read_result_columns, print_sink_summary
+
+# Tables the query reads (their last-modified time is part of the cache key)
+SOURCE_TABLES = ['narvar-data-lake.query_opt.traffic_classification']
+
+def run_monitor_analysis(output_format='csv', refresh=False):
     """Execute Monitor retailer performance analysis."""
     
-    # Initialize BigQuery client
-    client = bigquery.Client()
-    
-    # Read query from file
-    query_file = 'queries/phase2_consumer_analysis/monitor_retailer_performance_profile.sql'
+    # Read query from queries/ (resolved from this script's location)
+    query_file = resolve_query_path('phase2_consumer_analysis/monitor_retailer_performance_profile.sql')
     print(f"\n📂 Reading query from: {query_file}")
-    
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     print(f"\n🚀 Executing Monitor retailer performance analysis...")
-    print(f"💰 Estimated cost: ~$0.016 (3.20 GB scan)")
     print(f"⏱️  This should complete in 30-60 seconds...\n")
     
     # Run query
     try:
-        start_time = datetime.now()
-        df = client.query(query).to_dataframe()
-        duration = (datetime.now() - start_time).total_seconds()
-        
-        print(f"✅ Query completed successfully in {duration:.1f} seconds!")
-        print(f"📊 Results: {len(df)} retailer-period combinations analyzed\n")
-        
-        # Save to CSV
+        # Stream results to disk
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'results/monitor_retailer_performance_{timestamp}.csv'
+        output_file = results_path(f'monitor_retailer_performance_{timestamp}.{output_format}')
         
-        df.to_csv(output_file, index=False)
-        print(f"💾 Results saved to: {output_file}")
+        result = cached_query_to_file(query, output_file, script='run_monitor_retailer_analysis',
+                                      source_tables=SOURCE_TABLES, refresh=refresh)
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
+        
+        if not result['local_cache_hit']:
+            print_sink_summary(result)
+        print_cache_status(result)
+        df = read_result_columns(output_file)
+        print(f"📊 Results: {len(df)} retailer-period combinations analyzed\n")
         
         # Print comprehensive summary
         print(f"\n" + "="*80)
@@ -154,10 +157,14 @@ def run_monitor_analysis():
         return None, None
 
 if __name__ == "__main__":
-    # Change to project directory
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Run Monitor retailer performance analysis')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output file format')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache and re-run the query')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
     
-    df, output_file = run_monitor_analysis()
+    df, output_file = run_monitor_analysis(args.format, refresh=args.refresh)
     
     if df is not None:
         print(f"\n✨ Analysis complete! Ready for visualization and reporting.")
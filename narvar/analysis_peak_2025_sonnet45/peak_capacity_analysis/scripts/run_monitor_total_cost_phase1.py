@@ -4,6 +4,7 @@ Monitor Total Cost Analysis - Phase 1 Execution
 Execute fashionnova table extraction query and save results
 """
 
+import argparse
 import os
 import sys
 from datetime import datetime
@@ -13,6 +14,9 @@ from pathlib import Path
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent))
 
+from bq_execution import (PRICING, QUERIES_DIR, RESULTS_DIR, add_budget_arguments, configure_budget_from_args,
+                          execute_query, get_client, read_sql)
+
 def run_query_and_save(query_file, output_file, project_id='narvar-data-lake'):
     """
     Execute a BigQuery SQL file and save results to CSV
@@ -28,12 +32,11 @@ def run_query_and_save(query_file, output_file, project_id='narvar-data-lake'):
     
     # Initialize BigQuery client
     print(f"Initializing BigQuery client for project: {project_id}")
-    client = bigquery.Client(project=project_id)
+    client = get_client(project_id)
     
     # Read SQL query
     print(f"\nReading query from: {query_file}")
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql(query_file)
     
     # Configure query job
     job_config = bigquery.QueryJobConfig(
@@ -46,31 +49,27 @@ def run_query_and_save(query_file, output_file, project_id='narvar-data-lake'):
     print(f"{'='*80}\n")
     
     # Execute query
-    query_job = client.query(query, job_config=job_config)
-    
-    # Wait for completion and show progress
     print("Query submitted. Waiting for results...")
-    print(f"Job ID: {query_job.job_id}")
+    result = execute_query(query, client=client, script='run_monitor_total_cost_phase1', job_config=job_config)
     
     try:
-        # Get results
-        results = query_job.result()
+        if result['status'] != 'success':
+            raise RuntimeError(result['error'])
         
         # Get job statistics
-        total_bytes_processed = query_job.total_bytes_processed
-        total_bytes_billed = query_job.total_bytes_billed
+        total_bytes_processed = result['bytes_processed']
+        total_bytes_billed = result['bytes_billed']
         
         print(f"\n{'='*80}")
         print("QUERY COMPLETE")
         print(f"{'='*80}\n")
+        print(f"Job ID: {result['job_id']}")
         print(f"Total bytes processed: {total_bytes_processed:,} ({total_bytes_processed / 1024**3:.2f} GB)")
         print(f"Total bytes billed: {total_bytes_billed:,} ({total_bytes_billed / 1024**3:.2f} GB)")
-        print(f"Estimated cost: ${(total_bytes_billed / 1024**4) * 6.25:.4f}")
-        print(f"Total rows: {results.total_rows:,}")
+        print(f"Estimated cost: ${result['estimated_cost_usd']:.4f} (${PRICING['on_demand_usd_per_tib']}/TiB)")
+        print(f"Total rows: {result['total_rows']:,}")
         
-        # Convert to DataFrame
-        import pandas as pd
-        df = results.to_dataframe()
+        df = result['df']
         
         # Save to CSV
         output_path = Path(output_file)
@@ -131,13 +130,13 @@ def run_query_and_save(query_file, output_file, project_id='narvar-data-lake'):
 
 def main():
     """Main execution"""
-    # Get script directory
-    script_dir = Path(__file__).parent
-    project_root = script_dir.parent
+    parser = argparse.ArgumentParser(description='Monitor total cost analysis - Phase 1')
+    add_budget_arguments(parser)
+    configure_budget_from_args(parser.parse_args())
     
     # Define paths
-    query_file = project_root / 'queries' / 'monitor_total_cost' / '01_extract_referenced_tables.sql'
-    output_file = project_root / 'results' / 'monitor_total_cost' / 'fashionnova_referenced_tables.csv'
+    query_file = QUERIES_DIR / 'monitor_total_cost' / '01_extract_referenced_tables.sql'
+    output_file = RESULTS_DIR / 'monitor_total_cost' / 'fashionnova_referenced_tables.csv'
     
     # Verify query file exists
     if not query_file.exists():
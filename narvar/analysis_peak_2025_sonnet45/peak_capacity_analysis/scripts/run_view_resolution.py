@@ -3,11 +3,13 @@
 Execute recursive view resolution query and analyze results
 """
 
+import argparse
 import sys
-from pathlib import Path
-from google.cloud import bigquery
 import pandas as pd
 
+from bq_execution import PRICING, add_budget_arguments, configure_budget_from_args, get_client, read_sql, results_path
+from result_sink import stream_query_to_file, read_result_columns
+
 def main():
     print("="*80)
     print("Recursive View Resolution - All 9 Monitor Views")
@@ -15,33 +17,28 @@ def main():
     print()
     
     # Initialize client
-    client = bigquery.Client(project='narvar-data-lake')
+    client = get_client('narvar-data-lake')
     
     # Read query
-    query_file = Path('../queries/monitor_total_cost/04_recursive_view_resolution_all_views.sql')
-    with open(query_file, 'r') as f:
-        query = f.read()
+    query = read_sql('monitor_total_cost/04_recursive_view_resolution_all_views.sql')
     
     print("Executing query...")
     print("This will trace all 9 views to their root base tables...")
     print()
     
-    # Execute
-    query_job = client.query(query)
-    results = query_job.result()
+    # Execute and stream results to disk
+    output_file = results_path('monitor_total_cost/complete_view_dependency_tree.csv')
+    result = stream_query_to_file(query, output_file, client=client, script='run_view_resolution')
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
     
     # Stats
-    print(f"Bytes processed: {query_job.total_bytes_processed:,} ({query_job.total_bytes_processed/1024**3:.2f} GB)")
-    print(f"Estimated cost: ${(query_job.total_bytes_billed/1024**4)*6.25:.4f}")
-    print(f"Total rows: {results.total_rows:,}")
+    print(f"Bytes processed: {result['bytes_processed']:,} ({result['bytes_processed']/1024**3:.2f} GB)")
+    print(f"Estimated cost: ${result['estimated_cost_usd']:.4f} (${PRICING['on_demand_usd_per_tib']}/TiB)")
+    print(f"Total rows: {result['rows']:,}")
     print()
     
-    # Convert to DataFrame
-    df = results.to_dataframe()
-    
-    # Save
-    output_file = Path('../results/monitor_total_cost/complete_view_dependency_tree.csv')
-    df.to_csv(output_file, index=False)
+    df = read_result_columns(output_file)
     print(f"✅ Results saved to: {output_file}")
     print()
     
@@ -94,6 +91,10 @@ def main():
     return df
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resolve Monitor views to their base tables')
+    add_budget_arguments(parser)
+    configure_budget_from_args(parser.parse_args())
+    
     try:
         df = main()
     except Exception as e:
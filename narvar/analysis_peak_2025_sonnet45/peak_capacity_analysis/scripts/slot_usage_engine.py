@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Slot Usage Engine - Every slots_by_* report from one fetch
+
+Purpose: The SQL library's slots_by_second/minute/hour/day and *_and_user
+         queries each rescan JOBS_TIMELINE for the same curve at a different
+         granularity or grouping. This engine fetches slot_ms once, keeps it in
+         a compact columnar store (one row per second x user x project x
+         reservation, dictionary-encoded Parquet) and builds every report from
+         that store in memory.
+
+Sources:
+  timeline  JOBS_TIMELINE period_slot_ms summed per second and group in
+            BigQuery (exact; what the SQL library reports).
+  jobs      JOBS_BY_PROJECT total_slot_ms per job, spread evenly over
+            [start_time, end_time) with per-second difference arrays. One row
+            per job, so far cheaper over long windows; sub-job shape is lost.
+
+Reports divide slot_ms by the bucket length (average slots in the bucket),
+like the SQL library's SAFE_DIVIDE(SUM(period_slot_ms), time_period). The
+ungrouped series are zero-filled over the window like its RIGHT JOIN on
+generate_timestamp_array; grouped series only have rows where a group used slots.
+
+Usage:
+    python slot_usage_engine.py --days 7
+    python slot_usage_engine.py --days 30 --source jobs --reports slots_by_hour slots_by_hour_and_reservation
+    python slot_usage_engine.py --store ../results/slot_usage/slot_store.parquet   # reuse a fetch
+
+    from slot_usage_engine import load_store, rollup
+    slots = rollup(load_store(path), 'minute', by=['user_email'])
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bq_execution import (DEFAULT_PROJECT_ID, RESULTS_DIR, add_budget_arguments, configure_budget_from_args,
+                          get_client)
+from concurrency_engine import to_epoch_ms
+from result_cache import cached_query_dataframe, print_cache_status
+from sql_templates import render_sql
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+GRANULARITY_SECONDS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+GROUP_COLUMNS = ['user_email', 'project_id', 'reservation']
+GROUP_ALIASES = {'user': 'user_email', 'project': 'project_id', 'reservation': 'reservation'}
+
+# Report name -> (granularity, grouping); names follow the SQL library files
+REPORTS = {
+    'slots_by_second': ('second', []),
+    'slots_by_minute': ('minute', []),
+    'slots_by_hour': ('hour', []),
+    'slots_by_day': ('day', []),
+    'slots_by_minute_and_user': ('minute', ['user_email']),
+    'slots_by_hour_and_project': ('hour', ['project_id']),
+    'slots_by_hour_and_reservation': ('hour', ['reservation']),
+    'slots_by_day_and_user': ('day', ['user_email']),
+}
+DEFAULT_REGION = 'region-us'
+DEFAULT_DAYS = 7
+DEFAULT_OUTPUT_DIR = RESULTS_DIR / 'slot_usage'
+
+TIMELINE_SQL = """
+SELECT
+  UNIX_SECONDS(period_start) AS second,
+  user_email,
+  project_id,
+  IFNULL(reservation_id, 'ON_DEMAND') AS reservation,
+  SUM(period_slot_ms) AS slot_ms
+FROM `{project}`.`{region}`.INFORMATION_SCHEMA.JOBS_TIMELINE
+WHERE job_creation_time BETWEEN TIMESTAMP_SUB(@window_start, INTERVAL 1 DAY) AND @window_end
+  AND period_start >= @window_start AND period_start < @window_end
+  AND job_type <> 'SCRIPT'  -- Scripts pull in child job slots and would double count
+  AND period_slot_ms > 0
+GROUP BY 1, 2, 3, 4
+"""
+
+JOBS_SQL = """
+SELECT
+  user_email,
+  project_id,
+  IFNULL(reservation_id, 'ON_DEMAND') AS reservation,
+  start_time,
+  end_time,
+  total_slot_ms
+FROM `{project}`.`{region}`.INFORMATION_SCHEMA.JOBS_BY_PROJECT
+WHERE creation_time BETWEEN TIMESTAMP_SUB(@window_start, INTERVAL 1 DAY) AND @window_end
+  AND end_time > @window_start AND start_time < @window_end
+  AND job_type <> 'SCRIPT'
+  AND total_slot_ms > 0
+"""
+
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+def compact_store(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize to the store schema: int64 second, categorical groups, float64 slot_ms."""
+    store = pd.DataFrame({'second': df['second'].astype(np.int64)})
+    for column in GROUP_COLUMNS:
+        store[column] = df[column].fillna('UNKNOWN').astype('category')
+    store['slot_ms'] = df['slot_ms'].astype(np.float64)
+    return store.sort_values('second', kind='stable').reset_index(drop=True)
+
+
+def spread_per_second(starts: np.ndarray, ends: np.ndarray, slot_ms: np.ndarray,
+                      window_start: int, window_end: int) -> np.ndarray:
+    """
+    Dense slot_ms per second of [window_start, window_end) (epoch seconds) for
+    jobs spreading slot_ms evenly over [start, end) (epoch ms).
+
+    Full seconds go into a difference array (+rate at the first full second,
+    -rate after the last) and the partial first/last seconds are added
+    directly, so the cost is O(jobs + seconds) regardless of job length.
+    Slots outside the window are dropped.
+    """
+    keep = ends > starts
+    starts, ends, slot_ms = starts[keep], ends[keep], np.asarray(slot_ms, dtype=np.float64)[keep]
+    rate = slot_ms / (ends - starts)  # slots (slot_ms per elapsed ms)
+
+    n_seconds = window_end - window_start
+    origin = window_start * 1000
+    s = np.clip(starts - origin, 0, n_seconds * 1000)
+    e = np.clip(ends - origin, 0, n_seconds * 1000)
+    first_full = -(-s // 1000)       # first second starting at or after s
+    last_full = e // 1000            # first second not fully covered
+
+    whole = first_full < last_full
+    diff = np.zeros(n_seconds + 1)
+    np.add.at(diff, first_full[whole], rate[whole] * 1000)
+    np.add.at(diff, last_full[whole], -rate[whole] * 1000)
+    series = np.cumsum(diff)
+
+    inside = first_full > last_full  # starts and ends inside one second
+    np.add.at(series, s[inside] // 1000, rate[inside] * (e[inside] - s[inside]))
+    head = ~inside & (s < first_full * 1000)
+    np.add.at(series, s[head] // 1000, rate[head] * (first_full[head] * 1000 - s[head]))
+    tail = ~inside & (e > last_full * 1000)
+    np.add.at(series, last_full[tail], rate[tail] * (e[tail] - last_full[tail] * 1000))
+    return series[:n_seconds]
+
+
+def spread_jobs(jobs: pd.DataFrame, window_start: int, window_end: int) -> pd.DataFrame:
+    """Store rows from per-job total_slot_ms spread over each job's runtime, per group."""
+    starts = to_epoch_ms(jobs['start_time'])
+    ends = to_epoch_ms(jobs['end_time'])
+    slot_ms = jobs['total_slot_ms'].to_numpy(dtype=np.float64)
+
+    frames = []
+    codes = jobs.groupby(GROUP_COLUMNS, sort=False, dropna=False).ngroup().to_numpy()
+    for code in range(codes.max() + 1 if len(codes) else 0):
+        member = codes == code
+        series = spread_per_second(starts[member], ends[member], slot_ms[member], window_start, window_end)
+        used = np.flatnonzero(series > 0)
+        frame = pd.DataFrame({'second': window_start + used, 'slot_ms': series[used]})
+        first_row = jobs.iloc[np.flatnonzero(member)[0]]
+        for column in GROUP_COLUMNS:
+            frame[column] = first_row[column]
+        frames.append(frame)
+
+    if not frames:
+        return compact_store(pd.DataFrame(columns=['second', 'slot_ms'] + GROUP_COLUMNS))
+    return compact_store(pd.concat(frames, ignore_index=True))
+
+
+def fetch_store(project: str, region: str, source: str, window_start: datetime, window_end: datetime,
+                refresh: bool = False, max_gb: Optional[float] = None) -> pd.DataFrame:
+    """Fetch slot usage for the window once (via the local result cache) as a store."""
+    template = TIMELINE_SQL if source == 'timeline' else JOBS_SQL
+    sql, query_parameters = render_sql(
+        template,
+        identifiers={'project': project, 'region': region},
+        parameters={'window_start': window_start, 'window_end': window_end},
+    )
+    from google.cloud import bigquery
+    result = cached_query_dataframe(
+        sql,
+        client=get_client(project),
+        script='slot_usage_engine',
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+        source_tables=[],  # INFORMATION_SCHEMA has no version; the window is absolute
+        refresh=refresh,
+        max_gb=max_gb,
+    )
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    print_cache_status(result)
+
+    if source == 'timeline':
+        return compact_store(result['df'])
+    return spread_jobs(result['df'], int(window_start.timestamp()), int(window_end.timestamp()))
+
+
+def save_store(store: pd.DataFrame, path: Path):
+    store.to_parquet(path, index=False, compression='zstd')
+
+
+def load_store(path: Path) -> pd.DataFrame:
+    return compact_store(pd.read_parquet(path))
+
+
+# ============================================================================
+# ROLLUPS
+# ============================================================================
+
+def rollup(store: pd.DataFrame, granularity: str, by: Optional[List[str]] = None,
+           window: Optional[tuple] = None) -> pd.DataFrame:
+    """
+    Average slots per bucket at a granularity, optionally per group.
+
+    Ungrouped series are dense over window (start, end) epoch seconds, or the
+    store's own span; grouped series are sparse.
+    """
+    by = [GROUP_ALIASES.get(column, column) for column in (by or [])]
+    bucket_seconds = GRANULARITY_SECONDS[granularity]
+    bucket = store['second'].to_numpy() // bucket_seconds
+
+    if not by:
+        if window:
+            first, last = window[0] // bucket_seconds, (window[1] - 1) // bucket_seconds
+        elif len(store):
+            first, last = bucket.min(), bucket.max()
+        else:
+            return pd.DataFrame({'timeInterval': pd.Series(dtype='datetime64[s, UTC]'),
+                                 'slot_usage': pd.Series(dtype=np.float64)})
+        in_range = (bucket >= first) & (bucket <= last)
+        totals = np.bincount(bucket[in_range] - first, weights=store['slot_ms'].to_numpy()[in_range],
+                             minlength=last - first + 1)
+        return pd.DataFrame({
+            'timeInterval': pd.to_datetime((first + np.arange(len(totals))) * bucket_seconds, unit='s', utc=True),
+            'slot_usage': totals / (bucket_seconds * 1000),
+        })
+
+    grouped = (store.assign(bucket=bucket)
+               .groupby(['bucket'] + by, observed=True, sort=True)['slot_ms'].sum()
+               .reset_index())
+    grouped = grouped[grouped['slot_ms'] > 0]
+    return pd.DataFrame({
+        'timeInterval': pd.to_datetime(grouped['bucket'] * bucket_seconds, unit='s', utc=True),
+        **{column: grouped[column].astype(str) for column in by},
+        'slot_usage': grouped['slot_ms'] / (bucket_seconds * 1000),
+    }).reset_index(drop=True)
+
+
+def build_reports(store: pd.DataFrame, reports: List[str], window: Optional[tuple] = None) -> Dict[str, pd.DataFrame]:
+    """Build the named REPORTS from one store."""
+    return {name: rollup(store, *REPORTS[name], window=window) for name in reports}
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Build every slots_by_* report from one slot usage fetch')
+    parser.add_argument('--project', default=DEFAULT_PROJECT_ID, help='Project whose slot usage is analyzed')
+    parser.add_argument('--region', default=DEFAULT_REGION, help='INFORMATION_SCHEMA region qualifier')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='Days before --end-date')
+    parser.add_argument('--end-date', type=date.fromisoformat,
+                        help='Window end (exclusive, UTC midnight; default: today)')
+    parser.add_argument('--source', choices=['timeline', 'jobs'], default='timeline',
+                        help='Per-second JOBS_TIMELINE sums (exact) or per-job totals spread over runtime')
+    parser.add_argument('--store', type=Path, help='Build reports from this saved store instead of fetching')
+    parser.add_argument('--reports', nargs='+', choices=list(REPORTS), default=list(REPORTS))
+    parser.add_argument('--output-dir', type=Path, default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.store:
+        if not args.store.exists():
+            print(f"❌ Store not found: {args.store}")
+            sys.exit(1)
+        store = load_store(args.store)
+        window = None
+        print(f"📂 Loaded {len(store):,} store rows from {args.store}")
+    else:
+        end_date = args.end_date or datetime.now(timezone.utc).date()
+        window_end = datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc)
+        window_start = window_end - timedelta(days=args.days)
+        window = (int(window_start.timestamp()), int(window_end.timestamp()))
+        print(f"🔍 Fetching slot usage ({args.source}) for {args.project}, "
+              f"{window_start:%Y-%m-%d} to {window_end:%Y-%m-%d}")
+        try:
+            store = fetch_store(args.project, args.region, args.source, window_start, window_end,
+                                refresh=args.refresh, max_gb=args.max_gb)
+        except Exception as e:
+            print(f"❌ Fetch failed: {e}")
+            sys.exit(1)
+        store_file = args.output_dir / f"slot_store_{args.source}_{window_start:%Y%m%d}_{window_end:%Y%m%d}.parquet"
+        save_store(store, store_file)
+        print(f"💾 Store saved to: {store_file} ({len(store):,} rows)")
+
+    start_time = time.time()
+    for name, report in build_reports(store, args.reports, window).items():
+        output_file = args.output_dir / f"{name}.parquet"
+        report.to_parquet(output_file, index=False)
+        peak = report['slot_usage'].max() if len(report) else 0
+        print(f"   📊 {name}: {len(report):,} rows, peak {peak:,.1f} slots -> {output_file.name}")
+    print(f"\n✅ {len(args.reports)} reports built in {time.time() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+SQL Templates - Typed, validated rendering of SQL templates
+
+Purpose: Separate the three kinds of values that get spliced into SQL:
+         - identifiers (project/dataset/table names, locations) are substituted
+           as text, since BigQuery cannot parameterize them, and must match
+           IDENTIFIER_PATTERN so a value can never break out of a quoted name;
+         - fragments (trusted SQL generated by code, e.g. classification_rules)
+           are substituted as-is;
+         - values (dates, thresholds, labels) are never substituted: the SQL
+           references them as @name and they are passed as BigQuery query
+           parameters, typed from the DECLARE that receives them.
+         Query text therefore stays byte-identical across runs with different
+         dates or thresholds, so BigQuery's result cache and the calibration
+         log's query hash both see the same query.
+
+Templates use str.format fields ({project_id}) for identifiers and fragments.
+SQL library files (repo root audit_log/, information_schema/) use the
+generate_sql_files.py placeholders instead; render_library_sql() handles those
+and can turn their DECLARE ... DEFAULT <literal> variables (interval_in_days)
+into parameters. Every render fails with ValueError if a placeholder, field or
+@parameter is left without a value.
+
+Usage:
+    from sql_templates import render_sql
+
+    sql, query_parameters = render_sql(
+        "DECLARE start_date DATE DEFAULT @start_date;\\n"
+        "SELECT * FROM `{project_id}.{dataset_id}.traffic_classification` ...",
+        identifiers={'project_id': 'narvar-data-lake', 'dataset_id': 'query_opt'},
+        parameters={'start_date': '2025-11-01'},
+    )
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+
+    # Show a library file's declared variables and placeholders
+    python sql_templates.py ../../../../information_schema/top_billed_queries.sql
+"""
+
+import re
+import string
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# generate_sql_files.py placeholders -> keyword used by render_library_sql()
+LIBRARY_PLACEHOLDERS = {
+    '<project-name>': 'project',
+    '<project>': 'sink_project',  # Project holding the audit log sink dataset
+    '<dataset-region>': 'location',
+    '<dataset>': 'dataset',
+}
+
+# Project ids, dataset/table names, regions ('region-us') and versions ('v1.4')
+IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.\-]*$')
+
+# Scalar types a template may declare for a parameter
+PARAMETER_TYPES = ('STRING', 'INT64', 'FLOAT64', 'NUMERIC', 'BOOL', 'DATE', 'DATETIME', 'TIMESTAMP')
+
+# Python type -> BigQuery type, for parameters no DECLARE gives a type to
+# (bool before int: bool is a subclass of int; datetime before date likewise)
+INFERRED_TYPES = [
+    (bool, 'BOOL'),
+    (int, 'INT64'),
+    (float, 'FLOAT64'),
+    (Decimal, 'NUMERIC'),
+    (datetime, 'TIMESTAMP'),
+    (date, 'DATE'),
+    (str, 'STRING'),
+]
+
+# DECLARE name TYPE DEFAULT <expression>;
+DECLARE_PATTERN = re.compile(
+    r'^(?P<head>\s*DECLARE\s+(?P<name>\w+)\s+(?P<type>\w+)\s+DEFAULT\s+)(?P<default>[^;]+?)\s*;',
+    re.IGNORECASE | re.MULTILINE
+)
+# Comments and single-line string literals, matched together so quotes inside
+# comments ("-- don't") and comment markers inside strings ('%#%') are not confused
+TOKEN_PATTERN = re.compile(
+    r"(?P<comment>--[^\n]*|#[^\n]*|/\*.*?\*/)"
+    r"|(?P<string>'(?:[^'\\\n]|\\.)*'|\"(?:[^\"\\\n]|\\.)*\")",
+    re.DOTALL
+)
+PARAMETER_PATTERN = re.compile(r'(?<![@\w])@([A-Za-z_]\w*)')  # @@system variables excluded
+FIELD_PATTERN = re.compile(r'\{[A-Za-z_]\w*\}')
+
+
+# ============================================================================
+# INSPECTION
+# ============================================================================
+
+def strip_comments(sql: str, strings: bool = False) -> str:
+    """Remove comments (and string literal contents too if strings=True)."""
+    def replace(match):
+        if match.group('comment'):
+            return ' '
+        return "''" if strings else match.group(0)
+    return TOKEN_PATTERN.sub(replace, sql)
+
+
+def template_fields(template: str) -> List[str]:
+    """Return the str.format field names used by a template, in order of first use."""
+    fields = [name for _, name, _, _ in string.Formatter().parse(template) if name]
+    return list(dict.fromkeys(fields))
+
+
+def referenced_parameters(sql: str) -> List[str]:
+    """Return the @parameter names referenced by SQL code (not comments or strings)."""
+    return sorted(set(PARAMETER_PATTERN.findall(strip_comments(sql, strings=True))))
+
+
+def declared_variables(sql: str) -> Dict[str, str]:
+    """Return {name: type} for every DECLARE ... DEFAULT in the SQL."""
+    return {m.group('name'): m.group('type').upper() for m in DECLARE_PATTERN.finditer(sql)}
+
+
+def declared_parameter_types(sql: str) -> Dict[str, str]:
+    """Return {parameter: type} for parameters received by DECLARE name TYPE DEFAULT @parameter."""
+    types = {}
+    for m in DECLARE_PATTERN.finditer(sql):
+        default = m.group('default').strip()
+        if default.startswith('@') and not default.startswith('@@'):
+            types[default[1:]] = m.group('type').upper()
+    return types
+
+
+def find_unrendered_placeholders(sql: str) -> List[str]:
+    """Return library placeholders and str.format fields still present in SQL code."""
+    code = strip_comments(sql)
+    found = [p for p in LIBRARY_PLACEHOLDERS if p in code]
+    found.extend(sorted(set(FIELD_PATTERN.findall(strip_comments(sql, strings=True)))))
+    return found
+
+
+# ============================================================================
+# RENDERING
+# ============================================================================
+
+def validate_identifier(name: str, value) -> str:
+    """Return value as a string if it is safe to substitute as an identifier."""
+    value = str(value)
+    if not IDENTIFIER_PATTERN.match(value):
+        raise ValueError(f"Invalid identifier for '{name}': {value!r} "
+                         f"(allowed: letters, digits, '_', '-', '.')")
+    return value
+
+
+def to_query_parameter(name: str, value, param_type: Optional[str] = None) -> bigquery.ScalarQueryParameter:
+    """Build a typed scalar query parameter, coercing ISO date strings for DATE/TIMESTAMP."""
+    if param_type is None:
+        param_type = next((t for py_type, t in INFERRED_TYPES if isinstance(value, py_type)), None)
+        if param_type is None:
+            raise TypeError(f"Cannot infer a BigQuery type for parameter '{name}' ({type(value).__name__})")
+    param_type = param_type.upper()
+    if param_type not in PARAMETER_TYPES:
+        raise TypeError(f"Unsupported type {param_type} for parameter '{name}'")
+
+    if isinstance(value, str) and param_type == 'DATE':
+        value = date.fromisoformat(value)
+    elif isinstance(value, str) and param_type in ('DATETIME', 'TIMESTAMP'):
+        value = datetime.fromisoformat(value)
+    elif param_type == 'INT64' and (isinstance(value, bool) or not isinstance(value, int)):
+        raise TypeError(f"Parameter '{name}' is INT64 but got {value!r}")
+    elif param_type == 'FLOAT64' and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    elif param_type == 'STRING' and not isinstance(value, str):
+        raise TypeError(f"Parameter '{name}' is STRING but got {value!r}")
+    return bigquery.ScalarQueryParameter(name, param_type, value)
+
+
+def substitute(template: str, identifiers: Optional[Dict] = None, fragments: Optional[Dict] = None) -> str:
+    """
+    Fill a template's str.format fields with validated identifiers and SQL fragments.
+
+    Every field must be given; unused values are allowed so a shared dict (such
+    as classification_rules.render_sql_expressions()) can be passed whole.
+    """
+    identifiers = identifiers or {}
+    fragments = fragments or {}
+    overlap = set(identifiers) & set(fragments)
+    if overlap:
+        raise ValueError(f"Given as both identifier and fragment: {', '.join(sorted(overlap))}")
+
+    missing = [f for f in template_fields(template) if f not in identifiers and f not in fragments]
+    if missing:
+        raise ValueError(f"Template fields without a value: {', '.join(missing)}")
+
+    values = {name: validate_identifier(name, value) for name, value in identifiers.items()}
+    values.update(fragments)
+    return template.format(**values)
+
+
+def bind_parameters(sql: str, parameters: Optional[Dict] = None) -> List[bigquery.ScalarQueryParameter]:
+    """
+    Build query parameters for every @parameter the SQL references.
+
+    Types come from the DECLARE receiving the parameter, otherwise from the
+    Python value. Missing and unused parameters are both errors.
+    """
+    parameters = parameters or {}
+    referenced = referenced_parameters(sql)
+    missing = [p for p in referenced if p not in parameters]
+    if missing:
+        raise ValueError(f"Query parameters without a value: {', '.join(missing)}")
+    unused = sorted(set(parameters) - set(referenced))
+    if unused:
+        raise ValueError(f"Query parameters not referenced by the SQL: {', '.join(unused)}")
+
+    types = declared_parameter_types(sql)
+    return [to_query_parameter(name, parameters[name], types.get(name)) for name in referenced]
+
+
+def render_sql(
+    template: str,
+    identifiers: Optional[Dict] = None,
+    fragments: Optional[Dict] = None,
+    parameters: Optional[Dict] = None,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    Render a template and bind its parameters.
+
+    Returns:
+        (sql, query_parameters) - the SQL text depends only on identifiers and
+        fragments, never on parameter values
+    """
+    sql = substitute(template, identifiers, fragments)
+    unrendered = find_unrendered_placeholders(sql)
+    if unrendered:
+        raise ValueError(f"Unrendered placeholders: {', '.join(unrendered)}")
+    return sql, bind_parameters(sql, parameters)
+
+
+def parameterize_declares(sql: str, names: List[str]) -> str:
+    """Rewrite DECLARE name TYPE DEFAULT <literal> to DEFAULT @name for the given variables."""
+    declared = declared_variables(sql)
+    unknown = [n for n in names if n not in declared]
+    if unknown:
+        raise ValueError(f"Not declared with a DEFAULT: {', '.join(unknown)} "
+                         f"(declared: {', '.join(declared) or 'none'})")
+
+    def replace(match):
+        if match.group('name') in names:
+            return f"{match.group('head')}@{match.group('name')};"
+        return match.group(0)
+
+    return DECLARE_PATTERN.sub(replace, sql)
+
+
+def render_library_sql(
+    sql: str,
+    project: Optional[str] = None,
+    location: Optional[str] = None,
+    dataset: Optional[str] = None,
+    sink_project: Optional[str] = None,
+    parameters: Optional[Dict] = None,
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    """
+    Render a SQL library file (generate_sql_files.py placeholders).
+
+    Variables named in `parameters` (e.g. {'interval_in_days': 3}) have their
+    DECLARE default replaced by a query parameter of the declared type.
+    """
+    values = {'project': project, 'location': location, 'dataset': dataset, 'sink_project': sink_project}
+    for placeholder, keyword in LIBRARY_PLACEHOLDERS.items():
+        if values[keyword] is not None:
+            sql = sql.replace(placeholder, validate_identifier(keyword, values[keyword]))
+
+    unrendered = find_unrendered_placeholders(sql)
+    if unrendered:
+        raise ValueError(f"Unrendered placeholders: {', '.join(unrendered)} "
+                         f"(give {', '.join(LIBRARY_PLACEHOLDERS.get(p, p) for p in unrendered)})")
+
+    parameters = parameters or {}
+    sql = parameterize_declares(sql, list(parameters))
+    return sql, bind_parameters(sql, parameters)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python sql_templates.py <file.sql>")
+        sys.exit(1)
+
+    sql = Path(sys.argv[1]).read_text()
+    print(f"📄 {sys.argv[1]}")
+    print(f"   Declared variables: {declared_variables(sql) or 'none'}")
+    print(f"   Query parameters:   {referenced_parameters(sql) or 'none'}")
+    print(f"   Placeholders:       {find_unrendered_placeholders(sql) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
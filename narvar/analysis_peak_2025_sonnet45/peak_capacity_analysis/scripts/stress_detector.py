@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Stress Detector - Sliding-window capacity stress states in one pass
+
+Purpose: identify_capacity_stress_periods_table.sql screens whole hours by
+         P95 and only expands flagged hours into fixed 10-minute windows
+         (UNNEST([0, 10, 20, 30, 40, 50])), so stress straddling an hour
+         boundary, or inside an hour whose P95 looks normal, is missed. This
+         engine slides a window of any length and step over every period and
+         classifies every window with the same rules and thresholds.
+Output:  Parquet in the phase2_stress_periods schema (stress_state
+         NORMAL/INFO/WARNING/CRITICAL, trigger_reason, concurrent_* counts,
+         P50/P95/P99 execution seconds, dominant_category), one row per
+         window containing at least one job.
+
+Streaming: jobs are consumed once in start_time order. A job joins the window
+state when the window end passes its start and leaves it (min-heap on
+end_time) once the window start passes its end, matching the SQL's overlap
+join (start_time < window_end AND end_time > window_start). Counts are
+running sums and execution-time quantiles come from a mergeable log-bin
+sketch (quantile_sketch.py) that supports removal, so each step costs the
+jobs entering and leaving, not the jobs in the window.
+
+Usage:
+    python stress_detector.py                                   # SQL's periods, 10-min windows, 1-min step
+    python stress_detector.py --periods Peak_2024_2025 --window-minutes 5 --step-minutes 1
+    python stress_detector.py --input ../results/peak_jobs.parquet --output stress.parquet
+"""
+
+import argparse
+import heapq
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from bq_execution import RESULTS_DIR, add_budget_arguments, configure_budget_from_args, get_client
+from concurrency_engine import to_epoch_ms
+from quantile_sketch import NUM_BINS, sketch_bins, sketch_quantiles
+from result_cache import cached_query_dataframe, print_cache_status
+from run_classification_all_periods import DATASET_ID, PROJECT_ID, TABLE_ID
+from sql_templates import render_sql
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Same defaults as identify_capacity_stress_periods_table.sql
+ANALYZE_PERIODS = ['Peak_2024_2025', 'Baseline_2025_Sep_Oct', 'Peak_2023_2024']
+
+INFO_CONCURRENT_THRESHOLD = 20
+WARNING_CONCURRENT_THRESHOLD = 30
+CRITICAL_CONCURRENT_THRESHOLD = 60
+
+INFO_P95_THRESHOLD_SECONDS = 360
+WARNING_P95_THRESHOLD_SECONDS = 1200
+CRITICAL_P95_THRESHOLD_SECONDS = 3000
+
+DEFAULT_WINDOW_MINUTES = 10
+DEFAULT_STEP_MINUTES = 1
+
+CATEGORIES = ['EXTERNAL', 'AUTOMATED', 'INTERNAL']
+CUSTOMER_FACING_SUBCATEGORIES = ['MONITOR', 'HUB']
+STRESS_STATES = ['NORMAL', 'INFO', 'WARNING', 'CRITICAL']
+
+JOBS_SQL = """
+SELECT
+  start_time,
+  end_time,
+  execution_time_seconds,
+  consumer_category,
+  consumer_subcategory,
+  approximate_slot_count
+FROM `{project_id}.{dataset_id}.{table_id}`
+WHERE analysis_period_label = @period_label
+  AND start_time IS NOT NULL
+  AND end_time IS NOT NULL
+"""
+
+
+# ============================================================================
+# DATA
+# ============================================================================
+
+def fetch_period_jobs(period_label: str, refresh: bool = False, max_gb: Optional[float] = None) -> pd.DataFrame:
+    """Pull one period's classified jobs (via the local result cache)."""
+    sql, query_parameters = render_sql(
+        JOBS_SQL,
+        identifiers={'project_id': PROJECT_ID, 'dataset_id': DATASET_ID, 'table_id': TABLE_ID},
+        parameters={'period_label': period_label},
+    )
+    from google.cloud import bigquery
+    result = cached_query_dataframe(
+        sql,
+        client=get_client(PROJECT_ID),
+        script='stress_detector',
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+        refresh=refresh,
+        max_gb=max_gb,
+    )
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    print_cache_status(result)
+    return result['df']
+
+
+def prepare_jobs(jobs: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Per-job arrays in start_time order (the stream the detector consumes)."""
+    starts = to_epoch_ms(jobs['start_time'])
+    order = np.argsort(starts, kind='stable')
+    category = jobs['consumer_category'].to_numpy()[order]
+    subcategory = jobs['consumer_subcategory'].to_numpy()[order]
+    # Column per counter: concurrent_external/automated/internal, monitor_base, customer_facing
+    flags = np.column_stack(
+        [category == c for c in CATEGORIES]
+        + [subcategory == 'MONITOR_BASE', np.isin(subcategory, CUSTOMER_FACING_SUBCATEGORIES)]
+    ).astype(np.int64)
+    # Jobs without an execution time still count as concurrent but stay out of
+    # the percentile sketch (bin -1), like quantile_sketch.sketch_from_values
+    execution = jobs['execution_time_seconds'].to_numpy(dtype=np.float64)[order]
+    bins = np.where(np.isnan(execution), -1, sketch_bins(execution))
+    return {
+        'start': starts[order],
+        'end': to_epoch_ms(jobs['end_time'])[order],
+        'bin': bins,
+        'flags': flags,
+        'slots': np.nan_to_num(jobs['approximate_slot_count'].to_numpy(dtype=np.float64)[order]),
+    }
+
+
+# ============================================================================
+# DETECTION
+# ============================================================================
+
+def sliding_windows(jobs: Dict[str, np.ndarray], window_ms: int, step_ms: int) -> Iterator[Dict]:
+    """
+    Yield the window state for every window [start, start + window_ms) that
+    overlaps at least one job, with window starts on a step_ms grid.
+    """
+    starts, ends, bins, flags, slots = jobs['start'], jobs['end'], jobs['bin'], jobs['flags'], jobs['slots']
+    n_jobs = len(starts)
+    if n_jobs == 0:
+        return
+    end_list = ends.tolist()
+
+    sketch = np.zeros(NUM_BINS, dtype=np.int64)
+    counters = np.zeros(flags.shape[1], dtype=np.int64)
+    active = 0
+    slot_sum = 0.0
+    heap = []        # (end_ms, job index) of jobs in the window state
+    admitted = 0     # jobs [0, admitted) of the start-ordered stream have been consumed
+
+    # First window on the step grid that reaches the first job
+    origin = (int(starts[0]) - window_ms) // step_ms * step_ms + step_ms
+    window_start = origin
+    while admitted < n_jobs or heap:
+        window_end = window_start + window_ms
+
+        # Jobs starting before the window end join (a contiguous run of the stream)
+        joined = admitted + int(np.searchsorted(starts[admitted:], window_end, side='left'))
+        if joined > admitted:
+            for i in range(admitted, joined):
+                heapq.heappush(heap, (end_list[i], i))
+            joined_bins = bins[admitted:joined]
+            np.add.at(sketch, joined_bins[joined_bins >= 0], 1)
+            counters += flags[admitted:joined].sum(axis=0)
+            slot_sum += slots[admitted:joined].sum()
+            active += joined - admitted
+            admitted = joined
+
+        # Jobs that ended at or before the window start leave
+        left = []
+        while heap and heap[0][0] <= window_start:
+            left.append(heapq.heappop(heap)[1])
+        if left:
+            left_bins = bins[left]
+            np.subtract.at(sketch, left_bins[left_bins >= 0], 1)
+            counters -= flags[left].sum(axis=0)
+            slot_sum -= slots[left].sum()
+            active -= len(left)
+
+        if active:
+            p50, p95, p99 = sketch_quantiles(sketch, [0.50, 0.95, 0.99])
+            yield {
+                'window_start': window_start,
+                'window_end': window_end,
+                'concurrent_jobs': active,
+                'concurrent_external': int(counters[0]),
+                'concurrent_automated': int(counters[1]),
+                'concurrent_internal': int(counters[2]),
+                'concurrent_monitor_base': int(counters[3]),
+                'concurrent_customer_facing': int(counters[4]),
+                'p50_execution_seconds': p50,
+                'p95_execution_seconds': p95,
+                'p99_execution_seconds': p99,
+                'total_concurrent_slots': slot_sum,
+                'avg_slot_count': slot_sum / active,
+            }
+            window_start += step_ms
+        elif admitted < n_jobs:
+            # Nothing running: jump to the first window reaching the next job
+            next_start = int(starts[admitted])
+            window_start = max(window_start + step_ms,
+                               origin + ((next_start - window_ms - origin) // step_ms + 1) * step_ms)
+        else:
+            break
+
+
+def classify_stress(windows: pd.DataFrame) -> pd.DataFrame:
+    """Add stress_state, trigger_reason and dominant_category (the SQL's CASE rules)."""
+    jobs = windows['concurrent_jobs']
+    p95 = windows['p95_execution_seconds']
+    windows['stress_state'] = np.select(
+        [(jobs >= CRITICAL_CONCURRENT_THRESHOLD) | (p95 >= CRITICAL_P95_THRESHOLD_SECONDS),
+         (jobs >= WARNING_CONCURRENT_THRESHOLD) | (p95 >= WARNING_P95_THRESHOLD_SECONDS),
+         (jobs >= INFO_CONCURRENT_THRESHOLD) | (p95 >= INFO_P95_THRESHOLD_SECONDS)],
+        ['CRITICAL', 'WARNING', 'INFO'], default='NORMAL')
+    high_concurrency = jobs >= CRITICAL_CONCURRENT_THRESHOLD
+    slow_execution = p95 >= CRITICAL_P95_THRESHOLD_SECONDS
+    windows['trigger_reason'] = np.select(
+        [high_concurrency & slow_execution, high_concurrency, slow_execution],
+        ['BOTH_TRIGGERS', 'HIGH_CONCURRENCY', 'SLOW_EXECUTION'], default=None)
+
+    external, automated, internal = (windows[f'concurrent_{c.lower()}'] for c in CATEGORIES)
+    windows['dominant_category'] = np.select(
+        [(automated > external) & (automated > internal), external > internal],
+        ['AUTOMATED', 'EXTERNAL'], default='INTERNAL')
+    return windows
+
+
+def detect_stress(jobs: pd.DataFrame, period_label: str, window_minutes: int = DEFAULT_WINDOW_MINUTES,
+                  step_minutes: int = DEFAULT_STEP_MINUTES) -> pd.DataFrame:
+    """Stress timeline for one period in the phase2_stress_periods schema."""
+    windows = pd.DataFrame(sliding_windows(prepare_jobs(jobs), window_minutes * 60_000, step_minutes * 60_000))
+    if windows.empty:
+        return windows
+    rounded = ['p50_execution_seconds', 'p95_execution_seconds', 'p99_execution_seconds',
+               'total_concurrent_slots', 'avg_slot_count']
+    windows[rounded] = windows[rounded].round(2)
+    windows = classify_stress(windows)
+    window_start = pd.to_datetime(windows['window_start'], unit='ms', utc=True)
+    windows['window_start'] = window_start
+    windows['window_end'] = pd.to_datetime(windows['window_end'], unit='ms', utc=True)
+    windows.insert(0, 'analysis_period_label', period_label)
+    windows.insert(1, 'date', window_start.dt.date)
+    windows.insert(2, 'hour', window_start.dt.hour)
+    windows['day_of_week'] = (window_start.dt.dayofweek + 1) % 7 + 1  # BigQuery DAYOFWEEK: Sunday = 1
+    windows['day_name'] = window_start.dt.day_name()
+    windows['is_hourly_aggregate'] = False
+    windows['screening_flag'] = f'SLIDING_{window_minutes}M_STEP_{step_minutes}M'
+    return windows[[
+        'analysis_period_label', 'date', 'hour', 'window_start', 'window_end', 'day_of_week', 'day_name',
+        'stress_state', 'trigger_reason',
+        'concurrent_jobs', 'concurrent_external', 'concurrent_automated', 'concurrent_internal',
+        'concurrent_monitor_base', 'concurrent_customer_facing',
+        'p50_execution_seconds', 'p95_execution_seconds', 'p99_execution_seconds',
+        'total_concurrent_slots', 'avg_slot_count', 'dominant_category',
+        'is_hourly_aggregate', 'screening_flag',
+    ]]
+
+
+def print_stress_summary(stress: pd.DataFrame, step_minutes: int):
+    """Print window counts and stressed time per state."""
+    counts = stress['stress_state'].value_counts().reindex(STRESS_STATES, fill_value=0)
+    for state in STRESS_STATES:
+        print(f"   {state:<9} {counts[state]:>9,} windows (~{counts[state] * step_minutes / 60:,.1f} h)")
+    critical = stress[stress['stress_state'] == 'CRITICAL']
+    if not critical.empty:
+        worst = critical.loc[critical['concurrent_jobs'].idxmax()]
+        print(f"   Worst window: {worst['window_start']} - {worst['concurrent_jobs']:,} jobs, "
+              f"P95 {worst['p95_execution_seconds']:,.0f}s ({worst['trigger_reason']})")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Sliding-window capacity stress detection')
+    parser.add_argument('--periods', nargs='+', default=ANALYZE_PERIODS, help='analysis_period_label values')
+    parser.add_argument('--input', type=Path, help='Local Parquet/CSV of classified jobs instead of querying '
+                                                   '(analysis_period_label column optional)')
+    parser.add_argument('--window-minutes', type=int, default=DEFAULT_WINDOW_MINUTES)
+    parser.add_argument('--step-minutes', type=int, default=DEFAULT_STEP_MINUTES)
+    parser.add_argument('--output', type=Path, default=RESULTS_DIR / 'phase2_stress_periods_sliding.parquet')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local result cache')
+    add_budget_arguments(parser)
+    args = parser.parse_args()
+    configure_budget_from_args(args)
+
+    if args.input:
+        if not args.input.exists():
+            print(f"❌ Input not found: {args.input}")
+            sys.exit(1)
+        jobs = pd.read_parquet(args.input) if args.input.suffix == '.parquet' else pd.read_csv(args.input)
+        if 'analysis_period_label' in jobs.columns:
+            period_jobs = {label: group for label, group in jobs.groupby('analysis_period_label')
+                           if label in args.periods}
+        else:
+            period_jobs = {args.input.stem: jobs}
+    else:
+        period_jobs = {}
+        for period in args.periods:
+            print(f"🔍 Fetching jobs for {period}...")
+            try:
+                period_jobs[period] = fetch_period_jobs(period, refresh=args.refresh, max_gb=args.max_gb)
+            except Exception as e:
+                print(f"❌ Query failed for {period}: {e}")
+                sys.exit(1)
+
+    results = []
+    for period, jobs in period_jobs.items():
+        start_time = time.time()
+        stress = detect_stress(jobs, period, args.window_minutes, args.step_minutes)
+        print(f"\n📊 {period}: {len(jobs):,} jobs -> {len(stress):,} windows in {time.time() - start_time:.1f}s")
+        if not stress.empty:
+            print_stress_summary(stress, args.step_minutes)
+            results.append(stress)
+
+    if not results:
+        print("❌ No jobs to analyze")
+        sys.exit(1)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    pd.concat(results, ignore_index=True).to_parquet(args.output, index=False)
+    print(f"\n💾 Stress timeline saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
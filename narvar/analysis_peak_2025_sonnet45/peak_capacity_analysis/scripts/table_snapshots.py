@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Table Snapshots - Column-projected, filtered, locally cached table loads
+
+Purpose: Notebooks (generate_phase2_notebook.py) used to run SELECT * against
+         the Phase 2 result tables and pull them whole into pandas on every
+         kernel restart. load_snapshot() instead:
+         - selects only the columns a section uses
+         - pushes equality / IN filters (period labels, stress states) into
+           the WHERE clause as query parameters
+         - caches the result as a local Parquet snapshot through
+           result_cache.py, keyed by the SQL, its parameters and the table's
+           last-modified time, so a re-run costs one get_table() call
+         - reads string columns dictionary-encoded, so they arrive as pandas
+           categoricals (optionally with an ordered category list) without
+           ever materializing one Python string per row
+
+Requirements:
+- google-cloud-bigquery
+- pyarrow
+
+Usage (from a notebook in ../notebooks):
+    import sys; sys.path.insert(0, '../scripts')
+    from table_snapshots import load_snapshot, STRESS_STATES
+
+    df = load_snapshot('narvar-data-lake.query_opt.phase2_stress_periods',
+                       columns=['analysis_period_label', 'window_start', 'stress_state'],
+                       filters={'analysis_period_label': 'Peak_2024_2025'},
+                       order_by=['window_start'],
+                       ordered_categories={'stress_state': STRESS_STATES})
+
+    # Inspect / clear snapshots (they live in the shared result cache)
+    python result_cache.py --stats
+"""
+
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+from result_cache import fetch_to_cache
+from sql_templates import validate_identifier
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+STRESS_STATES = ['NORMAL', 'INFO', 'WARNING', 'CRITICAL']
+
+# BigQuery types for filter values, by Python type
+FILTER_VALUE_TYPES = {str: 'STRING', int: 'INT64', float: 'FLOAT64', bool: 'BOOL'}
+
+
+# ============================================================================
+# QUERY BUILDING
+# ============================================================================
+
+def filter_parameter(column: str, value) -> bigquery.ScalarQueryParameter:
+    """Query parameter for one filter: a scalar for =, an array for IN UNNEST()."""
+    values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+    types = {FILTER_VALUE_TYPES.get(type(v)) for v in values}
+    if len(types) != 1 or None in types:
+        raise ValueError(f"Filter {column}: values must share one of "
+                         f"{', '.join(t.__name__ for t in FILTER_VALUE_TYPES)}")
+    param_type = types.pop()
+    if isinstance(value, (list, tuple, set)):
+        return bigquery.ArrayQueryParameter(f'filter_{column}', param_type, values)
+    return bigquery.ScalarQueryParameter(f'filter_{column}', param_type, value)
+
+
+def build_snapshot_query(table_id: str, columns: List[str], filters: Optional[Dict] = None,
+                         order_by: Optional[List[str]] = None):
+    """
+    Return (sql, query_parameters) selecting the columns of table_id.
+
+    Column names are validated identifiers; filter values are always passed as
+    parameters. A filter value of None means "no filter" (e.g. all periods).
+    """
+    validate_identifier('table_id', table_id)
+    for column in list(columns) + list(filters or {}) + list(order_by or []):
+        validate_identifier('column', column)
+
+    where = []
+    query_parameters = []
+    for column, value in (filters or {}).items():
+        if value is None:
+            continue
+        parameter = filter_parameter(column, value)
+        if isinstance(parameter, bigquery.ArrayQueryParameter):
+            where.append(f"{column} IN UNNEST(@{parameter.name})")
+        else:
+            where.append(f"{column} = @{parameter.name}")
+        query_parameters.append(parameter)
+
+    sql = f"SELECT {', '.join(columns)}\nFROM `{table_id}`"
+    if where:
+        sql += "\nWHERE " + "\n  AND ".join(where)
+    if order_by:
+        sql += f"\nORDER BY {', '.join(order_by)}"
+    return sql, query_parameters
+
+
+# ============================================================================
+# LOADING
+# ============================================================================
+
+def read_snapshot(snapshot_file: str, ordered_categories: Optional[Dict[str, List[str]]] = None) -> pd.DataFrame:
+    """Read a snapshot with every string column as a categorical."""
+    schema = pq.read_schema(snapshot_file)
+    string_columns = [f.name for f in schema if pa.types.is_string(f.type) or pa.types.is_large_string(f.type)]
+    df = pq.read_table(snapshot_file, read_dictionary=string_columns).to_pandas()
+    for column, categories in (ordered_categories or {}).items():
+        if column in df.columns:
+            df[column] = df[column].astype(pd.CategoricalDtype(categories, ordered=True))
+    return df
+
+
+def load_snapshot(
+    table_id: str,
+    columns: List[str],
+    filters: Optional[Dict] = None,
+    order_by: Optional[List[str]] = None,
+    ordered_categories: Optional[Dict[str, List[str]]] = None,
+    client: Optional[bigquery.Client] = None,
+    refresh: bool = False,
+    max_gb: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Load the given columns/rows of a table from the local snapshot, querying
+    BigQuery only when the table changed since the snapshot was taken.
+
+    Raises:
+        RuntimeError if the query fails or is blocked by the byte budget
+    """
+    sql, query_parameters = build_snapshot_query(table_id, columns, filters, order_by)
+    result = fetch_to_cache(
+        sql,
+        client=client,
+        script='table_snapshots',
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+        source_tables=[table_id],
+        refresh=refresh,
+        max_gb=max_gb,
+    )
+    if result['status'] != 'success':
+        raise RuntimeError(f"Loading {table_id} failed: {result['error']}")
+
+    df = read_snapshot(result['cache_file'], ordered_categories)
+    source = 'snapshot' if result['local_cache_hit'] else f"BigQuery ({result['bytes_processed'] / 1024**2:,.1f} MB)"
+    print(f"   📥 {table_id.split('.')[-1]}: {len(df):,} rows x {len(df.columns)} columns from {source}, "
+          f"{df.memory_usage(deep=True).sum() / 1024**2:,.1f} MB in memory")
+    return df
@@ -4,15 +4,14 @@ Verify that BOTH analytics-api-bigquery-access service accounts are captured.
 Checks classification table for ANALYTICS_API queries.
 """
 
-import os
-from google.cloud import bigquery
+import argparse
 import pandas as pd
 
+from bq_execution import add_budget_arguments, configure_budget_from_args, execute_query
+
 def verify_service_accounts():
     """Check which analytics-api service accounts are captured."""
     
-    client = bigquery.Client()
-    
     query = """
     SELECT
       principal_email,
@@ -31,7 +30,10 @@ def verify_service_accounts():
     
     print(f"\n🔍 Checking ANALYTICS_API service accounts...\n")
     
-    df = client.query(query).to_dataframe()
+    result = execute_query(query, script='verify_hub_analytics_service_accounts')
+    if result['status'] != 'success':
+        raise RuntimeError(result['error'])
+    df = result['df']
     
     print("="*80)
     print("ANALYTICS_API SERVICE ACCOUNTS")
@@ -94,7 +96,9 @@ def verify_service_accounts():
     return df
 
 if __name__ == "__main__":
-    os.chdir('/Users/cezarmihaila/workspace/do_it_query_optimization_queries/bigquery-optimization-queries/narvar/analysis_peak_2025_sonnet45')
+    parser = argparse.ArgumentParser(description='Verify ANALYTICS_API service accounts')
+    add_budget_arguments(parser)
+    configure_budget_from_args(parser.parse_args())
     
     df = verify_service_accounts()
 